@@ -0,0 +1,24 @@
+"""
+Benchmarks of iniesta. Every benchmark module writes its results as JSON
+with :code:`benchmarks.results`, so runs of different commits can be
+compared with :code:`python -m benchmarks.compare`.
+"""
+from insanic.conf import settings
+
+
+def configure() -> None:
+    """
+    Configures the settings like a service would, if they aren't yet.
+    """
+    from iniesta import Iniesta
+
+    if not settings.configured:
+        settings.configure(
+            SERVICE_NAME="iniesta",
+            ENVIRONMENT="benchmarks",
+            ENFORCE_APPLICATION_VERSION=False,
+            AWS_ACCESS_KEY_ID="testing",
+            AWS_SECRET_ACCESS_KEY="testing",
+            AWS_DEFAULT_REGION="us-east-1",
+        )
+    Iniesta.load_config(settings)
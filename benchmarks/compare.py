@@ -0,0 +1,66 @@
+"""
+Compares two result files of the same suite.
+
+.. code-block:: sh
+
+    $ python -m benchmarks.compare base.json head.json --threshold 0.1
+
+Exits with status 1 if a benchmark's throughput dropped by more than the
+threshold.
+"""
+import sys
+
+import click
+import ujson as json
+
+
+def compare(base: dict, head: dict, threshold: float) -> list:
+    """
+    Compares the throughput of the benchmarks in both results.
+
+    :return: Tuples of the name, base and head throughput, the relative
+        change and if it is a regression.
+    """
+    rows = []
+    for name, result in head["benchmarks"].items():
+        if name not in base["benchmarks"]:
+            continue
+        before = base["benchmarks"][name]["per_second"]
+        after = result["per_second"]
+        change = (after - before) / before if before else 0.0
+        rows.append((name, before, after, change, change < -threshold))
+    return rows
+
+
+@click.command()
+@click.argument("base", type=click.File("r"))
+@click.argument("head", type=click.File("r"))
+@click.option(
+    "-t",
+    "--threshold",
+    default=0.1,
+    show_default=True,
+    help="Relative drop in throughput reported as a regression.",
+)
+def main(base, head, threshold):
+    """
+    Compares the throughput of two benchmark result files.
+    """
+    base, head = json.load(base), json.load(head)
+    rows = compare(base, head, threshold)
+
+    click.echo(
+        f"{'BENCHMARK':<44} {'BASE /s':>12} {'HEAD /s':>12} {'CHANGE':>8}"
+    )
+    for name, before, after, change, regressed in rows:
+        click.echo(
+            f"{name:<44} {before:>12.1f} {after:>12.1f} {change:>+8.1%}"
+            + ("  REGRESSION" if regressed else "")
+        )
+
+    if any(row[4] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""
+Micro benchmarks of building and parsing messages, the code that runs at
+least once per published or received message.
+
+Every operation is timed with :code:`timeit` across body sizes and
+attribute counts, and its allocations are measured with
+:code:`tracemalloc`: the bytes and blocks that remain allocated by the
+result of an operation, and the peak of memory allocated while it runs.
+
+.. code-block:: sh
+
+    $ python -m benchmarks.messages -o messages.json
+    $ python -m benchmarks.messages -b from_sqs -b body --size 262144
+"""
+import functools
+import gc
+import timeit
+import tracemalloc
+
+from typing import Callable, Iterator, List, Optional, Sequence
+
+import click
+
+from insanic.conf import settings
+
+from . import configure
+from .results import format_result, summarize, write_results
+
+#: The body sizes in bytes, from 100 B to the 256 KiB maximum.
+SIZES: Sequence[int] = (100, 1024, 16 * 1024, 64 * 1024, 256 * 1024)
+
+#: The numbers of message attributes besides the event and version.
+ATTRIBUTE_COUNTS: Sequence[int] = (0, 1, 5, 10)
+
+#: The body size of operations that don't depend on it.
+DEFAULT_SIZE: int = 1024
+
+
+def body(size: int) -> str:
+    """
+    A JSON body of exactly :code:`size` bytes.
+    """
+    return '{"data":"' + "x" * max(0, size - 11) + '"}'
+
+
+def attributes(count: int) -> dict:
+    """
+    Message attributes of mixed string, number and list values.
+    """
+    values = {}
+    for i in range(count):
+        if i % 3 == 0:
+            values[f"attribute_{i}"] = f"value-{i}"
+        elif i % 3 == 1:
+            values[f"attribute_{i}"] = i
+        else:
+            values[f"attribute_{i}"] = ["a", str(i)]
+    return values
+
+
+def received(sns_client, size: int, count: int) -> dict:
+    """
+    A message as returned by :code:`receive_message`.
+    """
+    message = sns_client.create_message(
+        event="Benchmark", message=body(size), **attributes(count)
+    )
+    return {
+        "MessageId": "0c3e5ab4-0a36-4b6a-9ae6-8a1c4b5f2f3e",
+        "ReceiptHandle": "handle",
+        "MD5OfBody": "",
+        "Body": message.message,
+        "Attributes": {"SentTimestamp": "1600000000000"},
+        "MessageAttributes": message.message_attributes,
+    }
+
+
+def operations(sizes: Sequence[int], counts: Sequence[int]) -> Iterator[tuple]:
+    """
+    The benchmarked operations.
+
+    :return: Tuples of the operation name, body size, attribute count and
+        the operation.
+    """
+    from iniesta.sns import SNSClient, SNSMessage
+    from iniesta.sqs import SQSMessage
+
+    sns_client = SNSClient("arn:aws:sns:us-east-1:000000000000:benchmarks")
+    sqs_client = None
+
+    for size in sizes:
+        for count in counts:
+            values, payload = attributes(count), body(size)
+            yield "create_message", size, count, functools.partial(
+                SNSMessage.create_message,
+                sns_client,
+                event="Benchmark",
+                message=payload,
+                **values,
+            )
+
+            message = SNSMessage.create_message(
+                sns_client, event="Benchmark", message=payload, **values
+            )
+            yield "size", size, count, lambda m=message: m.size
+
+            raw = received(sns_client, size, count)
+            yield "from_sqs", size, count, functools.partial(
+                SQSMessage.from_sqs, sqs_client, raw
+            )
+
+        parsed = SQSMessage.from_sqs(sqs_client, received(sns_client, size, 0))
+        yield "body", size, 0, lambda m=parsed: m.body
+
+    for count in counts:
+        values = list(attributes(count).items())
+        if values:
+            target = SNSMessage(body(DEFAULT_SIZE))
+
+            def add_attributes(target=target, values=values):
+                for name, value in values:
+                    target.add_attribute(name, value)
+
+            yield "add_attribute", DEFAULT_SIZE, count, add_attributes
+
+        parsed = SQSMessage.from_sqs(
+            sqs_client, received(sns_client, DEFAULT_SIZE, count)
+        )
+        yield "message_attributes", DEFAULT_SIZE, count, (
+            lambda m=parsed: m.message_attributes
+        )
+
+    target = SNSMessage(body(DEFAULT_SIZE))
+    yield "add_event", DEFAULT_SIZE, 0, functools.partial(
+        target.add_event, "Benchmark"
+    )
+
+
+def allocations(operation: Callable, number: int = 100) -> dict:
+    """
+    Measures the memory allocated by an operation.
+
+    :return: The bytes and blocks that remain allocated by the result of
+        an operation, and the peak bytes allocated while it runs.
+    """
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot().filter_traces(ignore)
+        results = [operation() for _ in range(number)]
+        after = tracemalloc.take_snapshot().filter_traces(ignore)
+        del results
+    finally:
+        tracemalloc.stop()
+
+    differences = after.compare_to(before, "filename")
+    retained_bytes = sum(d.size_diff for d in differences) / number
+    retained_blocks = sum(d.count_diff for d in differences) / number
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        operation()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "retained_bytes": retained_bytes,
+        "retained_blocks": retained_blocks,
+        "peak_bytes": peak - baseline,
+    }
+
+
+def run(
+    *,
+    sizes: Sequence[int] = SIZES,
+    counts: Sequence[int] = ATTRIBUTE_COUNTS,
+    repeat: int = 5,
+    only: Optional[List[str]] = None,
+) -> List[dict]:
+    """
+    Runs the micro benchmarks.
+
+    :param sizes: The body sizes in bytes.
+    :param counts: The numbers of message attributes.
+    :param repeat: The repetitions of each benchmark.
+    :param only: Only runs the operations with these names.
+    """
+    results = []
+    for name, size, count, operation in operations(sizes, counts):
+        if only and name not in only:
+            continue
+
+        timer = timeit.Timer(operation)
+        number, _ = timer.autorange()
+        samples = timer.repeat(repeat, number)
+        result = summarize(
+            f"{name}[size={size},attributes={count}]",
+            number,
+            samples,
+            operation=name,
+            size=size,
+            attributes=count,
+            per_operation=min(samples) / number,
+            **allocations(operation),
+        )
+        results.append(result)
+        click.echo(
+            f"{format_result(result)} "
+            f"{result['per_operation'] * 1e6:.2f} us/op "
+            f"{result['retained_bytes']:.0f} B retained "
+            f"{result['peak_bytes']} B peak",
+            err=True,
+        )
+    return results
+
+
+@click.command()
+@click.option(
+    "--size",
+    "sizes",
+    multiple=True,
+    type=int,
+    help="Body size in bytes. Can be repeated. Defaults to 100 B to 256 KiB.",
+)
+@click.option(
+    "--attributes",
+    "counts",
+    multiple=True,
+    type=int,
+    help="Number of message attributes. Can be repeated. Defaults to 0-10.",
+)
+@click.option("-r", "--repeat", default=5, show_default=True, type=int)
+@click.option(
+    "-b",
+    "--benchmark",
+    "only",
+    multiple=True,
+    help="Only run this operation, e.g. from_sqs. Can be repeated.",
+)
+@click.option(
+    "-o", "--output", default="-", help="Results file. Defaults to stdout."
+)
+def main(output, sizes, counts, repeat, only):
+    """
+    Runs the micro benchmarks of building and parsing messages.
+    """
+    configure()
+
+    sizes = sizes or SIZES
+    counts = counts or ATTRIBUTE_COUNTS
+    results = run(sizes=sizes, counts=counts, repeat=repeat, only=only)
+    write_results(
+        output,
+        "messages",
+        results,
+        sizes=list(sizes),
+        attributes=list(counts),
+        repeat=repeat,
+        service_name=settings.SERVICE_NAME,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import datetime
+import platform
+import statistics
+import subprocess
+import sys
+
+from typing import List, Optional
+
+import ujson as json
+
+
+def _commit() -> Optional[str]:
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL
+            )
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment() -> dict:
+    """
+    Where the benchmarks ran, to tell results apart.
+    """
+    from iniesta import __version__
+
+    return {
+        "commit": _commit(),
+        "iniesta": __version__,
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+    }
+
+
+def summarize(name: str, count: int, samples: List[float], **extra) -> dict:
+    """
+    Summarizes the seconds it took to process :code:`count` operations
+    in each repetition of a benchmark.
+
+    :param name: The name of the benchmark.
+    :param count: The number of operations (e.g. messages) per repetition.
+    :param samples: The seconds of each repetition.
+    :param extra: Other values to include in the results.
+    """
+    median = statistics.median(samples)
+    return {
+        "name": name,
+        "count": count,
+        "repeat": len(samples),
+        "samples": samples,
+        "min": min(samples),
+        "median": median,
+        "max": max(samples),
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "per_second": count / median if median else 0.0,
+        **extra,
+    }
+
+
+def write_results(
+    path: Optional[str], suite: str, results: List[dict], **parameters
+) -> dict:
+    """
+    Writes the results of a suite as JSON to :code:`path` (or stdout
+    if :code:`path` is :code:`None` or :code:`"-"`).
+
+    :return: The written document.
+    """
+    document = {
+        "suite": suite,
+        "environment": environment(),
+        "parameters": parameters,
+        "benchmarks": {result["name"]: result for result in results},
+    }
+    output = json.dumps(document, indent=2)
+    if path is None or path == "-":
+        print(output)
+    else:
+        with open(path, "w") as file:
+            file.write(output + "\n")
+    return document
+
+
+def format_result(result: dict) -> str:
+    """
+    A single line summary of a result for the console.
+    """
+    return (
+        f"{result['name']:<44} {result['per_second']:>12.1f}/s "
+        f"median {result['median'] * 1000:>10.2f} ms "
+        f"(min {result['min'] * 1000:.2f}, max {result['max'] * 1000:.2f})"
+    )
@@ -0,0 +1,435 @@
+"""
+End to end throughput benchmarks of publishing and consuming events.
+
+Runs in process on :code:`iniesta.memory` by default, which leaves
+iniesta's own costs, or against a SNS/SQS endpoint such as a local moto
+server with :code:`--endpoint-url`.
+
+.. code-block:: sh
+
+    $ python -m benchmarks.throughput -o results.json
+    $ python -m benchmarks.throughput --endpoint-url http://localhost:4566 -o moto.json
+    $ python -m benchmarks.compare base.json results.json
+"""
+import asyncio
+import functools
+import time
+import uuid
+
+from typing import Awaitable, Callable, List, Optional
+
+import click
+
+from insanic.conf import settings
+
+from . import configure
+from .results import format_result, summarize, write_results
+
+#: The event published and handled by the benchmarks.
+EVENT: str = "Benchmark"
+
+
+def payload(size: int) -> dict:
+    """
+    A message body of about :code:`size` bytes when serialized.
+    """
+    return {"data": "x" * max(0, size - 12)}
+
+
+class NullLockManager:
+    """
+    A lock manager that doesn't lock, to measure the overhead of locking.
+    """
+
+    class Lock:
+        valid = True
+
+    async def lock(self, resource: str, *args, **kwargs):
+        return self.Lock()
+
+    async def unlock(self, lock) -> None:
+        pass
+
+    async def destroy(self) -> None:
+        pass
+
+
+class Environment:
+    """
+    A topic and a queue subscribed to it, created for a single run and
+    deleted afterwards.
+
+    :param endpoint_url: The SNS and SQS endpoint. In memory if :code:`None`.
+    """
+
+    def __init__(self, endpoint_url: Optional[str] = None) -> None:
+        self.endpoint_url = endpoint_url
+        self.name = f"iniesta-benchmarks-{uuid.uuid4().hex[:12]}"
+        self.topic_arn = None
+        self.queue_url = None
+
+    def _client(self, service: str):
+        from iniesta.sessions import BotoSession
+
+        return BotoSession.get_session().create_client(
+            service,
+            region_name=BotoSession.aws_default_region,
+            endpoint_url=self.endpoint_url,
+            aws_access_key_id=BotoSession.aws_access_key_id,
+            aws_secret_access_key=BotoSession.aws_secret_access_key,
+        )
+
+    async def __aenter__(self) -> "Environment":
+        from iniesta.memory import InMemorySession
+        from iniesta.sessions import BotoSession
+        from iniesta.sns import SNSClient
+        from iniesta.sqs import SQSClient
+
+        BotoSession.set_session(
+            InMemorySession() if self.endpoint_url is None else None
+        )
+
+        async with self._client("sns") as sns:
+            response = await sns.create_topic(Name=self.name)
+            self.topic_arn = response["TopicArn"]
+        async with self._client("sqs") as sqs:
+            response = await sqs.create_queue(QueueName=self.name)
+            self.queue_url = response["QueueUrl"]
+            response = await sqs.get_queue_attributes(
+                QueueUrl=self.queue_url, AttributeNames=["QueueArn"]
+            )
+            queue_arn = response["Attributes"]["QueueArn"]
+        async with self._client("sns") as sns:
+            await sns.subscribe(
+                TopicArn=self.topic_arn,
+                Protocol="sqs",
+                Endpoint=queue_arn,
+                Attributes={"RawMessageDelivery": "true"},
+            )
+
+        SQSClient.queue_urls[self.name] = self.queue_url
+        self.sns_client = SNSClient(
+            self.topic_arn, endpoint_url=self.endpoint_url
+        )
+        self.sqs_client = SQSClient(
+            queue_name=self.name, endpoint_url=self.endpoint_url
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        from iniesta.sqs import SQSClient
+
+        SQSClient.queue_urls.pop(self.name, None)
+        async with self._client("sqs") as sqs:
+            await sqs.delete_queue(QueueUrl=self.queue_url)
+        async with self._client("sns") as sns:
+            await sns.delete_topic(TopicArn=self.topic_arn)
+
+    async def fill(self, count: int, size: int) -> None:
+        """
+        Sends messages of the benchmark event directly to the queue.
+        """
+        attributes = self.sns_client.create_message(
+            event=EVENT, message={}
+        ).message_attributes
+        body = self.sns_client.create_message(
+            event=EVENT, message=payload(size)
+        ).message
+
+        async with self._client("sqs") as sqs:
+            for start in range(0, count, 10):
+                await sqs.send_message_batch(
+                    QueueUrl=self.queue_url,
+                    Entries=[
+                        {
+                            "Id": str(i),
+                            "MessageBody": body,
+                            "MessageAttributes": attributes,
+                        }
+                        for i in range(min(10, count - start))
+                    ],
+                )
+
+
+async def _gather_limited(coroutines: List[Awaitable], concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*[limited(c) for c in coroutines])
+
+
+async def publish(env: Environment, count: int, size: int, concurrency: int):
+    """
+    Creates and publishes every message with :code:`SNSMessage.publish`.
+
+    :return: The elapsed seconds.
+    """
+    body = payload(size)
+
+    start = time.perf_counter()
+    await _gather_limited(
+        [
+            env.sns_client.create_message(event=EVENT, message=body).publish()
+            for _ in range(count)
+        ],
+        concurrency,
+    )
+    return time.perf_counter() - start
+
+
+async def publish_batch(
+    env: Environment, count: int, size: int, concurrency: int
+):
+    """
+    Creates messages and publishes them in batches of 10 with
+    :code:`SNSClient.publish_batch`.
+
+    :return: The elapsed seconds.
+    """
+    from iniesta.sns.client import MAX_BATCH_SIZE
+
+    body = payload(size)
+
+    start = time.perf_counter()
+    async with env.sns_client._create_client() as client:
+        batches = []
+        for offset in range(0, count, MAX_BATCH_SIZE):
+            batch = [
+                env.sns_client.create_message(event=EVENT, message=body)
+                for _ in range(min(MAX_BATCH_SIZE, count - offset))
+            ]
+            batches.append(env.sns_client.publish_batch(client, batch))
+        await _gather_limited(batches, concurrency)
+    return time.perf_counter() - start
+
+
+async def consume(
+    env: Environment,
+    count: int,
+    size: int,
+    handler: Callable[[], Awaitable],
+    *,
+    lock_manager=None,
+    timeout: float = 300,
+):
+    """
+    Fills the queue and handles every message with :code:`SQSClient._poll`.
+
+    :return: The seconds until the last message was handled.
+    """
+    await env.fill(count, size)
+
+    client = env.sqs_client
+    if lock_manager is not None:
+        client.lock_manager = lock_manager
+
+    handled = 0
+    finished = asyncio.Event()
+
+    async def handle(message):
+        nonlocal handled
+        await handler()
+        handled += 1
+        if handled == count:
+            finished.set()
+
+    client.add_handler(handle, f"{EVENT}.{settings.SERVICE_NAME}")
+
+    start = time.perf_counter()
+    client.start_receiving_messages()
+    try:
+        await asyncio.wait_for(finished.wait(), timeout)
+        return time.perf_counter() - start
+    finally:
+        await client.stop_receiving_messages()
+        await asyncio.gather(client._polling_task, return_exceptions=True)
+
+
+async def noop() -> None:
+    pass
+
+
+def sleeping(seconds: float) -> Callable[[], Awaitable]:
+    async def handler():
+        await asyncio.sleep(seconds)
+
+    return handler
+
+
+def cpu_bound(iterations: int) -> Callable[[], Awaitable]:
+    async def handler():
+        sum(i * i for i in range(iterations))
+
+    return handler
+
+
+def _lock_manager(redis: bool):
+    if redis:
+        # the lock manager created from INSANIC_CACHES
+        return None
+    from iniesta.sqs.replay import LocalLockManager
+
+    return LocalLockManager()
+
+
+async def _repeat(endpoint_url, repeat, benchmark, *args, lock_factory=None):
+    samples = []
+    for _ in range(repeat):
+        async with Environment(endpoint_url) as env:
+            kwargs = {}
+            if lock_factory is not None:
+                kwargs["lock_manager"] = lock_factory()
+            samples.append(await benchmark(env, *args, **kwargs))
+    return samples
+
+
+async def run(
+    *,
+    endpoint_url: Optional[str] = None,
+    messages: int = 1000,
+    size: int = 1024,
+    concurrency: int = 10,
+    repeat: int = 3,
+    sleep: float = 0.01,
+    cpu: int = 10000,
+    redis: bool = False,
+    only: Optional[List[str]] = None,
+) -> List[dict]:
+    """
+    Runs the benchmarks.
+
+    :param endpoint_url: The SNS and SQS endpoint. In memory if :code:`None`.
+    :param messages: The number of messages per repetition.
+    :param size: The size of the message bodies in bytes.
+    :param concurrency: The number of concurrent publishes.
+    :param repeat: The repetitions of each benchmark.
+    :param sleep: Seconds the sleeping handler sleeps.
+    :param cpu: Iterations of the CPU bound handler.
+    :param redis: Locks messages with Redis (from :code:`INSANIC_CACHES`)
+        instead of in process.
+    :param only: Only runs the benchmarks with these names.
+    """
+    benchmarks = {
+        "publish": (publish, size, concurrency),
+        "publish_batch": (publish_batch, size, concurrency),
+        "consume_noop": (consume, size, noop),
+        "consume_sleep": (consume, size, sleeping(sleep)),
+        "consume_cpu": (consume, size, cpu_bound(cpu)),
+        "consume_noop_unlocked": (consume, size, noop),
+    }
+
+    results = []
+    for name, (benchmark, *args) in benchmarks.items():
+        if only and name not in only:
+            continue
+        lock_factory = None
+        if benchmark is consume:
+            lock_factory = (
+                NullLockManager
+                if name.endswith("_unlocked")
+                else functools.partial(_lock_manager, redis)
+            )
+        samples = await _repeat(
+            endpoint_url,
+            repeat,
+            benchmark,
+            messages,
+            *args,
+            lock_factory=lock_factory,
+        )
+        results.append(summarize(name, messages, samples))
+        click.echo(format_result(results[-1]), err=True)
+
+    by_name = {result["name"]: result for result in results}
+    if "consume_noop" in by_name and "consume_noop_unlocked" in by_name:
+        overhead = (
+            by_name["consume_noop"]["median"]
+            - by_name["consume_noop_unlocked"]["median"]
+        ) / messages
+        results.append(
+            {
+                "name": "lock_overhead",
+                "count": messages,
+                "per_message": overhead,
+                "per_second": 1 / overhead if overhead > 0 else 0.0,
+            }
+        )
+        click.echo(
+            f"{'lock_overhead':<32} {overhead * 1e6:>12.1f} us/message",
+            err=True,
+        )
+    return results
+
+
+@click.command()
+@click.option(
+    "--endpoint-url",
+    default=None,
+    help="SNS and SQS endpoint, e.g. a moto server. In process if not set.",
+)
+@click.option(
+    "-n", "--messages", default=1000, show_default=True, type=int,
+)
+@click.option(
+    "-s",
+    "--size",
+    default=1024,
+    show_default=True,
+    type=int,
+    help="Message body size in bytes.",
+)
+@click.option(
+    "-c",
+    "--concurrency",
+    default=10,
+    show_default=True,
+    type=int,
+    help="Concurrent publishes.",
+)
+@click.option("-r", "--repeat", default=3, show_default=True, type=int)
+@click.option(
+    "--sleep",
+    default=0.01,
+    show_default=True,
+    type=float,
+    help="Seconds the sleeping handler sleeps.",
+)
+@click.option(
+    "--cpu",
+    default=10000,
+    show_default=True,
+    type=int,
+    help="Iterations of the CPU bound handler.",
+)
+@click.option(
+    "--redis", is_flag=True, help="Lock messages with Redis from settings.",
+)
+@click.option(
+    "-b",
+    "--benchmark",
+    "only",
+    multiple=True,
+    help="Only run this benchmark. Can be repeated.",
+)
+@click.option(
+    "-o", "--output", default="-", help="Results file. Defaults to stdout."
+)
+def main(output, **options):
+    """
+    Runs the end to end throughput benchmarks.
+    """
+    configure()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    results = loop.run_until_complete(run(**options))
+
+    parameters = {k: v for k, v in options.items() if k != "only"}
+    write_results(output, "throughput", results, **parameters)
+
+
+if __name__ == "__main__":
+    main()
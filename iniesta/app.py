@@ -8,6 +8,7 @@ from sanic.config import Config
 from . import config
 from .choices import InitializationTypes
 from .listeners import IniestaListener
+from .metrics import PrometheusExporter, statsd_exporter
 from .utils import filter_list_to_filter_policies
 
 
@@ -122,6 +123,32 @@ class _Iniesta(object):
             initialization_method(app)
             self.initialization_type = choice
 
+        self._init_metrics(app)
+
+    def _init_metrics(self, app: Insanic) -> None:
+        """
+        Attaches the exporters of the metrics that are configured.
+
+        Actions:
+
+            - Adds a route for Prometheus if INIESTA_METRICS_ROUTE is set
+            - Attaches listeners to send to StatsD if INIESTA_METRICS_STATSD_ADDRESS is set
+        """
+        if app.config.INIESTA_DRY_RUN:
+            return
+
+        if app.config.INIESTA_METRICS_ROUTE:
+            PrometheusExporter().attach(app, app.config.INIESTA_METRICS_ROUTE)
+
+        exporter = statsd_exporter(app.config)
+        if exporter is not None:
+            app.register_listener(
+                exporter.after_server_start, "after_server_start"
+            )
+            app.register_listener(
+                exporter.before_server_stop, "before_server_stop"
+            )
+
     def _init_custom(self, app: Insanic) -> None:
         """
         Initializes the application for custom use.
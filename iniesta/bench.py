@@ -0,0 +1,432 @@
+"""
+Load generation for soak tests of producers and consumers, used by
+:code:`iniesta bench publish` and :code:`iniesta bench consume`.
+
+:code:`publish` creates and publishes events with :code:`SNSClient` at a
+target rate with payload sizes drawn from a distribution. :code:`consume`
+runs the consumer pipeline of :code:`SQSClient` with a synthetic handler
+whose latency is drawn from a distribution. Both report the achieved
+rate, latency percentiles, in flight counts and the memory of the
+process every interval, so saturation and leaks show up over time.
+
+Both run against any SNS and SQS endpoint, e.g. a local moto server or
+localstack, or in process on :code:`iniesta.memory` with :code:`in_memory`.
+"""
+import asyncio
+import random
+import resource
+import sys
+import time
+
+from typing import Callable, Dict, List, Optional
+
+from iniesta.metrics import LatencyHistogram
+from iniesta.sqs.limits import TokenBucket
+
+#: The event published by :code:`publish`.
+EVENT: str = "Benchmark"
+
+
+class Distribution:
+    """
+    Random values, e.g. of payload sizes or handler latencies, parsed from
+    a specification:
+
+    - :code:`1024`: always 1024.
+    - :code:`uniform:100,10000`: uniformly between 100 and 10000.
+    - :code:`normal:1024,256`: normally distributed with the mean and
+      standard deviation. Negative values are 0.
+    - :code:`exponential:0.05`: exponentially distributed with the mean.
+    - :code:`choice:100=8,65536=2`: one of the values, with relative weights.
+
+    :param spec: The specification.
+    :param rng: The random number generator, to reproduce runs.
+    :raises ValueError: If the specification is invalid.
+    """
+
+    def __init__(self, spec: str, rng: Optional[random.Random] = None):
+        self.spec = spec
+        self.rng = rng or random.Random()
+        self._sample = self._parse(spec)
+
+    def _parse(self, spec: str) -> Callable[[], float]:
+        kind, _, arguments = spec.partition(":")
+        try:
+            if not arguments:
+                value = float(kind)
+                if value < 0:
+                    raise ValueError
+                return lambda: value
+            if kind == "choice":
+                return self._choice(arguments)
+            values = [float(v) for v in arguments.split(",")]
+        except ValueError:
+            raise ValueError(f"Invalid distribution: {spec}") from None
+
+        if kind == "uniform" and len(values) == 2 and min(values) >= 0:
+            low, high = sorted(values)
+            return lambda: self.rng.uniform(low, high)
+        if kind == "normal" and len(values) == 2 and values[1] >= 0:
+            mean, stdev = values
+            return lambda: max(0.0, self.rng.gauss(mean, stdev))
+        if kind == "exponential" and len(values) == 1 and values[0] > 0:
+            rate = 1 / values[0]
+            return lambda: self.rng.expovariate(rate)
+        raise ValueError(f"Invalid distribution: {spec}")
+
+    def _choice(self, arguments: str) -> Callable[[], float]:
+        values, weights = [], []
+        for choice in arguments.split(","):
+            value, _, weight = choice.partition("=")
+            values.append(float(value))
+            weights.append(float(weight or 1))
+        if min(values) < 0 or min(weights) < 0 or not sum(weights):
+            raise ValueError
+        return lambda: self.rng.choices(values, weights)[0]
+
+    def sample(self) -> float:
+        return self._sample()
+
+    def __str__(self) -> str:
+        return self.spec
+
+
+def memory_usage() -> int:
+    """
+    The resident set size of the process in bytes. Where
+    :code:`/proc` isn't available, the peak resident set size.
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _task_count() -> int:
+    all_tasks = getattr(asyncio, "all_tasks", None) or asyncio.Task.all_tasks
+    return len(all_tasks())
+
+
+class BenchStats:
+    """
+    The progress of a bench run. Latencies are counted for the whole run
+    and for the current interval, which :code:`snapshot` starts anew.
+    """
+
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+        self.completed = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.peak_memory = 0
+        self.latency = LatencyHistogram()
+        #: Seconds from sending to handling messages, when consuming.
+        self.lag = LatencyHistogram()
+        self.snapshots: List[dict] = []
+
+        self._interval_started = self.started
+        self._interval_latency = LatencyHistogram()
+        self._interval_errors = 0
+        self._interval_max_in_flight = 0
+
+    def begin(self) -> None:
+        self.in_flight += 1
+        if self.in_flight > self._interval_max_in_flight:
+            self._interval_max_in_flight = self.in_flight
+            if self.in_flight > self.max_in_flight:
+                self.max_in_flight = self.in_flight
+
+    def end(self, seconds: float, error: bool = False) -> None:
+        self.in_flight -= 1
+        self.completed += 1
+        self.latency.observe(seconds)
+        self._interval_latency.observe(seconds)
+        if error:
+            self.errors += 1
+            self._interval_errors += 1
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def throughput(self) -> float:
+        """
+        Completed operations per second.
+        """
+        elapsed = self.elapsed
+        return self.completed / elapsed if elapsed else 0.0
+
+    def snapshot(self, **extra) -> dict:
+        """
+        Records the state of the current interval and starts the next.
+
+        :param extra: Other values to include, e.g. metrics of the client.
+        """
+        now = time.monotonic()
+        duration = now - self._interval_started
+        memory = memory_usage()
+        self.peak_memory = max(self.peak_memory, memory)
+
+        snapshot = {
+            "elapsed": now - self.started,
+            "completed": self.completed,
+            "rate": (
+                self._interval_latency.count / duration if duration else 0.0
+            ),
+            "errors": self._interval_errors,
+            "latency": self._interval_latency.metrics,
+            "in_flight": self.in_flight,
+            "max_in_flight": self._interval_max_in_flight,
+            "memory": memory,
+            "tasks": _task_count(),
+            **extra,
+        }
+        self.snapshots.append(snapshot)
+
+        self._interval_started = now
+        self._interval_latency = LatencyHistogram()
+        self._interval_errors = 0
+        self._interval_max_in_flight = self.in_flight
+        return snapshot
+
+    @property
+    def summary(self) -> dict:
+        summary = {
+            "elapsed": self.elapsed,
+            "completed": self.completed,
+            "rate": self.throughput,
+            "errors": self.errors,
+            "latency": self.latency.metrics,
+            "max_in_flight": self.max_in_flight,
+            "peak_memory": self.peak_memory,
+        }
+        if self.lag.count:
+            summary["lag"] = self.lag.metrics
+        return summary
+
+
+def payload(size: int) -> dict:
+    """
+    A message body of about :code:`size` bytes when serialized.
+    """
+    return {"data": "x" * max(0, size - 12)}
+
+
+async def _report(
+    stats: BenchStats,
+    interval: float,
+    report: Optional[Callable[[dict], None]],
+    extra: Callable[[], dict],
+) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        snapshot = stats.snapshot(**extra())
+        if report is not None:
+            report(snapshot)
+
+
+async def _run(
+    stats: BenchStats,
+    load,
+    *,
+    interval: float,
+    report: Optional[Callable[[dict], None]],
+    extra: Callable[[], dict] = dict,
+) -> BenchStats:
+    reporter = asyncio.ensure_future(_report(stats, interval, report, extra))
+    try:
+        await load
+    finally:
+        reporter.cancel()
+        stats.finished = time.monotonic()
+
+    # a last interval much shorter than the others would report a
+    # meaningless rate
+    if (
+        not stats.snapshots
+        or stats.finished - stats._interval_started >= interval / 10
+    ):
+        snapshot = stats.snapshot(**extra())
+        if report is not None:
+            report(snapshot)
+    return stats
+
+
+async def publish(
+    sns_client,
+    *,
+    rate: float,
+    payload_size: Distribution,
+    duration: Optional[float] = None,
+    max_events: Optional[int] = None,
+    concurrency: int = 100,
+    event: str = EVENT,
+    interval: float = 5.0,
+    report: Optional[Callable[[dict], None]] = None,
+) -> BenchStats:
+    """
+    Creates and publishes events with :code:`SNSMessage.publish` at a
+    target rate until the duration passed or :code:`max_events` were
+    published. Latency is the time to create and publish an event.
+
+    :param sns_client: The client of the topic to publish to.
+    :param rate: The target number of events per second.
+    :param payload_size: The distribution of the body sizes in bytes.
+    :param duration: Seconds to publish for. Until :code:`max_events`
+        were published if :code:`None`.
+    :param max_events: The number of events to publish.
+    :param concurrency: The maximum number of publishes in flight. The
+        achieved rate drops below the target once it is reached.
+    :param event: The event to publish.
+    :param interval: Seconds between reports.
+    :param report: Called with a snapshot every interval and at the end.
+    """
+    if duration is None and max_events is None:
+        raise ValueError("Either duration or max_events is required.")
+
+    stats = BenchStats()
+    bucket = TokenBucket(rate, capacity=max(1.0, rate / 10))
+    semaphore = asyncio.Semaphore(concurrency)
+    deadline = None if duration is None else stats.started + duration
+
+    async def publish_one(size: int) -> None:
+        stats.begin()
+        start = time.perf_counter()
+        error = False
+        try:
+            message = sns_client.create_message(
+                event=event, message=payload(size)
+            )
+            await message.publish()
+        except Exception:
+            error = True
+        finally:
+            stats.end(time.perf_counter() - start, error)
+            semaphore.release()
+
+    async def load() -> None:
+        pending = set()
+        sent = 0
+        while (deadline is None or time.monotonic() < deadline) and (
+            max_events is None or sent < max_events
+        ):
+            await bucket.acquire()
+            await semaphore.acquire()
+            task = asyncio.ensure_future(
+                publish_one(int(payload_size.sample()))
+            )
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+            sent += 1
+        if pending:
+            await asyncio.gather(*pending)
+
+    return await _run(stats, load(), interval=interval, report=report)
+
+
+def _consumer_metrics(sqs_client) -> dict:
+    metrics = sqs_client.metrics
+    return {
+        key: metrics[key]
+        for key in ("receives", "empty_receive_ratio", "receive_concurrency")
+        if key in metrics
+    }
+
+
+async def consume(
+    sqs_client,
+    *,
+    latency: Distribution,
+    duration: Optional[float] = None,
+    max_messages: Optional[int] = None,
+    error_rate: float = 0.0,
+    interval: float = 5.0,
+    report: Optional[Callable[[dict], None]] = None,
+) -> BenchStats:
+    """
+    Receives and handles messages with the consumer pipeline of
+    :code:`SQSClient` and a synthetic handler of every event until the
+    duration passed or :code:`max_messages` were handled. Latency is the
+    time spent in the handler, lag the time since a message was published.
+
+    :param sqs_client: The client of the queue to consume.
+    :param latency: The distribution of the handler latencies in seconds.
+    :param duration: Seconds to consume for. Until :code:`max_messages`
+        were handled if :code:`None`.
+    :param max_messages: The number of messages to handle.
+    :param error_rate: The fraction of messages the handler fails, which
+        are received again after their visibility timeout.
+    :param interval: Seconds between reports.
+    :param report: Called with a snapshot every interval and at the end.
+    """
+    if duration is None and max_messages is None:
+        raise ValueError("Either duration or max_messages is required.")
+
+    stats = BenchStats()
+    finished = asyncio.Event()
+
+    async def handler(message) -> None:
+        stats.begin()
+        published_at = message.published_at
+        if published_at is not None:
+            stats.lag.observe(max(0.0, time.time() - published_at))
+
+        start = time.perf_counter()
+        error = error_rate > 0 and latency.rng.random() < error_rate
+        try:
+            await asyncio.sleep(latency.sample())
+            if error:
+                raise RuntimeError("Synthetic handler error.")
+        finally:
+            stats.end(time.perf_counter() - start, error)
+            if max_messages is not None and stats.completed >= max_messages:
+                finished.set()
+
+    async def load() -> None:
+        sqs_client.add_handler(handler)
+        sqs_client.start_receiving_messages()
+        try:
+            await asyncio.wait_for(finished.wait(), duration)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            await sqs_client.stop_receiving_messages()
+            await asyncio.gather(
+                sqs_client._polling_task, return_exceptions=True
+            )
+
+    return await _run(
+        stats,
+        load(),
+        interval=interval,
+        report=report,
+        extra=lambda: _consumer_metrics(sqs_client),
+    )
+
+
+def in_memory(name: str = "iniesta-bench") -> Dict[str, str]:
+    """
+    Sets an :code:`InMemorySession` as the session, with a topic and a
+    queue of the name subscribed to it with raw message delivery.
+
+    :return: The :code:`topic_arn`, :code:`queue_name` and
+        :code:`queue_url`.
+    """
+    from iniesta.memory import InMemorySession
+    from iniesta.sessions import BotoSession
+    from iniesta.sqs import SQSClient
+
+    session = InMemorySession()
+    BotoSession.set_session(session)
+
+    topic = session.backend.create_topic(name)
+    queue = session.backend.create_queue(name)
+    session.backend.subscribe(topic.arn, queue.arn, raw_message_delivery=True)
+    SQSClient.queue_urls[name] = queue.url
+
+    return {"topic_arn": topic.arn, "queue_name": name, "queue_url": queue.url}
@@ -4,6 +4,7 @@
 
 import asyncio
 import click
+import gzip
 import importlib
 import logging
 import json
@@ -178,3 +179,784 @@ def send(message):
     click.echo(f"MessageId: {message.message_id}")
 
     Iniesta.unload_config(settings)
+
+
+def parse_queues(queues: tuple) -> dict:
+    """
+    Parses :code:`name` or :code:`name:weight` queue options.
+    """
+    parsed = {}
+    for queue in queues:
+        name, _, weight = queue.partition(":")
+        try:
+            parsed[name] = float(weight) if weight else 1.0
+        except ValueError:
+            raise click.BadParameter(f"Invalid weight for {name}: {weight}")
+    return parsed
+
+
+@cli.command()
+@click.option(
+    "-n",
+    "--processes",
+    required=False,
+    type=int,
+    default=os.cpu_count,
+    help="Number of consumer processes. Defaults to the number of CPUs.",
+)
+@click.option(
+    "-q",
+    "--queue",
+    "queues",
+    required=False,
+    multiple=True,
+    type=str,
+    help="Queue to consume as NAME or NAME:WEIGHT. Can be repeated. "
+    "Defaults to the default queue of the service.",
+)
+@click.option(
+    "-m",
+    "--module",
+    "modules",
+    required=False,
+    multiple=True,
+    type=str,
+    help="Module that registers the handlers. Can be repeated. "
+    "Defaults to {SERVICE_NAME}.app",
+)
+@click.option(
+    "--drain-timeout",
+    required=False,
+    type=float,
+    default=30,
+    help="Seconds a process may take to finish in flight messages on SIGTERM.",
+)
+def worker(processes, queues, modules, drain_timeout):
+    """
+    Consumes messages in separate processes without running the web server.
+    """
+    from iniesta.worker import WorkerSupervisor, load_handlers
+
+    logging.disable(logging.NOTSET)
+    logging.basicConfig(level=logging.INFO)
+
+    Iniesta.load_config(settings)
+
+    load_handlers(modules or [f"{settings.SERVICE_NAME}.app"])
+    queues = parse_queues(queues) or {SQSClient.default_queue_name(): 1.0}
+
+    click.echo(f"Starting {processes} worker(s) consuming {', '.join(queues)}")
+    supervisor = WorkerSupervisor(
+        queues, processes=processes, drain_timeout=drain_timeout
+    )
+    supervisor.run()
+
+    Iniesta.unload_config(settings)
+
+
+@cli.command()
+@click.option(
+    "-q",
+    "--queue",
+    required=False,
+    type=str,
+    help="Queue to drain. Defaults to the default queue of the service.",
+)
+@click.option(
+    "-o",
+    "--output",
+    required=True,
+    type=click.Path(dir_okay=False, writable=True),
+    help="NDJSON file to write. Compressed with gzip if it ends with .gz",
+)
+@click.option(
+    "--delete/--no-delete",
+    default=False,
+    help="Delete messages after they are written to disk. Without it, the "
+    "ids of all written messages are kept in memory to skip them when "
+    "they become visible again.",
+)
+@click.option(
+    "-c",
+    "--concurrency",
+    required=False,
+    type=int,
+    default=4,
+    help="Number of concurrent receives.",
+)
+@click.option(
+    "--max-messages",
+    required=False,
+    type=int,
+    help="Stop after this many messages.",
+)
+@click.option(
+    "--idle-timeout",
+    required=False,
+    type=float,
+    default=10,
+    help="Stop when no message was received for this many seconds.",
+)
+def drain(queue, output, delete, concurrency, max_messages, idle_timeout):
+    """
+    Writes the messages of a queue to a NDJSON file.
+    """
+    from iniesta.sqs.drain import drain_queue
+
+    Iniesta.load_config(settings)
+
+    def progress(stats):
+        remaining = "?" if stats.remaining is None else stats.remaining
+        click.echo(
+            f"{stats.written} written, {stats.throughput:.1f} msg/s, "
+            f"~{remaining} remaining",
+            err=True,
+        )
+
+    loop = asyncio.get_event_loop()
+    sqs_client = loop.run_until_complete(SQSClient.initialize(queue_name=queue))
+    stats = loop.run_until_complete(
+        drain_queue(
+            sqs_client,
+            output,
+            delete=delete,
+            concurrency=concurrency,
+            max_messages=max_messages,
+            idle_timeout=idle_timeout,
+            progress=progress,
+        )
+    )
+
+    click.echo(
+        f"Drained {stats.written} message(s) to {output} "
+        f"in {stats.elapsed:.1f}s ({stats.throughput:.1f} msg/s)"
+    )
+    if stats.repeated:
+        click.echo(f"Skipped {stats.repeated} message(s) received again")
+    if delete:
+        click.echo(f"Deleted {stats.deleted} message(s)")
+
+    Iniesta.unload_config(settings)
+
+
+def open_input(path: str):
+    """
+    Opens a text file to read. Paths ending in :code:`.gz` are decompressed.
+    """
+    if path == "-":
+        return click.open_file(path)
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt")
+    return open(path, "r")
+
+
+@cli.command(name="publish-bulk")
+@click.option(
+    "-f",
+    "--file",
+    "path",
+    required=True,
+    type=click.Path(dir_okay=False, allow_dash=True),
+    help="NDJSON file with one event per line. - for stdin",
+)
+@click.option(
+    "-c",
+    "--concurrency",
+    required=False,
+    type=int,
+    default=4,
+    help="Number of concurrent PublishBatch requests.",
+)
+@click.option(
+    "-r",
+    "--rate-limit",
+    required=False,
+    type=float,
+    help="Maximum number of events published per second.",
+)
+@click.option(
+    "--reject-file",
+    required=False,
+    type=click.Path(dir_okay=False, writable=True),
+    default="rejected.ndjson",
+    help="File to write the events that could not be published to.",
+)
+@click.option(
+    "--topic-arn",
+    required=False,
+    type=str,
+    help="Topic to publish to. Defaults to INIESTA_SNS_PRODUCER_GLOBAL_TOPIC_ARN",
+)
+def publish_bulk(path, concurrency, rate_limit, reject_file, topic_arn):
+    """
+    Publishes the events of a NDJSON file into SNS.
+    """
+    from iniesta.sns.bulk import publish_bulk as publish
+
+    Iniesta.load_config(settings)
+
+    rejects = None
+
+    def reject(line, reason):
+        nonlocal rejects
+        if rejects is None:
+            rejects = open(reject_file, "w")
+        rejects.write(json.dumps({"record": line, "error": reason}) + "\n")
+
+    def progress(stats):
+        click.echo(
+            f"{stats.published} published, {stats.rejected} rejected, "
+            f"{stats.throughput:.1f} msg/s",
+            err=True,
+        )
+
+    loop = asyncio.get_event_loop()
+    sns_client = SNSClient(topic_arn)
+    try:
+        with open_input(path) as lines:
+            stats = loop.run_until_complete(
+                publish(
+                    sns_client,
+                    lines,
+                    concurrency=concurrency,
+                    rate_limit=rate_limit,
+                    reject=reject,
+                    progress=progress,
+                )
+            )
+    finally:
+        if rejects is not None:
+            rejects.close()
+
+    click.echo(
+        f"Published {stats.published} event(s) in "
+        f"{stats.batches} batch(es) in {stats.elapsed:.1f}s "
+        f"({stats.throughput:.1f} msg/s)"
+    )
+    if stats.rejected:
+        click.echo(f"Rejected {stats.rejected} event(s) to {reject_file}")
+
+    Iniesta.unload_config(settings)
+
+
+@cli.command()
+@click.option(
+    "--from",
+    "source",
+    required=True,
+    type=str,
+    help="Queue to move messages from.",
+)
+@click.option(
+    "--to", "target", required=True, type=str, help="Queue to move messages to."
+)
+@click.option(
+    "-e",
+    "--event",
+    "events",
+    required=False,
+    multiple=True,
+    type=str,
+    help="Only move messages of this event. Wildcards like User*.user "
+    "are allowed. Can be repeated.",
+)
+@click.option(
+    "-c",
+    "--concurrency",
+    required=False,
+    type=int,
+    default=4,
+    help="Number of concurrent receives and sends.",
+)
+@click.option(
+    "-r",
+    "--rate-limit",
+    required=False,
+    type=float,
+    help="Maximum number of messages moved per second.",
+)
+@click.option(
+    "--max-messages",
+    required=False,
+    type=int,
+    help="Stop after receiving this many messages.",
+)
+@click.option(
+    "--idle-timeout",
+    required=False,
+    type=float,
+    default=10,
+    help="Stop when no message was received for this many seconds.",
+)
+def redrive(
+    source, target, events, concurrency, rate_limit, max_messages, idle_timeout
+):
+    """
+    Moves messages from one queue to another.
+    """
+    from iniesta.sqs.redrive import redrive as move
+
+    Iniesta.load_config(settings)
+
+    def progress(stats):
+        remaining = "?" if stats.remaining is None else stats.remaining
+        click.echo(
+            f"{stats.moved} moved, {stats.skipped} skipped, "
+            f"{stats.failed} failed, {stats.throughput:.1f} msg/s, "
+            f"~{remaining} remaining",
+            err=True,
+        )
+
+    loop = asyncio.get_event_loop()
+    source_client = loop.run_until_complete(
+        SQSClient.initialize(queue_name=source)
+    )
+    target_client = loop.run_until_complete(
+        SQSClient.initialize(queue_name=target)
+    )
+    stats = loop.run_until_complete(
+        move(
+            source_client,
+            target_client,
+            events=events,
+            concurrency=concurrency,
+            rate_limit=rate_limit,
+            max_messages=max_messages,
+            idle_timeout=idle_timeout,
+            progress=progress,
+        )
+    )
+
+    click.echo(
+        f"Moved {stats.moved} message(s) from {source} to {target} "
+        f"in {stats.elapsed:.1f}s ({stats.throughput:.1f} msg/s)"
+    )
+    if stats.skipped:
+        click.echo(f"Skipped {stats.skipped} message(s) of other events")
+    if stats.failed:
+        click.echo(f"Failed to move {stats.failed} message(s)")
+
+    Iniesta.unload_config(settings)
+
+
+@cli.command()
+@click.option(
+    "-f",
+    "--file",
+    "path",
+    required=True,
+    type=click.Path(exists=True, dir_okay=False),
+    help="Trace file recorded with INIESTA_SQS_TRACE_FILE.",
+)
+@click.option(
+    "-q",
+    "--queue",
+    required=False,
+    type=str,
+    help="Queue whose handlers are used. Defaults to the default queue of the service.",
+)
+@click.option(
+    "-m",
+    "--module",
+    "modules",
+    required=False,
+    multiple=True,
+    type=str,
+    help="Module that registers the handlers. Can be repeated. "
+    "Defaults to {SERVICE_NAME}.app",
+)
+@click.option(
+    "-s",
+    "--speed",
+    required=False,
+    type=float,
+    default=0,
+    help="0 to replay as fast as possible, otherwise a factor of the "
+    "recorded speed.",
+)
+@click.option(
+    "-c",
+    "--concurrency",
+    required=False,
+    type=int,
+    default=4,
+    help="Number of concurrent receives when replaying as fast as possible.",
+)
+def replay(path, queue, modules, speed, concurrency):
+    """
+    Handles recorded messages with the registered handlers.
+    """
+    from iniesta.sqs.replay import replay as run
+    from iniesta.worker import load_handlers
+
+    Iniesta.load_config(settings)
+    load_handlers(modules or [f"{settings.SERVICE_NAME}.app"])
+
+    loop = asyncio.get_event_loop()
+    stats = loop.run_until_complete(
+        run(path, queue_name=queue, speed=speed, concurrency=concurrency)
+    )
+
+    click.echo(
+        f"Replayed {stats.messages} message(s) in {stats.elapsed:.2f}s "
+        f"({stats.throughput:.1f} msg/s)"
+    )
+    click.echo(
+        f"Deleted: {stats.transport.deleted}  "
+        f"Errors: {stats.client.handler_errors}  "
+        f"Timeouts: {stats.client.handler_timeouts}"
+    )
+    click.echo("")
+    click.echo(
+        f"{'EVENT':<40} {'COUNT':>8} {'P50 ms':>9} {'P90 ms':>9} "
+        f"{'P99 ms':>9} {'MAX ms':>9}"
+    )
+    for event, summary in stats.events.items():
+        click.echo(
+            f"{event:<40} {summary['count']:>8} "
+            f"{summary['p50'] * 1000:>9.2f} {summary['p90'] * 1000:>9.2f} "
+            f"{summary['p99'] * 1000:>9.2f} {summary['max'] * 1000:>9.2f}"
+        )
+
+    Iniesta.unload_config(settings)
+
+
+@cli.group()
+def bench():
+    """
+    Generates load to soak test producers and consumers.
+    """
+
+
+def distribution_option(ctx, param, value):
+    from iniesta.bench import Distribution
+
+    if value is None:
+        return None
+    try:
+        return Distribution(value, rng=ctx.meta.setdefault("bench_rng", None))
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+def seed_option(ctx, param, value):
+    import random
+
+    ctx.meta["bench_rng"] = random.Random(value)
+    return value
+
+
+def bench_options(func):
+    """
+    The options shared by the bench commands.
+    """
+    options = [
+        click.option(
+            "--endpoint-url",
+            required=False,
+            type=str,
+            help="SNS and SQS endpoint, e.g. a local moto server or localstack.",
+        ),
+        click.option(
+            "--in-memory",
+            is_flag=True,
+            help="Run in process on a topic and queue of iniesta.memory.",
+        ),
+        click.option(
+            "-d",
+            "--duration",
+            required=False,
+            type=float,
+            default=60,
+            help="Seconds to run for. 0 to run until the count is reached.",
+        ),
+        click.option(
+            "-i",
+            "--interval",
+            required=False,
+            type=float,
+            default=5,
+            help="Seconds between reports.",
+        ),
+        click.option(
+            "-o",
+            "--output",
+            required=False,
+            type=click.File("w"),
+            help="NDJSON file to write every report and the summary to.",
+        ),
+        click.option(
+            "--seed",
+            required=False,
+            type=int,
+            is_eager=True,
+            expose_value=False,
+            callback=seed_option,
+            help="Seed of the distributions, to reproduce a run.",
+        ),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+def bench_reporter(output):
+    """
+    Echoes a report line and writes the report to the output, if any.
+    """
+
+    def report(snapshot):
+        latency = snapshot["latency"]
+        click.echo(
+            f"{snapshot['elapsed']:>7.1f}s {snapshot['completed']:>9} done "
+            f"{snapshot['rate']:>9.1f}/s  "
+            f"p50 {latency['p50'] * 1000:>8.2f} ms  "
+            f"p99 {latency['p99'] * 1000:>8.2f} ms  "
+            f"max {latency['max'] * 1000:>8.2f} ms  "
+            f"in flight {snapshot['in_flight']:>4} "
+            f"(max {snapshot['max_in_flight']:>4})  "
+            f"rss {snapshot['memory'] / 2 ** 20:>7.1f} MiB  "
+            f"errors {snapshot['errors']}"
+            + (
+                f"  empty receives {snapshot['empty_receive_ratio']:.0%}"
+                if "empty_receive_ratio" in snapshot
+                else ""
+            ),
+            err=True,
+        )
+        if output is not None:
+            output.write(json.dumps({"report": snapshot}) + "\n")
+
+    return report
+
+
+def echo_bench_summary(stats, output, **extra):
+    summary = {**stats.summary, **extra}
+    if output is not None:
+        output.write(json.dumps({"summary": summary}) + "\n")
+
+    click.echo(
+        f"Completed {stats.completed} in {stats.elapsed:.1f}s "
+        f"({stats.throughput:.1f}/s) with {stats.errors} error(s)"
+    )
+    click.echo(
+        f"Max in flight: {stats.max_in_flight}  "
+        f"Peak memory: {stats.peak_memory / 2 ** 20:.1f} MiB"
+    )
+    for name, histogram in (("LATENCY", stats.latency), ("LAG", stats.lag)):
+        if not histogram.count:
+            continue
+        click.echo("")
+        click.echo(f"{name + ' <= ms':<14} {'COUNT':>9} {'%':>7}")
+        for bound, count in histogram.distribution:
+            click.echo(
+                f"{bound * 1000:<14g} {count:>9} "
+                f"{count / histogram.count:>7.1%}"
+            )
+
+
+@bench.command(name="publish")
+@click.option(
+    "--topic-arn",
+    required=False,
+    type=str,
+    help="Topic to publish to. Defaults to INIESTA_SNS_PRODUCER_GLOBAL_TOPIC_ARN",
+)
+@click.option(
+    "-e",
+    "--event",
+    required=False,
+    type=str,
+    default="Benchmark",
+    help="Event to publish.",
+)
+@click.option(
+    "-r",
+    "--rate",
+    required=False,
+    type=float,
+    default=100,
+    help="Target number of events published per second.",
+)
+@click.option(
+    "-s",
+    "--payload-size",
+    required=False,
+    type=str,
+    default="1024",
+    callback=distribution_option,
+    help="Body size in bytes, e.g. 1024, uniform:100,10000, "
+    "normal:1024,256, exponential:2048 or choice:100=8,65536=2.",
+)
+@click.option(
+    "-c",
+    "--concurrency",
+    required=False,
+    type=int,
+    default=100,
+    help="Maximum number of publishes in flight.",
+)
+@click.option(
+    "-n",
+    "--max-events",
+    required=False,
+    type=int,
+    help="Stop after publishing this many events.",
+)
+@bench_options
+def bench_publish(
+    endpoint_url,
+    in_memory,
+    duration,
+    interval,
+    output,
+    topic_arn,
+    event,
+    rate,
+    payload_size,
+    concurrency,
+    max_events,
+):
+    """
+    Publishes events at a target rate with SNSClient.
+    """
+    from iniesta.bench import in_memory as memory, publish as run
+
+    Iniesta.load_config(settings)
+    if in_memory:
+        topic_arn = memory()["topic_arn"]
+
+    loop = asyncio.get_event_loop()
+    stats = loop.run_until_complete(
+        run(
+            SNSClient(topic_arn, endpoint_url=endpoint_url),
+            rate=rate,
+            payload_size=payload_size,
+            duration=duration or None,
+            max_events=max_events,
+            concurrency=concurrency,
+            event=event,
+            interval=interval,
+            report=bench_reporter(output),
+        )
+    )
+
+    echo_bench_summary(stats, output, target_rate=rate)
+    Iniesta.unload_config(settings)
+
+
+@bench.command(name="consume")
+@click.option(
+    "-q",
+    "--queue",
+    required=False,
+    type=str,
+    help="Queue to consume. Defaults to the default queue of the service.",
+)
+@click.option(
+    "-l",
+    "--latency",
+    required=False,
+    type=str,
+    default="0.01",
+    callback=distribution_option,
+    help="Handler latency in seconds, e.g. 0.01, uniform:0.01,0.1, "
+    "normal:0.05,0.01, exponential:0.02 or choice:0.01=9,1=1.",
+)
+@click.option(
+    "--error-rate",
+    required=False,
+    type=click.FloatRange(0, 1),
+    default=0,
+    help="Fraction of messages the handler fails.",
+)
+@click.option(
+    "-n",
+    "--max-messages",
+    required=False,
+    type=int,
+    help="Stop after handling this many messages.",
+)
+@click.option(
+    "-r",
+    "--rate",
+    required=False,
+    type=float,
+    default=100,
+    help="With --in-memory, events published per second to the queue.",
+)
+@click.option(
+    "-s",
+    "--payload-size",
+    required=False,
+    type=str,
+    default="1024",
+    callback=distribution_option,
+    help="With --in-memory, body size in bytes of the published events.",
+)
+@bench_options
+def bench_consume(
+    endpoint_url,
+    in_memory,
+    duration,
+    interval,
+    output,
+    queue,
+    latency,
+    error_rate,
+    max_messages,
+    rate,
+    payload_size,
+):
+    """
+    Handles messages with synthetic handlers of a latency with SQSClient.
+
+    With --in-memory, events are published to the queue at --rate
+    while consuming.
+    """
+    from iniesta.bench import consume, in_memory as memory, publish
+    from iniesta.sqs.replay import LocalLockManager
+
+    Iniesta.load_config(settings)
+
+    loop = asyncio.get_event_loop()
+    producer = None
+    if in_memory:
+        resources = memory()
+        queue = resources["queue_name"]
+        producer = asyncio.ensure_future(
+            publish(
+                SNSClient(resources["topic_arn"]),
+                rate=rate,
+                payload_size=payload_size,
+                duration=duration or None,
+                max_events=max_messages,
+                interval=interval,
+            ),
+            loop=loop,
+        )
+
+    sqs_client = loop.run_until_complete(
+        SQSClient.initialize(queue_name=queue, endpoint_url=endpoint_url)
+    )
+    if in_memory:
+        sqs_client.lock_manager = LocalLockManager()
+
+    stats = loop.run_until_complete(
+        consume(
+            sqs_client,
+            latency=latency,
+            duration=duration or None,
+            max_messages=max_messages,
+            error_rate=error_rate,
+            interval=interval,
+            report=bench_reporter(output),
+        )
+    )
+
+    extra = {}
+    if producer is not None:
+        extra["published"] = loop.run_until_complete(producer).completed
+        click.echo(f"Published {extra['published']} in memory")
+    echo_bench_summary(stats, output, **extra)
+    Iniesta.unload_config(settings)
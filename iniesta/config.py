@@ -20,6 +20,20 @@ INIESTA_SQS_RECEIVE_MESSAGE_MAX_NUMBER_OF_MESSAGES: int = 10
 #: The time to wait between receiving SQS messages. A value between 0-20 (0 for short polling).
 INIESTA_SQS_RECEIVE_MESSAGE_WAIT_TIME_SECONDS: int = 20
 
+#: If the receive batch size, receiver concurrency and wait time should adapt to the queue's load.
+#: When disabled the values above are used as is with a single receiver.
+INIESTA_SQS_ADAPTIVE_RECEIVE: bool = False
+
+#: The maximum number of concurrent receivers when adaptive receive is enabled.
+INIESTA_SQS_RECEIVE_MAX_CONCURRENCY: int = 4
+
+#: The handler latency (in seconds) above which adaptive receive stops growing and starts shrinking.
+INIESTA_SQS_ADAPTIVE_LATENCY_THRESHOLD: float = 1.0
+
+#: The number of consecutive empty receives before the queue is considered idle
+#: and receives fall back to maximum length long polls.
+INIESTA_SQS_ADAPTIVE_IDLE_RECEIVES: int = 3
+
 # possible filters:
 # if ends with ".*" then filter is concerted to prefix
 # reference: https://docs.aws.amazon.com/sns/latest/dg/sns-subscription-filter-policies.html
@@ -33,12 +47,89 @@ INIESTA_ASSERT_FILTER_POLICIES: bool = True
 #: The event key that will be filtered.
 INIESTA_SNS_EVENT_KEY: str = "iniesta_pass"
 
+#: The message attribute with the time (seconds since the epoch) after which a message is expired.
+INIESTA_EXPIRES_AT_KEY: str = "iniesta_expires_at"
+
+#: The message attribute with the time (seconds since the epoch) a message was created to publish. Set to :code:`None` to not add it, in which case the lag is measured from when SQS received the message.
+INIESTA_PUBLISHED_AT_KEY: Optional[str] = "iniesta_published_at"
+
+#: The message attribute with the trace id of a message.
+INIESTA_TRACE_ID_KEY: str = "iniesta_trace_id"
+
 #: The default sqs queue name
 INIESTA_SQS_QUEUE_NAME: Optional[str] = None
 
 #: The SQS queue name template, if you have a normalized queue naming scheme.
 INIESTA_SQS_QUEUE_NAME_TEMPLATE: str = "iniesta-{env}-{service_name}"
 
+#: The number of messages a :code:`MultiQueueConsumer` handles concurrently across all of its queues.
+INIESTA_SQS_CONSUMER_MAX_CONCURRENCY: int = 20
+
+#: The seconds a message waits for its handler's :code:`max_concurrency` or :code:`rate_limit`
+#: before it is released back to the queue. Released messages become visible again after the
+#: same number of seconds. Should be lower than the queue's visibility timeout.
+INIESTA_SQS_HANDLER_LIMIT_MAX_HOLD: int = 10
+
+#: The number of messages that may wait for their handler's :code:`max_concurrency` or
+#: :code:`rate_limit` at once. Receiving pauses while this many messages are waiting.
+INIESTA_SQS_HANDLER_LIMIT_MAX_WAITING: int = 10
+
+#: The default seconds a handler may run before it is cancelled. :code:`None` for no timeout.
+#: Can be overridden per handler with :code:`timeout`.
+INIESTA_SQS_HANDLER_TIMEOUT: Optional[float] = None
+
+#: The visibility timeout a message is set to after its handler timed out.
+#: 0 makes it available for a retry right away.
+INIESTA_SQS_HANDLER_TIMEOUT_VISIBILITY: int = 0
+
+#: The maximum number of messages a :code:`SQSClient` handles at once. If set, messages are
+#: dispatched by the :code:`priority` of their handler and up to this many received
+#: messages are buffered while waiting. :code:`None` handles all received messages at once.
+INIESTA_SQS_MAX_IN_FLIGHT: Optional[int] = None
+
+#: The priority a buffered message gains per second it waits, so low priority messages don't starve.
+INIESTA_SQS_PRIORITY_AGING: float = 1.0
+
+#: The budget in bytes for the bodies of the messages a :code:`SQSClient` has received
+#: but not finished handling. Receiving pauses, or requests fewer messages, while it is
+#: exceeded. :code:`None` for no budget.
+INIESTA_SQS_IN_FLIGHT_BYTES: Optional[int] = None
+
+#: The ratio (0-1) of failed handlers in the recent window at or above which receiving pauses.
+#: :code:`None` to not pause on handler errors.
+INIESTA_SQS_BACKPRESSURE_ERROR_RATE: Optional[float] = None
+
+#: The average handler latency (in seconds) in the recent window above which receiving pauses.
+#: :code:`None` to not pause on handler latency.
+INIESTA_SQS_BACKPRESSURE_LATENCY: Optional[float] = None
+
+#: The seconds of handler outcomes considered for the two settings above.
+INIESTA_SQS_BACKPRESSURE_WINDOW: float = 30
+
+#: The upper bound for the exponentially growing wait while backpressure is applied.
+INIESTA_SQS_BACKPRESSURE_MAX_WAIT: float = 60
+
+#: A gzip compressed file that received messages are sampled to, for replaying
+#: them with :code:`iniesta replay`. :code:`None` to not record.
+INIESTA_SQS_TRACE_FILE: Optional[str] = None
+
+#: The ratio (0-1) of received messages that are recorded to :code:`INIESTA_SQS_TRACE_FILE`.
+INIESTA_SQS_TRACE_SAMPLE_RATE: float = 1.0
+
+#: The path of a route on the app that serves iniesta's metrics in the Prometheus text format,
+#: e.g. :code:`"/user/iniesta/metrics/"`. :code:`None` for no route.
+INIESTA_METRICS_ROUTE: Optional[str] = None
+
+#: The :code:`host:port` of a StatsD server iniesta's metrics are sent to over UDP.
+#: :code:`None` to not send them.
+INIESTA_METRICS_STATSD_ADDRESS: Optional[str] = None
+
+#: Prepended to the names of the metrics sent to StatsD.
+INIESTA_METRICS_STATSD_PREFIX: Optional[str] = None
+
+#: The seconds between sends to StatsD.
+INIESTA_METRICS_STATSD_INTERVAL: float = 10
+
 #: The retry count for attempting to acquire a lock.
 INIESTA_LOCK_RETRY_COUNT: int = 1
 
@@ -4,3 +4,19 @@ class StopPolling(Exception):
     """
 
     pass
+
+
+class BatchItemFailed(Exception):
+    """
+    Represents a message that a batch handler reported as failed.
+    """
+
+    pass
+
+
+class HandlerTimeout(Exception):
+    """
+    Raised when a handler did not finish within its timeout.
+    """
+
+    pass
@@ -0,0 +1,1247 @@
+"""
+An in memory transport that implements the parts of the SNS and SQS apis
+used by iniesta, so events can be published and consumed in process
+without AWS, moto or localstack.
+
+.. code-block:: python
+
+    from iniesta.memory import InMemorySession
+    from iniesta.sessions import BotoSession
+
+    session = InMemorySession()
+    BotoSession.set_session(session)
+
+    topic_arn = session.backend.create_topic("global").arn
+    queue = session.backend.create_queue("iniesta-tests-xavi")
+    session.backend.subscribe(
+        topic_arn,
+        queue.arn,
+        filter_policy={"iniesta_pass": ["hello.iniesta"]},
+        raw_message_delivery=True,
+    )
+
+The backend models topics, sqs subscriptions with filter policies on
+message attributes, raw and enveloped delivery, standard and FIFO queues,
+delays, visibility timeouts, receipt handles, long polling, dead letter
+queues and the batch apis. Queue policies and permissions are not
+enforced.
+"""
+import asyncio
+import base64
+import datetime
+import hashlib
+import struct
+import time
+import uuid
+
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import botocore.exceptions
+import ujson as json
+
+#: The account id used in the arns and urls of the in memory resources.
+ACCOUNT_ID: str = "000000000000"
+
+#: The maximum size of a message in bytes.
+MAX_MESSAGE_SIZE: int = 256 * 1024
+
+#: The maximum number of entries of a batch request.
+MAX_BATCH_SIZE: int = 10
+
+#: Seconds in which a FIFO deduplication id or receive attempt id is remembered.
+DEDUPLICATION_INTERVAL: int = 300
+
+_exception_classes: Dict[str, type] = {}
+
+
+def _exception_class(name: str) -> type:
+    if name not in _exception_classes:
+        _exception_classes[name] = type(
+            name, (botocore.exceptions.ClientError,), {}
+        )
+    return _exception_classes[name]
+
+
+def client_error(
+    code: str,
+    message: str,
+    operation_name: str,
+    *,
+    name: Optional[str] = None,
+    status: int = 400,
+) -> botocore.exceptions.ClientError:
+    """
+    Creates an error like the ones raised by botocore. The class is named
+    after the modeled exception (e.g. :code:`QueueDoesNotExist`) so it
+    can also be caught with :code:`client.exceptions.<name>`.
+    """
+    return _exception_class(name or code)(
+        {
+            "Error": {"Code": code, "Message": message, "Type": "Sender"},
+            "ResponseMetadata": {"HTTPStatusCode": status},
+        },
+        operation_name,
+    )
+
+
+class _Exceptions:
+    def __getattr__(self, name: str) -> type:
+        return _exception_class(name)
+
+
+def _response(**values) -> dict:
+    return {
+        **values,
+        "ResponseMetadata": {
+            "RequestId": uuid.uuid4().hex,
+            "HTTPStatusCode": 200,
+        },
+    }
+
+
+def _md5(value: str) -> str:
+    return hashlib.md5(value.encode("utf-8")).hexdigest()
+
+
+def md5_of_message_attributes(attributes: dict) -> str:
+    """
+    The MD5 digest of message attributes as calculated by SQS.
+    """
+
+    def encoded(value: bytes) -> bytes:
+        return struct.pack("!I", len(value)) + value
+
+    data = b""
+    for name in sorted(attributes):
+        attribute = attributes[name]
+        data += encoded(name.encode("utf-8"))
+        data += encoded(attribute["DataType"].encode("utf-8"))
+        if "BinaryValue" in attribute:
+            value = attribute["BinaryValue"]
+            if isinstance(value, str):
+                value = value.encode("utf-8")
+            data += b"\x02" + encoded(value)
+        else:
+            data += b"\x01" + encoded(attribute["StringValue"].encode("utf-8"))
+    return hashlib.md5(data).hexdigest()
+
+
+def _message_size(body: str, attributes: dict) -> int:
+    size = len(body.encode("utf-8"))
+    for name, attribute in attributes.items():
+        size += len(name) + len(attribute["DataType"])
+        size += len(attribute.get("StringValue", ""))
+        size += len(attribute.get("BinaryValue", b""))
+    return size
+
+
+def _validate_message(body: str, attributes: dict, operation: str) -> None:
+    for name, attribute in attributes.items():
+        data_type = attribute.get("DataType", "")
+        if data_type.split(".", 1)[0] not in ("String", "Number", "Binary"):
+            raise client_error(
+                "InvalidParameterValue",
+                f"The message attribute '{name}' has an invalid message "
+                f"attribute type, the set of supported type prefixes is "
+                f"Binary, Number, and String.",
+                operation,
+            )
+    if _message_size(body, attributes) > MAX_MESSAGE_SIZE:
+        raise client_error(
+            "InvalidParameterValue",
+            f"One or more parameters are invalid. Reason: Message must be "
+            f"shorter than {MAX_MESSAGE_SIZE} bytes.",
+            operation,
+        )
+
+
+def _validate_entries(entries: List[dict], operation: str) -> None:
+    if not entries:
+        raise client_error(
+            "AWS.SimpleQueueService.EmptyBatchRequest",
+            "There should be at least one entry in the request.",
+            operation,
+            name="EmptyBatchRequest",
+        )
+    if len(entries) > MAX_BATCH_SIZE:
+        raise client_error(
+            "AWS.SimpleQueueService.TooManyEntriesInBatchRequest",
+            f"Maximum number of entries per request are {MAX_BATCH_SIZE}. "
+            f"You have sent {len(entries)}.",
+            operation,
+            name="TooManyEntriesInBatchRequest",
+        )
+    if len({entry["Id"] for entry in entries}) != len(entries):
+        raise client_error(
+            "AWS.SimpleQueueService.BatchEntryIdsNotDistinct",
+            "Two or more batch entries in the request have the same Id.",
+            operation,
+            name="BatchEntryIdsNotDistinct",
+        )
+
+
+def _batch(entries: List[dict], operation: str, send) -> dict:
+    """
+    Calls :code:`send` for every entry and collects the results like the
+    batch apis, with errors reported per entry.
+    """
+    _validate_entries(entries, operation)
+
+    successful, failed = [], []
+    for entry in entries:
+        try:
+            result = send(entry)
+        except botocore.exceptions.ClientError as e:
+            failed.append(
+                {
+                    "Id": entry["Id"],
+                    "SenderFault": True,
+                    "Code": e.response["Error"]["Code"],
+                    "Message": e.response["Error"]["Message"],
+                }
+            )
+        else:
+            successful.append({"Id": entry["Id"], **result})
+
+    response = {"Successful": successful}
+    if failed:
+        response["Failed"] = failed
+    return _response(**response)
+
+
+def _filter_values(attribute: dict) -> list:
+    data_type = attribute["DataType"]
+    value = attribute.get("StringValue")
+    if value is None:
+        return []
+    if data_type.startswith("Number"):
+        return [float(value)]
+    if data_type.startswith("String.Array"):
+        try:
+            values = json.loads(value)
+        except ValueError:
+            return []
+        return values if isinstance(values, list) else []
+    return [value]
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+_NUMERIC_OPERATORS = {
+    "=": lambda a, b: a == b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+}
+
+
+def _matches_numeric(conditions: list, value: Any) -> bool:
+    if not _is_number(value):
+        return False
+    pairs = zip(conditions[::2], conditions[1::2])
+    return all(_NUMERIC_OPERATORS[op](value, operand) for op, operand in pairs)
+
+
+def _matches_value(rule: Any, value: Any) -> bool:
+    if isinstance(rule, dict):
+        operator, operand = next(iter(rule.items()))
+        if operator == "prefix":
+            return isinstance(value, str) and value.startswith(operand)
+        if operator == "suffix":
+            return isinstance(value, str) and value.endswith(operand)
+        if operator == "equals-ignore-case":
+            return isinstance(value, str) and value.lower() == operand.lower()
+        if operator == "anything-but":
+            operands = operand if isinstance(operand, list) else [operand]
+            return not any(_matches_value(o, value) for o in operands)
+        if operator == "numeric":
+            return _matches_numeric(operand, value)
+        if operator == "exists":
+            return operand is True
+        return False
+    if _is_number(rule):
+        return _is_number(value) and value == rule
+    return rule == value
+
+
+def matches_filter_policy(policy: dict, message_attributes: dict) -> bool:
+    """
+    If message attributes match a SNS subscription filter policy. Every
+    key of the policy must match, and a key matches if any of its rules
+    matches the attribute (or any element of a :code:`String.Array`).
+
+    Supports exact strings and numbers, :code:`prefix`, :code:`suffix`,
+    :code:`equals-ignore-case`, :code:`anything-but`, :code:`numeric`
+    and :code:`exists`.
+    """
+    for name, rules in policy.items():
+        if not isinstance(rules, list):
+            rules = [rules]
+        attribute = message_attributes.get(name)
+        if attribute is None:
+            if not any(rule == {"exists": False} for rule in rules):
+                return False
+            continue
+
+        values = _filter_values(attribute)
+        if not any(
+            _matches_value(rule, value) for rule in rules for value in values
+        ):
+            return False
+    return True
+
+
+class InMemoryMessage:
+    """
+    A message in an :code:`InMemoryQueue`.
+    """
+
+    def __init__(
+        self,
+        body: str,
+        message_attributes: dict,
+        *,
+        visible_at: float,
+        group_id: Optional[str] = None,
+        deduplication_id: Optional[str] = None,
+        sequence_number: Optional[str] = None,
+    ) -> None:
+        self.message_id = str(uuid.uuid4())
+        self.body = body
+        self.md5_of_body = _md5(body)
+        self.message_attributes = message_attributes
+        self.group_id = group_id
+        self.deduplication_id = deduplication_id
+        self.sequence_number = sequence_number
+        self.sent_timestamp = int(time.time() * 1000)
+        self.first_receive_timestamp: Optional[int] = None
+        self.receive_count = 0
+        self.visible_at = visible_at
+        self.receipt_handle: Optional[str] = None
+
+    @property
+    def in_flight(self) -> bool:
+        return self.receive_count > 0 and self.visible_at > time.monotonic()
+
+    @property
+    def attributes(self) -> dict:
+        attributes = {
+            "SenderId": ACCOUNT_ID,
+            "SentTimestamp": str(self.sent_timestamp),
+            "ApproximateReceiveCount": str(self.receive_count),
+        }
+        if self.first_receive_timestamp is not None:
+            attributes["ApproximateFirstReceiveTimestamp"] = str(
+                self.first_receive_timestamp
+            )
+        if self.group_id is not None:
+            attributes["MessageGroupId"] = self.group_id
+            attributes["MessageDeduplicationId"] = self.deduplication_id
+            attributes["SequenceNumber"] = self.sequence_number
+        return attributes
+
+    def receive(self, visibility_timeout: float) -> None:
+        self.receive_count += 1
+        if self.first_receive_timestamp is None:
+            self.first_receive_timestamp = int(time.time() * 1000)
+        self.visible_at = time.monotonic() + visibility_timeout
+        self.receipt_handle = f"{self.message_id}#{uuid.uuid4().hex}"
+
+    def to_sqs(self, attribute_names: list, message_attribute_names: list):
+        """
+        The message as returned by :code:`receive_message`.
+        """
+        message = {
+            "MessageId": self.message_id,
+            "ReceiptHandle": self.receipt_handle,
+            "MD5OfBody": self.md5_of_body,
+            "Body": self.body,
+            "Attributes": {
+                k: v
+                for k, v in self.attributes.items()
+                if "All" in attribute_names or k in attribute_names
+            },
+        }
+        message_attributes = {
+            k: v
+            for k, v in self.message_attributes.items()
+            if _requested(k, message_attribute_names)
+        }
+        if message_attributes:
+            message["MessageAttributes"] = message_attributes
+            message["MD5OfMessageAttributes"] = md5_of_message_attributes(
+                message_attributes
+            )
+        return message
+
+
+def _requested(name: str, names: list) -> bool:
+    for requested in names:
+        if requested in ("All", ".*") or requested == name:
+            return True
+        if requested.endswith(".*") and name.startswith(requested[:-1]):
+            return True
+    return False
+
+
+class InMemoryQueue:
+    """
+    A standard or FIFO queue. FIFO queues hold back the messages of a
+    message group while one of them is in flight and drop messages with
+    a deduplication id that was sent in the last 5 minutes.
+    """
+
+    def __init__(self, backend, name: str, attributes: dict) -> None:
+        self.backend = backend
+        self.name = name
+        self.url = f"{backend.endpoint_url}/{ACCOUNT_ID}/{name}"
+        self.arn = f"arn:aws:sqs:{backend.region_name}:{ACCOUNT_ID}:{name}"
+        self.fifo = name.endswith(".fifo")
+        self.created_timestamp = int(time.time())
+        self.attributes = {
+            "VisibilityTimeout": "30",
+            "DelaySeconds": "0",
+            "MaximumMessageSize": str(MAX_MESSAGE_SIZE),
+            "MessageRetentionPeriod": "345600",
+            "ReceiveMessageWaitTimeSeconds": "0",
+        }
+        if self.fifo:
+            self.attributes["FifoQueue"] = "true"
+            self.attributes["ContentBasedDeduplication"] = "false"
+        self.attributes.update(attributes)
+
+        self.messages: Dict[str, InMemoryMessage] = OrderedDict()
+        self._sequence_number = 0
+        self._deduplication_ids: Dict[str, tuple] = {}
+        self._receive_attempts: Dict[str, tuple] = {}
+        self._waiters: List[asyncio.Future] = []
+
+    @property
+    def visibility_timeout(self) -> int:
+        return int(self.attributes["VisibilityTimeout"])
+
+    def get_attributes(self, names: List[str]) -> dict:
+        now = time.monotonic()
+        visible = in_flight = delayed = 0
+        for message in self.messages.values():
+            if message.visible_at <= now:
+                visible += 1
+            elif message.receive_count:
+                in_flight += 1
+            else:
+                delayed += 1
+
+        attributes = {
+            **self.attributes,
+            "QueueArn": self.arn,
+            "CreatedTimestamp": str(self.created_timestamp),
+            "ApproximateNumberOfMessages": str(visible),
+            "ApproximateNumberOfMessagesNotVisible": str(in_flight),
+            "ApproximateNumberOfMessagesDelayed": str(delayed),
+        }
+        if "All" in names:
+            return attributes
+        return {k: v for k, v in attributes.items() if k in names}
+
+    def _deduplicate(self, body: str, deduplication_id: Optional[str]):
+        if deduplication_id is None:
+            if self.attributes.get("ContentBasedDeduplication") != "true":
+                raise client_error(
+                    "InvalidParameterValue",
+                    "The queue should either have ContentBasedDeduplication "
+                    "enabled or MessageDeduplicationId provided explicitly",
+                    "SendMessage",
+                )
+            deduplication_id = hashlib.sha256(body.encode()).hexdigest()
+
+        now = time.monotonic()
+        self._deduplication_ids = {
+            k: v
+            for k, v in self._deduplication_ids.items()
+            if v[0] > now - DEDUPLICATION_INTERVAL
+        }
+        return deduplication_id, self._deduplication_ids.get(deduplication_id)
+
+    def send(
+        self,
+        body: str,
+        message_attributes: Optional[dict] = None,
+        *,
+        delay_seconds: Optional[int] = None,
+        group_id: Optional[str] = None,
+        deduplication_id: Optional[str] = None,
+    ) -> InMemoryMessage:
+        """
+        Adds a message to the queue. Raises :code:`ClientError` like
+        :code:`SendMessage` if the message is invalid.
+        """
+        message_attributes = message_attributes or {}
+        _validate_message(body, message_attributes, "SendMessage")
+
+        sequence_number = None
+        if self.fifo:
+            if group_id is None:
+                raise client_error(
+                    "MissingParameter",
+                    "The request must contain the parameter MessageGroupId.",
+                    "SendMessage",
+                )
+            deduplication_id, duplicate = self._deduplicate(
+                body, deduplication_id
+            )
+            if duplicate is not None:
+                return duplicate[1]
+            self._sequence_number += 1
+            sequence_number = str(self._sequence_number).zfill(20)
+
+        if delay_seconds is None:
+            delay_seconds = int(self.attributes["DelaySeconds"])
+
+        message = InMemoryMessage(
+            body,
+            message_attributes,
+            visible_at=time.monotonic() + delay_seconds,
+            group_id=group_id,
+            deduplication_id=deduplication_id,
+            sequence_number=sequence_number,
+        )
+        if self.fifo:
+            self._deduplication_ids[deduplication_id] = (
+                time.monotonic(),
+                message,
+            )
+        self.messages[message.message_id] = message
+        self.wake()
+        return message
+
+    def _dead_letter(self, message: InMemoryMessage) -> bool:
+        """
+        Moves a message that was received too many times to the dead
+        letter queue of the redrive policy.
+        """
+        if "RedrivePolicy" not in self.attributes:
+            return False
+
+        policy = json.loads(self.attributes["RedrivePolicy"])
+        if message.receive_count < int(policy["maxReceiveCount"]):
+            return False
+
+        target = self.backend.queue_by_arn(policy["deadLetterTargetArn"])
+        if target is None:
+            return False
+
+        del self.messages[message.message_id]
+        target.send(
+            message.body,
+            message.message_attributes,
+            delay_seconds=0,
+            group_id=message.group_id,
+            deduplication_id=message.deduplication_id,
+        )
+        return True
+
+    def take(
+        self, max_number_of_messages: int, visibility_timeout: float
+    ) -> List[InMemoryMessage]:
+        """
+        Receives the visible messages in order and hides them for the
+        visibility timeout.
+        """
+        now = time.monotonic()
+        taken, blocked_groups = [], set()
+        for message in list(self.messages.values()):
+            if len(taken) == max_number_of_messages:
+                break
+            if message.visible_at > now:
+                if message.group_id is not None:
+                    blocked_groups.add(message.group_id)
+                continue
+            if message.group_id in blocked_groups:
+                continue
+            if self._dead_letter(message):
+                continue
+
+            message.receive(visibility_timeout)
+            taken.append(message)
+        return taken
+
+    def _next_visible_in(self) -> Optional[float]:
+        now = time.monotonic()
+        upcoming = [
+            m.visible_at for m in self.messages.values() if m.visible_at > now
+        ]
+        return min(upcoming) - now if upcoming else None
+
+    async def receive(
+        self,
+        max_number_of_messages: int,
+        *,
+        visibility_timeout: Optional[float] = None,
+        wait_time_seconds: float = 0,
+        attempt_id: Optional[str] = None,
+    ) -> List[InMemoryMessage]:
+        """
+        Receives messages, waiting up to :code:`wait_time_seconds` for
+        a message to become available like long polling.
+        """
+        if attempt_id is not None:
+            attempt = self._receive_attempts.get(attempt_id)
+            if attempt and attempt[0] > time.monotonic():
+                return attempt[1]
+
+        if visibility_timeout is None:
+            visibility_timeout = self.visibility_timeout
+
+        deadline = time.monotonic() + wait_time_seconds
+        while True:
+            messages = self.take(max_number_of_messages, visibility_timeout)
+            remaining = deadline - time.monotonic()
+            if messages or remaining <= 0:
+                break
+
+            next_visible = self._next_visible_in()
+            if next_visible is not None:
+                remaining = min(remaining, next_visible)
+            waiter = asyncio.get_event_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await asyncio.wait([waiter], timeout=remaining)
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+
+        if attempt_id is not None:
+            self._receive_attempts[attempt_id] = (
+                time.monotonic() + DEDUPLICATION_INTERVAL,
+                messages,
+            )
+        return messages
+
+    def wake(self) -> None:
+        """
+        Wakes up the long polling receives.
+        """
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _in_flight(self, receipt_handle: str, operation: str):
+        message_id = receipt_handle.split("#", 1)[0]
+        message = self.messages.get(message_id)
+        if (
+            message is None
+            or message.receipt_handle != receipt_handle
+            or not message.in_flight
+        ):
+            raise client_error(
+                "InvalidParameterValue",
+                f"Value {receipt_handle} for parameter ReceiptHandle is "
+                f"invalid. Reason: Message does not exist or is not "
+                f"available for visibility timeout change.",
+                operation,
+            )
+        return message
+
+    def delete(self, receipt_handle: str) -> None:
+        """
+        Deletes the message of a receipt handle. Deleting a message that
+        was already deleted succeeds like it does in SQS.
+        """
+        if "#" not in receipt_handle:
+            raise client_error(
+                "ReceiptHandleIsInvalid",
+                f"The input receipt handle '{receipt_handle}' is not a "
+                f"valid receipt handle.",
+                "DeleteMessage",
+            )
+        self.messages.pop(receipt_handle.split("#", 1)[0], None)
+
+    def change_visibility(
+        self, receipt_handle: str, visibility_timeout: int
+    ) -> None:
+        """
+        Changes the visibility timeout of an in flight message from now on.
+        """
+        message = self._in_flight(receipt_handle, "ChangeMessageVisibility")
+        message.visible_at = time.monotonic() + visibility_timeout
+        if visibility_timeout == 0:
+            self.wake()
+
+    def purge(self) -> None:
+        self.messages.clear()
+
+
+class InMemoryTopic:
+    """
+    A SNS topic with its subscriptions.
+    """
+
+    def __init__(self, backend, name: str, attributes: dict) -> None:
+        self.name = name
+        self.arn = f"arn:aws:sns:{backend.region_name}:{ACCOUNT_ID}:{name}"
+        self.fifo = name.endswith(".fifo")
+        self.attributes = {
+            "TopicArn": self.arn,
+            "Owner": ACCOUNT_ID,
+            "DisplayName": "",
+            **attributes,
+        }
+        self.subscriptions: Dict[str, dict] = OrderedDict()
+
+    def get_attributes(self) -> dict:
+        return {
+            **self.attributes,
+            "SubscriptionsConfirmed": str(len(self.subscriptions)),
+            "SubscriptionsPending": "0",
+            "SubscriptionsDeleted": "0",
+        }
+
+
+def _envelope(topic: InMemoryTopic, message_id: str, message: dict) -> str:
+    """
+    The body of a message delivered without raw message delivery.
+    """
+    envelope = {
+        "Type": "Notification",
+        "MessageId": message_id,
+        "TopicArn": topic.arn,
+        "Message": message["Message"],
+        "Timestamp": datetime.datetime.utcnow().isoformat()[:-3] + "Z",
+        "SignatureVersion": "1",
+        "Signature": "",
+        "SigningCertURL": "",
+        "UnsubscribeURL": "",
+    }
+    if message.get("Subject") is not None:
+        envelope["Subject"] = message["Subject"]
+
+    attributes = {}
+    for name, attribute in message["MessageAttributes"].items():
+        if "BinaryValue" in attribute:
+            value = base64.b64encode(attribute["BinaryValue"]).decode()
+        else:
+            value = attribute["StringValue"]
+        attributes[name] = {"Type": attribute["DataType"], "Value": value}
+    if attributes:
+        envelope["MessageAttributes"] = attributes
+    return json.dumps(envelope)
+
+
+class InMemoryBackend:
+    """
+    The state shared by all in memory clients of a session.
+    """
+
+    def __init__(
+        self,
+        *,
+        region_name: str = "us-east-1",
+        endpoint_url: str = "memory://sqs",
+    ) -> None:
+        self.region_name = region_name
+        self.endpoint_url = endpoint_url
+        self.topics: Dict[str, InMemoryTopic] = OrderedDict()
+        self.queues: Dict[str, InMemoryQueue] = OrderedDict()
+        self.subscriptions: Dict[str, dict] = {}
+
+    def create_topic(
+        self, name: str, attributes: Optional[dict] = None
+    ) -> InMemoryTopic:
+        """
+        Creates a topic, or returns the existing topic with the name.
+        """
+        for topic in self.topics.values():
+            if topic.name == name:
+                return topic
+        topic = InMemoryTopic(self, name, attributes or {})
+        self.topics[topic.arn] = topic
+        return topic
+
+    def get_topic(self, topic_arn: str, operation: str) -> InMemoryTopic:
+        try:
+            return self.topics[topic_arn]
+        except KeyError:
+            raise client_error(
+                "NotFound", "Topic does not exist", operation, status=404
+            )
+
+    def delete_topic(self, topic_arn: str) -> None:
+        topic = self.topics.pop(topic_arn, None)
+        if topic is not None:
+            for subscription_arn in topic.subscriptions:
+                self.subscriptions.pop(subscription_arn, None)
+
+    def subscribe(
+        self,
+        topic_arn: str,
+        endpoint: str,
+        *,
+        protocol: str = "sqs",
+        filter_policy: Optional[dict] = None,
+        raw_message_delivery: bool = False,
+        attributes: Optional[dict] = None,
+    ) -> str:
+        """
+        Subscribes an endpoint to a topic. Only :code:`sqs` subscriptions
+        are delivered to.
+
+        :return: The subscription arn.
+        """
+        topic = self.get_topic(topic_arn, "Subscribe")
+        attributes = dict(attributes or {})
+        if filter_policy is not None:
+            attributes["FilterPolicy"] = json.dumps(filter_policy)
+        if raw_message_delivery:
+            attributes["RawMessageDelivery"] = "true"
+
+        for subscription in topic.subscriptions.values():
+            if (
+                subscription["Protocol"] == protocol
+                and subscription["Endpoint"] == endpoint
+            ):
+                subscription.update(attributes)
+                return subscription["SubscriptionArn"]
+
+        subscription_arn = f"{topic_arn}:{uuid.uuid4()}"
+        subscription = {
+            "SubscriptionArn": subscription_arn,
+            "TopicArn": topic_arn,
+            "Protocol": protocol,
+            "Endpoint": endpoint,
+            "Owner": ACCOUNT_ID,
+            "PendingConfirmation": "false",
+            "ConfirmationWasAuthenticated": "true",
+            "RawMessageDelivery": "false",
+            **attributes,
+        }
+        topic.subscriptions[subscription_arn] = subscription
+        self.subscriptions[subscription_arn] = subscription
+        return subscription_arn
+
+    def get_subscription(self, subscription_arn: str, operation: str) -> dict:
+        try:
+            return self.subscriptions[subscription_arn]
+        except KeyError:
+            raise client_error(
+                "NotFound",
+                "Subscription does not exist",
+                operation,
+                status=404,
+            )
+
+    def unsubscribe(self, subscription_arn: str) -> None:
+        subscription = self.subscriptions.pop(subscription_arn, None)
+        if subscription is not None:
+            topic = self.topics.get(subscription["TopicArn"])
+            if topic is not None:
+                topic.subscriptions.pop(subscription_arn, None)
+
+    def publish(self, topic_arn: str, message: dict) -> dict:
+        """
+        Publishes a message like :code:`Publish` and delivers it to the
+        sqs subscriptions whose filter policies match.
+
+        :return: The response of :code:`Publish`.
+        """
+        topic = self.get_topic(topic_arn, "Publish")
+        message = _resolve_structure(message)
+        attributes = message.get("MessageAttributes", {})
+        _validate_message(message["Message"], attributes, "Publish")
+        if topic.fifo and message.get("MessageGroupId") is None:
+            raise client_error(
+                "InvalidParameter",
+                "Invalid parameter: The MessageGroupId parameter is "
+                "required for FIFO topics",
+                "Publish",
+            )
+
+        message_id = str(uuid.uuid4())
+        for subscription in topic.subscriptions.values():
+            self._deliver(topic, subscription, message_id, message)
+
+        response = {"MessageId": message_id}
+        if topic.fifo:
+            response["SequenceNumber"] = str(int(time.time() * 1e6)).zfill(20)
+        return response
+
+    def _deliver(self, topic, subscription, message_id, message) -> None:
+        if subscription["Protocol"] != "sqs":
+            return
+        queue = self.queue_by_arn(subscription["Endpoint"])
+        if queue is None:
+            return
+
+        attributes = message.get("MessageAttributes", {})
+        filter_policy = subscription.get("FilterPolicy")
+        if filter_policy and not matches_filter_policy(
+            json.loads(filter_policy), attributes
+        ):
+            return
+
+        if subscription.get("RawMessageDelivery") == "true":
+            body = message["Message"]
+        else:
+            body, attributes = _envelope(topic, message_id, message), {}
+        queue.send(
+            body,
+            attributes,
+            group_id=message.get("MessageGroupId"),
+            deduplication_id=message.get("MessageDeduplicationId")
+            or message_id,
+        )
+
+    def create_queue(
+        self, name: str, attributes: Optional[dict] = None
+    ) -> InMemoryQueue:
+        """
+        Creates a queue, or returns the existing queue with the name.
+        """
+        attributes = attributes or {}
+        if name not in self.queues:
+            if attributes.get("FifoQueue") == "true" and not name.endswith(
+                ".fifo"
+            ):
+                raise client_error(
+                    "InvalidParameterValue",
+                    "The name of a FIFO queue can only include alphanumeric "
+                    "characters, hyphens, or underscores, must end with "
+                    ".fifo suffix.",
+                    "CreateQueue",
+                )
+            self.queues[name] = InMemoryQueue(self, name, attributes)
+        return self.queues[name]
+
+    def get_queue(self, queue_url: str, operation: str) -> InMemoryQueue:
+        queue = self.queues.get(queue_url.rsplit("/", 1)[-1])
+        if queue is None or queue.url != queue_url:
+            raise client_error(
+                "AWS.SimpleQueueService.NonExistentQueue",
+                "The specified queue does not exist for this wsdl version.",
+                operation,
+                name="QueueDoesNotExist",
+            )
+        return queue
+
+    def queue_by_arn(self, arn: str) -> Optional[InMemoryQueue]:
+        queue = self.queues.get(arn.rsplit(":", 1)[-1])
+        if queue is None or queue.arn != arn:
+            return None
+        return queue
+
+    def delete_queue(self, queue_url: str) -> None:
+        queue = self.get_queue(queue_url, "DeleteQueue")
+        del self.queues[queue.name]
+        queue.wake()
+
+
+def _resolve_structure(message: dict) -> dict:
+    """
+    Picks the sqs (or default) message of a :code:`json` message structure.
+    """
+    if message.get("MessageStructure") != "json":
+        return message
+
+    try:
+        messages = json.loads(message["Message"])
+        body = messages.get("sqs", messages["default"])
+    except (ValueError, KeyError, AttributeError):
+        raise client_error(
+            "InvalidParameter",
+            "Invalid parameter: Message Structure - No default entry "
+            "in JSON message body",
+            "Publish",
+        )
+    return {**message, "Message": body}
+
+
+class _InMemoryClient:
+    def __init__(self, backend: InMemoryBackend) -> None:
+        self.backend = backend
+        self.exceptions = _Exceptions()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self) -> None:
+        pass
+
+
+class InMemorySNSClient(_InMemoryClient):
+    """
+    The in memory counterpart of an aiobotocore sns client.
+    """
+
+    async def create_topic(self, *, Name, Attributes=None, **kwargs) -> dict:
+        topic = self.backend.create_topic(Name, Attributes)
+        return _response(TopicArn=topic.arn)
+
+    async def delete_topic(self, *, TopicArn) -> dict:
+        self.backend.delete_topic(TopicArn)
+        return _response()
+
+    async def list_topics(self, **kwargs) -> dict:
+        return _response(
+            Topics=[{"TopicArn": arn} for arn in self.backend.topics]
+        )
+
+    async def get_topic_attributes(self, *, TopicArn) -> dict:
+        topic = self.backend.get_topic(TopicArn, "GetTopicAttributes")
+        return _response(Attributes=topic.get_attributes())
+
+    async def subscribe(
+        self, *, TopicArn, Protocol, Endpoint, Attributes=None, **kwargs
+    ) -> dict:
+        subscription_arn = self.backend.subscribe(
+            TopicArn, Endpoint, protocol=Protocol, attributes=Attributes
+        )
+        return _response(SubscriptionArn=subscription_arn)
+
+    async def unsubscribe(self, *, SubscriptionArn) -> dict:
+        self.backend.unsubscribe(SubscriptionArn)
+        return _response()
+
+    async def list_subscriptions_by_topic(
+        self, *, TopicArn, NextToken=None
+    ) -> dict:
+        topic = self.backend.get_topic(TopicArn, "ListSubscriptionsByTopic")
+        subscriptions = [
+            {
+                k: s[k]
+                for k in (
+                    "SubscriptionArn",
+                    "Owner",
+                    "Protocol",
+                    "Endpoint",
+                    "TopicArn",
+                )
+            }
+            for s in topic.subscriptions.values()
+        ]
+        start = int(NextToken or 0)
+        response = {"Subscriptions": subscriptions[start : start + 100]}
+        if start + 100 < len(subscriptions):
+            response["NextToken"] = str(start + 100)
+        return _response(**response)
+
+    async def get_subscription_attributes(self, *, SubscriptionArn) -> dict:
+        subscription = self.backend.get_subscription(
+            SubscriptionArn, "GetSubscriptionAttributes"
+        )
+        return _response(Attributes=dict(subscription))
+
+    async def set_subscription_attributes(
+        self, *, SubscriptionArn, AttributeName, AttributeValue=None
+    ) -> dict:
+        subscription = self.backend.get_subscription(
+            SubscriptionArn, "SetSubscriptionAttributes"
+        )
+        subscription[AttributeName] = AttributeValue
+        return _response()
+
+    async def publish(self, *, TopicArn, Message, **kwargs) -> dict:
+        response = self.backend.publish(
+            TopicArn, {"Message": Message, **kwargs}
+        )
+        return _response(**response)
+
+    async def publish_batch(
+        self, *, TopicArn, PublishBatchRequestEntries
+    ) -> dict:
+        self.backend.get_topic(TopicArn, "PublishBatch")
+
+        def publish(entry):
+            message = {k: v for k, v in entry.items() if k != "Id"}
+            return self.backend.publish(TopicArn, message)
+
+        return _batch(PublishBatchRequestEntries, "PublishBatch", publish)
+
+
+class InMemorySQSClient(_InMemoryClient):
+    """
+    The in memory counterpart of an aiobotocore sqs client.
+    """
+
+    async def create_queue(self, *, QueueName, Attributes=None, **kwargs):
+        queue = self.backend.create_queue(QueueName, Attributes)
+        return _response(QueueUrl=queue.url)
+
+    async def delete_queue(self, *, QueueUrl) -> dict:
+        self.backend.delete_queue(QueueUrl)
+        return _response()
+
+    async def get_queue_url(self, *, QueueName, **kwargs) -> dict:
+        queue = self.backend.queues.get(QueueName)
+        if queue is None:
+            raise client_error(
+                "AWS.SimpleQueueService.NonExistentQueue",
+                "The specified queue does not exist for this wsdl version.",
+                "GetQueueUrl",
+                name="QueueDoesNotExist",
+            )
+        return _response(QueueUrl=queue.url)
+
+    async def list_queues(self, *, QueueNamePrefix="", **kwargs) -> dict:
+        return _response(
+            QueueUrls=[
+                queue.url
+                for queue in self.backend.queues.values()
+                if queue.name.startswith(QueueNamePrefix)
+            ]
+        )
+
+    async def get_queue_attributes(self, *, QueueUrl, AttributeNames=None):
+        queue = self.backend.get_queue(QueueUrl, "GetQueueAttributes")
+        return _response(
+            Attributes=queue.get_attributes(AttributeNames or ["All"])
+        )
+
+    async def set_queue_attributes(self, *, QueueUrl, Attributes) -> dict:
+        queue = self.backend.get_queue(QueueUrl, "SetQueueAttributes")
+        queue.attributes.update(Attributes)
+        return _response()
+
+    async def purge_queue(self, *, QueueUrl) -> dict:
+        self.backend.get_queue(QueueUrl, "PurgeQueue").purge()
+        return _response()
+
+    def _send(self, queue: InMemoryQueue, entry: dict) -> dict:
+        message = queue.send(
+            entry["MessageBody"],
+            entry.get("MessageAttributes"),
+            delay_seconds=entry.get("DelaySeconds"),
+            group_id=entry.get("MessageGroupId"),
+            deduplication_id=entry.get("MessageDeduplicationId"),
+        )
+        result = {
+            "MessageId": message.message_id,
+            "MD5OfMessageBody": message.md5_of_body,
+        }
+        if message.message_attributes:
+            result["MD5OfMessageAttributes"] = md5_of_message_attributes(
+                message.message_attributes
+            )
+        if message.sequence_number is not None:
+            result["SequenceNumber"] = message.sequence_number
+        return result
+
+    async def send_message(self, *, QueueUrl, MessageBody, **kwargs) -> dict:
+        queue = self.backend.get_queue(QueueUrl, "SendMessage")
+        return _response(
+            **self._send(queue, {"MessageBody": MessageBody, **kwargs})
+        )
+
+    async def send_message_batch(self, *, QueueUrl, Entries) -> dict:
+        queue = self.backend.get_queue(QueueUrl, "SendMessageBatch")
+        return _batch(
+            Entries, "SendMessageBatch", lambda e: self._send(queue, e)
+        )
+
+    async def receive_message(
+        self,
+        *,
+        QueueUrl,
+        MaxNumberOfMessages=1,
+        WaitTimeSeconds=None,
+        VisibilityTimeout=None,
+        AttributeNames=(),
+        MessageAttributeNames=(),
+        ReceiveRequestAttemptId=None,
+        **kwargs,
+    ) -> dict:
+        queue = self.backend.get_queue(QueueUrl, "ReceiveMessage")
+        if not 1 <= MaxNumberOfMessages <= MAX_BATCH_SIZE:
+            raise client_error(
+                "InvalidParameterValue",
+                f"Value {MaxNumberOfMessages} for parameter "
+                f"MaxNumberOfMessages is invalid. Reason: Must be between "
+                f"1 and {MAX_BATCH_SIZE}, if provided.",
+                "ReceiveMessage",
+            )
+        if WaitTimeSeconds is None:
+            WaitTimeSeconds = int(
+                queue.attributes["ReceiveMessageWaitTimeSeconds"]
+            )
+
+        messages = await queue.receive(
+            MaxNumberOfMessages,
+            visibility_timeout=VisibilityTimeout,
+            wait_time_seconds=WaitTimeSeconds,
+            attempt_id=ReceiveRequestAttemptId if queue.fifo else None,
+        )
+        response = {}
+        if messages:
+            response["Messages"] = [
+                m.to_sqs(list(AttributeNames), list(MessageAttributeNames))
+                for m in messages
+            ]
+        return _response(**response)
+
+    async def delete_message(self, *, QueueUrl, ReceiptHandle) -> dict:
+        queue = self.backend.get_queue(QueueUrl, "DeleteMessage")
+        queue.delete(ReceiptHandle)
+        return _response()
+
+    async def delete_message_batch(self, *, QueueUrl, Entries) -> dict:
+        queue = self.backend.get_queue(QueueUrl, "DeleteMessageBatch")
+
+        def delete(entry):
+            queue.delete(entry["ReceiptHandle"])
+            return {}
+
+        return _batch(Entries, "DeleteMessageBatch", delete)
+
+    async def change_message_visibility(
+        self, *, QueueUrl, ReceiptHandle, VisibilityTimeout
+    ) -> dict:
+        queue = self.backend.get_queue(QueueUrl, "ChangeMessageVisibility")
+        queue.change_visibility(ReceiptHandle, VisibilityTimeout)
+        return _response()
+
+    async def change_message_visibility_batch(
+        self, *, QueueUrl, Entries
+    ) -> dict:
+        queue = self.backend.get_queue(QueueUrl, "ChangeMessageVisibilityBatch")
+
+        def change(entry):
+            queue.change_visibility(
+                entry["ReceiptHandle"], entry["VisibilityTimeout"]
+            )
+            return {}
+
+        return _batch(Entries, "ChangeMessageVisibilityBatch", change)
+
+
+class InMemorySession:
+    """
+    A stand in for the aiobotocore session whose sns and sqs clients
+    share an :code:`InMemoryBackend`. Set it with
+    :code:`BotoSession.set_session` to run iniesta in process.
+
+    :param backend: The state of the topics and queues. A new backend if not passed.
+    """
+
+    clients = {"sns": InMemorySNSClient, "sqs": InMemorySQSClient}
+
+    def __init__(self, backend: Optional[InMemoryBackend] = None) -> None:
+        self.backend = backend or InMemoryBackend()
+
+    def create_client(self, service_name: str, **kwargs) -> _InMemoryClient:
+        """
+        Creates a client for the service. The connection arguments
+        (region, endpoint and credentials) are ignored.
+        """
+        try:
+            client_class = self.clients[service_name]
+        except KeyError:
+            raise ValueError(
+                f"The in memory transport doesn't support {service_name}."
+            )
+        return client_class(self.backend)
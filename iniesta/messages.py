@@ -1,3 +1,6 @@
+import datetime
+import time
+
 from typing import Any, Union
 
 import ujson as json
@@ -21,6 +24,11 @@ class MessageAttributes(UserDict):
     def message_attributes(self) -> dict:
         return self.get("MessageAttributes", {})
 
+    def _set_message_attribute(
+        self, attribute_name: str, attribute: dict
+    ) -> None:
+        self["MessageAttributes"][attribute_name] = attribute
+
     def add_event(self, value: str, *, raw: bool = False):
         """
         Adds the event to the message to be sent.
@@ -33,6 +41,51 @@ class MessageAttributes(UserDict):
 
         self.add_string_attribute(settings.INIESTA_SNS_EVENT_KEY, value)
 
+    def add_expiry(
+        self,
+        *,
+        ttl: Union[int, float, datetime.timedelta, None] = None,
+        expires_at: Union[int, float, datetime.datetime, None] = None,
+    ) -> None:
+        """
+        Adds the time after which the message is expired and
+        is deleted without being handled.
+
+        :param ttl: Seconds (or a timedelta) from now until the message expires.
+        :param expires_at: The time (seconds since the epoch or a datetime)
+            the message expires. Naive datetimes are in local time.
+        :raises ValueError: If both or neither of :code:`ttl` and :code:`expires_at` are set.
+        """
+        if (ttl is None) == (expires_at is None):
+            raise ValueError("Exactly one of ttl or expires_at must be set.")
+
+        if ttl is not None:
+            if isinstance(ttl, datetime.timedelta):
+                ttl = ttl.total_seconds()
+            expires_at = time.time() + ttl
+        elif isinstance(expires_at, datetime.datetime):
+            expires_at = expires_at.timestamp()
+
+        self.add_number_attribute(
+            settings.INIESTA_EXPIRES_AT_KEY, round(expires_at, 3)
+        )
+
+    def add_published_at(self) -> None:
+        """
+        Adds the current time as the time the message was published,
+        unless :code:`INIESTA_PUBLISHED_AT_KEY` is :code:`None`.
+        """
+        if settings.INIESTA_PUBLISHED_AT_KEY:
+            self.add_number_attribute(
+                settings.INIESTA_PUBLISHED_AT_KEY, round(time.time(), 6)
+            )
+
+    def add_trace_id(self, trace_id: str) -> None:
+        """
+        Adds the trace id of the message.
+        """
+        self.add_string_attribute(settings.INIESTA_TRACE_ID_KEY, trace_id)
+
     def add_attribute(self, attribute_name: str, attribute_value: Any) -> None:
         """
         Adds an attribute depending on value type.
@@ -61,13 +114,9 @@ class MessageAttributes(UserDict):
         if not isinstance(attribute_value, str):
             raise ValueError("Value is not a string.")
 
-        self["MessageAttributes"].update(
-            {
-                attribute_name: {
-                    "DataType": "String",
-                    "StringValue": attribute_value,
-                }
-            }
+        self._set_message_attribute(
+            attribute_name,
+            {"DataType": "String", "StringValue": attribute_value},
         )
 
     def add_number_attribute(
@@ -81,13 +130,9 @@ class MessageAttributes(UserDict):
         if not isinstance(attribute_value, (int, float)):
             raise ValueError("Value is not a number.")
 
-        self["MessageAttributes"].update(
-            {
-                attribute_name: {
-                    "DataType": "Number",
-                    "StringValue": str(attribute_value),
-                }
-            }
+        self._set_message_attribute(
+            attribute_name,
+            {"DataType": "Number", "StringValue": str(attribute_value)},
         )
 
     def add_list_attribute(
@@ -101,13 +146,12 @@ class MessageAttributes(UserDict):
         if not isinstance(attribute_value, (list, tuple)):
             raise ValueError("Value is not a list or tuple.")
 
-        self["MessageAttributes"].update(
+        self._set_message_attribute(
+            attribute_name,
             {
-                attribute_name: {
-                    "DataType": "String.Array",
-                    "StringValue": json.dumps(attribute_value),
-                }
-            }
+                "DataType": "String.Array",
+                "StringValue": json.dumps(attribute_value),
+            },
         )
 
     def add_binary_attribute(self, attribute_name: str, attribute_value: bytes):
@@ -119,11 +163,7 @@ class MessageAttributes(UserDict):
         if not isinstance(attribute_value, bytes):
             raise ValueError("Value is not bytes.")
 
-        self["MessageAttributes"].update(
-            {
-                attribute_name: {
-                    "DataType": "Binary",
-                    "BinaryValue": attribute_value,
-                }
-            }
+        self._set_message_attribute(
+            attribute_name,
+            {"DataType": "Binary", "BinaryValue": attribute_value},
         )
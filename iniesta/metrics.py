@@ -0,0 +1,651 @@
+"""
+A registry of the runtime metrics of iniesta and exporters for them.
+
+Counters, gauges and histograms are updated in place when messages are
+received, handled and deleted, which costs a dictionary lookup and an
+addition per update. Nothing is formatted or sent until an exporter
+collects the registry:
+
+- :code:`PrometheusExporter` serves the registry in the Prometheus text
+  format on a route of the app (:code:`INIESTA_METRICS_ROUTE`).
+- :code:`StatsDExporter` sends the registry to a StatsD server over UDP
+  every interval (:code:`INIESTA_METRICS_STATSD_ADDRESS`).
+
+The :code:`metrics` of clients that are registered with
+:code:`MetricsRegistry.collect` are included as gauges.
+
+.. code-block:: python
+
+    from iniesta.metrics import registry
+
+    registry.counter("iniesta_sqs_messages_handled_total").labels(
+        queue="iniesta-prod-user", event="UserCreated.user"
+    ).value
+"""
+import asyncio
+import bisect
+import math
+import re
+import socket
+import weakref
+
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from iniesta.log import error_logger
+
+#: The upper bounds of the latency histogram buckets in seconds.
+LATENCY_BUCKETS: Sequence[float] = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    math.inf,
+)
+
+#: The upper bounds of the lag histogram buckets in seconds.
+LAG_BUCKETS: Sequence[float] = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    300.0,
+    900.0,
+    3600.0,
+    math.inf,
+)
+
+#: The upper bounds of the message size histogram buckets in bytes.
+SIZE_BUCKETS: Sequence[float] = (
+    256,
+    1024,
+    4096,
+    16384,
+    65536,
+    131072,
+    262144,
+    math.inf,
+)
+
+_INVALID_NAME = re.compile(r"[^a-zA-Z0-9_]")
+
+
+class CounterValue:
+    """
+    A value that only increases.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class GaugeValue:
+    """
+    A value that goes up and down.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class LatencyHistogram:
+    """
+    Counts latencies (or other observations, e.g. sizes) in buckets of
+    fixed upper bounds, so memory doesn't grow with the number of
+    observations.
+
+    :param buckets: The upper bounds of the buckets (e.g. in seconds),
+        ascending and ending with infinity.
+    """
+
+    __slots__ = ("buckets", "counts", "count", "sum", "max")
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, percent: float) -> float:
+        """
+        The nearest-rank percentile, estimated by the upper bound of its
+        bucket (but never more than the maximum).
+        """
+        return _percentile(self.buckets, self.counts, percent, self.max)
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    @property
+    def metrics(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+    @property
+    def distribution(self) -> List[Tuple[float, int]]:
+        """
+        The upper bound and count of each bucket from the first to the
+        last non-empty one.
+        """
+        used = [i for i, count in enumerate(self.counts) if count]
+        if not used:
+            return []
+        return list(zip(self.buckets, self.counts))[used[0] : used[-1] + 1]
+
+
+def _percentile(
+    buckets: Sequence[float],
+    counts: Sequence[int],
+    percent: float,
+    maximum: float = math.inf,
+) -> float:
+    total = sum(counts)
+    if not total:
+        return 0.0
+    rank = max(1, math.ceil(percent / 100 * total))
+    seen = 0
+    for bound, count in zip(buckets, counts):
+        seen += count
+        if seen >= rank:
+            return min(bound, maximum)
+    return maximum
+
+
+class Metric:
+    """
+    A metric with a value for every combination of its label values.
+
+    :param name: The name, e.g. :code:`iniesta_sqs_messages_handled_total`.
+    :param documentation: What the metric measures.
+    :param labelnames: The names of the labels.
+    """
+
+    type: str = "untyped"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def _value(self):
+        raise NotImplementedError
+
+    def labels(self, *values, **labels):
+        """
+        The value of the label values, given in the order of the label
+        names or by name.
+        """
+        if labels:
+            values = tuple(labels[name] for name in self.labelnames)
+        try:
+            return self._values[values]
+        except KeyError:
+            if len(values) != len(self.labelnames):
+                raise ValueError(
+                    f"{self.name} has the labels {self.labelnames}. "
+                    f"Got {values}."
+                ) from None
+            value = self._values[values] = self._value()
+            return value
+
+    def remove(self, *values) -> None:
+        """
+        Removes the value of the label values.
+        """
+        self._values.pop(values, None)
+
+    def items(self) -> List[Tuple[Dict[str, str], object]]:
+        """
+        The labels and value of every combination of label values.
+        """
+        return [
+            (dict(zip(self.labelnames, values)), value)
+            for values, value in list(self._values.items())
+        ]
+
+
+class Counter(Metric):
+    type = "counter"
+    _value = CounterValue
+
+
+class Gauge(Metric):
+    type = "gauge"
+    _value = GaugeValue
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _value(self) -> LatencyHistogram:
+        return LatencyHistogram(self.buckets)
+
+
+def _flatten(
+    metrics: dict, prefix: str, labels: Dict[str, str]
+) -> Iterator[Tuple[str, Dict[str, str], float]]:
+    """
+    The numeric values of a :code:`metrics` dict. Nested dicts of numbers
+    extend the name, nested dicts of dicts (e.g. per handler) are labelled
+    with :code:`name`.
+    """
+    for key, value in metrics.items():
+        name = f"{prefix}_{_INVALID_NAME.sub('_', str(key))}"
+        if isinstance(value, bool):
+            yield name, labels, int(value)
+        elif isinstance(value, (int, float)):
+            yield name, labels, value
+        elif isinstance(value, dict):
+            if value and all(isinstance(v, dict) for v in value.values()):
+                for item, nested in value.items():
+                    yield from _flatten(
+                        nested, name, {**labels, "name": str(item)}
+                    )
+            else:
+                yield from _flatten(value, name, labels)
+
+
+class MetricsRegistry:
+    """
+    The metrics of a process. Metrics are created once with
+    :code:`counter`, :code:`gauge` or :code:`histogram`, which return
+    the existing metric of the name if it was created before.
+    """
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = OrderedDict()
+        self._collected = OrderedDict()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs) -> Metric:
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, *args, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"{name} is already a {metric.type}.")
+        return metric
+
+    def counter(
+        self, name: str, documentation: str = "", labelnames=()
+    ) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str = "", labelnames=()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str = "",
+        labelnames=(),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._get_or_create(
+            Histogram, name, documentation, labelnames, buckets=buckets
+        )
+
+    def collect(self, source, prefix: str, **labels: str) -> None:
+        """
+        Includes the :code:`metrics` dict of an object, e.g. a
+        :code:`SQSClient`, as gauges when the registry is exported. The
+        object is referenced weakly and replaces the object registered
+        before with the same prefix and labels.
+
+        :param source: An object with a :code:`metrics` property.
+        :param prefix: The prefix of the names of the gauges.
+        :param labels: The labels of the gauges.
+        """
+        key = (prefix, tuple(sorted(labels.items())))
+        self._collected[key] = weakref.ref(source)
+
+    def metrics(self) -> List[Metric]:
+        """
+        The metrics, followed by gauges of the current values of the
+        collected :code:`metrics` dicts.
+        """
+        collected = OrderedDict()
+        for key, reference in list(self._collected.items()):
+            source = reference()
+            if source is None:
+                self._collected.pop(key, None)
+                continue
+
+            prefix, labels = key
+            try:
+                values = source.metrics
+            except Exception:
+                error_logger.exception(f"[INIESTA] Collecting {prefix} failed")
+                continue
+
+            for name, item_labels, value in _flatten(
+                values, prefix, dict(labels)
+            ):
+                gauge = collected.get(name)
+                if gauge is None:
+                    gauge = collected[name] = Gauge(
+                        name,
+                        f"Collected from {type(source).__name__}.metrics.",
+                        tuple(item_labels),
+                    )
+                gauge.labels(**item_labels).set(value)
+
+        return list(self._metrics.values()) + list(collected.values())
+
+
+#: The registry iniesta records its metrics to.
+registry = MetricsRegistry()
+
+
+def _escape(value: str) -> str:
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\n", "\\n")
+        .replace('"', '\\"')
+    )
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return (
+        "{"
+        + ",".join(
+            f'{name}="{_escape(value)}"' for name, value in labels.items()
+        )
+        + "}"
+    )
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+class PrometheusExporter:
+    """
+    Renders a registry in the Prometheus text exposition format.
+
+    :param registry: The registry to export.
+    """
+
+    content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self, registry: MetricsRegistry = registry) -> None:
+        self.registry = registry
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.registry.metrics():
+            lines.append(
+                f"# HELP {metric.name} {_escape(metric.documentation)}"
+            )
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for labels, value in metric.items():
+                if metric.type == "histogram":
+                    lines.extend(self._histogram(metric.name, labels, value))
+                else:
+                    lines.append(
+                        f"{metric.name}{_format_labels(labels)} "
+                        f"{_format_value(value.value)}"
+                    )
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _histogram(
+        name: str, labels: Dict[str, str], histogram: LatencyHistogram
+    ) -> Iterator[str]:
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            bucket_labels = _format_labels(
+                {**labels, "le": _format_value(bound)}
+            )
+            yield f"{name}_bucket{bucket_labels} {cumulative}"
+        yield f"{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}"
+        yield f"{name}_count{_format_labels(labels)} {histogram.count}"
+
+    async def handler(self, request):
+        """
+        A route handler that responds with the rendered registry.
+        """
+        from sanic.response import text
+
+        return text(self.render(), content_type=self.content_type)
+
+    def attach(self, app, uri: str) -> None:
+        """
+        Adds a :code:`GET` route for the metrics to the app.
+        """
+        app.add_route(self.handler, uri, methods=["GET"])
+
+
+class StatsDExporter:
+    """
+    Sends a registry to a StatsD server over UDP every interval, with
+    labels as DogStatsD tags.
+
+    Counters are sent as the increase since the last flush, gauges as
+    their value. Histograms are sent as the number of observations since
+    the last flush and their 50th, 90th and 99th percentile during the
+    interval, in seconds, as gauges.
+
+    :param address: The :code:`host:port` of the StatsD server.
+    :param prefix: Prepended with a dot to the names of the metrics.
+    :param interval: Seconds between flushes.
+    :param registry: The registry to export.
+    """
+
+    #: The maximum bytes sent in a datagram, to avoid fragmentation.
+    max_packet_size: int = 1432
+
+    def __init__(
+        self,
+        address: str,
+        *,
+        prefix: Optional[str] = None,
+        interval: float = 10,
+        registry: MetricsRegistry = registry,
+    ) -> None:
+        host, _, port = address.rpartition(":")
+        self.address = (host or "localhost", int(port))
+        self.prefix = f"{prefix}." if prefix else ""
+        self.interval = interval
+        self.registry = registry
+        self._last = {}
+        self._socket = None
+        self._task = None
+
+    def _line(self, name: str, value, kind: str, labels: dict) -> str:
+        line = f"{self.prefix}{name}:{value:g}|{kind}"
+        if labels:
+            line += "|#" + ",".join(f"{k}:{v}" for k, v in labels.items())
+        return line
+
+    def lines(self) -> List[str]:
+        """
+        The lines of the current flush, updating the last sent values.
+        """
+        lines = []
+        for metric in self.registry.metrics():
+            for labels, value in metric.items():
+                key = (metric.name, tuple(labels.values()))
+                if metric.type == "counter":
+                    delta = value.value - self._last.get(key, 0)
+                    self._last[key] = value.value
+                    if delta:
+                        lines.append(
+                            self._line(metric.name, delta, "c", labels)
+                        )
+                elif metric.type == "histogram":
+                    lines.extend(
+                        self._histogram(metric.name, key, labels, value)
+                    )
+                else:
+                    lines.append(
+                        self._line(metric.name, value.value, "g", labels)
+                    )
+        return lines
+
+    def _histogram(
+        self, name: str, key: tuple, labels: dict, histogram: LatencyHistogram
+    ) -> List[str]:
+        last = self._last.get(key) or [0] * len(histogram.counts)
+        counts = [now - before for now, before in zip(histogram.counts, last)]
+        self._last[key] = list(histogram.counts)
+
+        observed = sum(counts)
+        if not observed:
+            return []
+        lines = [self._line(f"{name}.count", observed, "c", labels)]
+        for percent in (50, 90, 99):
+            value = _percentile(histogram.buckets, counts, percent)
+            if value == math.inf:
+                value = histogram.max
+            lines.append(self._line(f"{name}.p{percent}", value, "g", labels))
+        return lines
+
+    def _packets(self, lines: List[str]) -> Iterator[bytes]:
+        packet = b""
+        for line in lines:
+            encoded = line.encode("utf-8")
+            if packet and len(packet) + 1 + len(encoded) > self.max_packet_size:
+                yield packet
+                packet = b""
+            packet = packet + b"\n" + encoded if packet else encoded
+        if packet:
+            yield packet
+
+    def flush(self) -> int:
+        """
+        Sends the metrics.
+
+        :return: The number of datagrams sent.
+        """
+        if self._socket is None:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._socket.setblocking(False)
+
+        sent = 0
+        for packet in self._packets(self.lines()):
+            try:
+                self._socket.sendto(packet, self.address)
+                sent += 1
+            except OSError as e:
+                error_logger.warning(f"[INIESTA] Sending metrics failed: {e}")
+        return sent
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                error_logger.exception("[INIESTA] Sending metrics failed")
+
+    def start(self) -> None:
+        """
+        Starts flushing every interval.
+        """
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stops flushing and sends the metrics one last time.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.flush()
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    async def after_server_start(self, app, loop=None, **kwargs) -> None:
+        self.start()
+
+    async def before_server_stop(self, app, loop=None, **kwargs) -> None:
+        await self.stop()
+
+
+def statsd_exporter(settings_object) -> Optional[StatsDExporter]:
+    """
+    The StatsD exporter configured with
+    :code:`INIESTA_METRICS_STATSD_ADDRESS`, if any.
+    """
+    if not settings_object.INIESTA_METRICS_STATSD_ADDRESS:
+        return None
+    return StatsDExporter(
+        settings_object.INIESTA_METRICS_STATSD_ADDRESS,
+        prefix=settings_object.INIESTA_METRICS_STATSD_PREFIX,
+        interval=settings_object.INIESTA_METRICS_STATSD_INTERVAL,
+    )
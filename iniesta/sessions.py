@@ -20,6 +20,16 @@ class AWSCredentials(object):
 
 
 class BotoSession:
+    """
+    Holds the session that creates the aws clients of iniesta.
+
+    The session is the transport of iniesta. Every sns and sqs client is
+    created with :code:`session.create_client(service_name, **kwargs)`,
+    which must return an async context manager with the aiobotocore
+    client api. Defaults to an aiobotocore session, but may be replaced
+    with :code:`set_session`, e.g. with :code:`iniesta.memory.InMemorySession`.
+    """
+
     session = None
 
     @classmethod
@@ -28,6 +38,14 @@ class BotoSession:
             cls.session = aiobotocore.get_session()
         return cls.session
 
+    @classmethod
+    def set_session(cls, session) -> None:
+        """
+        Replaces the session used to create aws clients. :code:`None`
+        resets it to an aiobotocore session.
+        """
+        cls.session = session
+
     aws_access_key_id = AWSCredentials("AWS_ACCESS_KEY_ID")
     aws_secret_access_key = AWSCredentials("AWS_SECRET_ACCESS_KEY")
     aws_default_region = AWSCredentials("AWS_DEFAULT_REGION")
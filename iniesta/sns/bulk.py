@@ -0,0 +1,217 @@
+import asyncio
+import time
+
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+import botocore.exceptions
+import ujson as json
+
+from iniesta.log import error_logger
+from iniesta.metrics import registry
+from iniesta.sqs.limits import TokenBucket
+
+from .client import MAX_BATCH_SIZE
+from .message import MAX_BODY_SIZE, SNSMessage, topic_name
+
+QUEUED_MESSAGES = registry.gauge(
+    "iniesta_sns_publish_queue_depth",
+    "Messages read by publish_bulk that are waiting for a publisher.",
+    ("topic",),
+)
+
+
+class BulkPublishStats:
+    """
+    The progress of :code:`publish_bulk`.
+    """
+
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self.published = 0
+        self.rejected = 0
+        self.batches = 0
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def throughput(self) -> float:
+        """
+        Messages published per second.
+        """
+        elapsed = self.elapsed
+        return self.published / elapsed if elapsed else 0.0
+
+
+def record_message(sns_client, record: dict) -> SNSMessage:
+    """
+    Creates the message for a record of a bulk publish file.
+
+    A record is a JSON object with the :code:`event` and optionally the
+    :code:`message`, :code:`version`, :code:`raw_event` (defaults to
+    :code:`true`), :code:`ttl`, :code:`expires_at` and :code:`attributes`
+    to pass to :code:`SNSClient.create_message`.
+
+    :raises ValueError: If the record is invalid.
+    """
+    if not isinstance(record, dict) or "event" not in record:
+        raise ValueError("Record must be an object with an event.")
+
+    attributes = record.get("attributes", {})
+    if not isinstance(attributes, dict):
+        raise ValueError("attributes must be an object.")
+
+    try:
+        return sns_client.create_message(
+            event=record["event"],
+            message=record.get("message", {}),
+            version=record.get("version", 1),
+            raw_event=record.get("raw_event", True),
+            ttl=record.get("ttl"),
+            expires_at=record.get("expires_at"),
+            **attributes,
+        )
+    except TypeError as e:
+        raise ValueError(str(e))
+
+
+def _batches(
+    sns_client, lines: Iterable[str], rejected: Callable[[str, str], None]
+) -> Iterator[List[Tuple[str, SNSMessage]]]:
+    """
+    Groups the messages of the lines into batches of up to 10 messages
+    and at most 256 KiB.
+    """
+    batch, batch_size = [], 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            message = record_message(sns_client, json.loads(line))
+        except ValueError as e:
+            rejected(line, str(e))
+            continue
+
+        size = message.size
+        if batch and (
+            len(batch) == MAX_BATCH_SIZE or batch_size + size > MAX_BODY_SIZE
+        ):
+            yield batch
+            batch, batch_size = [], 0
+        batch.append((line, message))
+        batch_size += size
+
+    if batch:
+        yield batch
+
+
+async def _publish_batch(
+    sns_client, client, messages: List[SNSMessage]
+) -> List[Tuple[SNSMessage, str]]:
+    try:
+        return await sns_client.publish_batch(client, messages)
+    except asyncio.CancelledError:
+        raise
+    except botocore.exceptions.ClientError as e:
+        reason = (
+            f"[{e.response['Error']['Code']}] {e.response['Error']['Message']}"
+        )
+    except Exception as e:
+        error_logger.exception("[INIESTA] PUBLISH BATCH FAILED")
+        reason = repr(e)
+    return [(message, reason) for message in messages]
+
+
+async def publish_bulk(
+    sns_client,
+    lines: Iterable[str],
+    *,
+    concurrency: int = 4,
+    rate_limit: Optional[float] = None,
+    reject: Optional[Callable[[str, str], None]] = None,
+    progress: Optional[Callable[[BulkPublishStats], None]] = None,
+    progress_interval: float = 5,
+) -> BulkPublishStats:
+    """
+    Publishes one message per line of NDJSON records with :code:`PublishBatch`.
+
+    The lines are read as they are published, so only the batches waiting
+    for a publisher are held in memory. Batches hold up to 10 messages and
+    at most 256 KiB.
+
+    :param sns_client: The client of the topic to publish to.
+    :type sns_client: :code:`SNSClient`
+    :param lines: The NDJSON lines. Refer to :code:`record_message` for the format.
+    :param concurrency: The number of concurrent :code:`PublishBatch` requests.
+    :param rate_limit: The maximum number of messages published per second.
+    :param reject: Called with the line and the reason for every line
+        that could not be published.
+    :param progress: Called with the stats every :code:`progress_interval` seconds.
+    :param progress_interval: Seconds between progress reports.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1.")
+
+    stats = BulkPublishStats()
+    bucket = None if rate_limit is None else TokenBucket(rate_limit)
+    batches = asyncio.Queue(concurrency)
+    queued = QUEUED_MESSAGES.labels(topic_name(sns_client.topic_arn))
+
+    def rejected(line: str, reason: str) -> None:
+        stats.rejected += 1
+        if reject is not None:
+            reject(line, reason)
+
+    async def publisher(client):
+        while True:
+            batch = await batches.get()
+            if batch is None:
+                return
+            queued.dec(len(batch))
+
+            if bucket is not None:
+                for _ in batch:
+                    await bucket.acquire()
+
+            lines = {id(message): line for line, message in batch}
+            messages = [message for _, message in batch]
+            failed = await _publish_batch(sns_client, client, messages)
+
+            stats.batches += 1
+            stats.published += len(messages) - len(failed)
+            for message, reason in failed:
+                rejected(lines[id(message)], reason)
+
+    async def report():
+        while True:
+            await asyncio.sleep(progress_interval)
+            progress(stats)
+
+    async with sns_client._create_client() as client:
+        publishers = [
+            asyncio.ensure_future(publisher(client)) for _ in range(concurrency)
+        ]
+        reporter = asyncio.ensure_future(report()) if progress else None
+        try:
+            for batch in _batches(sns_client, lines, rejected):
+                await batches.put(batch)
+                queued.inc(len(batch))
+            for _ in publishers:
+                await batches.put(None)
+            await asyncio.gather(*publishers)
+        finally:
+            for task in publishers:
+                task.cancel()
+            if reporter is not None:
+                reporter.cancel()
+            while not batches.empty():
+                batch = batches.get_nowait()
+                if batch is not None:
+                    queued.dec(len(batch))
+
+    if progress:
+        progress(stats)
+    return stats
@@ -1,17 +1,22 @@
-from typing import Optional, Iterator, Any, Callable
+from typing import Optional, Iterator, Any, Callable, List, Tuple
 
 import botocore.exceptions
 import functools
+import time
 
 from inspect import isawaitable
 
 from iniesta.log import error_logger, logger
 from iniesta.sessions import BotoSession
 from iniesta.sns import SNSMessage
+from iniesta.sns.message import failure_reason, record_publish, topic_name
 
 from insanic.conf import settings
 from insanic.exceptions import APIException
 
+#: The maximum number of messages in a :code:`PublishBatch` request.
+MAX_BATCH_SIZE: int = 10
+
 
 class SNSClient:
     """
@@ -165,6 +170,89 @@ class SNSClient:
                 SubscriptionArn=subscription_arn
             )
 
+    def _create_client(self):
+        """
+        Creates an aws sns client for this client's region and endpoint.
+        """
+        return BotoSession.get_session().create_client(
+            "sns",
+            region_name=self.region_name,
+            endpoint_url=self.endpoint_url,
+            aws_access_key_id=BotoSession.aws_access_key_id,
+            aws_secret_access_key=BotoSession.aws_secret_access_key,
+        )
+
+    async def publish_batch(
+        self, client, messages: List[SNSMessage]
+    ) -> List[Tuple[SNSMessage, str]]:
+        """
+        Publishes up to 10 messages with a single :code:`PublishBatch` request.
+
+        :param client: aws sns client
+        :param messages: The messages to publish.
+        :return: The messages that failed to be published with the reason.
+        :raises ValueError: If there are more than 10 messages.
+        """
+        if len(messages) > MAX_BATCH_SIZE:
+            raise ValueError(
+                f"A batch can have at most {MAX_BATCH_SIZE} messages. "
+                f"Got {len(messages)}."
+            )
+
+        start = time.perf_counter()
+        try:
+            response = await client.publish_batch(
+                TopicArn=self.topic_arn,
+                PublishBatchRequestEntries=[
+                    {"Id": str(i), **message}
+                    for i, message in enumerate(messages)
+                ],
+            )
+        except Exception as e:
+            self._record_batch(messages, time.perf_counter() - start, {}, e)
+            raise
+
+        failed, reasons = [], {}
+        for entry in response.get("Failed", []):
+            index = int(entry["Id"])
+            reasons[index] = failure_reason(entry.get("Code"))
+            failed.append(
+                (
+                    messages[index],
+                    f"[{entry.get('Code')}] {entry.get('Message')}",
+                )
+            )
+        self._record_batch(messages, time.perf_counter() - start, reasons)
+        logger.debug(
+            f"[INIESTA] Published batch: {len(messages) - len(failed)}"
+            f"/{len(messages)} messages"
+        )
+        return failed
+
+    def _record_batch(
+        self,
+        messages: List[SNSMessage],
+        latency: float,
+        reasons: dict,
+        exc: Optional[Exception] = None,
+    ) -> None:
+        """
+        Records the metrics of the messages of a batch.
+
+        :param reasons: The failure reasons by index of the failed messages.
+        :param exc: The exception the whole batch failed with.
+        """
+        topic = topic_name(self.topic_arn)
+        reason = None if exc is None else failure_reason(exc)
+        for i, message in enumerate(messages):
+            record_publish(
+                topic,
+                message.event,
+                message["Message"],
+                latency,
+                reasons.get(i, reason),
+            )
+
     def create_message(
         self,
         *,
@@ -172,6 +260,10 @@ class SNSClient:
         message: Any,
         version: int = 1,
         raw_event: bool = False,
+        ttl=None,
+        expires_at=None,
+        trace_id: Optional[str] = None,
+        published_at: bool = True,
         **message_attributes,
     ) -> SNSMessage:
         """
@@ -180,6 +272,12 @@ class SNSClient:
         :param event: The event to publish (will be used to filter).
         :param message: The message body to send with event.
         :param version: A version to publish. Defaults to 1.
+        :param ttl: Seconds (or a timedelta) until the message expires and
+            is deleted by consumers without being handled.
+        :param expires_at: The time (epoch seconds or a datetime) the message expires.
+        :param trace_id: The trace or correlation id of the message. Defaults
+            to the trace id of the message being handled.
+        :param published_at: If the message is stamped with the current time.
         :param message_attributes: Any attributes to include in the message.
             Refer to https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/sns.html#SNS.Client.publish.
         """
@@ -189,6 +287,10 @@ class SNSClient:
             message=message,
             version=version,
             raw_event=raw_event,
+            ttl=ttl,
+            expires_at=expires_at,
+            trace_id=trace_id,
+            published_at=published_at,
             **message_attributes,
         )
         return message_payload
@@ -1,4 +1,6 @@
-from typing import Union, Any
+import time
+
+from typing import Union, Any, Optional
 
 import botocore
 import ujson as json
@@ -8,10 +10,87 @@ from insanic.conf import settings
 from iniesta.log import logger, error_logger
 from iniesta.sessions import BotoSession
 from iniesta.messages import MessageAttributes
+from iniesta.metrics import SIZE_BUCKETS, registry
+from iniesta.tracing import current_trace_id
 
 #: A constant for the max body size SNS can publish.
 MAX_BODY_SIZE: int = 1024 * 256
 
+#: A constant for the max number of message attributes SQS delivers.
+MAX_MESSAGE_ATTRIBUTES: int = 10
+
+#: The error codes of publish requests that were throttled.
+THROTTLING_ERROR_CODES = frozenset(
+    ("Throttling", "ThrottlingException", "ThrottledException", "Throttled")
+)
+
+MESSAGES_PUBLISHED = registry.counter(
+    "iniesta_sns_messages_published_total",
+    "Messages published.",
+    ("topic", "event"),
+)
+MESSAGES_FAILED = registry.counter(
+    "iniesta_sns_messages_failed_total",
+    "Messages that failed to be published, by reason (throttled or error).",
+    ("topic", "event", "reason"),
+)
+PUBLISH_LATENCY = registry.histogram(
+    "iniesta_sns_publish_seconds",
+    "Latency of publish requests. Messages of a batch observe the batch.",
+    ("topic", "event"),
+)
+MESSAGE_SIZE = registry.histogram(
+    "iniesta_sns_message_bytes",
+    "Size of the bodies of published messages.",
+    ("topic", "event"),
+    buckets=SIZE_BUCKETS,
+)
+
+
+def topic_name(topic_arn: Optional[str]) -> str:
+    """
+    The name of a topic from its arn, used to label metrics.
+    """
+    return (topic_arn or "").rpartition(":")[2]
+
+
+def failure_reason(error: Union[Exception, str, None]) -> str:
+    """
+    :code:`throttled` if the publish request was throttled, otherwise
+    :code:`error`.
+
+    :param error: The exception of the request or the error code of a
+        failed batch entry.
+    """
+    if isinstance(error, botocore.exceptions.ClientError):
+        error = error.response.get("Error", {}).get("Code")
+    return "throttled" if error in THROTTLING_ERROR_CODES else "error"
+
+
+def record_publish(
+    topic: str,
+    event: Optional[str],
+    body: str,
+    latency: float,
+    reason: Optional[str] = None,
+) -> None:
+    """
+    Records the metrics of a published message.
+
+    :param topic: The name of the topic.
+    :param event: The event of the message.
+    :param body: The message body.
+    :param latency: The seconds the publish request took.
+    :param reason: Why the message failed to be published, if it did.
+    """
+    event = event or ""
+    PUBLISH_LATENCY.labels(topic, event).observe(latency)
+    if reason is None:
+        MESSAGES_PUBLISHED.labels(topic, event).inc()
+        MESSAGE_SIZE.labels(topic, event).observe(len(body.encode("utf8")))
+    else:
+        MESSAGES_FAILED.labels(topic, event, reason).inc()
+
 
 class SNSMessage(MessageAttributes):
     """
@@ -120,6 +199,7 @@ class SNSMessage(MessageAttributes):
         """
 
         session = BotoSession.get_session()
+        start = time.perf_counter()
         try:
             async with session.create_client(
                 "sns",
@@ -135,15 +215,30 @@ class SNSMessage(MessageAttributes):
                     f"[INIESTA] Published ({self.event}) with "
                     f"the following attributes: {self}"
                 )
-                return message
         except botocore.exceptions.ClientError as e:
+            self._record_publish(start, e)
             error_logger.critical(
                 f"[{e.response['Error']['Code']}]: {e.response['Error']['Message']}"
             )
             raise
-        except Exception:
+        except Exception as e:
+            self._record_publish(start, e)
             error_logger.exception("Publishing SNS Message Failed!")
             raise
+        else:
+            self._record_publish(start)
+            return message
+
+    def _record_publish(
+        self, start: float, exc: Optional[Exception] = None
+    ) -> None:
+        record_publish(
+            topic_name(self.client.topic_arn),
+            self.event,
+            self["Message"],
+            time.perf_counter() - start,
+            None if exc is None else failure_reason(exc),
+        )
 
     @classmethod
     def create_message(
@@ -154,20 +249,37 @@ class SNSMessage(MessageAttributes):
         message: Any,
         version: int = 1,
         raw_event: bool = False,
+        ttl=None,
+        expires_at=None,
+        trace_id: Optional[str] = None,
+        published_at: bool = True,
         **message_attributes,
     ):
         """
         A factory method to initialize an event message.
 
+        The message is stamped with the current time to measure the lag
+        until it is handled, and with the trace id, which defaults to the
+        trace id of the message being handled (refer to :code:`iniesta.tracing`).
+        Both count towards the :code:`MAX_MESSAGE_ATTRIBUTES` attributes of a
+        message, along with the event, the version and the expiry.
+
         :param client: The initialized SNSClient
         :type client: :code:`SNSClient`
         :param event: The event this message will publish.
         :param message: The message body to publish.
         :param version: Version of the message.
         :param raw_event: If the event should be passed in as itself.
+        :param ttl: Seconds (or a timedelta) until the message expires.
+        :param expires_at: The time (epoch seconds or a datetime) the message expires.
+        :param trace_id: The trace or correlation id of the message.
+        :param published_at: If the message is stamped with the current time.
+            Also disabled if :code:`INIESTA_PUBLISHED_AT_KEY` is :code:`None`.
         :param message_attributes: Any message attributes
         :return: Instantiated instance of self.
         :rtype: :code:`SNSMessage`
+        :raises ValueError: If the message has more than
+            :code:`MAX_MESSAGE_ATTRIBUTES` attributes.
         """
 
         message_object = cls(message)
@@ -178,6 +290,23 @@ class SNSMessage(MessageAttributes):
 
         message_object.add_event(event, raw=raw_event)
         message_object.add_number_attribute("version", version)
+        if ttl is not None or expires_at is not None:
+            message_object.add_expiry(ttl=ttl, expires_at=expires_at)
+        if published_at:
+            message_object.add_published_at()
+        if trace_id is None:
+            trace_id = current_trace_id()
+        if trace_id is not None:
+            message_object.add_trace_id(trace_id)
+
+        attributes = list(message_object.message_attributes)
+        if len(attributes) > MAX_MESSAGE_ATTRIBUTES:
+            raise ValueError(
+                f"Message has too many attributes! Max is "
+                f"{MAX_MESSAGE_ATTRIBUTES}. {len(attributes)} attributes "
+                f"including the ones added by iniesta: {attributes}. "
+                f"Pass published_at=False to make room for one more."
+            )
         message_object.client = client
 
         return message_object
@@ -1,4 +1,5 @@
 from .client import SQSClient
+from .consumer import MultiQueueConsumer
 from .message import SQSMessage
 
-__all__ = ("SQSClient", "SQSMessage")
+__all__ = ("SQSClient", "SQSMessage", "MultiQueueConsumer")
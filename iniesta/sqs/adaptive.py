@@ -0,0 +1,170 @@
+from typing import Optional
+
+#: The maximum number of messages SQS will return for a single receive.
+MAX_NUMBER_OF_MESSAGES: int = 10
+
+#: The maximum long poll wait time SQS allows.
+MAX_WAIT_TIME_SECONDS: int = 20
+
+
+class AdaptiveReceiveController:
+    """
+    Decides how many concurrent receivers should be polling, how many
+    messages each receive should request and how long each receive should
+    wait, based on the results of recent receives and handler latency.
+
+    - While receives come back full and handler latency is healthy, the batch
+      size grows up to :code:`max_number_of_messages` and then the receiver
+      concurrency grows up to :code:`max_concurrency`.
+    - While receives come back empty, concurrency and batch size shrink.
+    - After :code:`idle_receives` consecutive empty receives the queue is
+      considered idle and a single receiver falls back to maximum length
+      long polls.
+    - When the handler latency moving average exceeds
+      :code:`latency_threshold`, concurrency shrinks even if receives are full.
+
+    If :code:`enabled` is :code:`False`, the controller always returns the
+    initial (static) values.
+
+    :param max_number_of_messages: Upper bound for messages per receive.
+    :param wait_time_seconds: The long poll wait time when the queue is not idle.
+    :param max_concurrency: Upper bound for concurrent receivers.
+    :param latency_threshold: Handler latency (seconds) considered healthy.
+    :param idle_receives: Consecutive empty receives before the queue is idle.
+    :param enabled: If the controller should adapt at all.
+    """
+
+    #: The weight of the latest latency sample in the moving average.
+    latency_smoothing: float = 0.2
+
+    def __init__(
+        self,
+        *,
+        max_number_of_messages: int = MAX_NUMBER_OF_MESSAGES,
+        wait_time_seconds: int = MAX_WAIT_TIME_SECONDS,
+        max_concurrency: int = 1,
+        latency_threshold: float = 1.0,
+        idle_receives: int = 3,
+        enabled: bool = True,
+    ) -> None:
+        self.enabled = enabled
+        self.max_number_of_messages_limit = max(
+            1, min(max_number_of_messages, MAX_NUMBER_OF_MESSAGES)
+        )
+        self.max_concurrency = max(1, max_concurrency)
+        self.base_wait_time_seconds = max(
+            0, min(wait_time_seconds, MAX_WAIT_TIME_SECONDS)
+        )
+        self.latency_threshold = latency_threshold
+        self.idle_receives = max(1, idle_receives)
+
+        self.concurrency = 1
+        self.max_number_of_messages = self.max_number_of_messages_limit
+        self.idle = False
+        self.handler_latency: Optional[float] = None
+
+        self.receives = 0
+        self.empty_receives = 0
+        self.full_receives = 0
+        self._empty_streak = 0
+
+    @property
+    def wait_time_seconds(self) -> int:
+        """
+        The long poll wait time for the next receive.
+        """
+        if self.enabled and self.idle:
+            return MAX_WAIT_TIME_SECONDS
+        return self.base_wait_time_seconds
+
+    @property
+    def healthy(self) -> bool:
+        """
+        If the handler latency moving average is within the threshold.
+        """
+        return (
+            self.handler_latency is None
+            or self.handler_latency <= self.latency_threshold
+        )
+
+    def record_handler_latency(self, seconds: float) -> None:
+        """
+        Adds a handler latency sample to the moving average.
+        """
+        if self.handler_latency is None:
+            self.handler_latency = seconds
+        else:
+            self.handler_latency += self.latency_smoothing * (
+                seconds - self.handler_latency
+            )
+
+    def record_receive(self, requested: int, received: int) -> None:
+        """
+        Adjusts the receive parameters with the result of a receive.
+
+        :param requested: The :code:`MaxNumberOfMessages` that was requested.
+        :param received: The number of messages that were actually received.
+        """
+        self.receives += 1
+
+        if received == 0:
+            self.empty_receives += 1
+            self._empty_streak += 1
+        else:
+            self._empty_streak = 0
+            self.idle = False
+            if received >= requested:
+                self.full_receives += 1
+
+        if not self.enabled:
+            return
+
+        if received == 0:
+            if self._empty_streak >= self.idle_receives:
+                # a long poll returns as soon as messages are available so
+                # there is no reason to ask for fewer while idle
+                self.idle = True
+                self.concurrency = 1
+                self.max_number_of_messages = self.max_number_of_messages_limit
+            else:
+                self._shrink()
+        elif not self.healthy:
+            self.concurrency = max(1, self.concurrency - 1)
+        elif received >= requested:
+            self._grow()
+
+    def _grow(self) -> None:
+        if self.max_number_of_messages < self.max_number_of_messages_limit:
+            self.max_number_of_messages = min(
+                self.max_number_of_messages * 2,
+                self.max_number_of_messages_limit,
+            )
+        elif self.concurrency < self.max_concurrency:
+            self.concurrency += 1
+
+    def _shrink(self) -> None:
+        if self.concurrency > 1:
+            self.concurrency -= 1
+        elif self.max_number_of_messages > 1:
+            self.max_number_of_messages = max(
+                1, self.max_number_of_messages // 2
+            )
+
+    @property
+    def metrics(self) -> dict:
+        """
+        A snapshot of the current state of the controller.
+        """
+        return {
+            "receive_concurrency": self.concurrency,
+            "receive_max_number_of_messages": self.max_number_of_messages,
+            "receive_wait_time_seconds": self.wait_time_seconds,
+            "receive_idle": int(self.idle),
+            "receives": self.receives,
+            "empty_receives": self.empty_receives,
+            "full_receives": self.full_receives,
+            "empty_receive_ratio": (
+                self.empty_receives / self.receives if self.receives else 0.0
+            ),
+            "handler_latency_seconds": self.handler_latency or 0.0,
+        }
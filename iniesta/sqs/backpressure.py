@@ -0,0 +1,211 @@
+import asyncio
+import time
+
+from collections import deque
+from inspect import isawaitable
+from typing import Callable, Optional
+
+from iniesta.log import logger, error_logger
+
+
+class HandlerHealthProbe:
+    """
+    A backpressure probe that reports unhealthy while the handlers of
+    the recent :code:`window` seconds failed too often or were too slow.
+
+    Outcomes are counted in buckets of one second, so the memory used
+    only depends on the window and not on the throughput. While receiving
+    is paused no new outcomes are recorded, the old ones leave the window
+    and the probe reports healthy again once fewer than :code:`min_samples`
+    are left.
+
+    :param error_rate: The ratio of failed handlers (0-1) at or above which the probe trips.
+    :param latency: The average handler latency in seconds above which the probe trips.
+    :param window: The seconds of outcomes that are considered.
+    :param min_samples: The number of outcomes needed before the probe can trip.
+    """
+
+    def __init__(
+        self,
+        *,
+        error_rate: Optional[float] = None,
+        latency: Optional[float] = None,
+        window: float = 30.0,
+        min_samples: int = 10,
+    ) -> None:
+        if error_rate is not None and not 0 < error_rate <= 1:
+            raise ValueError("error_rate must be greater than 0 and at most 1.")
+        if latency is not None and latency <= 0:
+            raise ValueError("latency must be greater than 0.")
+        if window <= 0:
+            raise ValueError("window must be greater than 0.")
+
+        self.error_rate = error_rate
+        self.latency = latency
+        self.window = window
+        self.min_samples = max(1, min_samples)
+        # [second, count, errors, latency sum]
+        self._buckets = deque()
+
+    def _trim(self, now: float) -> None:
+        while self._buckets and self._buckets[0][0] <= now - self.window:
+            self._buckets.popleft()
+
+    def record(self, latency: float, failed: bool) -> None:
+        """
+        Records the outcome of a handler.
+
+        :param latency: The seconds the handler took.
+        :param failed: If the handler raised an exception.
+        """
+        second = int(time.monotonic())
+        if not self._buckets or self._buckets[-1][0] != second:
+            self._trim(second)
+            self._buckets.append([second, 0, 0, 0.0])
+        bucket = self._buckets[-1]
+        bucket[1] += 1
+        bucket[2] += failed
+        bucket[3] += latency
+
+    def _totals(self) -> tuple:
+        self._trim(time.monotonic())
+        count = errors = latency = 0
+        for _, bucket_count, bucket_errors, bucket_latency in self._buckets:
+            count += bucket_count
+            errors += bucket_errors
+            latency += bucket_latency
+        return count, errors, latency
+
+    def __call__(self) -> bool:
+        count, errors, latency = self._totals()
+        if count < self.min_samples:
+            return True
+        if self.error_rate is not None and errors / count >= self.error_rate:
+            return False
+        if self.latency is not None and latency / count > self.latency:
+            return False
+        return True
+
+    @property
+    def metrics(self) -> dict:
+        """
+        The error rate and average latency of the handlers in the window.
+        """
+        count, errors, latency = self._totals()
+        return {
+            "recent_handler_error_rate": errors / count if count else 0.0,
+            "recent_handler_latency": latency / count if count else 0.0,
+        }
+
+
+class Backpressure:
+    """
+    Consults the registered probes before messages are received and waits,
+    with an exponentially growing wait, until all of them report healthy.
+
+    A probe is a callable without arguments that returns, or a coroutine
+    function that resolves to, :code:`True` if messages may be received.
+    A probe that raises is considered unhealthy.
+
+    A healthy result is reused for :code:`interval` seconds so concurrent
+    receivers don't call the probes for every receive.
+
+    :param initial_wait: The seconds to wait after the first unhealthy result.
+    :param max_wait: The upper bound for the wait between probes.
+    :param interval: The seconds a healthy result is reused for.
+    """
+
+    def __init__(
+        self,
+        *,
+        initial_wait: float = 1.0,
+        max_wait: float = 60.0,
+        interval: float = 1.0,
+    ) -> None:
+        if initial_wait <= 0:
+            raise ValueError("initial_wait must be greater than 0.")
+        if max_wait < initial_wait:
+            raise ValueError("max_wait must be at least initial_wait.")
+
+        self.initial_wait = initial_wait
+        self.max_wait = max_wait
+        self.interval = interval
+        self.probes = []
+        self.healthy = True
+        self.paused = 0
+        self.paused_seconds = 0.0
+        self._checked_at = None
+        self._lock = asyncio.Lock()
+
+    def add_probe(self, probe: Callable) -> Callable:
+        """
+        Registers a probe. Returns the probe so this can be used as a decorator.
+        """
+        self.probes.append(probe)
+        self._checked_at = None
+        return probe
+
+    async def _probe(self, probe: Callable) -> bool:
+        try:
+            result = probe()
+            if isawaitable(result):
+                result = await result
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            error_logger.exception("[INIESTA] BACKPRESSURE PROBE FAILED")
+            return False
+        return bool(result)
+
+    async def check(self) -> bool:
+        """
+        Calls the probes, unless they were healthy less than
+        :code:`interval` seconds ago.
+
+        :return: If all probes are healthy.
+        """
+        async with self._lock:
+            now = time.monotonic()
+            if (
+                self.healthy
+                and self._checked_at is not None
+                and now - self._checked_at < self.interval
+            ):
+                return True
+
+            healthy = True
+            for probe in self.probes:
+                if not await self._probe(probe):
+                    healthy = False
+                    break
+
+            self._checked_at = now
+            if healthy != self.healthy:
+                if healthy:
+                    logger.info("[INIESTA] Backpressure released. Resuming.")
+                else:
+                    self.paused += 1
+                    logger.warning("[INIESTA] Backpressure applied. Pausing.")
+            self.healthy = healthy
+            return healthy
+
+    async def wait(self) -> None:
+        """
+        Waits until all probes report healthy.
+        """
+        wait = self.initial_wait
+        while not await self.check():
+            await asyncio.sleep(wait)
+            self.paused_seconds += wait
+            wait = min(wait * 2, self.max_wait)
+
+    @property
+    def metrics(self) -> dict:
+        """
+        A snapshot of the current state of the backpressure.
+        """
+        return {
+            "backpressure_healthy": self.healthy,
+            "backpressure_paused": self.paused,
+            "backpressure_paused_seconds": self.paused_seconds,
+        }
@@ -0,0 +1,106 @@
+import asyncio
+
+from typing import Awaitable, Callable, List
+
+from iniesta.log import error_logger
+
+
+class BatchCollector:
+    """
+    Collects messages for a batch handler across receives and flushes
+    them when :code:`max_size` messages have been collected or when
+    the oldest message has waited :code:`max_wait_ms`.
+
+    :param flush: Coroutine function called with the list of collected messages.
+    :param max_size: The maximum number of messages in a batch.
+    :param max_wait_ms: The maximum time the first message of a batch waits.
+    """
+
+    #: The number of batches that may be flushing before :code:`add` waits.
+    max_flushes: int = 2
+
+    def __init__(
+        self,
+        flush: Callable[[list], Awaitable],
+        *,
+        max_size: int,
+        max_wait_ms: int,
+    ) -> None:
+        self._flush = flush
+        self.max_size = max_size
+        self.max_wait = max_wait_ms / 1000
+        self.pending: List = []
+        self._timer = None
+        self._flushing = set()
+        # batches of flushes that haven't started running yet
+        self._queued = {}
+
+    async def add(self, message) -> None:
+        """
+        Adds a message to the current batch. Waits while too many batches are
+        being flushed so the collector applies backpressure to receiving.
+        """
+        self.pending.append(message)
+
+        if len(self.pending) >= self.max_size:
+            self._flush_pending()
+        elif self._timer is None:
+            self._timer = asyncio.get_event_loop().call_later(
+                self.max_wait, self._flush_pending
+            )
+
+        while len(self._flushing) >= self.max_flushes:
+            await asyncio.wait(
+                list(self._flushing), return_when=asyncio.FIRST_COMPLETED
+            )
+
+    def _flush_pending(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self.pending:
+            batch = self.pending[: self.max_size]
+            del self.pending[: self.max_size]
+
+            self._queued[id(batch)] = batch
+            task = asyncio.ensure_future(self._run(batch))
+            self._flushing.add(task)
+            task.add_done_callback(self._flushing.discard)
+
+    async def _run(self, batch: list) -> None:
+        self._queued.pop(id(batch), None)
+        try:
+            await self._flush(batch)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            error_logger.exception("[INIESTA] BATCH FLUSH EXCEPTION CAUGHT")
+
+    async def flush(self) -> None:
+        """
+        Flushes the pending messages and waits for all flushes to finish.
+        """
+        self._flush_pending()
+        if self._flushing:
+            await asyncio.wait(list(self._flushing))
+
+    def close(self) -> list:
+        """
+        Drops the pending messages and cancels running flushes. The dropped
+        messages become visible in the queue again after their visibility timeout.
+
+        :return: The dropped messages, including those of flushes that were
+            cancelled before they started.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        dropped = self.pending
+        for batch in self._queued.values():
+            dropped.extend(batch)
+        self.pending = []
+        self._queued = {}
+        for task in self._flushing:
+            task.cancel()
+        return dropped
@@ -0,0 +1,106 @@
+import asyncio
+
+from typing import Hashable
+
+
+class InFlightBudget:
+    """
+    Keeps track of the size of the messages that have been received but
+    not finished yet, so receiving can pause while they take up more than
+    :code:`max_bytes`.
+
+    :param max_bytes: The budget for the sum of the message sizes.
+    """
+
+    #: The weight of the latest message size in the moving average.
+    size_smoothing: float = 0.2
+
+    def __init__(self, max_bytes: int) -> None:
+        if max_bytes < 1:
+            raise ValueError("max_bytes must be at least 1.")
+
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.average_size = 0.0
+        self.paused = 0
+        self._sizes = {}
+        self._room = asyncio.Event()
+        self._room.set()
+
+    @property
+    def messages(self) -> int:
+        """
+        The number of messages counted against the budget.
+        """
+        return len(self._sizes)
+
+    @property
+    def exceeded(self) -> bool:
+        return self.bytes >= self.max_bytes
+
+    def add(self, key: Hashable, size: int) -> None:
+        """
+        Counts a received message against the budget.
+
+        :param key: Identifies the message, e.g. the receipt handle.
+        :param size: The size of the message in bytes.
+        """
+        if key in self._sizes:
+            return
+
+        self._sizes[key] = size
+        self.bytes += size
+        if self.average_size:
+            self.average_size += self.size_smoothing * (
+                size - self.average_size
+            )
+        else:
+            self.average_size = float(size)
+        if self.exceeded:
+            self._room.clear()
+
+    def release(self, key: Hashable) -> None:
+        """
+        Gives back the budget of a finished message. Releasing a message
+        more than once has no effect.
+        """
+        size = self._sizes.pop(key, None)
+        if size is None:
+            return
+
+        self.bytes -= size
+        if not self.exceeded:
+            self._room.set()
+
+    async def wait(self) -> None:
+        """
+        Waits while the budget is exceeded.
+        """
+        if self.exceeded:
+            self.paused += 1
+            await self._room.wait()
+
+    def max_number_of_messages(self, requested: int) -> int:
+        """
+        How many messages to request so their expected size fits in the
+        remaining budget. At least 1 message is always requested.
+
+        :param requested: The number of messages that would be requested otherwise.
+        """
+        if not self.average_size:
+            return requested
+
+        fits = int((self.max_bytes - self.bytes) // self.average_size)
+        return max(1, min(requested, fits))
+
+    @property
+    def metrics(self) -> dict:
+        """
+        A snapshot of the current state of the budget.
+        """
+        return {
+            "in_flight_bytes": self.bytes,
+            "in_flight_bytes_budget": self.max_bytes,
+            "in_flight_messages": self.messages,
+            "in_flight_budget_paused": self.paused,
+        }
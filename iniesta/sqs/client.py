@@ -1,5 +1,9 @@
 import asyncio
-from typing import Optional, Callable, Any, Union
+import functools
+import hashlib
+import time
+import uuid
+from typing import Optional, Callable, Any, Union, List, Tuple
 
 import botocore.exceptions
 import ujson as json
@@ -11,24 +15,101 @@ from insanic.exceptions import ImproperlyConfigured
 
 # from insanic.log import logger, error_logger
 
-from iniesta.exceptions import StopPolling
+from iniesta.exceptions import BatchItemFailed, HandlerTimeout, StopPolling
 from iniesta.log import logger, error_logger
+from iniesta.metrics import LAG_BUCKETS, registry
 from iniesta.sessions import BotoSession
 from iniesta.sns import SNSClient
-from iniesta.utils import filter_list_to_filter_policies
-
-from .message import SQSMessage
+from iniesta.tracing import trace
+from iniesta.utils import filter_list_to_filter_policies, hybridmethod
+
+from .adaptive import AdaptiveReceiveController, MAX_NUMBER_OF_MESSAGES
+from .backpressure import Backpressure, HandlerHealthProbe
+from .batch import BatchCollector
+from .budget import InFlightBudget
+from .handlers import HandlerOptions, InstanceHandlers
+from .limits import HandlerLimiter
+from .message import SQSMessage, VALID_SEND_MESSAGE_ARGS
+from .ordering import KeyedExecutor, ordering_key_value
+from .priority import PriorityDispatcher
+from .stream import MessageStream
+from .trace import TraceRecorder
 
 
 default = object()
 
+MESSAGES_RECEIVED = registry.counter(
+    "iniesta_sqs_messages_received_total",
+    "Messages received.",
+    ("queue", "event"),
+)
+MESSAGES_HANDLED = registry.counter(
+    "iniesta_sqs_messages_handled_total",
+    "Messages handled successfully.",
+    ("queue", "event"),
+)
+MESSAGES_FAILED = registry.counter(
+    "iniesta_sqs_messages_failed_total",
+    "Messages that failed to be handled, by reason (error, timeout or lock).",
+    ("queue", "event", "reason"),
+)
+MESSAGES_DELETED = registry.counter(
+    "iniesta_sqs_messages_deleted_total",
+    "Messages deleted.",
+    ("queue", "event"),
+)
+RECEIVE_LATENCY = registry.histogram(
+    "iniesta_sqs_receive_seconds", "Latency of receive requests.", ("queue",),
+)
+LOCK_LATENCY = registry.histogram(
+    "iniesta_sqs_lock_seconds",
+    "Latency of locking messages.",
+    ("queue", "event"),
+)
+HANDLER_LATENCY = registry.histogram(
+    "iniesta_sqs_handler_seconds",
+    "Latency of handlers. Messages of a batch handler observe the batch.",
+    ("queue", "event"),
+)
+DELETE_LATENCY = registry.histogram(
+    "iniesta_sqs_delete_seconds",
+    "Latency of deleting messages.",
+    ("queue", "event"),
+)
+MESSAGE_LAG = registry.histogram(
+    "iniesta_sqs_lag_seconds",
+    "Time from publishing messages to calling their handler.",
+    ("queue", "event"),
+    buckets=LAG_BUCKETS,
+)
+MESSAGES_IN_FLIGHT = registry.gauge(
+    "iniesta_sqs_messages_in_flight",
+    "Messages received that are not finished.",
+    ("queue",),
+)
+HANDLERS_RUNNING = registry.gauge(
+    "iniesta_sqs_handlers_running", "Handlers running.", ("queue",)
+)
+
+
+def _chunks(messages: list, size: int = 10) -> List[list]:
+    """
+    Splits messages into chunks for the SQS batch apis.
+    """
+    return [messages[i : i + size] for i in range(0, len(messages), size)]
+
 
 class SQSClient:
 
     endpoint_url = None
     lock_key = "sqs:event:{message_id}"
+    #: The number of times a FIFO receive is attempted on connection errors.
+    receive_attempts = 3
+    #: The maximum number of messages collected in a coalesce window.
+    coalesce_max_messages = 100
 
     handlers = {}  # dict with {event: handler function}
+    handler_options = {}  # dict with {event: HandlerOptions}
     queue_urls = {}  # dict with {queue_name: queue_url}
 
     def __init__(
@@ -64,8 +145,44 @@ class SQSClient:
         self.endpoint_url = endpoint_url or getattr(
             settings, "INIESTA_SQS_ENDPOINT_URL", None
         )
+        self.fifo = self.queue_name.endswith(".fifo")
         self._filters = None
 
+        # handlers registered on this instance take priority over the class'
+        self.handlers = InstanceHandlers(type(self), "handlers")
+        self.handler_options = InstanceHandlers(type(self), "handler_options")
+        self._batch_collectors = {}
+        self._coalesce_collectors = {}
+        self._ordering = KeyedExecutor()
+        self._limiters = {}
+        self._detached_tasks = set()
+        self.handler_limit_max_hold = (
+            settings.INIESTA_SQS_HANDLER_LIMIT_MAX_HOLD
+        )
+        self.handler_limit_max_waiting = (
+            settings.INIESTA_SQS_HANDLER_LIMIT_MAX_WAITING
+        )
+        self._limit_waiting = 0
+        self._limit_room = asyncio.Event()
+        self._limit_room.set()
+        self.handler_timeout = settings.INIESTA_SQS_HANDLER_TIMEOUT
+        self.handler_timeout_visibility = (
+            settings.INIESTA_SQS_HANDLER_TIMEOUT_VISIBILITY
+        )
+        self.handler_errors = 0
+        self.handler_timeouts = 0
+        self.expired_messages = 0
+        self.coalesced_messages = 0
+
+        self._in_flight = MESSAGES_IN_FLIGHT.labels(self.queue_name)
+        self._handlers_running = HANDLERS_RUNNING.labels(self.queue_name)
+        self._receive_latency = RECEIVE_LATENCY.labels(self.queue_name)
+        registry.collect(self, "iniesta_sqs", queue=self.queue_name)
+
+        # set by a MultiQueueConsumer to share its handler concurrency
+        self.scheduler = None
+        self.weight = 1
+
         retry_count = retry_count or settings.INIESTA_LOCK_RETRY_COUNT
         lock_timeout = lock_timeout or settings.INIESTA_LOCK_TIMEOUT
 
@@ -83,6 +200,59 @@ class SQSClient:
             internal_lock_timeout=lock_timeout,
         )
 
+        self.receive_controller = AdaptiveReceiveController(
+            max_number_of_messages=settings.INIESTA_SQS_RECEIVE_MESSAGE_MAX_NUMBER_OF_MESSAGES,
+            wait_time_seconds=settings.INIESTA_SQS_RECEIVE_MESSAGE_WAIT_TIME_SECONDS,
+            max_concurrency=settings.INIESTA_SQS_RECEIVE_MAX_CONCURRENCY,
+            latency_threshold=settings.INIESTA_SQS_ADAPTIVE_LATENCY_THRESHOLD,
+            idle_receives=settings.INIESTA_SQS_ADAPTIVE_IDLE_RECEIVES,
+            enabled=settings.INIESTA_SQS_ADAPTIVE_RECEIVE,
+        )
+        self._receivers = {}
+
+        # samples received messages for replaying them with `iniesta replay`
+        self.recorder = (
+            None
+            if settings.INIESTA_SQS_TRACE_FILE is None
+            else TraceRecorder(
+                settings.INIESTA_SQS_TRACE_FILE,
+                sample_rate=settings.INIESTA_SQS_TRACE_SAMPLE_RATE,
+            )
+        )
+
+        # pauses receiving while a probe reports that downstream is unhealthy
+        self.backpressure = Backpressure(
+            max_wait=settings.INIESTA_SQS_BACKPRESSURE_MAX_WAIT
+        )
+        self.handler_health = None
+        if (
+            settings.INIESTA_SQS_BACKPRESSURE_ERROR_RATE is not None
+            or settings.INIESTA_SQS_BACKPRESSURE_LATENCY is not None
+        ):
+            self.handler_health = HandlerHealthProbe(
+                error_rate=settings.INIESTA_SQS_BACKPRESSURE_ERROR_RATE,
+                latency=settings.INIESTA_SQS_BACKPRESSURE_LATENCY,
+                window=settings.INIESTA_SQS_BACKPRESSURE_WINDOW,
+            )
+            self.add_backpressure_probe(self.handler_health)
+
+        # pauses receiving while received messages take up too much memory
+        self.budget = (
+            None
+            if settings.INIESTA_SQS_IN_FLIGHT_BYTES is None
+            else InFlightBudget(settings.INIESTA_SQS_IN_FLIGHT_BYTES)
+        )
+
+        # dispatches messages by handler priority when in flight messages are limited
+        self.dispatcher = (
+            None
+            if settings.INIESTA_SQS_MAX_IN_FLIGHT is None
+            else PriorityDispatcher(
+                settings.INIESTA_SQS_MAX_IN_FLIGHT,
+                aging=settings.INIESTA_SQS_PRIORITY_AGING,
+            )
+        )
+
     @classmethod
     def default_queue_name(cls) -> str:
         return (
@@ -104,6 +274,8 @@ class SQSClient:
         The initialization classmethod that should be first run before any subsequent SQSClient initializations.
 
         :param queue_name: queue_name if want to initialize client with a different queue
+        :param endpoint_url: Takes priority or defaults to :code:`INIESTA_SQS_ENDPOINT_URL` settings.
+        :param region_name: Defaults to :code:`AWS_DEFAULT_REGION`.
         :rtype: :code:`SQSClient`
         """
         session = BotoSession.get_session()
@@ -134,7 +306,11 @@ class SQSClient:
                 queue_url = response["QueueUrl"]
                 cls.queue_urls.update({queue_name: queue_url})
 
-        sqs_client = cls(queue_name=queue_name)
+        sqs_client = cls(
+            queue_name=queue_name,
+            endpoint_url=endpoint_url,
+            region_name=region_name,
+        )
 
         # check if subscription exists
         # await cls._confirm_subscription(sqs_client, topic_arn, endpoint_url)
@@ -209,6 +385,29 @@ class SQSClient:
         assert "SQS:SendMessage" in statement["Action"]
         # assert statement['Condition']['ArnEquals']['aws:SourceArn'] == topic_arn
 
+    async def approximate_number_of_messages(self) -> int:
+        """
+        The approximate number of messages available for receiving
+        from :code:`GetQueueAttributes`.
+        """
+        async with self._create_client() as client:
+            response = await client.get_queue_attributes(
+                QueueUrl=self.queue_url,
+                AttributeNames=["ApproximateNumberOfMessages"],
+            )
+        return int(response["Attributes"]["ApproximateNumberOfMessages"])
+
+    async def queue_visibility_timeout(self) -> int:
+        """
+        The default visibility timeout of the queue in seconds from
+        :code:`GetQueueAttributes`.
+        """
+        async with self._create_client() as client:
+            response = await client.get_queue_attributes(
+                QueueUrl=self.queue_url, AttributeNames=["VisibilityTimeout"],
+            )
+        return int(response["Attributes"]["VisibilityTimeout"])
+
     @property
     def filters(self) -> dict:
         if self._filters is None:
@@ -221,7 +420,11 @@ class SQSClient:
     def start_receiving_messages(self, loop=None) -> None:
         """
         Method to start polling for messages.
+
+        :raises ImproperlyConfigured: If a batch handler is registered
+            for a FIFO queue.
         """
+        self._validate_fifo_handlers()
         self._receive_messages = True
 
         if loop is None:
@@ -230,6 +433,29 @@ class SQSClient:
         self._polling_task = asyncio.ensure_future(self._poll())
         self._loop = loop
 
+    def _validate_fifo_handlers(self) -> None:
+        """
+        Batch handlers are called with messages of any message group, so
+        they can't keep the order of the groups of a FIFO queue.
+
+        :raises ImproperlyConfigured: If a batch handler is registered
+            and the queue is a FIFO queue.
+        """
+        if not self.fifo:
+            return
+
+        events = [
+            "default" if key is default else key
+            for key, options in self.handler_options.items()
+            if options.batch
+        ]
+        if events:
+            raise ImproperlyConfigured(
+                f"Batch handlers can't be used for the FIFO queue "
+                f"{self.queue_name} because they don't keep the order of "
+                f"message groups: {', '.join(map(str, events))}"
+            )
+
     async def stop_receiving_messages(self) -> None:
         """
         Method to stop polling
@@ -238,52 +464,403 @@ class SQSClient:
         await self.lock_manager.destroy()
         self._polling_task.cancel()
 
+    async def drain(self, timeout: Optional[float] = None) -> None:
+        """
+        Stops receiving new messages, waits for the messages that have
+        already been received to be handled and then stops polling.
+
+        :param timeout: Seconds to wait for in flight messages before
+            cancelling them. Waits indefinitely if :code:`None`.
+        """
+        self._receive_messages = False
+        logger.info("[INIESTA] Draining in flight messages.")
+
+        tasks = [self._polling_task, *self._receivers.values()]
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        if pending:
+            logger.warning(
+                f"[INIESTA] Drain timed out with {len(pending)} "
+                f"receiver(s) still handling messages."
+            )
+
+        await self.stop_receiving_messages()
+
     async def handle_message(self, message: SQSMessage) -> tuple:
         """
         Method that hold logic to handle a certain type of mesage
 
+        If the handler is a coroutine function and doesn't finish within its
+        :code:`timeout` (or :code:`INIESTA_SQS_HANDLER_TIMEOUT`), it is
+        cancelled and the lock is released.
+
+        The lag since the message was published is recorded before the
+        handler is called, and the trace id of the message is the current
+        trace id while the handler runs.
+
         :param message: Message to handle
         :raises LockError: If lock could not be acquired for the message
+        :raises HandlerTimeout: If the handler timed out
         :raises Exception: General exception handler attaches the message and message handler
         :return: Returns a tuple of the message and result of the handler
         """
         lock = None
+        event = message.event
 
         try:
+            start = time.perf_counter()
             lock = await self.lock_manager.lock(
                 self.lock_key.format(message_id=message.message_id)
             )
+            LOCK_LATENCY.labels(self.queue_name, event).observe(
+                time.perf_counter() - start
+            )
             if not lock.valid:
                 raise LockError(
                     f"Could not acquire lock for {message.message_id}"
                 )
 
-            if message.event in self.handlers:
-                handler = self.handlers[message.event]
-            elif default in self.handlers:
-                handler = self.handlers[default]
-            else:
-                raise KeyError(f"{message.event} handler not found!")
+            key = self._handler_key(event)
+            handler = self.handlers[key]
+            options = self.handler_options.get(key)
+            timeout = (
+                options.timeout
+                if options is not None and options.timeout is not None
+                else self.handler_timeout
+            )
 
         except Exception as e:
             e.message = message
             e.handler = None
             raise e
         else:
+            self._observe_lag(message, event)
+            self._handlers_running.inc()
+            start = time.perf_counter()
             try:
-                result = handler(message)
-                if isawaitable(result):
-                    result = await result
+                with trace(message.trace_id):
+                    result = handler(message)
+                    if isawaitable(result):
+                        if timeout is None:
+                            result = await result
+                        else:
+                            try:
+                                result = await asyncio.wait_for(result, timeout)
+                            except asyncio.TimeoutError:
+                                raise HandlerTimeout(
+                                    f"Handler did not finish in {timeout} seconds."
+                                )
 
                 return message, result
             except Exception as e:
                 e.message = message
                 e.handler = handler
                 raise e
+            finally:
+                self._handlers_running.dec()
+                HANDLER_LATENCY.labels(self.queue_name, event).observe(
+                    time.perf_counter() - start
+                )
         finally:
             if lock:
                 await self.lock_manager.unlock(lock)
 
+    def _handler_key(self, event: str) -> Any:
+        """
+        The key the handler for the event is registered with.
+
+        :raises KeyError: If there is no handler for the event nor a default handler.
+        """
+        if event in self.handlers:
+            return event
+        elif default in self.handlers:
+            return default
+        else:
+            raise KeyError(f"{event} handler not found!")
+
+    def _handler_options(self, event: str) -> Tuple[Any, HandlerOptions]:
+        """
+        The key and options of the handler for the event. If there is no
+        handler, the key is :code:`None` and the options are the defaults.
+        """
+        try:
+            key = self._handler_key(event)
+        except KeyError:
+            return None, HandlerOptions()
+
+        return key, self.handler_options.get(key) or HandlerOptions()
+
+    async def handle_batch(
+        self, handler: Callable, messages: List[SQSMessage]
+    ) -> List[Tuple[SQSMessage, Optional[Exception]]]:
+        """
+        Locks the messages and calls a batch handler with the
+        messages that could be locked.
+
+        The handler may return :code:`None` if all messages were handled,
+        or a list with a result for each message where :code:`False` or an
+        exception marks the message as failed. If the handler raises,
+        all messages in the batch fail.
+
+        :param handler: The batch handler.
+        :param messages: The messages of the same event to handle.
+        :return: A list of the messages with the exception of each failed message
+            or :code:`None` if the message was handled.
+        """
+        locks = await asyncio.gather(
+            *[
+                self.lock_manager.lock(
+                    self.lock_key.format(message_id=message.message_id)
+                )
+                for message in messages
+            ],
+            return_exceptions=True,
+        )
+
+        results = []
+        locked = []
+        for message, lock in zip(messages, locks):
+            if isinstance(lock, Exception) or not lock.valid:
+                exc = (
+                    lock
+                    if isinstance(lock, Exception)
+                    else LockError(
+                        f"Could not acquire lock for {message.message_id}"
+                    )
+                )
+                exc.message = message
+                exc.handler = None
+                results.append((message, exc))
+            else:
+                locked.append((message, lock))
+
+        batch = [message for message, _ in locked]
+        for message in batch:
+            self._observe_lag(message, message.event)
+        try:
+            if batch:
+                self._handlers_running.inc()
+                try:
+                    outcome = handler(batch)
+                    if isawaitable(outcome):
+                        outcome = await outcome
+                    failures = self._batch_failures(batch, outcome)
+                except Exception as e:
+                    failures = []
+                    for _ in batch:
+                        failure = BatchItemFailed(str(e))
+                        failure.__cause__ = e
+                        failures.append(failure)
+                finally:
+                    self._handlers_running.dec()
+
+                for message, failure in zip(batch, failures):
+                    if failure is not None:
+                        failure.message = message
+                        failure.handler = handler
+                    results.append((message, failure))
+        finally:
+            await asyncio.gather(
+                *[self.lock_manager.unlock(lock) for _, lock in locked],
+                return_exceptions=True,
+            )
+
+        return results
+
+    @staticmethod
+    def _batch_failures(
+        messages: List[SQSMessage], outcome: Any
+    ) -> List[Optional[Exception]]:
+        if outcome is None:
+            return [None] * len(messages)
+
+        outcome = list(outcome)
+        if len(outcome) != len(messages):
+            raise ValueError(
+                f"Batch handler returned {len(outcome)} results "
+                f"for {len(messages)} messages."
+            )
+
+        failures = []
+        for message, result in zip(messages, outcome):
+            if isinstance(result, Exception):
+                failures.append(result)
+            elif result is False:
+                failures.append(
+                    BatchItemFailed(
+                        f"Batch handler failed message {message.message_id}"
+                    )
+                )
+            else:
+                failures.append(None)
+        return failures
+
+    async def _flush_batch(
+        self, client, handler: Callable, messages: List[SQSMessage]
+    ) -> None:
+        """
+        Handles a batch collected for a batch handler, logs the failed
+        messages and deletes the handled messages.
+        """
+        try:
+            start = time.monotonic()
+            try:
+                if self.scheduler is None:
+                    results = await self.handle_batch(handler, messages)
+                else:
+                    async with self.scheduler.slot(self, self.weight):
+                        results = await self.handle_batch(handler, messages)
+            finally:
+                latency = time.monotonic() - start
+                self.receive_controller.record_handler_latency(latency)
+
+            handled = []
+            for message, exc in results:
+                event = message.event
+                HANDLER_LATENCY.labels(self.queue_name, event).observe(latency)
+                if exc is None:
+                    MESSAGES_HANDLED.labels(self.queue_name, event).inc()
+                    handled.append(message)
+                else:
+                    self._count_failure(message, exc)
+                    self.handle_error(exc)
+
+            logger.info(
+                f"[INIESTA] Batch handled successfully: "
+                f"{len(handled)}/{len(messages)} messages"
+            )
+            await self.delete_messages(client, handled)
+        finally:
+            self._release_budget(messages)
+
+    async def delete_messages(
+        self, client, messages: List[SQSMessage]
+    ) -> List[dict]:
+        """
+        Deletes messages from SQS with :code:`DeleteMessageBatch`,
+        10 messages per request.
+
+        :param client: aws sqs client
+        :param messages: The messages to delete.
+        :return: The entries that failed to be deleted.
+        """
+
+        async def delete(chunk):
+            start = time.perf_counter()
+            response = await client.delete_message_batch(
+                QueueUrl=self.queue_url,
+                Entries=[
+                    {"Id": str(i), "ReceiptHandle": m.receipt_handle}
+                    for i, m in enumerate(chunk)
+                ],
+            )
+            return response, time.perf_counter() - start
+
+        chunks = _chunks(messages)
+        responses = await asyncio.gather(*[delete(chunk) for chunk in chunks])
+
+        failed = []
+        for chunk, (response, latency) in zip(chunks, responses):
+            failed_ids = set()
+            for entry in response.get("Failed", []):
+                error_logger.error(
+                    f"[INIESTA] Failed to delete message: "
+                    f"[{entry.get('Code')}] {entry.get('Message')}"
+                )
+                failed.append(entry)
+                failed_ids.add(entry.get("Id"))
+
+            for i, message in enumerate(chunk):
+                if str(i) not in failed_ids:
+                    self._count_deleted(message.event, latency)
+
+        logger.debug(
+            f"[INIESTA] Messages deleted: {len(messages) - len(failed)}"
+        )
+        return failed
+
+    async def send_message_batch(
+        self, client, messages: List[SQSMessage]
+    ) -> List[Tuple[SQSMessage, str]]:
+        """
+        Sends up to 10 messages to this client's queue with a single
+        :code:`SendMessageBatch` request. The body, message attributes,
+        delay and FIFO ids of the messages are sent.
+
+        :param client: aws sqs client
+        :param messages: The messages to send.
+        :return: The messages that failed to be sent with the reason.
+        """
+        if len(messages) > MAX_NUMBER_OF_MESSAGES:
+            raise ValueError(
+                f"A batch can have at most {MAX_NUMBER_OF_MESSAGES} messages. "
+                f"Got {len(messages)}."
+            )
+
+        response = await client.send_message_batch(
+            QueueUrl=self.queue_url,
+            Entries=[
+                {
+                    "Id": str(i),
+                    **{
+                        k: v
+                        for k, v in message.items()
+                        if k in VALID_SEND_MESSAGE_ARGS
+                    },
+                }
+                for i, message in enumerate(messages)
+            ],
+        )
+
+        failed = []
+        for entry in response.get("Failed", []):
+            failed.append(
+                (
+                    messages[int(entry["Id"])],
+                    f"[{entry.get('Code')}] {entry.get('Message')}",
+                )
+            )
+        return failed
+
+    async def change_visibility(
+        self, client, messages: List[SQSMessage], visibility_timeout: int
+    ) -> List[dict]:
+        """
+        Changes the visibility timeout of messages with
+        :code:`ChangeMessageVisibilityBatch`, 10 messages per request.
+        A visibility timeout of 0 makes the messages visible right away.
+
+        :param client: aws sqs client
+        :param messages: The messages to change the visibility of.
+        :param visibility_timeout: The new visibility timeout in seconds.
+        :return: The entries that failed to be changed.
+        """
+        responses = await asyncio.gather(
+            *[
+                client.change_message_visibility_batch(
+                    QueueUrl=self.queue_url,
+                    Entries=[
+                        {
+                            "Id": str(i),
+                            "ReceiptHandle": m.receipt_handle,
+                            "VisibilityTimeout": visibility_timeout,
+                        }
+                        for i, m in enumerate(chunk)
+                    ],
+                )
+                for chunk in _chunks(messages)
+            ]
+        )
+
+        failed = []
+        for response in responses:
+            for entry in response.get("Failed", []):
+                error_logger.error(
+                    f"[INIESTA] Failed to change message visibility: "
+                    f"[{entry.get('Code')}] {entry.get('Message')}"
+                )
+                failed.append(entry)
+        return failed
+
     def handle_error(self, exc: Exception) -> None:
         """
         If an exception occured while handling the message, log the error.
@@ -308,6 +885,19 @@ class SQSClient:
             extra=extra,
         )
 
+    async def handle_timeout(self, client, exc: HandlerTimeout) -> None:
+        """
+        If a handler timed out, log the error and change the visibility of the
+        message to :code:`INIESTA_SQS_HANDLER_TIMEOUT_VISIBILITY` so
+        it can be retried without waiting for the queue's visibility timeout.
+
+        :param client: aws sqs client
+        """
+        self.handle_error(exc)
+        await self.change_visibility(
+            client, [exc.message], self.handler_timeout_visibility
+        )
+
     async def handle_success(self, client, message: SQSMessage) -> dict:
         """
         Success handler for a message. Deletes the message from SQS.
@@ -322,9 +912,11 @@ class SQSClient:
             f"[INIESTA] Message handled successfully: msg_id={message_id}",
             extra={"sqs_message_id": message_id},
         )
+        start = time.perf_counter()
         resp = await client.delete_message(
             QueueUrl=self.queue_url, ReceiptHandle=message.receipt_handle
         )
+        self._count_deleted(message.event, time.perf_counter() - start)
         logger.debug(
             f"[INIESTA] Message deleted: msg_id={message_id} "
             f"receipt_handle={message.receipt_handle}",
@@ -332,58 +924,674 @@ class SQSClient:
         )
         return resp
 
-    async def _poll(self) -> str:
+    def _observe_lag(self, message: SQSMessage, event: str) -> None:
+        published_at = message.published_at
+        if published_at is not None:
+            MESSAGE_LAG.labels(self.queue_name, event).observe(
+                max(0.0, time.time() - published_at)
+            )
+
+    def _count_deleted(self, event: str, latency: float) -> None:
+        DELETE_LATENCY.labels(self.queue_name, event).observe(latency)
+        MESSAGES_DELETED.labels(self.queue_name, event).inc()
+
+    def _count_failure(self, message: SQSMessage, exc: Exception) -> None:
+        if isinstance(exc, HandlerTimeout):
+            self.handler_timeouts += 1
+            reason = "timeout"
+        else:
+            self.handler_errors += 1
+            reason = "lock" if isinstance(exc, LockError) else "error"
+        MESSAGES_FAILED.labels(self.queue_name, message.event, reason).inc()
+
+    @property
+    def metrics(self) -> dict:
         """
-        The long running method that consistently polls the SQS queue for
-        messages.
-        :return:
+        A snapshot of the runtime state of this client.
         """
-        session = BotoSession.get_session()
+        metrics = dict(self.receive_controller.metrics)
+        metrics.update(self._ordering.metrics)
+        if self.dispatcher is not None:
+            metrics.update(self.dispatcher.metrics)
+        if self.budget is not None:
+            metrics.update(self.budget.metrics)
+        if self.backpressure.probes:
+            metrics.update(self.backpressure.metrics)
+        if self.handler_health is not None:
+            metrics.update(self.handler_health.metrics)
+        metrics["handler_errors"] = self.handler_errors
+        metrics["handler_timeouts"] = self.handler_timeouts
+        metrics["expired_messages"] = self.expired_messages
+        metrics["coalesced_messages"] = self.coalesced_messages
+        metrics["handler_limit_waiting"] = self._limit_waiting
+        metrics["handler_limits"] = {
+            limiter.name: limiter.metrics for limiter in self._limiters.values()
+        }
+        return metrics
 
-        async with session.create_client(
+    async def _receive(
+        self, client, max_number_of_messages: Optional[int] = None
+    ) -> list:
+        """
+        Receives a batch of messages with the parameters decided by
+        the receive controller. If messages are dispatched by priority,
+        waits until there is room to buffer more messages and
+        requests at most as many as there is room for. The same applies
+        to messages waiting for the limits of their handlers and if the
+        size of the in flight messages is limited.
+
+        Waits while a backpressure probe reports unhealthy first.
+
+        :param client: aws sqs client
+        :param max_number_of_messages: An upper bound for the number of messages.
+        :return: The raw messages received.
+        """
+        if self.backpressure.probes:
+            await self.backpressure.wait()
+
+        controller = self.receive_controller
+        if max_number_of_messages is None:
+            max_number_of_messages = controller.max_number_of_messages
+        else:
+            max_number_of_messages = min(
+                max_number_of_messages, controller.max_number_of_messages
+            )
+
+        await self._limit_room.wait()
+        max_number_of_messages = max(
+            1,
+            min(
+                max_number_of_messages,
+                self.handler_limit_max_waiting - self._limit_waiting,
+            ),
+        )
+
+        if self.dispatcher is not None:
+            await self.dispatcher.wait_for_capacity()
+            max_number_of_messages = max(
+                1, min(max_number_of_messages, self.dispatcher.capacity)
+            )
+
+        if self.budget is not None:
+            await self.budget.wait()
+            max_number_of_messages = self.budget.max_number_of_messages(
+                max_number_of_messages
+            )
+
+        receive_args = dict(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=max_number_of_messages,
+            WaitTimeSeconds=controller.wait_time_seconds,
+            AttributeNames=["All"],
+            MessageAttributeNames=["All"],
+        )
+
+        start = time.perf_counter()
+        if self.fifo:
+            # retrying with the same attempt id returns the same messages
+            # instead of hiding them for the visibility timeout
+            receive_args["ReceiveRequestAttemptId"] = uuid.uuid4().hex
+            for attempt in range(self.receive_attempts):
+                try:
+                    response = await client.receive_message(**receive_args)
+                except botocore.exceptions.HTTPClientError:
+                    if attempt + 1 == self.receive_attempts:
+                        raise
+                    logger.warning(
+                        "[INIESTA] Receive failed. Retrying with "
+                        f"ReceiveRequestAttemptId={receive_args['ReceiveRequestAttemptId']}"
+                    )
+                else:
+                    break
+        else:
+            response = await client.receive_message(**receive_args)
+        self._receive_latency.observe(time.perf_counter() - start)
+
+        messages = response.get("Messages", [])
+        controller.record_receive(max_number_of_messages, len(messages))
+        return messages
+
+    async def _handle_message_timed(self, message: SQSMessage) -> tuple:
+        start = time.monotonic()
+        failed = False
+        try:
+            return await self.handle_message(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            failed = True
+            raise
+        finally:
+            latency = time.monotonic() - start
+            self.receive_controller.record_handler_latency(latency)
+            if self.handler_health is not None:
+                self.handler_health.record(latency, failed)
+
+    async def _dispatch(self, message: SQSMessage) -> tuple:
+        """
+        Runs the handler for the message. If in flight messages are limited,
+        waits for a slot that is granted by the priority of the handler first.
+        """
+        if self.dispatcher is None:
+            return await self._schedule(message)
+
+        _, options = self._handler_options(message.event)
+        async with self.dispatcher.slot(options.priority):
+            return await self._schedule(message)
+
+    async def _schedule(self, message: SQSMessage) -> tuple:
+        """
+        Runs the handler for the message, waiting for a handler slot
+        first if this client shares a scheduler.
+        """
+        if self.scheduler is None:
+            return await self._handle_message_timed(message)
+
+        async with self.scheduler.slot(self, self.weight):
+            return await self._handle_message_timed(message)
+
+    async def _process(self, client, messages: list) -> None:
+        """
+        Handles all received messages concurrently and deletes the
+        messages that were handled successfully.
+
+        Expired messages are deleted without being locked or handled.
+        Messages of handlers that coalesce are reduced to the newest
+        message per key before they are handled.
+
+        :param client: aws sqs client
+        :param messages: The raw messages from receive_message.
+        """
+        if self.recorder is not None:
+            self.recorder.record(messages)
+
+        routed = []
+        coalesced = {}
+        expired = []
+        now = time.time()
+        for message in messages:
+            message = SQSMessage.from_sqs(client, message)
+            event = message.event
+            self._add_in_flight(message, event)
+
+            if message.expired(now):
+                expired.append(message)
+                continue
+
+            key, options = self._handler_options(event)
+
+            if options.coalesce_key is not None and not self.fifo:
+                coalesced.setdefault(key, (options, []))[1].append(message)
+            else:
+                routed.append((key, options, message))
+
+        if expired:
+            await self._expire(client, expired)
+
+        for key, (options, coalescing) in coalesced.items():
+            if options.coalesce_window_ms:
+                collector = self._coalesce_collector(client, key, options)
+                for message in coalescing:
+                    await collector.add(message)
+            else:
+                for message in await self._coalesce(
+                    client, options, coalescing
+                ):
+                    routed.append((key, options, message))
+
+        await self._route(client, routed)
+
+    async def _route(
+        self, client, routed: List[Tuple[Any, HandlerOptions, SQSMessage]]
+    ) -> None:
+        """
+        Handles messages according to their handler's options and waits
+        for them to be handled. Messages of a FIFO queue are handled in
+        order within their message group and messages of handlers with an
+        ordering key in order of the key's value.
+
+        Messages of handlers with a concurrency or rate limit are not waited
+        for, so a limited handler doesn't hold up the messages of other handlers.
+        Instead, receiving pauses while too many of them wait for their limits.
+        Neither are messages that wait to be dispatched by priority, so
+        receiving can continue while they are buffered.
+
+        :param client: aws sqs client
+        :param routed: The messages with the key and options of their handler.
+        """
+        single = []
+        limited = []
+        ordered = []
+        batched = []
+        for key, options, message in routed:
+            if options.batch:
+                batched.append((key, options, message))
+            elif options.ordering_key is not None and not self.fifo:
+                value = ordering_key_value(message, options.ordering_key)
+                if value is None:
+                    single.append(message)
+                else:
+                    ordered.append(((options.ordering_key, value), message))
+            elif options.limited and not self.fifo:
+                limited.append(message)
+            else:
+                single.append(message)
+
+        if self.fifo:
+            groups = {}
+            for message in single:
+                groups.setdefault(message.message_group_id, []).append(message)
+            event_tasks = [
+                asyncio.ensure_future(self._process_group(client, group))
+                for group in groups.values()
+            ]
+        elif self.dispatcher is not None:
+            event_tasks = []
+            limited.extend(single)
+        else:
+            event_tasks = [
+                asyncio.ensure_future(self._process_message(client, message))
+                for message in single
+            ]
+
+        for message in limited:
+            task = asyncio.ensure_future(self._process_message(client, message))
+            self._detached_tasks.add(task)
+            task.add_done_callback(self._detached_tasks.discard)
+
+        if limited:
+            # let the messages start waiting for their limits or the dispatcher
+            # before the next receive checks how many more can be buffered
+            await asyncio.sleep(0)
+
+        for ordering, message in ordered:
+            event_tasks.append(
+                self._ordering.submit(
+                    ordering, self._process_message, client, message
+                )
+            )
+
+        for key, options, message in batched:
+            await self._batch_collector(client, key, options).add(message)
+
+        if event_tasks:
+            await asyncio.gather(*event_tasks)
+
+    async def _coalesce(
+        self, client, options: HandlerOptions, messages: List[SQSMessage]
+    ) -> List[SQSMessage]:
+        """
+        Keeps the newest message for each value of the handler's coalesce
+        key and deletes the messages they supersede. Messages without
+        the key are kept.
+
+        :return: The messages to handle in the order they were received.
+        """
+        newest = {}
+        kept = []
+        superseded = []
+        for message in messages:
+            value = ordering_key_value(message, options.coalesce_key)
+            if value is None:
+                kept.append(message)
+                continue
+
+            current = newest.get(value)
+            if current is None:
+                newest[value] = message
+            elif (message.published_at or 0) >= (current.published_at or 0):
+                newest[value] = message
+                superseded.append(current)
+            else:
+                superseded.append(message)
+
+        if superseded:
+            self.coalesced_messages += len(superseded)
+            logger.info(
+                f"[INIESTA] Deleting {len(superseded)} superseded message(s)"
+            )
+            await self.delete_messages(client, superseded)
+            self._release_budget(superseded)
+
+        handled = set(map(id, kept)) | set(map(id, newest.values()))
+        return [message for message in messages if id(message) in handled]
+
+    async def _flush_coalesced(
+        self, client, key: Any, options: HandlerOptions, messages: List
+    ) -> None:
+        """
+        Coalesces the messages collected during the window and handles
+        the newest ones.
+        """
+        messages = await self._coalesce(client, options, messages)
+        await self._route(client, [(key, options, m) for m in messages])
+
+    def _coalesce_collector(
+        self, client, key: Any, options: HandlerOptions
+    ) -> BatchCollector:
+        collector = self._coalesce_collectors.get(key)
+        if collector is None:
+            collector = self._coalesce_collectors[key] = BatchCollector(
+                functools.partial(self._flush_coalesced, client, key, options),
+                max_size=self.coalesce_max_messages,
+                max_wait_ms=options.coalesce_window_ms,
+            )
+        return collector
+
+    async def _expire(self, client, messages: List[SQSMessage]) -> None:
+        """
+        Deletes expired messages and passes them to
+        :code:`hook_expired_messages`.
+        """
+        self.expired_messages += len(messages)
+        logger.info(f"[INIESTA] Deleting {len(messages)} expired message(s)")
+
+        try:
+            await self.delete_messages(client, messages)
+        finally:
+            self._release_budget(messages)
+        try:
+            await self.hook_expired_messages(messages)
+        except Exception:
+            error_logger.exception("[INIESTA] EXPIRED MESSAGES HOOK FAILED")
+
+    def _add_in_flight(self, message: SQSMessage, event: str) -> None:
+        """
+        Counts a received message and adds it to the in flight messages
+        and their budget.
+        """
+        MESSAGES_RECEIVED.labels(self.queue_name, event).inc()
+        self._in_flight.inc()
+        if self.budget is not None:
+            self.budget.add(
+                message.receipt_handle, len(message.raw_body.encode("utf-8"))
+            )
+
+    def _release_budget(self, messages: List[SQSMessage]) -> None:
+        """
+        Removes messages that are finished from the in flight messages
+        and gives back their budget.
+        """
+        self._in_flight.dec(len(messages))
+        if self.budget is not None:
+            for message in messages:
+                self.budget.release(message.receipt_handle)
+
+    def add_backpressure_probe(self, probe: Callable) -> Callable:
+        """
+        Registers a probe that is consulted before every receive. While it
+        returns :code:`False` (or raises), receiving pauses with an
+        exponentially growing wait until it returns :code:`True` again.
+
+        Can be used as a decorator. Coroutine functions are awaited.
+
+        .. code-block:: python
+
+            @sqs_client.add_backpressure_probe
+            async def database_healthy():
+                return await database.ping()
+
+        :param probe: A callable without arguments.
+        """
+        return self.backpressure.add_probe(probe)
+
+    def _limiter(self, event: str) -> Optional[HandlerLimiter]:
+        """
+        The limiter of the handler for the event if the handler has
+        a concurrency or rate limit.
+        """
+        key, options = self._handler_options(event)
+        if not options.limited:
+            return None
+
+        limiter = self._limiters.get(options)
+        if limiter is None:
+            handler = self.handlers[key]
+            limiter = self._limiters[options] = HandlerLimiter(
+                max_concurrency=options.max_concurrency,
+                rate_limit=options.rate_limit,
+                name=getattr(handler, "__qualname__", repr(handler)),
+            )
+        return limiter
+
+    async def _process_message(self, client, message: SQSMessage) -> bool:
+        """
+        Handles a message and deletes it if it was handled successfully.
+
+        If the handler has a concurrency or rate limit, the message waits up
+        to :code:`INIESTA_SQS_HANDLER_LIMIT_MAX_HOLD` seconds for it. If the
+        wait would be longer, the message is released back to the queue.
+
+        :return: If the message was handled successfully.
+        """
+        limiter = self._limiter(message.event)
+        try:
+            if limiter is None:
+                return await self._handle_and_delete(client, message)
+
+            if not await self._acquire_limit(limiter):
+                logger.info(
+                    f"[INIESTA] Handler limit reached. Releasing message: "
+                    f"msg_id={message.message_id}",
+                    extra={"sqs_message_id": message.message_id},
+                )
+                await self.change_visibility(
+                    client, [message], self.handler_limit_max_hold
+                )
+                return False
+
+            try:
+                return await self._handle_and_delete(client, message)
+            finally:
+                limiter.release()
+        finally:
+            self._release_budget([message])
+
+    async def _acquire_limit(self, limiter: HandlerLimiter) -> bool:
+        """
+        Waits for the limit of a handler. While it waits, the message counts
+        against the messages that may wait for limits and, if messages are
+        dispatched by priority, against the capacity of the dispatcher.
+        """
+        self._limit_waiting += 1
+        self._update_limit_room()
+        if self.dispatcher is not None:
+            self.dispatcher.park()
+        try:
+            return await limiter.acquire(self.handler_limit_max_hold)
+        finally:
+            self._limit_waiting -= 1
+            self._update_limit_room()
+            if self.dispatcher is not None:
+                self.dispatcher.unpark()
+
+    def _update_limit_room(self) -> None:
+        if self._limit_waiting < self.handler_limit_max_waiting:
+            self._limit_room.set()
+        else:
+            self._limit_room.clear()
+
+    async def _handle_and_delete(self, client, message: SQSMessage) -> bool:
+        # NOTE: must catch CancelledError and raise
+        try:
+            message_obj, result = await self._dispatch(message)
+        except asyncio.CancelledError:
+            raise
+        except HandlerTimeout as e:
+            self._count_failure(message, e)
+            await self.handle_timeout(client, e)
+            return False
+        except Exception as e:
+            # if error log failure and pass so sqs message persists and message becomes visible again
+            self._count_failure(message, e)
+            self.handle_error(e)
+            return False
+        else:
+            MESSAGES_HANDLED.labels(self.queue_name, message.event).inc()
+            await self.handle_success(client, message_obj)
+            return True
+
+    async def _process_group(self, client, messages: List[SQSMessage]) -> None:
+        """
+        Handles the messages of a FIFO message group one at a time in order.
+        If a message fails, the rest of the group is released so it is
+        received again after the failed message.
+        """
+        for index, message in enumerate(messages):
+            if not await self._process_message(client, message):
+                remaining = messages[index + 1 :]
+                if remaining:
+                    await self.change_visibility(client, remaining, 0)
+                    self._release_budget(remaining)
+                return
+
+    def _batch_collector(
+        self, client, key: Any, options: HandlerOptions
+    ) -> BatchCollector:
+        collector = self._batch_collectors.get(key)
+        if collector is None:
+            collector = self._batch_collectors[key] = BatchCollector(
+                functools.partial(
+                    self._flush_batch, client, self.handlers[key]
+                ),
+                max_size=options.batch_max_size,
+                max_wait_ms=options.batch_max_wait_ms,
+            )
+        return collector
+
+    async def _poll_once(self, client) -> None:
+        """
+        A single receive and handle cycle.
+        """
+        try:
+            messages = await self._receive(client)
+        except botocore.exceptions.ClientError as e:
+            error_logger.critical(
+                f"[INIESTA] [{e.response['Error']['Code']}]: {e.response['Error']['Message']}"
+            )
+        else:
+            await self._process(client, messages)
+            await self.hook_post_receive_message_handler()
+
+    def _scale_receivers(self, client) -> None:
+        """
+        Starts additional receivers until there are as many as the
+        receive controller's concurrency. The polling task itself is
+        receiver 0. Surplus receivers stop by themselves.
+        """
+        self._receivers = {
+            index: task
+            for index, task in self._receivers.items()
+            if not task.done()
+        }
+
+        for index in range(1, self.receive_controller.concurrency):
+            if index not in self._receivers:
+                self._receivers[index] = asyncio.ensure_future(
+                    self._receiver(client, index)
+                )
+
+    async def _receiver(self, client, index: int) -> None:
+        """
+        An additional receive loop that runs alongside the polling task
+        while the receive controller's concurrency allows it.
+        """
+        while (
+            self._loop.is_running()
+            and self._receive_messages
+            and index < self.receive_controller.concurrency
+        ):
+            try:
+                await self._poll_once(client)
+            except asyncio.CancelledError:
+                raise
+            except StopPolling:
+                self._receive_messages = False
+            except Exception:
+                error_logger.exception(
+                    f"[INIESTA] RECEIVER {index} EXCEPTION CAUGHT"
+                )
+
+    async def _finish(self) -> None:
+        """
+        Waits for the messages that have been received to be handled,
+        including the messages collected for coalescing and batches.
+        """
+        await asyncio.gather(
+            *[c.flush() for c in self._coalesce_collectors.values()]
+        )
+        await asyncio.gather(*self._detached_tasks, return_exceptions=True)
+        await asyncio.gather(
+            *[c.flush() for c in self._batch_collectors.values()]
+        )
+
+    def _create_client(self):
+        """
+        Creates the aws sqs client used for receiving.
+        """
+        session = BotoSession.get_session()
+        return session.create_client(
             "sqs",
             region_name=self.region_name,
             endpoint_url=self.endpoint_url,
             aws_access_key_id=BotoSession.aws_access_key_id,
             aws_secret_access_key=BotoSession.aws_secret_access_key,
-        ) as client:
+        )
+
+    def messages(
+        self,
+        *,
+        max_messages: Optional[int] = None,
+        idle_timeout: Optional[float] = None,
+        concurrency: Optional[int] = None,
+        prefetch: Optional[int] = None,
+    ) -> MessageStream:
+        """
+        Receives messages to be handled inline instead of by handlers.
+        Each message must be acknowledged with :code:`await message.ack()`,
+        which deletes it, or :code:`await message.nack(delay=...)`, which
+        makes it visible again after :code:`delay` seconds.
+
+        .. code-block:: python
+
+            async with sqs_client.messages(idle_timeout=30) as messages:
+                async for message in messages:
+                    await process(message.body)
+                    await message.ack()
+
+        :param max_messages: Stops after this many messages. :code:`None` for no limit.
+        :param idle_timeout: Stops when no message was received for this many seconds.
+            :code:`None` to wait indefinitely.
+        :param concurrency: The number of concurrent receives. Defaults to
+            :code:`INIESTA_SQS_RECEIVE_MAX_CONCURRENCY`.
+        :param prefetch: The number of received messages buffered ahead of
+            the iteration. Defaults to 10 per concurrent receive.
+        """
+        return MessageStream(
+            self,
+            max_messages=max_messages,
+            idle_timeout=idle_timeout,
+            concurrency=concurrency or self.receive_controller.max_concurrency,
+            prefetch=prefetch,
+        )
+
+    async def _poll(self) -> str:
+        """
+        The long running method that consistently polls the SQS queue for
+        messages.
+        :return:
+        """
+        async with self._create_client() as client:
             try:
                 while self._loop.is_running() and self._receive_messages:
-                    try:
-                        response = await client.receive_message(
-                            QueueUrl=self.queue_url,
-                            MaxNumberOfMessages=settings.INIESTA_SQS_RECEIVE_MESSAGE_MAX_NUMBER_OF_MESSAGES,
-                            WaitTimeSeconds=settings.INIESTA_SQS_RECEIVE_MESSAGE_WAIT_TIME_SECONDS,
-                            AttributeNames=["All"],
-                            MessageAttributeNames=["All"],
-                        )
-                    except botocore.exceptions.ClientError as e:
-                        error_logger.critical(
-                            f"[INIESTA] [{e.response['Error']['Code']}]: {e.response['Error']['Message']}"
-                        )
-                    else:
-                        event_tasks = [
-                            asyncio.ensure_future(
-                                self.handle_message(
-                                    SQSMessage.from_sqs(client, message)
-                                )
-                            )
-                            for message in response.get("Messages", [])
-                        ]
+                    await self._poll_once(client)
+                    self._scale_receivers(client)
 
-                        for fut in asyncio.as_completed(event_tasks):
-                            # NOTE: must catch CancelledError and raise
-                            try:
-                                message_obj, result = await fut
-                            except asyncio.CancelledError:
-                                raise
-                            except Exception as e:
-                                # if error log failure and pass so sqs message persists and message becomes visible again
-                                self.handle_error(e)
-                            else:
-                                await self.handle_success(client, message_obj)
-
-                        await self.hook_post_receive_message_handler()
+                # let the other receivers finish handling what they received
+                await asyncio.gather(
+                    *self._receivers.values(), return_exceptions=True
+                )
+                await self._finish()
             except asyncio.CancelledError:
                 logger.info("[INIESTA] POLLING TASK CANCELLED")
                 return "Cancelled"
@@ -397,59 +1605,250 @@ class SQSClient:
                     self._polling_task = asyncio.ensure_future(self._poll())
                 error_logger.exception("[INIESTA] POLLING EXCEPTION CAUGHT")
             finally:
+                for receiver in self._receivers.values():
+                    receiver.cancel()
+                self._receivers = {}
+                for task in self._detached_tasks:
+                    task.cancel()
+                for collector in self._coalesce_collectors.values():
+                    self._release_budget(collector.close())
+                self._coalesce_collectors = {}
+                for collector in self._batch_collectors.values():
+                    self._release_budget(collector.close())
+                self._batch_collectors = {}
+                if self.recorder is not None:
+                    self.recorder.close()
                 await client.close()
 
         return "Shutdown"  # pragma: no cover
 
-    @classmethod
+    @hybridmethod
     def handler(
-        cls, event: Union[Callable, str, list, tuple] = None
+        cls_or_self,
+        event: Union[Callable, str, list, tuple] = None,
+        *,
+        ordering_key: Optional[str] = None,
+        max_concurrency: Optional[int] = None,
+        rate_limit: Optional[float] = None,
+        timeout: Optional[float] = None,
+        coalesce_key: Optional[str] = None,
+        coalesce_window_ms: int = 0,
+        priority: int = 0,
     ) -> Callable:
         """
         Decorator for attaching a message handler for an event or if None, a default handler.
+
+        If used on the class, the handler is registered for all instances.
+        If used on an instance, the handler is only registered for
+        that instance and takes priority over handlers registered on the class.
+
+        With an :code:`ordering_key`, messages with the same value of that
+        message attribute or JSON body field (e.g. :code:`"order_id"`) are
+        handled one at a time in the order they were received, while
+        messages with different values are handled concurrently.
+
+        With :code:`max_concurrency` or :code:`rate_limit`, messages
+        beyond the limits wait for the handler while messages of other handlers
+        keep flowing. Messages that would wait longer than
+        :code:`INIESTA_SQS_HANDLER_LIMIT_MAX_HOLD` seconds are released
+        back to the queue.
+
+        A coroutine handler that runs longer than :code:`timeout` seconds
+        (or :code:`INIESTA_SQS_HANDLER_TIMEOUT`) is cancelled and its message
+        made visible again after :code:`INIESTA_SQS_HANDLER_TIMEOUT_VISIBILITY`
+        seconds.
+
+        With a :code:`coalesce_key`, only the newest message (by the time SQS
+        received it) for each value of that message attribute or body field
+        is handled, and the messages it supersedes are deleted. Messages are
+        collected for :code:`coalesce_window_ms` or, if 0, only the
+        messages of a single receive are coalesced.
+
+        :param event: The event(or a list of event) the function is attached to.
+        :param ordering_key: The message attribute or body field to order by.
+            A dotted name refers to a nested body field.
+        :param max_concurrency: The maximum number of messages handled at once.
+        :param rate_limit: The maximum number of messages handled per second.
+        :param timeout: Seconds the handler may run before it is cancelled.
+        :param coalesce_key: The message attribute or body field to coalesce by.
+        :param coalesce_window_ms: How long to collect messages to coalesce.
+        :param priority: Higher priorities are dispatched first when
+            :code:`INIESTA_SQS_MAX_IN_FLIGHT` is set.
         """
 
         if event and isfunction(event):
-            cls.add_handler(event, default)
+            cls_or_self.add_handler(event, default)
             return event
         else:
 
             def register_handler(func):
-                cls.add_handler(func, default if event is None else event)
+                cls_or_self.add_handler(
+                    func,
+                    default if event is None else event,
+                    ordering_key=ordering_key,
+                    max_concurrency=max_concurrency,
+                    rate_limit=rate_limit,
+                    timeout=timeout,
+                    coalesce_key=coalesce_key,
+                    coalesce_window_ms=coalesce_window_ms,
+                    priority=priority,
+                )
                 return func
 
             return register_handler
 
-    @classmethod
+    @hybridmethod
     def add_handler(
-        cls, handler: Callable, event: Union[str, list, tuple] = default
+        cls_or_self,
+        handler: Callable,
+        event: Union[str, list, tuple] = default,
+        *,
+        ordering_key: Optional[str] = None,
+        max_concurrency: Optional[int] = None,
+        rate_limit: Optional[float] = None,
+        timeout: Optional[float] = None,
+        coalesce_key: Optional[str] = None,
+        coalesce_window_ms: int = 0,
+        priority: int = 0,
     ) -> None:
         """
         Method for manually declaring a handler for event(s).
+        Refer to :code:`handler` for the options.
 
         :param handler: A function to execute
         :param event: The event(or a list of event) the function is attached to.
+        :param ordering_key: The message attribute or body field to order by.
+        :param max_concurrency: The maximum number of messages handled at once.
+        :param rate_limit: The maximum number of messages handled per second.
+        :param timeout: Seconds the handler may run before it is cancelled.
+        :param coalesce_key: The message attribute or body field to coalesce by.
+        :param coalesce_window_ms: How long to collect messages to coalesce.
+        :param priority: Higher priorities are dispatched first when
+            :code:`INIESTA_SQS_MAX_IN_FLIGHT` is set.
         """
-        cls._validate_handler_signature(handler)
+        cls_or_self._register_handler(
+            handler,
+            event,
+            HandlerOptions(
+                ordering_key=ordering_key,
+                max_concurrency=max_concurrency,
+                rate_limit=rate_limit,
+                timeout=timeout,
+                coalesce_key=coalesce_key,
+                coalesce_window_ms=coalesce_window_ms,
+                priority=priority,
+            ),
+        )
+
+    @hybridmethod
+    def batch_handler(
+        cls_or_self,
+        event: Union[str, list, tuple] = None,
+        *,
+        max_size: int = 10,
+        max_wait_ms: int = 1000,
+    ) -> Callable:
+        """
+        Decorator for attaching a batch handler for an event or if None,
+        a default batch handler.
+
+        The handler is called with a list of up to :code:`max_size` messages
+        of the same event, collected across receives for up to
+        :code:`max_wait_ms`. It can return :code:`None` if all messages were
+        handled or a list with a result for each message, where
+        :code:`False` or an exception marks the message as failed.
+        Failed messages stay in the queue and handled messages are deleted
+        in batches.
+
+        .. code-block:: python
+
+            @SQSClient.batch_handler("UserUpdated.user", max_size=50, max_wait_ms=200)
+            async def update_users(messages):
+                results = await bulk_upsert([m.body for m in messages])
+                return [r.ok for r in results]
+
+        Batch handlers can't be used for FIFO queues because a batch
+        holds messages of any message group.
+
+        :param event: The event(or a list of event) the function is attached to.
+        :param max_size: The maximum number of messages in a batch.
+        :param max_wait_ms: How long to wait for a full batch.
+        :raises ImproperlyConfigured: If registered on a client of a FIFO queue.
+        """
+
+        def register_handler(func):
+            cls_or_self.add_batch_handler(
+                func,
+                default if event is None else event,
+                max_size=max_size,
+                max_wait_ms=max_wait_ms,
+            )
+            return func
+
+        return register_handler
+
+    @hybridmethod
+    def add_batch_handler(
+        cls_or_self,
+        handler: Callable,
+        event: Union[str, list, tuple] = default,
+        *,
+        max_size: int = 10,
+        max_wait_ms: int = 1000,
+    ) -> None:
+        """
+        Method for manually declaring a batch handler for event(s).
+        Refer to :code:`batch_handler` for the parameters.
+        """
+        cls_or_self._register_handler(
+            handler,
+            event,
+            HandlerOptions(
+                batch_max_size=max_size, batch_max_wait_ms=max_wait_ms
+            ),
+        )
+
+    @hybridmethod
+    def _register_handler(
+        cls_or_self,
+        handler: Callable,
+        event: Union[str, list, tuple],
+        options: HandlerOptions,
+    ) -> None:
+        cls_or_self._validate_handler_signature(handler)
+        if (
+            options.batch
+            and not isinstance(cls_or_self, type)
+            and cls_or_self.fifo
+        ):
+            raise ImproperlyConfigured(
+                f"Batch handlers can't be used for the FIFO queue "
+                f"{cls_or_self.queue_name}."
+            )
 
         if isinstance(event, list) or isinstance(event, tuple):
-            cls._validate_event_iterable(event)
+            cls_or_self._validate_event_iterable(event)
             for e in event:
-                cls._add_handler(handler, e)
+                cls_or_self._add_handler(handler, e, options)
         else:
-            cls._validate_event_name(event)
-            cls._add_handler(handler, event)
+            cls_or_self._validate_event_name(event)
+            cls_or_self._add_handler(handler, event, options)
 
-    @classmethod
-    def _validate_event_iterable(cls, events):
+    @hybridmethod
+    def _validate_event_iterable(cls_or_self, events):
         if len(set(events)) != len(events):
             raise ValueError("Duplication found in list of event")
         for e in events:
-            cls._validate_event_name(e)
+            cls_or_self._validate_event_name(e)
 
-    @classmethod
-    def _validate_event_name(cls, event):
-        if event in cls.handlers.keys():
+    @hybridmethod
+    def _validate_event_name(cls_or_self, event):
+        handlers = cls_or_self.handlers
+        if isinstance(handlers, InstanceHandlers):
+            # instances may override handlers registered on the class
+            handlers = handlers.own
+
+        if event in handlers.keys():
             raise ValueError(f"Handler for event [{event}] already exists.")
 
     @classmethod
@@ -462,20 +1861,61 @@ class SQSClient:
                 f"in the {handler.__name__}() route?"
             )
 
-    @classmethod
-    def _add_handler(cls, handler, event):
-        cls.handlers.update({event: handler})
+    @hybridmethod
+    def _add_handler(cls_or_self, handler, event, options=None):
+        cls_or_self.handlers.update({event: handler})
+        cls_or_self.handler_options.update({event: options or HandlerOptions()})
 
     async def hook_post_receive_message_handler(self):  # pragma: no cover
         pass
 
-    def create_message(self, message: Any) -> SQSMessage:
+    async def hook_expired_messages(
+        self, messages: List[SQSMessage]
+    ):  # pragma: no cover
+        """
+        Called with the messages that were deleted because they expired.
+        """
+        pass
+
+    def create_message(
+        self,
+        message: Any,
+        *,
+        group_id: Optional[str] = None,
+        deduplication_id: Optional[str] = None,
+        ttl=None,
+        expires_at=None,
+    ) -> SQSMessage:
         """
         A helper method to create an SQSMessage
 
         :param message: The message body. A json encodable object.
+        :param group_id: The FIFO message group. Required for FIFO queues.
+        :param deduplication_id: The FIFO deduplication id. If not set for a FIFO
+            message, the SHA-256 hash of the body is used.
+        :param ttl: Seconds (or a timedelta) until the message expires and
+            is deleted by consumers without being handled.
+        :param expires_at: The time (epoch seconds or a datetime) the message expires.
+        :raises ValueError: If a FIFO message has no group id.
         """
         if not isinstance(message, str):
             message = json.dumps(message)
 
-        return SQSMessage(self, message)
+        message_object = SQSMessage(self, message)
+
+        if group_id is None and self.fifo:
+            raise ValueError(f"group_id is required for {self.queue_name}.")
+
+        if group_id is not None:
+            message_object.message_group_id = group_id
+            message_object.message_deduplication_id = (
+                deduplication_id
+                or hashlib.sha256(message.encode("utf-8")).hexdigest()
+            )
+        elif deduplication_id is not None:
+            raise ValueError("deduplication_id requires a group_id.")
+
+        if ttl is not None or expires_at is not None:
+            message_object.add_expiry(ttl=ttl, expires_at=expires_at)
+
+        return message_object
@@ -0,0 +1,204 @@
+import asyncio
+
+from typing import Dict, Hashable, Optional
+
+from insanic.conf import settings
+
+from iniesta.log import logger
+
+from .client import SQSClient
+from .slots import Slot, SlotPool
+
+
+class WeightedFairScheduler(SlotPool):
+    """
+    Shares a fixed number of handler slots between several flows
+    (e.g. queues) with weighted fair queuing.
+
+    Every request for a slot is tagged with a virtual finish time of
+    :code:`max(virtual_time, last_finish_of_flow) + 1 / weight` and free
+    slots are always granted to the waiting request with the smallest tag.
+    A flow with twice the weight is granted twice as many slots while both
+    flows are backlogged, and a flow that was idle does not build up credit
+    it could later use to starve the others.
+
+    :param max_concurrency: The number of slots to share.
+    """
+
+    def __init__(self, max_concurrency: int) -> None:
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1.")
+
+        super().__init__(max_concurrency)
+        self._virtual_time = 0.0
+        self._finish_tags = {}
+        self._granted = {}
+
+    @property
+    def max_concurrency(self) -> int:
+        return self.slots
+
+    def granted(self, flow: Hashable) -> int:
+        """
+        The number of slots that have been granted to the flow.
+        """
+        return self._granted.get(flow, 0)
+
+    def _tag(self, flow: Hashable, weight: float) -> float:
+        if weight <= 0:
+            raise ValueError("weight must be greater than 0.")
+
+        tag = max(self._virtual_time, self._finish_tags.get(flow, 0.0))
+        tag += 1.0 / weight
+        self._finish_tags[flow] = tag
+        return tag
+
+    def _grant(self, tag: float, flow: Hashable) -> None:
+        super()._grant(tag, flow)
+        self._virtual_time = tag
+        self._granted[flow] = self._granted.get(flow, 0) + 1
+
+    async def acquire(self, flow: Hashable, weight: float = 1) -> None:
+        """
+        Waits until a slot is granted to this flow.
+
+        :param flow: Identifies who is requesting the slot.
+        :param weight: The share of slots of this flow relative to others.
+        """
+        await self._acquire(self._tag(flow, weight), flow)
+
+    def slot(self, flow: Hashable, weight: float = 1) -> Slot:
+        """
+        An async context manager that acquires and releases a slot.
+
+        .. code-block:: python
+
+            async with scheduler.slot("bulk", 1):
+                ...
+        """
+        return Slot(self, flow, weight)
+
+    @property
+    def metrics(self) -> dict:
+        """
+        A snapshot of the current state of the scheduler.
+        """
+        return {
+            "handler_slots": self.max_concurrency,
+            "handler_slots_in_flight": self.in_flight,
+            "handler_slots_waiting": self.waiting,
+        }
+
+
+class MultiQueueConsumer:
+    """
+    Consumes several queues in one process. All clients share a single
+    handler concurrency budget that is scheduled with weighted fair queuing,
+    so a busy queue with a low weight can not starve a queue with a
+    higher weight.
+
+    .. code-block:: python
+
+        consumer = await MultiQueueConsumer.initialize(
+            {"iniesta-production-priority": 4, "iniesta-production-bulk": 1}
+        )
+
+        @consumer.clients["iniesta-production-priority"].handler("PaymentCompleted.payment")
+        async def payment_completed(message):
+            ...
+
+        consumer.start_receiving_messages()
+
+    :param clients: The clients to consume with their weights.
+    :param max_concurrency: The number of messages handled concurrently across
+        all queues. Defaults to :code:`INIESTA_SQS_CONSUMER_MAX_CONCURRENCY`.
+    """
+
+    def __init__(
+        self,
+        clients: Dict[SQSClient, float],
+        *,
+        max_concurrency: Optional[int] = None,
+    ) -> None:
+        if not clients:
+            raise ValueError("At least one client is required.")
+
+        self.scheduler = WeightedFairScheduler(
+            max_concurrency or settings.INIESTA_SQS_CONSUMER_MAX_CONCURRENCY
+        )
+        self.clients = {}
+
+        for client, weight in clients.items():
+            if weight <= 0:
+                raise ValueError(
+                    f"Weight for {client.queue_name} must be greater than 0."
+                )
+            client.scheduler = self.scheduler
+            client.weight = weight
+            self.clients[client.queue_name] = client
+
+    @classmethod
+    async def initialize(
+        cls, queues: Dict[str, float], *, max_concurrency: Optional[int] = None,
+    ) -> "MultiQueueConsumer":
+        """
+        Initializes a :code:`SQSClient` for each queue.
+
+        :param queues: The queue names to consume with their weights.
+        :param max_concurrency: The number of messages handled concurrently across
+            all queues.
+        :rtype: :code:`MultiQueueConsumer`
+        """
+        clients = {}
+        for queue_name, weight in queues.items():
+            client = await SQSClient.initialize(queue_name=queue_name)
+            clients[client] = weight
+
+        return cls(clients, max_concurrency=max_concurrency)
+
+    def start_receiving_messages(self, loop=None) -> None:
+        """
+        Starts polling all queues.
+        """
+        for queue_name, client in self.clients.items():
+            logger.debug(f"[INIESTA] Starting to poll {queue_name}")
+            client.start_receiving_messages(loop)
+
+    async def stop_receiving_messages(self) -> None:
+        """
+        Stops polling all queues.
+        """
+        await asyncio.gather(
+            *[
+                client.stop_receiving_messages()
+                for client in self.clients.values()
+            ]
+        )
+
+    async def drain(self, timeout: Optional[float] = None) -> None:
+        """
+        Stops receiving from all queues after the messages that have
+        already been received are handled.
+
+        :param timeout: Seconds to wait for in flight messages before
+            cancelling them.
+        """
+        await asyncio.gather(
+            *[client.drain(timeout) for client in self.clients.values()]
+        )
+
+    @property
+    def metrics(self) -> dict:
+        """
+        A snapshot of the shared scheduler and of each client,
+        with the client metrics keyed by queue name.
+        """
+        metrics = self.scheduler.metrics
+        metrics["queues"] = {
+            queue_name: dict(
+                client.metrics,
+                handler_slots_granted=self.scheduler.granted(client),
+            )
+            for queue_name, client in self.clients.items()
+        }
+        return metrics
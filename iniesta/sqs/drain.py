@@ -0,0 +1,214 @@
+import asyncio
+import gzip
+import os
+import time
+
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+import ujson as json
+
+from iniesta.log import error_logger
+
+
+class DrainStats:
+    """
+    The progress of :code:`drain_queue`.
+    """
+
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self.written = 0
+        self.deleted = 0
+        self.repeated = 0
+        # ids of written messages kept to skip them when received again
+        self.tracked = 0
+        self.remaining: Optional[int] = None
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def throughput(self) -> float:
+        """
+        Messages written per second.
+        """
+        elapsed = self.elapsed
+        return self.written / elapsed if elapsed else 0.0
+
+
+def message_record(message) -> dict:
+    """
+    The line written for a received message: the body, the message
+    attributes and the system attributes.
+
+    :param message: A received message.
+    :type message: :code:`SQSMessage`
+    """
+    return {
+        "MessageId": message.message_id,
+        "Body": message.raw_body,
+        "MD5OfBody": message.md5_of_body,
+        "MessageAttributes": message.original_message.get(
+            "MessageAttributes", {}
+        ),
+        "Attributes": message.attributes,
+    }
+
+
+def open_output(path: str):
+    """
+    Opens the file to write to in binary mode. Paths ending in
+    :code:`.gz` are compressed with gzip.
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, "wb")
+    return open(path, "wb")
+
+
+def _sync(file) -> None:
+    file.flush()
+    # the gzip file's underlying file
+    raw = getattr(file, "fileobj", None) or file
+    raw.flush()
+    os.fsync(raw.fileno())
+
+
+def _forget_deleted(
+    written: OrderedDict, deleted: List, visibility_timeout: int
+) -> None:
+    """
+    Starts the visibility timeout of the deleted messages, after which a
+    copy received before the delete can't be received anymore, and
+    forgets the ids whose timeout has passed. The messages are deleted in
+    the order they were written, so expired ids are always the oldest.
+    """
+    now = time.monotonic()
+    for message in deleted:
+        if written.get(message.message_id, 0) is None:
+            written[message.message_id] = now + visibility_timeout
+
+    while written:
+        expires = next(iter(written.values()))
+        if expires is None or expires > now:
+            break
+        written.popitem(last=False)
+
+
+async def drain_queue(
+    sqs_client,
+    path: str,
+    *,
+    delete: bool = False,
+    concurrency: int = 4,
+    max_messages: Optional[int] = None,
+    idle_timeout: float = 10,
+    sync_every: int = 100,
+    progress: Optional[Callable[[DrainStats], None]] = None,
+    progress_interval: float = 5,
+) -> DrainStats:
+    """
+    Receives the messages of a queue with several concurrent receives
+    and writes one JSON object per message to :code:`path`.
+
+    Only a bounded number of messages is held in memory: the prefetched
+    messages and up to :code:`sync_every` written messages waiting to be
+    deleted. If :code:`delete` is set, messages are deleted in batches after
+    the file has been flushed and synced to disk. Otherwise they become
+    visible again after their visibility timeout.
+
+    Messages that are received again, e.g. because the drain takes longer
+    than the visibility timeout, are not written again. Once only such
+    messages were received for :code:`idle_timeout` seconds, the drain
+    stops. The ids of the written messages are kept to recognize them:
+    with :code:`delete`, only until the queue's visibility timeout has
+    passed after deleting them, otherwise for the whole drain.
+
+    :param sqs_client: The client of the queue to drain.
+    :type sqs_client: :code:`SQSClient`
+    :param path: The file to write. Compressed if it ends with :code:`.gz`.
+    :param delete: If the written messages should be deleted.
+    :param concurrency: The number of concurrent receives.
+    :param max_messages: Stops after this many messages.
+    :param idle_timeout: Stops when no message was received for this many seconds.
+    :param sync_every: The number of messages written between syncs.
+    :param progress: Called with the stats every :code:`progress_interval` seconds.
+    :param progress_interval: Seconds between progress reports.
+    """
+    stats = DrainStats()
+    loop = asyncio.get_event_loop()
+    pending: List = []
+    # message id -> when it can't be received again, None until deleted
+    written = OrderedDict()
+    visibility_timeout = (
+        await sqs_client.queue_visibility_timeout() if delete else None
+    )
+
+    async def report():
+        while True:
+            try:
+                stats.remaining = (
+                    await sqs_client.approximate_number_of_messages()
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                error_logger.exception("[INIESTA] Getting queue size failed.")
+            progress(stats)
+            await asyncio.sleep(progress_interval)
+
+    async def sync(file, messages):
+        try:
+            await loop.run_in_executor(None, _sync, file)
+            if delete:
+                for message in pending:
+                    await message.ack()
+                _forget_deleted(written, pending, visibility_timeout)
+        finally:
+            if not delete:
+                # written messages stay in the queue and out of memory
+                messages.release(pending)
+            pending.clear()
+            stats.tracked = len(written)
+
+    reporter = asyncio.ensure_future(report()) if progress else None
+    try:
+        with open_output(path) as file:
+            async with sqs_client.messages(
+                max_messages=max_messages,
+                idle_timeout=idle_timeout,
+                concurrency=concurrency,
+            ) as messages:
+                last_written = time.monotonic()
+                async for message in messages:
+                    if message.message_id in written:
+                        stats.repeated += 1
+                        if delete:
+                            # deleted with the next sync like the original
+                            pending.append(message)
+                        else:
+                            messages.release([message])
+                        if time.monotonic() - last_written >= idle_timeout:
+                            break
+                        continue
+
+                    file.write(json.dumps(message_record(message)).encode())
+                    file.write(b"\n")
+                    written[message.message_id] = None
+                    last_written = time.monotonic()
+                    stats.written += 1
+                    pending.append(message)
+                    if len(pending) >= sync_every:
+                        await sync(file, messages)
+
+                await sync(file, messages)
+
+            stats.deleted = messages.acked
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+
+    if progress:
+        progress(stats)
+    return stats
@@ -0,0 +1,106 @@
+from collections import ChainMap
+from typing import List, Optional
+
+
+class HandlerOptions:
+    """
+    The options a handler was registered with. One instance is shared
+    by all the events a handler was registered for in a single call.
+
+    :param batch_max_size: If set, the handler is a batch handler and is
+        called with up to this many messages at once.
+    :param batch_max_wait_ms: How long a batch handler waits for more messages
+        before being called with a partial batch.
+    :param ordering_key: The message attribute or JSON body field whose value
+        the messages are handled in order by. Messages with the same value
+        are handled one at a time, messages with different values concurrently.
+    :param max_concurrency: The maximum number of messages handled at once.
+    :param rate_limit: The maximum number of messages handled per second.
+    :param timeout: Seconds the handler may run before it is cancelled.
+    :param coalesce_key: The message attribute or JSON body field by which
+        only the newest message is handled. The older messages are deleted.
+    :param coalesce_window_ms: How long messages are collected to coalesce.
+        If 0, only the messages of the same receive are coalesced.
+    :param priority: Messages of handlers with a higher priority are
+        dispatched first when in flight messages are limited.
+    """
+
+    def __init__(
+        self,
+        *,
+        batch_max_size: Optional[int] = None,
+        batch_max_wait_ms: int = 0,
+        ordering_key: Optional[str] = None,
+        max_concurrency: Optional[int] = None,
+        rate_limit: Optional[float] = None,
+        timeout: Optional[float] = None,
+        coalesce_key: Optional[str] = None,
+        coalesce_window_ms: int = 0,
+        priority: int = 0,
+    ) -> None:
+        if batch_max_size is not None and batch_max_size < 1:
+            raise ValueError("max_size must be at least 1.")
+        if batch_max_wait_ms < 0:
+            raise ValueError("max_wait_ms must not be negative.")
+        if ordering_key is not None:
+            if not ordering_key:
+                raise ValueError("ordering_key must not be empty.")
+            if batch_max_size is not None:
+                raise ValueError("Batch handlers can't have an ordering_key.")
+        if max_concurrency is not None and max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1.")
+        if rate_limit is not None and rate_limit <= 0:
+            raise ValueError("rate_limit must be greater than 0.")
+        if timeout is not None and timeout <= 0:
+            raise ValueError("timeout must be greater than 0.")
+        if coalesce_key is not None and not coalesce_key:
+            raise ValueError("coalesce_key must not be empty.")
+        if coalesce_window_ms < 0:
+            raise ValueError("coalesce_window_ms must not be negative.")
+        if coalesce_window_ms and coalesce_key is None:
+            raise ValueError("coalesce_window_ms requires a coalesce_key.")
+
+        self.batch_max_size = batch_max_size
+        self.batch_max_wait_ms = batch_max_wait_ms
+        self.ordering_key = ordering_key
+        self.max_concurrency = max_concurrency
+        self.rate_limit = rate_limit
+        self.timeout = timeout
+        self.coalesce_key = coalesce_key
+        self.coalesce_window_ms = coalesce_window_ms
+        self.priority = priority
+
+    @property
+    def batch(self) -> bool:
+        """
+        If the handler is called with a list of messages.
+        """
+        return self.batch_max_size is not None
+
+    @property
+    def limited(self) -> bool:
+        """
+        If the handler has a concurrency or rate limit.
+        """
+        return self.max_concurrency is not None or self.rate_limit is not None
+
+
+class InstanceHandlers(ChainMap):
+    """
+    The handlers (or handler options) registered on an instance, falling
+    back to the mapping of its class. The class' mapping is looked up on
+    every access, so it still applies after it is reassigned, e.g. by
+    :code:`SQSClient.handlers = {}`.
+
+    :param owner: The class of the instance.
+    :param name: The name of the class attribute with the mapping.
+    """
+
+    def __init__(self, owner: type, name: str) -> None:
+        self.own = {}
+        self.owner = owner
+        self.name = name
+
+    @property
+    def maps(self) -> List[dict]:
+        return [self.own, getattr(self.owner, self.name)]
@@ -0,0 +1,169 @@
+import asyncio
+import time
+
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    A token bucket that refills :code:`rate` tokens per second up to
+    :code:`capacity` tokens.
+
+    :param rate: The number of tokens added per second.
+    :param capacity: The maximum number of tokens. Defaults to one second
+        worth of tokens (at least 1).
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        if rate <= 0:
+            raise ValueError("rate must be greater than 0.")
+
+        self.rate = rate
+        self.capacity = max(1.0, rate) if capacity is None else capacity
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        # tokens promised to waiters that are sleeping until they refill
+        self._reserved = 0.0
+
+    @property
+    def tokens(self) -> float:
+        """
+        The tokens currently available.
+        """
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+        return self._tokens
+
+    def wait_time(self) -> float:
+        """
+        Seconds until a token would be available for the next caller
+        of :code:`acquire`.
+        """
+        return max(0.0, (self._reserved + 1 - self.tokens) / self.rate)
+
+    async def acquire(self) -> None:
+        """
+        Takes a token, waiting for it to refill if the bucket is empty.
+        Callers are served in the order they called.
+        """
+        wait = self.wait_time()
+        self._reserved += 1
+        try:
+            if wait > 0:
+                await asyncio.sleep(wait)
+        finally:
+            self._reserved -= 1
+        self._tokens = self.tokens - 1
+
+
+class HandlerLimiter:
+    """
+    Limits how many messages of a handler are handled at once and
+    how many are started per second.
+
+    :param max_concurrency: The maximum number of messages handled at once.
+    :param rate_limit: The maximum number of messages started per second.
+    :param name: The name of the handler for the metrics.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_concurrency: Optional[int] = None,
+        rate_limit: Optional[float] = None,
+        name: Optional[str] = None,
+    ) -> None:
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.rate_limit = rate_limit
+
+        self._semaphore = (
+            None
+            if max_concurrency is None
+            else asyncio.Semaphore(max_concurrency)
+        )
+        self._bucket = None if rate_limit is None else TokenBucket(rate_limit)
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.held = 0
+        self.released = 0
+
+    def wait_time(self) -> float:
+        """
+        A lower bound of how long the next message would wait for the rate limit.
+        """
+        return 0.0 if self._bucket is None else self._bucket.wait_time()
+
+    async def _acquire(self) -> None:
+        if self._semaphore is not None:
+            await self._semaphore.acquire()
+        try:
+            if self._bucket is not None:
+                await self._bucket.acquire()
+        except BaseException:
+            if self._semaphore is not None:
+                self._semaphore.release()
+            raise
+
+    async def acquire(self, timeout: float) -> bool:
+        """
+        Waits up to :code:`timeout` seconds until the message may be handled.
+
+        :return: If the message may be handled. If :code:`True`,
+            :code:`release` must be called after handling it.
+        """
+        if self.wait_time() > timeout:
+            self.released += 1
+            return False
+
+        waited = (
+            self._semaphore is not None and self._semaphore.locked()
+        ) or self.wait_time() > 0
+        if waited:
+            self.held += 1
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._acquire(), timeout)
+        except asyncio.TimeoutError:
+            self.released += 1
+            return False
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        return True
+
+    def release(self) -> None:
+        """
+        Marks a message acquired with :code:`acquire` as handled.
+        """
+        self.in_flight -= 1
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+    @property
+    def saturation(self) -> float:
+        """
+        The share of the concurrency limit in use, or 1 while messages
+        are waiting for the rate limit.
+        """
+        if self.max_concurrency is not None:
+            return self.in_flight / self.max_concurrency
+        return 1.0 if self.waiting else 0.0
+
+    @property
+    def metrics(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "rate_limit": self.rate_limit,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "held": self.held,
+            "released": self.released,
+            "saturation": self.saturation,
+        }
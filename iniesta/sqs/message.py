@@ -1,6 +1,7 @@
-from typing import Any
+from typing import Any, Optional
 
 import hashlib
+import time
 import ujson as json
 from botocore.exceptions import ClientError
 
@@ -22,6 +23,7 @@ VALID_SEND_MESSAGE_ARGS = [
 ERROR_MESSAGES = {
     "delay_seconds_out_of_bounds": "Delay Seconds must be between 0 and 900 inclusive. Got {value}.",
     "delay_seconds_type_error": "Delay Seconds must be an integer. Got {value}.",
+    "fifo_id_invalid": "{name} must be a string of 1 to 128 characters. Got {value}.",
 }
 
 
@@ -45,6 +47,17 @@ class SQSMessage(MessageAttributes):
         self.md5_of_body = None
         self.attributes = None
 
+    def __setitem__(self, key, value) -> None:
+        super().__setitem__(key, value)
+        if key == "MessageAttributes":
+            self._message_attributes = None
+
+    def _set_message_attribute(
+        self, attribute_name: str, attribute: dict
+    ) -> None:
+        super()._set_message_attribute(attribute_name, attribute)
+        self._message_attributes = None
+
     @classmethod
     def from_sqs(cls, client, message: Any):
         """
@@ -107,6 +120,97 @@ class SQSMessage(MessageAttributes):
 
         self["DelaySeconds"] = value
 
+    @property
+    def message_group_id(self) -> Optional[str]:
+        """
+        The FIFO message group of this message.
+        """
+        if self.attributes and "MessageGroupId" in self.attributes:
+            return self.attributes["MessageGroupId"]
+        return self.get("MessageGroupId")
+
+    @message_group_id.setter
+    def message_group_id(self, value: str) -> None:
+        """
+        :raises ValueError: If the value is not a string of 1 to 128 characters.
+        """
+        self["MessageGroupId"] = self._validate_fifo_id("MessageGroupId", value)
+
+    @property
+    def message_deduplication_id(self) -> Optional[str]:
+        """
+        The FIFO deduplication id of this message.
+        """
+        if self.attributes and "MessageDeduplicationId" in self.attributes:
+            return self.attributes["MessageDeduplicationId"]
+        return self.get("MessageDeduplicationId")
+
+    @message_deduplication_id.setter
+    def message_deduplication_id(self, value: str) -> None:
+        """
+        :raises ValueError: If the value is not a string of 1 to 128 characters.
+        """
+        self["MessageDeduplicationId"] = self._validate_fifo_id(
+            "MessageDeduplicationId", value
+        )
+
+    @staticmethod
+    def _validate_fifo_id(name: str, value: str) -> str:
+        if not isinstance(value, str) or not 0 < len(value) <= 128:
+            raise ValueError(
+                ERROR_MESSAGES["fifo_id_invalid"].format(name=name, value=value)
+            )
+        return value
+
+    @property
+    def expires_at(self) -> Optional[float]:
+        """
+        The time (seconds since the epoch) after which this message is
+        expired or :code:`None` if it doesn't expire.
+        """
+        value = self.message_attributes.get(settings.INIESTA_EXPIRES_AT_KEY)
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return None
+
+    def expired(self, now: Optional[float] = None) -> bool:
+        """
+        If this message has expired.
+
+        :param now: The current time in seconds since the epoch.
+        """
+        expires_at = self.expires_at
+        if expires_at is None:
+            return False
+        return expires_at <= (time.time() if now is None else now)
+
+    @property
+    def published_at(self) -> Optional[float]:
+        """
+        The time (seconds since the epoch) this message was published, or
+        if it wasn't stamped by the publisher, when SQS received it.
+        :code:`None` if neither is known.
+        """
+        value = self.message_attributes.get(settings.INIESTA_PUBLISHED_AT_KEY)
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            pass
+        try:
+            return int(self.attributes["SentTimestamp"]) / 1000
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    @property
+    def trace_id(self) -> Optional[str]:
+        """
+        The trace id of this message, if any.
+        """
+        return self.message_attributes.get(settings.INIESTA_TRACE_ID_KEY)
+
     @property
     def raw_body(self):
         """
@@ -145,7 +249,11 @@ class SQSMessage(MessageAttributes):
         """
         Any message attributes attached to this body.
         Refer to https://docs.aws.amazon.com/AWSSimpleQueueService/latest/SQSDeveloperGuide/sqs-message-metadata.html#sqs-message-attributes
+
+        Parsed once and kept until the attributes change.
         """
+        if self._message_attributes is not None:
+            return self._message_attributes
 
         _message_attributes = {}
 
@@ -159,6 +267,7 @@ class SQSMessage(MessageAttributes):
                 {attribute: attribute_value[f"{data_type}Value"]}
             )
 
+        self._message_attributes = _message_attributes
         return _message_attributes
 
     async def send(self):
@@ -0,0 +1,83 @@
+import asyncio
+import functools
+
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+
+def ordering_key_value(message, ordering_key: str) -> Optional[str]:
+    """
+    The value of the ordering key for a message. The message attribute
+    with the name is used if it exists, otherwise the field of the
+    JSON body. A dotted name looks up a nested body field.
+
+    :param message: The received message.
+    :type message: :code:`SQSMessage`
+    :param ordering_key: The attribute or body field name.
+    :return: The value as a string or :code:`None` if the message does not have it.
+    """
+    attributes = message.message_attributes
+    if ordering_key in attributes:
+        return str(attributes[ordering_key])
+
+    value = message.body
+    for field in ordering_key.split("."):
+        if not isinstance(value, dict) or field not in value:
+            return None
+        value = value[field]
+
+    return None if value is None else str(value)
+
+
+class KeyedExecutor:
+    """
+    Runs coroutines in serial lanes per key while coroutines of different
+    keys run concurrently. A lane only exists while it has work, so
+    keys that are no longer active do not take up any memory.
+    """
+
+    def __init__(self) -> None:
+        self._lanes = {}
+        self.submitted = 0
+
+    def submit(
+        self, key: Hashable, func: Callable[..., Awaitable], *args
+    ) -> asyncio.Future:
+        """
+        Schedules :code:`func(*args)` to run after everything that
+        was submitted before with the same key has finished.
+
+        :return: The task running the coroutine.
+        """
+        previous = self._lanes.get(key)
+        task = asyncio.ensure_future(self._run(previous, func, args))
+        self._lanes[key] = task
+        task.add_done_callback(functools.partial(self._release, key))
+        self.submitted += 1
+        return task
+
+    @staticmethod
+    async def _run(
+        previous: Optional[asyncio.Future], func: Callable, args: tuple
+    ) -> Any:
+        if previous is not None:
+            # the outcome of the previous task doesn't matter, only that it's done
+            await asyncio.wait([previous])
+        return await func(*args)
+
+    def _release(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._lanes.get(key) is task:
+            del self._lanes[key]
+
+    @property
+    def lanes(self) -> int:
+        """
+        The number of keys with work running or waiting.
+        """
+        return len(self._lanes)
+
+    @property
+    def metrics(self) -> dict:
+        return {
+            "ordering_lanes": self.lanes,
+            "ordering_submitted": self.submitted,
+        }
@@ -0,0 +1,113 @@
+import asyncio
+import time
+
+from .slots import Slot, SlotPool
+
+
+class PriorityDispatcher(SlotPool):
+    """
+    Limits the number of messages handled at once and grants free
+    slots to the waiting message with the highest priority.
+
+    To keep low priority messages from starving, the priority of a waiting
+    message increases by :code:`aging` every second it waits. Because all
+    waiting messages age at the same rate, their order only depends on
+    :code:`priority - aging * enqueued_at` and never has to be recomputed.
+
+    Up to :code:`max_in_flight` messages may wait for a slot, so receives can
+    run ahead of the handlers far enough for priorities to matter. Messages
+    that are parked, e.g. while they wait for the limit of their handler,
+    count as waiting.
+
+    :param max_in_flight: The number of messages handled at once.
+    :param aging: The priority a waiting message gains per second.
+    """
+
+    def __init__(self, max_in_flight: int, *, aging: float = 1.0) -> None:
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1.")
+        if aging < 0:
+            raise ValueError("aging must not be negative.")
+
+        super().__init__(max_in_flight)
+        self.aging = aging
+        self.parked = 0
+        self.dispatched = 0
+        self._room = asyncio.Event()
+        self._room.set()
+
+    @property
+    def max_in_flight(self) -> int:
+        return self.slots
+
+    @property
+    def max_waiting(self) -> int:
+        """
+        The number of messages that may wait for a slot.
+        """
+        return self.max_in_flight
+
+    @property
+    def capacity(self) -> int:
+        """
+        How many more messages may be received to wait for a slot.
+        """
+        return max(0, self.max_waiting - self.waiting - self.parked)
+
+    def _waiting_changed(self) -> None:
+        if self.waiting + self.parked < self.max_waiting:
+            self._room.set()
+        else:
+            self._room.clear()
+
+    def _grant(self, key: float, item: None) -> None:
+        super()._grant(key, item)
+        self.dispatched += 1
+
+    async def wait_for_capacity(self) -> None:
+        """
+        Waits until fewer than :code:`max_waiting` messages are waiting.
+        """
+        await self._room.wait()
+
+    def park(self) -> None:
+        """
+        Counts a received message that waits for something else before
+        it waits for a slot. Must be followed by :code:`unpark`.
+        """
+        self.parked += 1
+        self._waiting_changed()
+
+    def unpark(self) -> None:
+        """
+        Stops counting a message counted with :code:`park`.
+        """
+        self.parked -= 1
+        self._waiting_changed()
+
+    async def acquire(self, priority: int = 0) -> None:
+        """
+        Waits until a slot is granted.
+
+        :param priority: Higher priorities are granted first.
+        """
+        await self._acquire(-(priority - self.aging * time.monotonic()))
+
+    def slot(self, priority: int = 0) -> Slot:
+        """
+        An async context manager that acquires and releases a slot.
+        """
+        return Slot(self, priority)
+
+    @property
+    def metrics(self) -> dict:
+        """
+        A snapshot of the current state of the dispatcher.
+        """
+        return {
+            "dispatch_max_in_flight": self.max_in_flight,
+            "dispatch_in_flight": self.in_flight,
+            "dispatch_waiting": self.waiting,
+            "dispatch_parked": self.parked,
+            "dispatched": self.dispatched,
+        }
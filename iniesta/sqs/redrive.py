@@ -0,0 +1,304 @@
+import asyncio
+import fnmatch
+import time
+
+from collections import namedtuple
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional
+
+import botocore.exceptions
+
+from iniesta.log import error_logger
+
+from .adaptive import MAX_NUMBER_OF_MESSAGES
+from .batch import BatchCollector
+from .limits import TokenBucket
+
+#: The maximum size of all messages in a :code:`SendMessageBatch` request.
+MAX_BATCH_BYTES: int = 256 * 1024
+
+# a skipped message, without its body
+_Skipped = namedtuple("_Skipped", ["message_id", "receipt_handle"])
+
+
+class RedriveStats:
+    """
+    The progress of :code:`redrive`.
+    """
+
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self.received = 0
+        self.moved = 0
+        self.failed = 0
+        self.skipped = 0
+        self.remaining: Optional[int] = None
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def throughput(self) -> float:
+        """
+        Messages moved per second.
+        """
+        elapsed = self.elapsed
+        return self.moved / elapsed if elapsed else 0.0
+
+
+def event_matches(message, events: Optional[Iterable[str]]) -> bool:
+    """
+    If the event of the message matches one of the event patterns.
+    Patterns may contain shell-style wildcards, e.g. :code:`User*.user`.
+    Every message matches if there are no patterns.
+    """
+    if not events:
+        return True
+    event = message.event
+    if event is None:
+        return False
+    return any(fnmatch.fnmatchcase(event, pattern) for pattern in events)
+
+
+def _message_size(message) -> int:
+    size = len(message.raw_body.encode("utf-8"))
+    for name, value in message["MessageAttributes"].items():
+        size += len(name) + len(value["DataType"])
+        size += len(value.get("StringValue", "")) + len(
+            value.get("BinaryValue", b"")
+        )
+    return size
+
+
+def _keep_fifo_ids(message) -> None:
+    group_id = message.attributes.get("MessageGroupId")
+    if group_id is not None:
+        message.message_group_id = group_id
+    deduplication_id = message.attributes.get("MessageDeduplicationId")
+    if deduplication_id is not None:
+        message.message_deduplication_id = deduplication_id
+
+
+async def _send_batch(target, client, batch: List) -> set:
+    """
+    Sends a batch to the target queue.
+
+    :return: The ids of the messages that failed to be sent.
+    """
+    if target.fifo:
+        for message in batch:
+            _keep_fifo_ids(message)
+
+    try:
+        failed = await target.send_message_batch(client, batch)
+    except asyncio.CancelledError:
+        raise
+    except botocore.exceptions.ClientError as e:
+        error_logger.critical(
+            f"[INIESTA] [{e.response['Error']['Code']}]: {e.response['Error']['Message']}"
+        )
+        failed = [(message, e) for message in batch]
+    except Exception as e:
+        error_logger.exception("[INIESTA] Sending a redrive batch failed.")
+        failed = [(message, e) for message in batch]
+
+    failed_ids = set()
+    for message, reason in failed:
+        failed_ids.add(id(message))
+        error_logger.error(
+            f"[INIESTA] Failed to redrive message {message.message_id}: {reason}"
+        )
+    return failed_ids
+
+
+async def _report(
+    source, stats: RedriveStats, progress: Callable, interval: float
+) -> None:
+    while True:
+        try:
+            stats.remaining = await source.approximate_number_of_messages()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            error_logger.exception("[INIESTA] Getting queue size failed.")
+        progress(stats)
+        await asyncio.sleep(interval)
+
+
+async def _batches(
+    messages,
+    stats: RedriveStats,
+    events: List[str],
+    skipped: Dict[str, str],
+    idle_timeout: float,
+) -> AsyncIterator[List]:
+    """
+    Batches the messages to send. A batch is sent when it is full, or
+    when no more messages are buffered, so messages don't wait for the
+    next receive and outlive their visibility timeout. The receipt handles
+    of messages that don't match the events are collected in
+    :code:`skipped` by message id instead. If a skipped message is received
+    again, only its latest receipt is kept, and once only such messages
+    were received for :code:`idle_timeout` seconds, the batching stops.
+    """
+    batch, batch_size = [], 0
+    last_received = time.monotonic()
+    async for message in messages:
+        if message.message_id in skipped:
+            messages.release([message])
+            skipped[message.message_id] = message.receipt_handle
+            if time.monotonic() - last_received >= idle_timeout:
+                break
+        elif not event_matches(message, events):
+            stats.received += 1
+            last_received = time.monotonic()
+            # kept invisible until the redrive finishes so it isn't
+            # received again while redriving
+            stats.skipped += 1
+            messages.release([message])
+            skipped[message.message_id] = message.receipt_handle
+        else:
+            stats.received += 1
+            last_received = time.monotonic()
+            size = _message_size(message)
+            if batch and (
+                len(batch) == MAX_NUMBER_OF_MESSAGES
+                or batch_size + size > MAX_BATCH_BYTES
+            ):
+                yield batch
+                batch, batch_size = [], 0
+            batch.append(message)
+            batch_size += size
+
+        if batch and not messages.buffered:
+            yield batch
+            batch, batch_size = [], 0
+
+    if batch:
+        yield batch
+
+
+async def _make_visible(source, skipped: Dict[str, str]) -> None:
+    """
+    Makes the skipped messages visible again with
+    :code:`ChangeMessageVisibilityBatch`, 10 messages per request.
+    """
+    async with source._create_client() as client:
+
+        async def flush(batch):
+            await source.change_visibility(client, batch, 0)
+
+        collector = BatchCollector(
+            flush, max_size=MAX_NUMBER_OF_MESSAGES, max_wait_ms=0
+        )
+        try:
+            for message_id, receipt_handle in skipped.items():
+                await collector.add(_Skipped(message_id, receipt_handle))
+            await collector.flush()
+        finally:
+            collector.close()
+
+
+async def redrive(
+    source,
+    target,
+    *,
+    events: Optional[Iterable[str]] = None,
+    concurrency: int = 4,
+    rate_limit: Optional[float] = None,
+    max_messages: Optional[int] = None,
+    idle_timeout: float = 10,
+    progress: Optional[Callable[[RedriveStats], None]] = None,
+    progress_interval: float = 5,
+) -> RedriveStats:
+    """
+    Moves messages from one queue to another. Messages are received with
+    several concurrent receives and sent with :code:`SendMessageBatch`,
+    keeping their body and message attributes. A message is only deleted
+    from the source queue after it was sent successfully. Messages that
+    failed to be sent stay in the source queue and become visible again
+    after its visibility timeout. Messages that don't match :code:`events`
+    are made visible again when the redrive finishes.
+
+    If the target is a FIFO queue, the :code:`MessageGroupId` and
+    :code:`MessageDeduplicationId` of the source messages are kept.
+
+    :param source: The client of the queue to move messages from.
+    :type source: :code:`SQSClient`
+    :param target: The client of the queue to move messages to.
+    :type target: :code:`SQSClient`
+    :param events: Only moves messages with events matching these patterns.
+    :param concurrency: The number of concurrent receives and sends.
+    :param rate_limit: The maximum number of messages moved per second.
+    :param max_messages: Stops after receiving this many messages.
+    :param idle_timeout: Stops when no message was received for this many seconds.
+    :param progress: Called with the stats every :code:`progress_interval` seconds.
+    :param progress_interval: Seconds between progress reports.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1.")
+
+    events = list(events or [])
+    stats = RedriveStats()
+    skipped = {}
+    bucket = None if rate_limit is None else TokenBucket(rate_limit)
+    batches = asyncio.Queue(concurrency)
+
+    async def sender(client):
+        while True:
+            batch = await batches.get()
+            if batch is None:
+                return
+            if bucket is not None:
+                for _ in batch:
+                    await bucket.acquire()
+
+            # failures are recorded per batch, so the senders keep
+            # taking batches and the receiving never waits on a full queue
+            failed_ids = await _send_batch(target, client, batch)
+            for message in batch:
+                if id(message) in failed_ids:
+                    message.stream.release([message])
+                else:
+                    await message.ack()
+            stats.moved += len(batch) - len(failed_ids)
+            stats.failed += len(failed_ids)
+
+    reporter = None
+    if progress:
+        reporter = asyncio.ensure_future(
+            _report(source, stats, progress, progress_interval)
+        )
+    try:
+        async with target._create_client() as client:
+            async with source.messages(
+                max_messages=max_messages,
+                idle_timeout=idle_timeout,
+                concurrency=concurrency,
+            ) as messages:
+                senders = [
+                    asyncio.ensure_future(sender(client))
+                    for _ in range(concurrency)
+                ]
+                try:
+                    async for batch in _batches(
+                        messages, stats, events, skipped, idle_timeout
+                    ):
+                        await batches.put(batch)
+                    for _ in senders:
+                        await batches.put(None)
+                    await asyncio.gather(*senders)
+                finally:
+                    for task in senders:
+                        task.cancel()
+    finally:
+        try:
+            if skipped:
+                await _make_visible(source, skipped)
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+
+    if progress:
+        progress(stats)
+    return stats
@@ -0,0 +1,241 @@
+import asyncio
+import time
+
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from aioredlock import LockError
+
+from iniesta.metrics import LatencyHistogram
+
+from .adaptive import MAX_NUMBER_OF_MESSAGES
+from .client import SQSClient
+from .message import SQSMessage
+from .trace import read_trace
+
+
+class ReplayTransport:
+    """
+    Stands in for the aws sqs client while replaying. Deletes and
+    visibility changes are only counted.
+    """
+
+    def __init__(self) -> None:
+        self.deleted = 0
+        self.released = 0
+
+    async def delete_message(self, **kwargs) -> dict:
+        self.deleted += 1
+        return {}
+
+    async def delete_message_batch(self, *, Entries, **kwargs) -> dict:
+        self.deleted += len(Entries)
+        return {}
+
+    async def change_message_visibility(self, **kwargs) -> dict:
+        self.released += 1
+        return {}
+
+    async def change_message_visibility_batch(
+        self, *, Entries, **kwargs
+    ) -> dict:
+        self.released += len(Entries)
+        return {}
+
+
+class _LocalLock:
+    def __init__(self, resource: str) -> None:
+        self.resource = resource
+        self.valid = True
+
+
+class LocalLockManager:
+    """
+    An in process replacement of :code:`Aioredlock` for replaying.
+    """
+
+    def __init__(self) -> None:
+        self._locked = set()
+
+    async def lock(self, resource: str) -> _LocalLock:
+        if resource in self._locked:
+            raise LockError(f"Could not acquire lock for {resource}")
+        self._locked.add(resource)
+        return _LocalLock(resource)
+
+    async def unlock(self, lock: _LocalLock) -> None:
+        self._locked.discard(lock.resource)
+        lock.valid = False
+
+    async def destroy(self) -> None:
+        self._locked.clear()
+
+
+class ReplayClient(SQSClient):
+    """
+    A :code:`SQSClient` that handles messages with the registered handlers
+    without Redis and records the latency of every handler per event.
+    """
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.lock_manager = LocalLockManager()
+        # don't record the replayed messages again
+        self.recorder = None
+        self.latencies: Dict[str, LatencyHistogram] = defaultdict(
+            LatencyHistogram
+        )
+
+    async def handle_message(self, message: SQSMessage) -> tuple:
+        start = time.monotonic()
+        try:
+            return await super().handle_message(message)
+        finally:
+            self.latencies[str(message.event)].observe(time.monotonic() - start)
+
+    async def handle_batch(
+        self, handler: Callable, messages: List[SQSMessage]
+    ) -> list:
+        start = time.monotonic()
+        try:
+            return await super().handle_batch(handler, messages)
+        finally:
+            self.latencies[str(messages[0].event)].observe(
+                time.monotonic() - start
+            )
+
+
+class ReplayStats:
+    """
+    The results of :code:`replay`.
+    """
+
+    def __init__(self, client: ReplayClient, transport: ReplayTransport):
+        self.client = client
+        self.transport = transport
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+        self.messages = 0
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def throughput(self) -> float:
+        """
+        Messages replayed per second.
+        """
+        elapsed = self.elapsed
+        return self.messages / elapsed if elapsed else 0.0
+
+    @property
+    def events(self) -> Dict[str, dict]:
+        """
+        The number of handled messages (or batches) and the latency
+        percentiles in seconds per event. The percentiles are the upper
+        bounds of the latency buckets they fall into.
+        """
+        return {
+            event: histogram.metrics
+            for event, histogram in sorted(self.client.latencies.items())
+        }
+
+    @property
+    def metrics(self) -> dict:
+        return {
+            "messages": self.messages,
+            "elapsed": self.elapsed,
+            "throughput": self.throughput,
+            "deleted": self.transport.deleted,
+            "released": self.transport.released,
+            "handler_errors": self.client.handler_errors,
+            "handler_timeouts": self.client.handler_timeouts,
+            "events": self.events,
+        }
+
+
+def _receives(records: Iterable[dict]) -> Iterator[tuple]:
+    """
+    Groups the recorded messages back into the receives they came from.
+
+    :return: Tuples of the time of the receive and the raw messages.
+    """
+    received_at, messages = None, []
+    for record in records:
+        if messages and (
+            record["received_at"] != received_at
+            or len(messages) == MAX_NUMBER_OF_MESSAGES
+        ):
+            yield received_at, messages
+            messages = []
+        received_at = record["received_at"]
+        messages.append(record["message"])
+
+    if messages:
+        yield received_at, messages
+
+
+async def replay(
+    path: str,
+    *,
+    queue_name: Optional[str] = None,
+    speed: float = 0,
+    concurrency: int = 4,
+) -> ReplayStats:
+    """
+    Handles the messages of a trace file with the registered handlers.
+
+    The messages go through the same processing as polled messages, but
+    are deleted from a stubbed transport and locked in process.
+
+    :param path: The trace file recorded with :code:`TraceRecorder`.
+    :param queue_name: The queue whose handlers are used. Defaults to
+        the default queue of the service.
+    :param speed: 0 to replay as fast as possible with :code:`concurrency`
+        concurrent receives. Otherwise receives are replayed at the recorded
+        times, sped up by this factor (e.g. 1 for the recorded speed).
+    :param concurrency: The concurrent receives when replaying as fast as possible.
+    """
+    if speed < 0:
+        raise ValueError("speed must not be negative.")
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1.")
+
+    if queue_name is None:
+        queue_name = SQSClient.default_queue_name()
+    SQSClient.queue_urls.setdefault(queue_name, f"replay://{queue_name}")
+
+    client = ReplayClient(queue_name=queue_name)
+    transport = ReplayTransport()
+    stats = ReplayStats(client, transport)
+    receives = _receives(read_trace(path))
+
+    async def process(messages):
+        stats.messages += len(messages)
+        await client._process(transport, messages)
+
+    if speed:
+        tasks = set()
+        first = None
+        for received_at, messages in receives:
+            if first is None:
+                first = received_at
+            delay = (received_at - first) / speed - stats.elapsed
+            if delay > 0:
+                await asyncio.sleep(delay)
+            task = asyncio.ensure_future(process(messages))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+    else:
+
+        async def receiver():
+            for _, messages in receives:
+                await process(messages)
+
+        await asyncio.gather(*[receiver() for _ in range(concurrency)])
+
+    await client._finish()
+    stats.finished = time.monotonic()
+    return stats
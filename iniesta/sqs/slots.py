@@ -0,0 +1,91 @@
+import asyncio
+import heapq
+import itertools
+
+from typing import Any, Hashable
+
+
+class SlotPool:
+    """
+    A fixed number of slots that are granted to waiters in the order of
+    their keys, smallest first. Waiters with the same key are granted in
+    the order they started waiting.
+
+    Subclasses decide the keys and may override :code:`_grant` and
+    :code:`_waiting_changed` to keep track of the grants.
+
+    :param slots: The number of slots.
+    """
+
+    def __init__(self, slots: int) -> None:
+        self.slots = slots
+        self.in_flight = 0
+        self.waiting = 0
+        self._waiters = []
+        self._sequence = itertools.count()
+
+    def _grant(self, key: Any, item: Hashable) -> None:
+        self.in_flight += 1
+
+    def _waiting_changed(self) -> None:
+        pass
+
+    async def _acquire(self, key: Any, item: Hashable = None) -> None:
+        """
+        Waits until a slot is granted.
+
+        :param key: Slots are granted to the smallest key first.
+        :param item: Passed to :code:`_grant` when the slot is granted.
+        """
+        if self.in_flight < self.slots and not self.waiting:
+            self._grant(key, item)
+            return
+
+        waiter = asyncio.get_event_loop().create_future()
+        heapq.heappush(self._waiters, (key, next(self._sequence), item, waiter))
+        self.waiting += 1
+        self._waiting_changed()
+
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.cancelled():
+                self.waiting -= 1
+                self._waiting_changed()
+            else:
+                # the slot was granted just before we were cancelled
+                self.release()
+            raise
+
+    def release(self) -> None:
+        """
+        Gives back a slot and grants it to the waiter with the smallest key.
+        """
+        self.in_flight -= 1
+
+        while self._waiters and self.in_flight < self.slots:
+            key, _, item, waiter = heapq.heappop(self._waiters)
+            if waiter.done():
+                continue
+            self.waiting -= 1
+            self._grant(key, item)
+            waiter.set_result(None)
+
+        self._waiting_changed()
+
+
+class Slot:
+    """
+    An async context manager that acquires a slot of a pool with the
+    arguments of its :code:`acquire` and releases it.
+    """
+
+    def __init__(self, pool: SlotPool, *args: Any) -> None:
+        self.pool = pool
+        self.args = args
+
+    async def __aenter__(self) -> None:
+        await self.pool.acquire(*self.args)
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.pool.release()
@@ -0,0 +1,352 @@
+import asyncio
+import functools
+
+from typing import List, Optional
+
+import botocore.exceptions
+
+from iniesta.log import error_logger
+
+from .adaptive import MAX_NUMBER_OF_MESSAGES
+from .batch import BatchCollector
+from .message import SQSMessage
+
+#: The maximum visibility timeout SQS allows.
+MAX_VISIBILITY_TIMEOUT: int = 43200
+
+_failed = object()
+
+
+class StreamMessage(SQSMessage):
+    """
+    A message received by a :code:`MessageStream` that is acknowledged
+    explicitly.
+    """
+
+    stream = None
+    settled = False
+
+    def _settle(self) -> None:
+        if self.settled:
+            raise RuntimeError(
+                f"Message {self.message_id} was already acked or nacked."
+            )
+        self.settled = True
+
+    async def ack(self) -> None:
+        """
+        Deletes the message. Deletes are batched with other messages of the stream.
+        """
+        self._settle()
+        await self.stream.ack(self)
+
+    async def nack(self, delay: int = 0) -> None:
+        """
+        Makes the message visible again, so it is received again.
+        Visibility changes are batched with other messages of the stream.
+
+        :param delay: The seconds until the message is visible again.
+        """
+        if not 0 <= delay <= MAX_VISIBILITY_TIMEOUT:
+            raise ValueError(
+                f"delay must be between 0 and {MAX_VISIBILITY_TIMEOUT}. "
+                f"Got {delay}."
+            )
+        self._settle()
+        await self.stream.nack(self, delay)
+
+
+class MessageStream:
+    """
+    An async iterator of the messages of a :code:`SQSClient` queue.
+
+    Several receives run concurrently and buffer up to :code:`prefetch`
+    messages ahead of the iteration. The receives go through the same
+    receive controller, backpressure and in flight budget as polling.
+
+    Acks and nacks are collected and sent with :code:`DeleteMessageBatch`
+    and :code:`ChangeMessageVisibilityBatch`. When the iteration ends, the
+    buffered messages that were not iterated are made visible again.
+    Messages that were iterated but neither acked nor nacked become visible
+    again after their visibility timeout. Their budget is given back when
+    the stream closes.
+    Closing the stream also sends the collected acks and nacks. Used with
+    :code:`async with`, the stream closes when the block is left, so messages
+    can still be acked after the iteration ended. Otherwise it closes when
+    the iteration ends.
+
+    :param client: The client of the queue.
+    :type client: :code:`SQSClient`
+    :param max_messages: Stops after this many messages. :code:`None` for no limit.
+    :param idle_timeout: Stops when no message was received for this many seconds.
+    :param concurrency: The number of concurrent receives.
+    :param prefetch: The number of messages buffered ahead of the iteration.
+    """
+
+    #: The milliseconds an ack or nack waits to be batched with others.
+    settle_max_wait_ms: int = 100
+    #: The seconds to wait before receiving again after a receive failed.
+    error_wait: float = 1.0
+
+    def __init__(
+        self,
+        client,
+        *,
+        max_messages: Optional[int] = None,
+        idle_timeout: Optional[float] = None,
+        concurrency: int = 1,
+        prefetch: Optional[int] = None,
+    ) -> None:
+        if max_messages is not None and max_messages < 1:
+            raise ValueError("max_messages must be at least 1.")
+        if idle_timeout is not None and idle_timeout <= 0:
+            raise ValueError("idle_timeout must be greater than 0.")
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1.")
+
+        self.client = client
+        self.max_messages = max_messages
+        self.idle_timeout = idle_timeout
+        self.concurrency = concurrency
+        self.prefetch = prefetch or concurrency * MAX_NUMBER_OF_MESSAGES
+
+        # includes the messages requested by receives that are running
+        self.received = 0
+        self.yielded = 0
+        self.acked = 0
+        self.nacked = 0
+        self.stopped = False
+        self.closed = False
+
+        self._sqs = None
+        self._context = None
+        self._buffer = None
+        self._receivers = []
+        self._collectors = {}
+        # the messages counted against the client's in flight budget
+        self._held = {}
+        # messages of a receive that was cancelled before buffering them
+        self._unbuffered = []
+        self._error = None
+        self._managed = False
+
+    def __aiter__(self) -> "MessageStream":
+        return self
+
+    async def __aenter__(self) -> "MessageStream":
+        self._managed = True
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
+
+    async def __anext__(self) -> StreamMessage:
+        if self.stopped or (
+            self.max_messages is not None and self.yielded >= self.max_messages
+        ):
+            await self._end()
+            raise StopAsyncIteration
+
+        if self._buffer is None:
+            await self._start()
+
+        try:
+            message = await asyncio.wait_for(
+                self._buffer.get(), self.idle_timeout
+            )
+        except asyncio.TimeoutError:
+            await self._end()
+            raise StopAsyncIteration
+
+        if message is _failed:
+            await self._end()
+            raise self._error
+
+        self.yielded += 1
+        return message
+
+    async def _start(self) -> None:
+        self._context = self.client._create_client()
+        self._sqs = await self._context.__aenter__()
+        self._buffer = asyncio.Queue(self.prefetch)
+        self._receivers = [
+            asyncio.ensure_future(self._receive())
+            for _ in range(self.concurrency)
+        ]
+
+    async def _receive(self) -> None:
+        while True:
+            limit = MAX_NUMBER_OF_MESSAGES
+            if self.max_messages is not None:
+                limit = min(limit, self.max_messages - self.received)
+                if limit < 1:
+                    return
+
+            self.received += limit
+            try:
+                received = await self.client._receive(self._sqs, limit)
+            except asyncio.CancelledError:
+                raise
+            except botocore.exceptions.ClientError as e:
+                self.received -= limit
+                error_logger.critical(
+                    f"[INIESTA] [{e.response['Error']['Code']}]: {e.response['Error']['Message']}"
+                )
+                await asyncio.sleep(self.error_wait)
+                continue
+            except Exception as e:
+                self._error = e
+                await self._buffer.put(_failed)
+                return
+
+            self.received -= limit - len(received)
+            messages = []
+            for raw_message in received:
+                message = StreamMessage.from_sqs(self.client, raw_message)
+                message.stream = self
+                self.client._add_in_flight(message, message.event)
+                self._held[message.receipt_handle] = message
+                messages.append(message)
+
+            for index, message in enumerate(messages):
+                try:
+                    await self._buffer.put(message)
+                except asyncio.CancelledError:
+                    self._unbuffered.extend(messages[index:])
+                    raise
+
+    def release(self, messages: List[StreamMessage]) -> None:
+        """
+        Gives back the in flight budget of messages that are kept without
+        being acked or nacked yet. Acking and nacking a message also gives
+        back its budget. Releasing a message more than once has no effect.
+        """
+        self.client._release_budget(
+            [
+                message
+                for message in messages
+                if self._held.pop(message.receipt_handle, None) is not None
+            ]
+        )
+
+    def _collector(self, delay: Optional[int]) -> BatchCollector:
+        if self.closed:
+            raise RuntimeError("The message stream is closed.")
+
+        collector = self._collectors.get(delay)
+        if collector is None:
+            flush = (
+                self._delete
+                if delay is None
+                else functools.partial(self._change_visibility, delay)
+            )
+            collector = self._collectors[delay] = BatchCollector(
+                flush,
+                max_size=MAX_NUMBER_OF_MESSAGES,
+                max_wait_ms=self.settle_max_wait_ms,
+            )
+        return collector
+
+    async def ack(self, message: StreamMessage) -> None:
+        """
+        Collects a message to be deleted.
+        """
+        await self._collector(None).add(message)
+
+    async def nack(self, message: StreamMessage, delay: int = 0) -> None:
+        """
+        Collects a message to be made visible again after :code:`delay` seconds.
+        """
+        await self._collector(delay).add(message)
+
+    async def _delete(self, messages: List[StreamMessage]) -> None:
+        try:
+            failed = await self.client.delete_messages(self._sqs, messages)
+            self.acked += len(messages) - len(failed)
+        finally:
+            self.release(messages)
+
+    async def _change_visibility(
+        self, delay: int, messages: List[StreamMessage]
+    ) -> None:
+        try:
+            failed = await self.client.change_visibility(
+                self._sqs, messages, delay
+            )
+            self.nacked += len(messages) - len(failed)
+        finally:
+            self.release(messages)
+
+    async def _end(self) -> None:
+        if self._managed:
+            await self._stop()
+        else:
+            await self.close()
+
+    async def _stop(self) -> None:
+        """
+        Stops receiving and makes the messages that were received
+        but not iterated visible again.
+        """
+        if self.stopped:
+            return
+        self.stopped = True
+
+        for receiver in self._receivers:
+            receiver.cancel()
+        await asyncio.gather(*self._receivers, return_exceptions=True)
+
+        if self._buffer is None:
+            return
+
+        buffered = self._unbuffered
+        self._unbuffered = []
+        while not self._buffer.empty():
+            message = self._buffer.get_nowait()
+            if message is not _failed:
+                buffered.append(message)
+        if buffered:
+            try:
+                await self.client.change_visibility(self._sqs, buffered, 0)
+            finally:
+                self.release(buffered)
+
+    async def close(self) -> None:
+        """
+        Stops receiving, makes the messages that were received but not
+        iterated visible again and sends the collected acks and nacks.
+        Gives back the budget of the messages that were not acked or nacked.
+        """
+        if self.closed:
+            return
+        self.closed = True
+
+        try:
+            await self._stop()
+            await asyncio.gather(
+                *[c.flush() for c in self._collectors.values()]
+            )
+        finally:
+            self.release(list(self._held.values()))
+            if self._context is not None:
+                await self._context.__aexit__(None, None, None)
+
+    @property
+    def buffered(self) -> int:
+        """
+        The number of received messages waiting to be iterated.
+        """
+        return 0 if self._buffer is None else self._buffer.qsize()
+
+    @property
+    def metrics(self) -> dict:
+        """
+        A snapshot of the current state of the stream.
+        """
+        return {
+            "stream_received": self.received,
+            "stream_yielded": self.yielded,
+            "stream_buffered": self.buffered,
+            "stream_acked": self.acked,
+            "stream_nacked": self.nacked,
+        }
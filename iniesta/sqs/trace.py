@@ -0,0 +1,109 @@
+import gzip
+import random
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List
+
+import ujson as json
+
+from iniesta.log import error_logger
+
+
+class TraceRecorder:
+    """
+    Samples received messages to a gzip compressed NDJSON trace file,
+    one line per message with the time it was received and the message
+    as returned by :code:`receive_message`.
+
+    Recorded messages are buffered and compressed, written and flushed in
+    a background thread, so recording doesn't block the handling of messages.
+    The file is opened for appending on the first write, so several
+    recordings can be collected in one file.
+
+    :param path: The trace file.
+    :param sample_rate: The ratio (0-1) of messages that are recorded.
+    """
+
+    #: The number of recorded messages that are buffered before they are written.
+    flush_every: int = 100
+
+    def __init__(self, path: str, *, sample_rate: float = 1.0) -> None:
+        if not 0 < sample_rate <= 1:
+            raise ValueError(
+                "sample_rate must be greater than 0 and at most 1."
+            )
+
+        self.path = path
+        self.sample_rate = sample_rate
+        self.recorded = 0
+        self._file = None
+        self._buffer: List[bytes] = []
+        # a single thread so the writes are in order
+        self._executor = None
+
+    def record(self, messages: List[dict]) -> None:
+        """
+        Samples messages of a receive.
+
+        :param messages: The raw messages from receive_message.
+        """
+        now = time.time()
+        for message in messages:
+            if self.sample_rate < 1 and random.random() >= self.sample_rate:
+                continue
+
+            self._buffer.append(
+                json.dumps({"received_at": now, "message": message}).encode()
+                + b"\n"
+            )
+            self.recorded += 1
+
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+
+    def _write(self, lines: List[bytes]) -> None:
+        try:
+            if self._file is None:
+                self._file = gzip.open(self.path, "ab")
+            self._file.writelines(lines)
+            self._file.flush()
+        except Exception:
+            error_logger.exception("[INIESTA] Writing the trace file failed.")
+
+    def flush(self) -> None:
+        """
+        Writes the buffered messages in the background.
+        """
+        if not self._buffer:
+            return
+
+        lines, self._buffer = self._buffer, []
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        self._executor.submit(self._write, lines)
+
+    def close(self) -> None:
+        """
+        Writes the buffered messages and closes the file. Waits for the
+        writes to finish.
+        """
+        self.flush()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_trace(path: str) -> Iterator[dict]:
+    """
+    Reads the recorded messages of a trace file in order.
+
+    :return: Dicts with :code:`received_at` and the raw :code:`message`.
+    """
+    with gzip.open(path, "rb") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,63 @@
+"""
+The trace id of the events that are being handled.
+
+While a handler runs, the trace id of its message is the current trace
+id, so events created in the handler with :code:`create_message` carry
+the trace id of the event that caused them.
+
+.. code-block:: python
+
+    from iniesta.tracing import trace
+
+    with trace(request.headers.get("X-Request-ID")):
+        await sns_client.create_message(event="UserCreated", message={}).publish()
+
+The trace id is kept in a :code:`contextvars.ContextVar` and so is
+inherited by tasks started while it is set. On python 3.6, which has no
+:code:`contextvars`, trace ids are only added when passed explicitly.
+"""
+import uuid
+
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+try:
+    from contextvars import ContextVar
+except ImportError:  # pragma: no cover
+    ContextVar = None
+
+_trace_id = (
+    None if ContextVar is None else ContextVar("iniesta_trace_id", default=None)
+)
+
+
+def current_trace_id() -> Optional[str]:
+    """
+    The trace id of the current context, if any.
+    """
+    return None if _trace_id is None else _trace_id.get()
+
+
+def new_trace_id() -> str:
+    """
+    A random trace id.
+    """
+    return uuid.uuid4().hex
+
+
+@contextmanager
+def trace(trace_id: Optional[str]) -> Iterator[Optional[str]]:
+    """
+    Sets the trace id of the current context in the :code:`with` block.
+
+    :param trace_id: The trace id, or :code:`None` for no trace id.
+    """
+    if _trace_id is None:  # pragma: no cover
+        yield trace_id
+        return
+
+    token = _trace_id.set(trace_id)
+    try:
+        yield trace_id
+    finally:
+        _trace_id.reset(token)
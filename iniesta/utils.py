@@ -1,3 +1,7 @@
+import functools
+import types
+
+
 def filter_list_to_filter_policies(event_key: str, filter_list: list) -> dict:
     """
     Helper function to convert defined filter policies to
@@ -20,3 +24,20 @@ def filter_list_to_filter_policies(event_key: str, filter_list: list) -> dict:
         filter_policies = {}
 
     return filter_policies
+
+
+class hybridmethod:
+    """
+    A decorator for a method that can be called on both the class and an
+    instance. The first argument is the class when called on the class and
+    the instance when called on an instance.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        functools.update_wrapper(self, func)
+
+    def __get__(self, instance, owner):
+        return types.MethodType(
+            self.func, owner if instance is None else instance
+        )
@@ -0,0 +1,235 @@
+import asyncio
+import importlib
+import multiprocessing
+import os
+import signal
+import time
+
+from typing import Dict, Iterable, Optional, Union
+
+from insanic.conf import settings
+
+from iniesta.choices import InitializationTypes
+from iniesta.log import logger, error_logger
+from iniesta.metrics import statsd_exporter
+from iniesta.sqs import MultiQueueConsumer, SQSClient
+
+
+def load_handlers(modules: Iterable[str]) -> None:
+    """
+    Imports the modules that register the handlers so they are
+    registered before the consumer processes are forked.
+
+    :param modules: Dotted paths of the modules to import.
+    """
+    for module in modules:
+        logger.debug(f"[INIESTA] Importing {module}")
+        importlib.import_module(module)
+
+
+def _event_polling() -> bool:
+    initialization_type = InitializationTypes(0)
+    for it in settings.INIESTA_INITIALIZATION_TYPE:
+        initialization_type |= InitializationTypes[it]
+    return InitializationTypes.EVENT_POLLING in initialization_type
+
+
+async def _initialize_consumer(
+    queues: Dict[str, float]
+) -> Union[SQSClient, MultiQueueConsumer]:
+    if len(queues) == 1:
+        queue_name = next(iter(queues))
+        consumer = await SQSClient.initialize(queue_name=queue_name)
+        clients = [consumer]
+    else:
+        consumer = await MultiQueueConsumer.initialize(queues)
+        clients = list(consumer.clients.values())
+
+    if _event_polling():
+        for client in clients:
+            await client.confirm_subscription(
+                settings.INIESTA_SNS_PRODUCER_GLOBAL_TOPIC_ARN
+            )
+            await client.confirm_permission()
+
+    return consumer
+
+
+async def consume(
+    queues: Dict[str, float], *, drain_timeout: Optional[float] = None
+) -> None:
+    """
+    Polls the queues until SIGTERM is received and then drains
+    the messages that have already been received.
+
+    :param queues: The queue names to consume with their weights.
+    :param drain_timeout: Seconds to wait for in flight messages on shut down.
+    """
+    loop = asyncio.get_event_loop()
+    stopping = asyncio.Event()
+
+    loop.add_signal_handler(signal.SIGTERM, stopping.set)
+
+    consumer = await _initialize_consumer(queues)
+    consumer.start_receiving_messages(loop)
+
+    exporter = statsd_exporter(settings)
+    if exporter is not None:
+        exporter.start()
+
+    logger.info(f"[INIESTA] Worker {os.getpid()} consuming {list(queues)}")
+    await stopping.wait()
+
+    logger.info(f"[INIESTA] Worker {os.getpid()} draining")
+    await consumer.drain(drain_timeout)
+
+    if exporter is not None:
+        await exporter.stop()
+
+
+def run_consumer(
+    queues: Dict[str, float], drain_timeout: Optional[float] = None
+) -> None:
+    """
+    The entry point of a consumer process. Runs its own event loop
+    until the consumer has been drained.
+    """
+    # drop the supervisor's signal handlers inherited through fork.
+    # only the supervisor reacts to SIGINT and forwards SIGTERM.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(consume(queues, drain_timeout=drain_timeout))
+    finally:
+        loop.close()
+
+
+class WorkerSupervisor:
+    """
+    Forks consumer processes, restarts them if they exit unexpectedly
+    and forwards SIGTERM to them for a graceful drain.
+
+    :param queues: The queue names to consume with their weights.
+    :param processes: The number of consumer processes.
+    :param drain_timeout: Seconds a consumer may take to drain
+        before it is killed.
+    """
+
+    #: How often the consumer processes are checked.
+    check_interval: float = 0.5
+    #: A process that exits before this many seconds is considered crashing.
+    min_uptime: float = 5.0
+    #: The maximum seconds to wait before restarting a crashing process.
+    max_restart_delay: float = 30.0
+
+    def __init__(
+        self,
+        queues: Dict[str, float],
+        *,
+        processes: int = 1,
+        drain_timeout: float = 30.0,
+        target=run_consumer,
+    ) -> None:
+        if processes < 1:
+            raise ValueError("processes must be at least 1.")
+
+        self.queues = queues
+        self.processes = processes
+        self.drain_timeout = drain_timeout
+        self.target = target
+        self.stopping = False
+        self.restarts = 0
+
+        self._context = multiprocessing.get_context("fork")
+        self._workers = [None] * processes
+        self._started_at = [0.0] * processes
+        self._restart_delay = [0.0] * processes
+        self._restart_at = [0.0] * processes
+
+    def _spawn(self, index: int) -> None:
+        process = self._context.Process(
+            target=self.target,
+            args=(self.queues, self.drain_timeout),
+            name=f"iniesta-worker-{index}",
+            daemon=False,
+        )
+        process.start()
+        self._workers[index] = process
+        self._started_at[index] = time.monotonic()
+        logger.info(f"[INIESTA] Started worker {index} (pid {process.pid})")
+
+    def _check(self) -> None:
+        now = time.monotonic()
+
+        for index, process in enumerate(self._workers):
+            if process is not None and process.is_alive():
+                continue
+
+            if process is not None:
+                error_logger.error(
+                    f"[INIESTA] Worker {index} (pid {process.pid}) exited "
+                    f"with {process.exitcode}. Restarting."
+                )
+                self._workers[index] = None
+                self.restarts += 1
+
+                if now - self._started_at[index] < self.min_uptime:
+                    self._restart_delay[index] = min(
+                        max(self._restart_delay[index] * 2, 1.0),
+                        self.max_restart_delay,
+                    )
+                else:
+                    self._restart_delay[index] = 0.0
+                self._restart_at[index] = now + self._restart_delay[index]
+
+            if now >= self._restart_at[index]:
+                self._spawn(index)
+
+    def stop(self, signum=None, frame=None) -> None:
+        """
+        Signal handler that starts the graceful shut down.
+        """
+        self.stopping = True
+
+    def _shutdown(self) -> None:
+        workers = [p for p in self._workers if p is not None]
+
+        for process in workers:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+
+        deadline = time.monotonic() + self.drain_timeout + self.check_interval
+        for process in workers:
+            process.join(max(0.0, deadline - time.monotonic()))
+
+        for process in workers:
+            if process.is_alive():
+                error_logger.error(
+                    f"[INIESTA] Worker (pid {process.pid}) did not drain "
+                    f"in {self.drain_timeout} seconds. Killing."
+                )
+                os.kill(process.pid, signal.SIGKILL)
+                process.join()
+
+    def run(self) -> None:
+        """
+        Starts the consumer processes and supervises them until
+        SIGTERM or SIGINT is received.
+        """
+        previous = {
+            signum: signal.signal(signum, self.stop)
+            for signum in (signal.SIGTERM, signal.SIGINT)
+        }
+
+        try:
+            while not self.stopping:
+                self._check()
+                time.sleep(self.check_interval)
+        finally:
+            logger.info("[INIESTA] Stopping workers")
+            self._shutdown()
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
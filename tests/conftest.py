@@ -1,5 +1,6 @@
 import pytest
 import uuid
+from collections import defaultdict
 from itertools import permutations
 
 from insanic import Insanic
@@ -9,7 +10,9 @@ from pytest_redis import factories
 
 from iniesta.app import Iniesta
 from iniesta.choices import InitializationTypes
+from iniesta.memory import InMemorySession, InMemorySQSClient
 from iniesta.sessions import BotoSession
+from iniesta.sqs import SQSClient
 
 
 settings.configure(
@@ -60,6 +63,90 @@ def initialize_for_passing_and_receiving(insanic_application):
     yield insanic_application
 
 
+@pytest.fixture
+def iniesta_config(insanic_application):
+    """
+    Loads the iniesta settings without initializing the application.
+    """
+    Iniesta.load_config(insanic_application.config)
+    yield insanic_application.config
+    Iniesta.unload_config(insanic_application.config)
+
+
+@pytest.fixture
+def reset_sqs_client(iniesta_config):
+    """
+    Restores the handlers and queue urls registered on :code:`SQSClient`.
+    """
+    state = {
+        name: getattr(SQSClient, name)
+        for name in ("handlers", "handler_options", "queue_urls")
+    }
+    for name, value in state.items():
+        setattr(SQSClient, name, dict(value))
+    yield
+    for name, value in state.items():
+        setattr(SQSClient, name, value)
+
+
+@pytest.fixture
+def sqs_client(reset_sqs_client):
+    """
+    A :code:`SQSClient` of the default queue, without connecting to it.
+    """
+    SQSClient.queue_urls[SQSClient.default_queue_name()] = "hello"
+    yield SQSClient()
+
+
+@pytest.fixture
+def memory_session(reset_sqs_client):
+    """
+    Sets an in memory session for the sns and sqs clients.
+    """
+    session = InMemorySession()
+    BotoSession.set_session(session)
+    yield session
+    BotoSession.set_session(None)
+
+
+@pytest.fixture
+def memory_queue(memory_session, sqs_client):
+    """
+    The in memory queue of :code:`sqs_client`.
+    """
+    queue = memory_session.backend.create_queue(sqs_client.queue_name)
+    SQSClient.queue_urls[queue.name] = sqs_client.queue_url = queue.url
+    yield queue
+
+
+@pytest.fixture
+def sqs_requests(monkeypatch):
+    """
+    Records the keyword arguments of the requests made with in memory
+    sqs clients, by operation.
+    """
+    requests = defaultdict(list)
+
+    def recorder(operation):
+        method = getattr(InMemorySQSClient, operation)
+
+        async def record(self, **kwargs):
+            requests[operation].append(kwargs)
+            return await method(self, **kwargs)
+
+        return record
+
+    for operation in (
+        "receive_message",
+        "send_message_batch",
+        "delete_message_batch",
+        "change_message_visibility_batch",
+        "close",
+    ):
+        monkeypatch.setattr(InMemorySQSClient, operation, recorder(operation))
+    yield requests
+
+
 @pytest.fixture(scope="session")
 def session_id():
     return uuid.uuid4().hex
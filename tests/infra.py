@@ -8,6 +8,42 @@ from iniesta import Iniesta
 from iniesta.sessions import BotoSession
 
 
+def received(index, event="UserCreated.user", attributes=None):
+    """
+    A message as returned by :code:`receive_message`, with its index
+    as the body.
+    """
+    return {
+        "MessageId": str(index),
+        "ReceiptHandle": str(index),
+        "MD5OfBody": "",
+        "Attributes": attributes or {},
+        "Body": json.dumps({"index": index}),
+        "MessageAttributes": {
+            settings.INIESTA_SNS_EVENT_KEY: {
+                "DataType": "String",
+                "StringValue": event,
+            },
+            "version": {"DataType": "Number", "StringValue": "1"},
+        },
+    }
+
+
+def send_messages(queue, indexes, event="UserCreated.user"):
+    """
+    Sends messages with their index as the body to an in memory queue.
+
+    :return: The sent messages.
+    """
+    return [
+        queue.send(
+            json.dumps({"index": index}),
+            received(index, event)["MessageAttributes"],
+        )
+        for index in indexes
+    ]
+
+
 class InfraBase:
     def aws_client(self, service, **kwargs):
         return botocore.session.get_session().create_client(service, **kwargs)
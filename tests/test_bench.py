@@ -0,0 +1,282 @@
+import random
+
+import pytest
+
+from click.testing import CliRunner
+
+from iniesta import cli
+from iniesta.bench import (
+    Distribution,
+    LatencyHistogram,
+    consume,
+    in_memory,
+    publish,
+)
+from iniesta.sns import SNSClient
+from iniesta.sqs import SQSClient
+from iniesta.sqs.replay import LocalLockManager
+
+
+class TestDistribution:
+    @pytest.mark.parametrize(
+        "spec,low,high",
+        [
+            ("1024", 1024, 1024),
+            ("uniform:100,200", 100, 200),
+            ("normal:10,1000", 0, float("inf")),
+            ("exponential:0.05", 0, float("inf")),
+            ("choice:100=8,65536=2", 100, 65536),
+        ],
+    )
+    def test_sample(self, spec, low, high):
+        distribution = Distribution(spec, rng=random.Random(1))
+
+        samples = [distribution.sample() for _ in range(100)]
+
+        assert all(low <= sample <= high for sample in samples)
+        assert str(distribution) == spec
+
+    def test_choice_values(self):
+        distribution = Distribution("choice:1=1,2=1", rng=random.Random(1))
+
+        assert {distribution.sample() for _ in range(100)} == {1, 2}
+
+    def test_seed_reproduces(self):
+        first = Distribution("uniform:0,1", rng=random.Random(7))
+        second = Distribution("uniform:0,1", rng=random.Random(7))
+
+        assert [first.sample() for _ in range(5)] == [
+            second.sample() for _ in range(5)
+        ]
+
+    @pytest.mark.parametrize(
+        "spec",
+        [
+            "",
+            "-1",
+            "big",
+            "uniform:1",
+            "uniform:-1,2",
+            "normal:1,-1",
+            "exponential:0",
+            "choice:1=0",
+            "pareto:1,2",
+        ],
+    )
+    def test_invalid(self, spec):
+        with pytest.raises(ValueError, match="Invalid distribution"):
+            Distribution(spec)
+
+
+class TestLatencyHistogram:
+    def test_percentiles(self):
+        histogram = LatencyHistogram(buckets=(0.01, 0.1, 1, float("inf")))
+        for seconds in [0.005] * 90 + [0.05] * 9 + [0.5]:
+            histogram.observe(seconds)
+
+        assert histogram.count == 100
+        assert histogram.percentile(50) == 0.01
+        assert histogram.percentile(90) == 0.01
+        assert histogram.percentile(99) == 0.1
+        assert histogram.percentile(100) == 0.5
+        assert histogram.distribution == [(0.01, 90), (0.1, 9), (1, 1)]
+
+    def test_empty(self):
+        histogram = LatencyHistogram()
+
+        assert histogram.metrics["p99"] == 0.0
+        assert histogram.distribution == []
+
+
+@pytest.mark.usefixtures("reset_sqs_client")
+class TestBench:
+    async def test_publish(self, insanic_application):
+        resources = in_memory()
+        reports = []
+
+        stats = await publish(
+            SNSClient(resources["topic_arn"]),
+            rate=1000,
+            payload_size=Distribution("uniform:100,200"),
+            max_events=50,
+            interval=0.01,
+            report=reports.append,
+        )
+
+        assert stats.completed == 50
+        assert stats.errors == 0
+        assert stats.in_flight == 0
+        assert stats.latency.count == 50
+        assert 0 < reports[-1]["completed"] <= 50
+        assert reports[-1]["memory"] > 0
+
+    async def test_publish_errors(self, insanic_application):
+        in_memory()
+
+        stats = await publish(
+            SNSClient("arn:aws:sns:us-east-1:000000000000:missing"),
+            rate=1000,
+            payload_size=Distribution("100"),
+            max_events=5,
+        )
+
+        assert stats.completed == 5
+        assert stats.errors == 5
+
+    async def test_publish_requires_a_limit(self, insanic_application):
+        with pytest.raises(ValueError):
+            await publish(SNSClient(), rate=1, payload_size=Distribution("1"))
+
+    async def test_consume(self, insanic_application):
+        resources = in_memory()
+        await publish(
+            SNSClient(resources["topic_arn"]),
+            rate=1000,
+            payload_size=Distribution("100"),
+            max_events=20,
+        )
+        sqs_client = await SQSClient.initialize(
+            queue_name=resources["queue_name"]
+        )
+        sqs_client.lock_manager = LocalLockManager()
+
+        stats = await consume(
+            sqs_client,
+            latency=Distribution("uniform:0,0.01"),
+            max_messages=20,
+            duration=10,
+        )
+
+        assert stats.completed == 20
+        assert stats.errors == 0
+        assert stats.lag.count == 20
+        assert "empty_receive_ratio" in stats.snapshots[-1]
+
+    async def test_consume_errors(self, insanic_application):
+        resources = in_memory()
+        await publish(
+            SNSClient(resources["topic_arn"]),
+            rate=1000,
+            payload_size=Distribution("100"),
+            max_events=5,
+        )
+        sqs_client = await SQSClient.initialize(
+            queue_name=resources["queue_name"]
+        )
+        sqs_client.lock_manager = LocalLockManager()
+
+        stats = await consume(
+            sqs_client,
+            latency=Distribution("0"),
+            max_messages=5,
+            error_rate=1,
+            duration=10,
+        )
+
+        assert stats.errors == stats.completed == 5
+        assert sqs_client.handler_errors == 5
+
+
+@pytest.mark.usefixtures("reset_sqs_client")
+class TestBenchCommands:
+    @pytest.fixture()
+    def runner(self):
+        yield CliRunner()
+
+    def test_publish(self, runner, tmp_path, insanic_application):
+        output = tmp_path / "publish.ndjson"
+
+        result = runner.invoke(
+            cli.cli,
+            [
+                "bench",
+                "publish",
+                "--in-memory",
+                "-d",
+                "0",
+                "-n",
+                "30",
+                "-r",
+                "1000",
+                "-s",
+                "choice:100=1,1000=1",
+                "--seed",
+                "1",
+                "-o",
+                str(output),
+            ],
+        )
+
+        assert result.exit_code == 0, result.output
+        assert "Completed 30 in" in result.output
+        assert "LATENCY <= ms" in result.output
+        assert output.read_text().splitlines()[-1].startswith('{"summary"')
+
+    def test_consume(self, runner, insanic_application):
+        result = runner.invoke(
+            cli.cli,
+            [
+                "bench",
+                "consume",
+                "--in-memory",
+                "-d",
+                "0",
+                "-n",
+                "20",
+                "-r",
+                "500",
+                "-l",
+                "uniform:0,0.005",
+            ],
+        )
+
+        assert result.exit_code == 0, result.output
+        assert "Published 20 in memory" in result.output
+        assert "Completed 20 in" in result.output
+        assert "LAG <= ms" in result.output
+
+    def test_consume_endpoint_url(
+        self, runner, monkeypatch, insanic_application
+    ):
+        from iniesta.memory import InMemorySession
+
+        endpoints = []
+        create_client = InMemorySession.create_client
+
+        def record(self, service_name, **kwargs):
+            if service_name == "sqs":
+                endpoints.append(kwargs.get("endpoint_url"))
+            return create_client(self, service_name, **kwargs)
+
+        monkeypatch.setattr(InMemorySession, "create_client", record)
+
+        result = runner.invoke(
+            cli.cli,
+            [
+                "bench",
+                "consume",
+                "--in-memory",
+                "--endpoint-url",
+                "http://localhost:4566",
+                "-d",
+                "0",
+                "-n",
+                "5",
+                "-r",
+                "500",
+                "-l",
+                "0",
+            ],
+        )
+
+        assert result.exit_code == 0, result.output
+        assert endpoints
+        assert set(endpoints) == {"http://localhost:4566"}
+
+    def test_invalid_distribution(self, runner):
+        result = runner.invoke(
+            cli.cli, ["bench", "publish", "--in-memory", "-s", "big"]
+        )
+
+        assert result.exit_code == 2
+        assert "Invalid distribution: big" in result.output
@@ -0,0 +1,71 @@
+import pytest
+
+from benchmarks.compare import compare
+from benchmarks.results import summarize
+
+
+class TestBenchmarks:
+    def test_summarize(self):
+        result = summarize("publish", 100, [0.5, 0.25, 1.0])
+
+        assert result["median"] == 0.5
+        assert result["min"] == 0.25
+        assert result["per_second"] == 200
+
+    def test_compare(self):
+        base = {
+            "benchmarks": {
+                "publish": {"per_second": 100.0},
+                "consume": {"per_second": 100.0},
+            }
+        }
+        head = {
+            "benchmarks": {
+                "publish": {"per_second": 80.0},
+                "consume": {"per_second": 95.0},
+                "new": {"per_second": 1.0},
+            }
+        }
+
+        rows = {row[0]: row for row in compare(base, head, 0.1)}
+
+        assert rows["publish"][3] == pytest.approx(-0.2)
+        assert rows["publish"][4] is True
+        assert rows["consume"][4] is False
+        assert "new" not in rows
+
+    async def test_throughput(self, insanic_application):
+        from benchmarks import configure
+        from benchmarks.throughput import run
+        from iniesta.sqs import SQSClient
+
+        configure()
+        results = await run(messages=25, repeat=1, sleep=0, cpu=10)
+
+        assert [result["name"] for result in results] == [
+            "publish",
+            "publish_batch",
+            "consume_noop",
+            "consume_sleep",
+            "consume_cpu",
+            "consume_noop_unlocked",
+            "lock_overhead",
+        ]
+        assert all(result["count"] == 25 for result in results)
+        assert SQSClient.queue_urls == {}
+
+    def test_messages(self, insanic_application):
+        from benchmarks import configure
+        from benchmarks.messages import run
+
+        configure()
+        results = run(
+            sizes=[100], counts=[1], repeat=1, only=["from_sqs", "add_event"]
+        )
+
+        assert [result["name"] for result in results] == [
+            "from_sqs[size=100,attributes=1]",
+            "add_event[size=1024,attributes=0]",
+        ]
+        assert all(result["peak_bytes"] > 0 for result in results)
+        assert all(result["per_operation"] > 0 for result in results)
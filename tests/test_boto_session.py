@@ -21,6 +21,18 @@ class TestBotoSession:
 
         assert session1 is session2
 
+    async def test_set_session(self):
+        from iniesta.memory import InMemorySession
+
+        session = InMemorySession()
+        BotoSession.set_session(session)
+
+        assert BotoSession.get_session() is session
+
+        BotoSession.set_session(None)
+
+        assert BotoSession.session is None
+
     @pytest.mark.parametrize("access_key_id_prefix", ["iniesta", ""])
     @pytest.mark.parametrize("secret_access_key_prefix", ["iniesta", ""])
     def test_aws_credentials_fallback(
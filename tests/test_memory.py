@@ -0,0 +1,432 @@
+import asyncio
+import time
+
+import botocore.exceptions
+import pytest
+import ujson as json
+
+from insanic.conf import settings
+
+from iniesta.exceptions import StopPolling
+from iniesta.memory import (
+    InMemorySession,
+    matches_filter_policy,
+    md5_of_message_attributes,
+)
+from iniesta.sns import SNSClient
+from iniesta.sqs import SQSClient
+from iniesta.sqs.replay import LocalLockManager
+
+
+def string(value):
+    return {"DataType": "String", "StringValue": value}
+
+
+def number(value):
+    return {"DataType": "Number", "StringValue": str(value)}
+
+
+class TestFilterPolicy:
+    @pytest.mark.parametrize(
+        "policy,attributes,expected",
+        (
+            ({"event": ["a"]}, {"event": string("a")}, True),
+            ({"event": ["a"]}, {"event": string("b")}, False),
+            ({"event": ["a"]}, {}, False),
+            ({"event": [{"prefix": "Req."}]}, {"event": string("Req.a")}, True),
+            ({"event": [{"suffix": ".a"}]}, {"event": string("Req.b")}, False),
+            (
+                {"event": [{"anything-but": ["a", "b"]}]},
+                {"event": string("c")},
+                True,
+            ),
+            (
+                {"event": [{"anything-but": {"prefix": "a"}}]},
+                {"event": string("ab")},
+                False,
+            ),
+            ({"event": [{"exists": False}]}, {}, True),
+            ({"event": [{"exists": True}]}, {"event": string("a")}, True),
+            ({"v": [1]}, {"v": number(1)}, True),
+            ({"v": [{"numeric": [">", 1, "<=", 3]}]}, {"v": number(3)}, True),
+            ({"v": [{"numeric": [">", 1]}]}, {"v": string("3")}, False),
+            (
+                {"tags": ["b"]},
+                {
+                    "tags": {
+                        "DataType": "String.Array",
+                        "StringValue": '["a", "b"]',
+                    }
+                },
+                True,
+            ),
+            (
+                {"event": ["a"], "v": [1]},
+                {"event": string("a"), "v": number(2)},
+                False,
+            ),
+        ),
+    )
+    def test_matches(self, policy, attributes, expected):
+        assert matches_filter_policy(policy, attributes) is expected
+
+    def test_md5_of_message_attributes(self):
+        assert md5_of_message_attributes(
+            {"a": string("1"), "b": number(2)}
+        ) == md5_of_message_attributes({"b": number(2), "a": string("1")})
+        assert md5_of_message_attributes(
+            {"a": string("1")}
+        ) != md5_of_message_attributes({"a": number(1)})
+
+
+class TestInMemorySQS:
+    @pytest.fixture()
+    def session(self):
+        return InMemorySession()
+
+    @pytest.fixture()
+    async def sqs(self, session):
+        async with session.create_client("sqs") as client:
+            yield client
+
+    async def _queue_url(self, sqs, name="queue", **attributes):
+        response = await sqs.create_queue(QueueName=name, Attributes=attributes)
+        return response["QueueUrl"]
+
+    async def test_unsupported_service(self, session):
+        with pytest.raises(ValueError):
+            session.create_client("s3")
+
+    async def test_queue_does_not_exist(self, sqs):
+        with pytest.raises(sqs.exceptions.QueueDoesNotExist) as exc_info:
+            await sqs.get_queue_url(QueueName="nope")
+
+        assert exc_info.typename == "QueueDoesNotExist"
+        assert (
+            exc_info.value.response["Error"]["Code"]
+            == "AWS.SimpleQueueService.NonExistentQueue"
+        )
+
+    async def test_send_receive_delete(self, sqs):
+        queue_url = await self._queue_url(sqs)
+        sent = await sqs.send_message(
+            QueueUrl=queue_url,
+            MessageBody="hello",
+            MessageAttributes={"version": number(1)},
+        )
+
+        response = await sqs.receive_message(
+            QueueUrl=queue_url,
+            AttributeNames=["All"],
+            MessageAttributeNames=["All"],
+        )
+        message = response["Messages"][0]
+
+        assert message["MessageId"] == sent["MessageId"]
+        assert message["MD5OfBody"] == sent["MD5OfMessageBody"]
+        assert message["Body"] == "hello"
+        assert message["MessageAttributes"] == {"version": number(1)}
+        assert (
+            message["MD5OfMessageAttributes"] == sent["MD5OfMessageAttributes"]
+        )
+        assert message["Attributes"]["ApproximateReceiveCount"] == "1"
+        assert "SentTimestamp" in message["Attributes"]
+
+        # in flight until the visibility timeout
+        response = await sqs.receive_message(QueueUrl=queue_url)
+        assert "Messages" not in response
+
+        await sqs.delete_message(
+            QueueUrl=queue_url, ReceiptHandle=message["ReceiptHandle"]
+        )
+        attributes = await sqs.get_queue_attributes(QueueUrl=queue_url)
+        assert attributes["Attributes"]["ApproximateNumberOfMessages"] == "0"
+        assert (
+            attributes["Attributes"]["ApproximateNumberOfMessagesNotVisible"]
+            == "0"
+        )
+
+    async def test_visibility_timeout(self, sqs):
+        queue_url = await self._queue_url(sqs)
+        await sqs.send_message(QueueUrl=queue_url, MessageBody="hello")
+
+        first = await sqs.receive_message(
+            QueueUrl=queue_url, VisibilityTimeout=0.05
+        )
+        second = await sqs.receive_message(
+            QueueUrl=queue_url, WaitTimeSeconds=1
+        )
+
+        old_handle = first["Messages"][0]["ReceiptHandle"]
+        new_handle = second["Messages"][0]["ReceiptHandle"]
+        assert old_handle != new_handle
+
+        with pytest.raises(botocore.exceptions.ClientError):
+            await sqs.change_message_visibility(
+                QueueUrl=queue_url,
+                ReceiptHandle=old_handle,
+                VisibilityTimeout=0,
+            )
+
+        await sqs.change_message_visibility(
+            QueueUrl=queue_url, ReceiptHandle=new_handle, VisibilityTimeout=0
+        )
+        third = await sqs.receive_message(
+            QueueUrl=queue_url, AttributeNames=["ApproximateReceiveCount"]
+        )
+        assert third["Messages"][0]["Attributes"] == {
+            "ApproximateReceiveCount": "3"
+        }
+
+    async def test_long_polling_wakes_on_send(self, sqs):
+        queue_url = await self._queue_url(sqs)
+
+        receive = asyncio.ensure_future(
+            sqs.receive_message(QueueUrl=queue_url, WaitTimeSeconds=5)
+        )
+        await asyncio.sleep(0.01)
+        start = time.monotonic()
+        await sqs.send_message(QueueUrl=queue_url, MessageBody="hello")
+        response = await receive
+
+        assert response["Messages"][0]["Body"] == "hello"
+        assert time.monotonic() - start < 1
+
+    async def test_delay_seconds(self, sqs):
+        queue_url = await self._queue_url(sqs)
+        await sqs.send_message(
+            QueueUrl=queue_url, MessageBody="hello", DelaySeconds=0.05
+        )
+
+        assert "Messages" not in await sqs.receive_message(QueueUrl=queue_url)
+        response = await sqs.receive_message(
+            QueueUrl=queue_url, WaitTimeSeconds=1
+        )
+        assert response["Messages"][0]["Body"] == "hello"
+
+    async def test_batches(self, sqs):
+        queue_url = await self._queue_url(sqs)
+
+        response = await sqs.send_message_batch(
+            QueueUrl=queue_url,
+            Entries=[{"Id": str(i), "MessageBody": str(i)} for i in range(9)]
+            + [{"Id": "big", "MessageBody": "a" * (256 * 1024 + 1)}],
+        )
+        assert len(response["Successful"]) == 9
+        assert response["Failed"][0]["Id"] == "big"
+
+        with pytest.raises(sqs.exceptions.TooManyEntriesInBatchRequest):
+            await sqs.send_message_batch(
+                QueueUrl=queue_url,
+                Entries=[
+                    {"Id": str(i), "MessageBody": str(i)} for i in range(11)
+                ],
+            )
+
+        received = await sqs.receive_message(
+            QueueUrl=queue_url, MaxNumberOfMessages=10
+        )
+        assert [m["Body"] for m in received["Messages"]] == [
+            str(i) for i in range(9)
+        ]
+
+        response = await sqs.delete_message_batch(
+            QueueUrl=queue_url,
+            Entries=[
+                {"Id": str(i), "ReceiptHandle": m["ReceiptHandle"]}
+                for i, m in enumerate(received["Messages"])
+            ]
+            + [{"Id": "invalid", "ReceiptHandle": "invalid"}],
+        )
+        assert len(response["Successful"]) == 9
+        assert response["Failed"][0]["Code"] == "ReceiptHandleIsInvalid"
+
+    async def test_dead_letter_queue(self, sqs):
+        dlq_url = await self._queue_url(sqs, "dlq")
+        dlq = await sqs.get_queue_attributes(
+            QueueUrl=dlq_url, AttributeNames=["QueueArn"]
+        )
+        queue_url = await self._queue_url(
+            sqs,
+            RedrivePolicy=json.dumps(
+                {
+                    "deadLetterTargetArn": dlq["Attributes"]["QueueArn"],
+                    "maxReceiveCount": 1,
+                }
+            ),
+        )
+        await sqs.send_message(QueueUrl=queue_url, MessageBody="hello")
+
+        assert await sqs.receive_message(
+            QueueUrl=queue_url, VisibilityTimeout=0
+        )
+        assert "Messages" not in await sqs.receive_message(QueueUrl=queue_url)
+
+        response = await sqs.receive_message(QueueUrl=dlq_url)
+        assert response["Messages"][0]["Body"] == "hello"
+
+    async def test_fifo(self, sqs):
+        queue_url = await self._queue_url(sqs, "queue.fifo", FifoQueue="true")
+
+        with pytest.raises(botocore.exceptions.ClientError):
+            await sqs.send_message(QueueUrl=queue_url, MessageBody="a")
+
+        for body, group, deduplication_id in (
+            ("a1", "a", "1"),
+            ("b1", "b", "2"),
+            ("a2", "a", "3"),
+            ("a2", "a", "3"),
+        ):
+            await sqs.send_message(
+                QueueUrl=queue_url,
+                MessageBody=body,
+                MessageGroupId=group,
+                MessageDeduplicationId=deduplication_id,
+            )
+
+        first = await sqs.receive_message(QueueUrl=queue_url)
+        assert first["Messages"][0]["Body"] == "a1"
+
+        # group a is blocked while a1 is in flight
+        second = await sqs.receive_message(
+            QueueUrl=queue_url, MaxNumberOfMessages=10
+        )
+        assert [m["Body"] for m in second["Messages"]] == ["b1"]
+
+        await sqs.delete_message(
+            QueueUrl=queue_url,
+            ReceiptHandle=first["Messages"][0]["ReceiptHandle"],
+        )
+        third = await sqs.receive_message(
+            QueueUrl=queue_url,
+            MaxNumberOfMessages=10,
+            ReceiveRequestAttemptId="attempt",
+        )
+        assert [m["Body"] for m in third["Messages"]] == ["a2"]
+
+        # retrying a receive returns the same messages
+        retried = await sqs.receive_message(
+            QueueUrl=queue_url,
+            MaxNumberOfMessages=10,
+            ReceiveRequestAttemptId="attempt",
+        )
+        assert retried["Messages"] == third["Messages"]
+
+
+class TestInMemorySNS:
+    @pytest.fixture()
+    def session(self):
+        return InMemorySession()
+
+    async def test_publish_delivers_to_matching_subscriptions(self, session):
+        backend = session.backend
+        topic = backend.create_topic("global")
+        raw = backend.create_queue("raw")
+        enveloped = backend.create_queue("enveloped")
+        other = backend.create_queue("other")
+        backend.subscribe(topic.arn, raw.arn, raw_message_delivery=True)
+        backend.subscribe(topic.arn, enveloped.arn)
+        backend.subscribe(
+            topic.arn, other.arn, filter_policy={"event": ["other"]}
+        )
+
+        async with session.create_client("sns") as sns:
+            response = await sns.publish(
+                TopicArn=topic.arn,
+                Message="hello",
+                MessageAttributes={"event": string("hello")},
+            )
+
+        raw_message = next(iter(raw.messages.values()))
+        assert raw_message.body == "hello"
+        assert raw_message.message_attributes == {"event": string("hello")}
+
+        envelope = json.loads(next(iter(enveloped.messages.values())).body)
+        assert envelope["MessageId"] == response["MessageId"]
+        assert envelope["Message"] == "hello"
+        assert envelope["MessageAttributes"] == {
+            "event": {"Type": "String", "Value": "hello"}
+        }
+
+        assert not other.messages
+
+    async def test_publish_batch(self, session):
+        topic = session.backend.create_topic("global")
+        queue = session.backend.create_queue("queue")
+        session.backend.subscribe(
+            topic.arn, queue.arn, raw_message_delivery=True
+        )
+
+        async with session.create_client("sns") as sns:
+            response = await sns.publish_batch(
+                TopicArn=topic.arn,
+                PublishBatchRequestEntries=[
+                    {"Id": str(i), "Message": str(i)} for i in range(3)
+                ],
+            )
+
+        assert [e["Id"] for e in response["Successful"]] == ["0", "1", "2"]
+        assert [m.body for m in queue.messages.values()] == ["0", "1", "2"]
+
+    async def test_topic_not_found(self, session):
+        async with session.create_client("sns") as sns:
+            with pytest.raises(botocore.exceptions.ClientError) as exc_info:
+                await sns.get_topic_attributes(TopicArn="arn:nope")
+
+        assert exc_info.value.response["Error"]["Code"] == "NotFound"
+
+
+class TestInMemoryIntegration:
+    @pytest.fixture(autouse=True)
+    def session(self, memory_session, monkeypatch):
+        monkeypatch.setattr(
+            settings,
+            "INIESTA_SQS_CONSUMER_FILTERS",
+            ["Request.*"],
+            raising=False,
+        )
+        yield memory_session
+
+    async def test_publish_to_handler(self, session, monkeypatch):
+        backend = session.backend
+        topic = backend.create_topic("global")
+        queue = backend.create_queue(SQSClient.default_queue_name())
+        backend.subscribe(
+            topic.arn,
+            queue.arn,
+            filter_policy={
+                settings.INIESTA_SNS_EVENT_KEY: [{"prefix": "Request."}]
+            },
+            raw_message_delivery=True,
+        )
+
+        sns_client = await SNSClient.initialize(topic_arn=topic.arn)
+        sqs_client = await SQSClient.initialize()
+        sqs_client.lock_manager = LocalLockManager()
+        await sqs_client.confirm_subscription(topic.arn)
+
+        received = []
+
+        @SQSClient.handler("Request.xavi")
+        async def handler(message):
+            received.append(message.body["index"])
+
+        async def stop(self):
+            if not queue.messages:
+                raise StopPolling("Stop")
+
+        monkeypatch.setattr(
+            SQSClient, "hook_post_receive_message_handler", stop
+        )
+
+        for i in range(25):
+            await sns_client.create_message(
+                event="Request", message={"index": i}
+            ).publish()
+        await sns_client.create_message(event="Other", message={}).publish()
+
+        sqs_client.start_receiving_messages()
+        await sqs_client._polling_task
+
+        assert sorted(received) == list(range(25))
+        assert not queue.messages
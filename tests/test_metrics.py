@@ -0,0 +1,411 @@
+import socket
+
+import botocore.exceptions
+import pytest
+
+from insanic import Insanic
+from insanic.conf import settings
+
+from iniesta.app import Iniesta
+from iniesta.bench import Distribution, consume, in_memory, publish
+from iniesta.metrics import (
+    MetricsRegistry,
+    PrometheusExporter,
+    StatsDExporter,
+    registry,
+    statsd_exporter,
+)
+from iniesta.sns import SNSClient
+from iniesta.sns.message import failure_reason
+from iniesta.sqs import SQSClient
+from iniesta.sqs.replay import LocalLockManager
+
+
+class Source:
+    def __init__(self):
+        self.received = 0
+
+    @property
+    def metrics(self):
+        return {
+            "received": self.received,
+            "running": True,
+            "name": "ignored",
+            "budget": {"used": 1, "limit": 10},
+            "handler_limits": {"UserCreated.user": {"running": 2}},
+        }
+
+
+def total(name, **labels):
+    return sum(
+        value.value
+        for item_labels, value in registry.counter(name).items()
+        if labels.items() <= item_labels.items()
+    )
+
+
+class TestMetricsRegistry:
+    @pytest.fixture()
+    def metrics(self):
+        yield MetricsRegistry()
+
+    def test_counter(self, metrics):
+        counter = metrics.counter("handled_total", "Handled.", ["event"])
+
+        counter.labels("a").inc()
+        counter.labels(event="a").inc(2)
+        counter.labels("b").inc()
+
+        assert metrics.counter("handled_total") is counter
+        assert sorted(
+            (labels["event"], value.value) for labels, value in counter.items()
+        ) == [("a", 3), ("b", 1)]
+
+    def test_gauge(self, metrics):
+        gauge = metrics.gauge("in_flight")
+
+        gauge.labels().inc(3)
+        gauge.labels().dec()
+        assert gauge.labels().value == 2
+
+        gauge.labels().set(7)
+        assert gauge.labels().value == 7
+
+    def test_histogram(self, metrics):
+        histogram = metrics.histogram("latency", buckets=(0.1, 1, float("inf")))
+
+        histogram.labels().observe(0.05)
+        histogram.labels().observe(5)
+
+        assert histogram.labels().counts == [1, 0, 1]
+        assert histogram.labels().max == 5
+
+    def test_wrong_labels(self, metrics):
+        counter = metrics.counter(
+            "handled_total", labelnames=["queue", "event"]
+        )
+
+        with pytest.raises(ValueError, match="has the labels"):
+            counter.labels("queue")
+
+    def test_type_clash(self, metrics):
+        metrics.counter("handled_total")
+
+        with pytest.raises(ValueError, match="already a counter"):
+            metrics.gauge("handled_total")
+
+    def test_collect(self, metrics):
+        source = Source()
+        source.received = 4
+        metrics.collect(source, "client", queue="q")
+
+        collected = {
+            metric.name: metric.items() for metric in metrics.metrics()
+        }
+
+        assert collected["client_received"][0][0] == {"queue": "q"}
+        assert collected["client_received"][0][1].value == 4
+        assert collected["client_running"][0][1].value == 1
+        assert collected["client_budget_limit"][0][1].value == 10
+        assert collected["client_handler_limits_running"][0][0] == {
+            "queue": "q",
+            "name": "UserCreated.user",
+        }
+        assert "client_name" not in collected
+
+    def test_collect_is_weak(self, metrics):
+        source = Source()
+        metrics.collect(source, "client")
+        del source
+
+        assert metrics.metrics() == []
+
+
+@pytest.mark.usefixtures("iniesta_config")
+class TestPrometheusExporter:
+    def test_render(self):
+        metrics = MetricsRegistry()
+        metrics.counter("handled_total", "Handled.", ["event"]).labels(
+            'User"Created'
+        ).inc(2)
+        histogram = metrics.histogram(
+            "latency_seconds", "Latency.", buckets=(0.1, 1, float("inf"))
+        )
+        histogram.labels().observe(0.05)
+        histogram.labels().observe(0.5)
+
+        lines = PrometheusExporter(metrics).render().splitlines()
+
+        assert lines == [
+            "# HELP handled_total Handled.",
+            "# TYPE handled_total counter",
+            'handled_total{event="User\\"Created"} 2.0',
+            "# HELP latency_seconds Latency.",
+            "# TYPE latency_seconds histogram",
+            'latency_seconds_bucket{le="0.1"} 1',
+            'latency_seconds_bucket{le="1.0"} 2',
+            'latency_seconds_bucket{le="+Inf"} 2',
+            "latency_seconds_sum 0.55",
+            "latency_seconds_count 2",
+        ]
+
+    async def test_handler(self):
+        metrics = MetricsRegistry()
+        metrics.gauge("in_flight").labels().set(3)
+
+        response = await PrometheusExporter(metrics).handler(None)
+
+        assert response.content_type == PrometheusExporter.content_type
+        assert b"in_flight 3.0" in response.body
+
+    def test_route(self, monkeypatch):
+        monkeypatch.setattr(
+            settings, "INIESTA_METRICS_ROUTE", "/iniesta/metrics/"
+        )
+        app = Insanic("xavi")
+
+        Iniesta._init_metrics(app)
+
+        assert "/iniesta/metrics/" in app.router.routes_all
+
+
+@pytest.mark.usefixtures("iniesta_config")
+class TestStatsDExporter:
+    @pytest.fixture()
+    def metrics(self):
+        metrics = MetricsRegistry()
+        metrics.counter("handled_total", labelnames=["event"]).labels("a").inc(
+            3
+        )
+        metrics.gauge("in_flight").labels().set(2)
+        histogram = metrics.histogram(
+            "latency", buckets=(0.1, 1, float("inf"))
+        ).labels()
+        for seconds in [0.05] * 9 + [0.5]:
+            histogram.observe(seconds)
+        yield metrics
+
+    def test_lines(self, metrics):
+        exporter = StatsDExporter(
+            "localhost:8125", prefix="xavi", registry=metrics
+        )
+
+        assert exporter.lines() == [
+            "xavi.handled_total:3|c|#event:a",
+            "xavi.in_flight:2|g",
+            "xavi.latency.count:10|c",
+            "xavi.latency.p50:0.1|g",
+            "xavi.latency.p90:0.1|g",
+            "xavi.latency.p99:1|g",
+        ]
+
+    def test_deltas(self, metrics):
+        exporter = StatsDExporter("localhost:8125", registry=metrics)
+        exporter.lines()
+
+        metrics.counter("handled_total").labels("a").inc()
+        metrics.histogram("latency").labels().observe(5)
+
+        assert exporter.lines() == [
+            "handled_total:1|c|#event:a",
+            "in_flight:2|g",
+            "latency.count:1|c",
+            "latency.p50:5|g",
+            "latency.p90:5|g",
+            "latency.p99:5|g",
+        ]
+
+    def test_packets(self, metrics):
+        exporter = StatsDExporter("localhost:8125", registry=metrics)
+        exporter.max_packet_size = 40
+
+        packets = list(exporter._packets(exporter.lines()))
+
+        assert len(packets) > 1
+        assert all(len(packet) <= 40 for packet in packets)
+
+    async def test_flush(self, metrics):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(("127.0.0.1", 0))
+        server.settimeout(1)
+        port = server.getsockname()[1]
+        exporter = StatsDExporter(f"127.0.0.1:{port}", registry=metrics)
+
+        try:
+            exporter.start()
+            await exporter.stop()
+            data = server.recv(65535)
+        finally:
+            server.close()
+
+        assert data.decode().splitlines()[0] == "handled_total:3|c|#event:a"
+
+    def test_not_configured(self, monkeypatch):
+        monkeypatch.setattr(settings, "INIESTA_METRICS_STATSD_ADDRESS", None)
+        assert statsd_exporter(settings) is None
+
+        monkeypatch.setattr(
+            settings, "INIESTA_METRICS_STATSD_ADDRESS", "statsd:9125"
+        )
+        assert statsd_exporter(settings).address == ("statsd", 9125)
+
+
+@pytest.mark.usefixtures("reset_sqs_client")
+class TestSQSClientMetrics:
+    async def _consume(self, error_rate):
+        resources = in_memory()
+        await publish(
+            SNSClient(resources["topic_arn"]),
+            rate=1000,
+            payload_size=Distribution("100"),
+            max_events=5,
+        )
+        sqs_client = await SQSClient.initialize(
+            queue_name=resources["queue_name"]
+        )
+        sqs_client.lock_manager = LocalLockManager()
+        await consume(
+            sqs_client,
+            latency=Distribution("0"),
+            max_messages=5,
+            error_rate=error_rate,
+            duration=10,
+        )
+        return sqs_client
+
+    async def test_handled(self, insanic_application):
+        queue = in_memory()["queue_name"]
+        before = {
+            name: total(f"iniesta_sqs_messages_{name}_total", queue=queue)
+            for name in ("received", "handled", "deleted")
+        }
+
+        sqs_client = await self._consume(error_rate=0)
+
+        for name in ("received", "handled", "deleted"):
+            assert (
+                total(f"iniesta_sqs_messages_{name}_total", queue=queue)
+                - before[name]
+                == 5
+            )
+        assert (
+            registry.gauge("iniesta_sqs_messages_in_flight")
+            .labels(queue=queue)
+            .value
+            == 0
+        )
+        assert any(
+            histogram.count
+            for labels, histogram in registry.histogram(
+                "iniesta_sqs_handler_seconds"
+            ).items()
+            if labels["queue"] == queue
+        )
+        assert "iniesta_sqs_handler_errors" in PrometheusExporter().render()
+        assert sqs_client.metrics["handler_errors"] == 0
+
+    async def test_failed(self, insanic_application):
+        queue = in_memory()["queue_name"]
+        before = total(
+            "iniesta_sqs_messages_failed_total", queue=queue, reason="error"
+        )
+
+        await self._consume(error_rate=1)
+
+        assert (
+            total(
+                "iniesta_sqs_messages_failed_total", queue=queue, reason="error"
+            )
+            - before
+            == 5
+        )
+
+
+@pytest.mark.usefixtures("reset_sqs_client")
+class TestSNSMetrics:
+    async def test_publish(self, insanic_application):
+        resources = in_memory()
+        message = SNSClient(resources["topic_arn"]).create_message(
+            event="UserCreated", message={"id": 1}
+        )
+        labels = ("iniesta-bench", message.event)
+        size = registry.histogram("iniesta_sns_message_bytes").labels(*labels)
+        latency = registry.histogram("iniesta_sns_publish_seconds").labels(
+            *labels
+        )
+        before = (
+            total("iniesta_sns_messages_published_total", event=message.event),
+            size.count,
+            size.sum,
+            latency.count,
+        )
+
+        await message.publish()
+
+        assert (
+            total("iniesta_sns_messages_published_total", event=message.event)
+            - before[0]
+            == 1
+        )
+        assert size.count - before[1] == 1
+        assert size.sum - before[2] == len('{"id":1}')
+        assert latency.count - before[3] == 1
+
+    async def test_publish_failed(self, insanic_application):
+        in_memory()
+        message = SNSClient(
+            "arn:aws:sns:us-east-1:000000000000:missing"
+        ).create_message(event="UserCreated", message={})
+        before = total("iniesta_sns_messages_failed_total", topic="missing")
+
+        with pytest.raises(botocore.exceptions.ClientError):
+            await message.publish()
+
+        assert (
+            total(
+                "iniesta_sns_messages_failed_total",
+                topic="missing",
+                event=message.event,
+                reason="error",
+            )
+            - before
+            == 1
+        )
+
+    async def test_publish_event(self, insanic_application):
+        from sanic.response import json as json_response
+
+        resources = in_memory()
+        sns_client = SNSClient(resources["topic_arn"])
+        event = sns_client.create_message(event="Viewed", message="").event
+        before = total("iniesta_sns_messages_published_total", event=event)
+
+        @sns_client.publish_event(event="Viewed")
+        async def view():
+            return json_response({"id": 1})
+
+        await view()
+
+        assert (
+            total("iniesta_sns_messages_published_total", event=event) - before
+            == 1
+        )
+
+    @pytest.mark.parametrize(
+        "error,reason",
+        [
+            ("Throttling", "throttled"),
+            ("ThrottledException", "throttled"),
+            ("InternalError", "error"),
+            (None, "error"),
+            (
+                botocore.exceptions.ClientError(
+                    {"Error": {"Code": "Throttling"}}, "Publish"
+                ),
+                "throttled",
+            ),
+            (ValueError("Oops"), "error"),
+        ],
+    )
+    def test_failure_reason(self, error, reason):
+        assert failure_reason(error) == reason
@@ -0,0 +1,156 @@
+import pytest
+import ujson as json
+
+from insanic.conf import settings
+
+from iniesta.metrics import registry
+from iniesta.sns import SNSClient
+from iniesta.sns.bulk import publish_bulk, record_message
+
+
+class FakeSNS:
+    def __init__(self, fail_ids=(), code="InternalError"):
+        self.batches = []
+        self.fail_ids = fail_ids
+        self.code = code
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def publish_batch(self, TopicArn, PublishBatchRequestEntries):
+        self.batches.append(PublishBatchRequestEntries)
+        return {
+            "Failed": [
+                {"Id": e["Id"], "Code": self.code, "Message": "Oops"}
+                for e in PublishBatchRequestEntries
+                if json.loads(e["Message"]).get("index") in self.fail_ids
+            ]
+        }
+
+
+class TestBulkPublish:
+    @pytest.fixture()
+    def sns_client(self, iniesta_config):
+        yield SNSClient("arn:aws:sns:us-east-1:000000000000:topic")
+
+    def _lines(self, count, **extra):
+        return [
+            json.dumps(
+                {"event": "hello.iniesta", "message": {"index": i}, **extra}
+            )
+            + "\n"
+            for i in range(count)
+        ]
+
+    def test_record_message(self, sns_client):
+        message = record_message(
+            sns_client,
+            {
+                "event": "hello.iniesta",
+                "message": {"a": 1},
+                "version": 2,
+                "attributes": {"user_id": "1"},
+            },
+        )
+
+        assert message.event == "hello.iniesta"
+        assert json.loads(message.message) == {"a": 1}
+        assert message.message_attributes["version"]["StringValue"] == "2"
+        assert message.message_attributes["user_id"]["StringValue"] == "1"
+
+    @pytest.mark.parametrize(
+        "record", ([], {"message": {}}, {"event": "a", "attributes": []})
+    )
+    def test_invalid_record(self, sns_client, record):
+        with pytest.raises(ValueError):
+            record_message(sns_client, record)
+
+    async def test_publish(self, sns_client, monkeypatch):
+        fake = FakeSNS()
+        monkeypatch.setattr(sns_client, "_create_client", lambda: fake)
+
+        stats = await publish_bulk(sns_client, self._lines(25), concurrency=2)
+
+        assert [len(batch) for batch in fake.batches] == [10, 10, 5]
+        entry = fake.batches[0][0]
+        assert entry["Id"] == "0"
+        assert (
+            entry["MessageAttributes"][settings.INIESTA_SNS_EVENT_KEY][
+                "StringValue"
+            ]
+            == "hello.iniesta"
+        )
+        assert stats.published == 25
+        assert stats.batches == 3
+        assert stats.rejected == 0
+
+    async def test_batch_size_limit(self, sns_client, monkeypatch):
+        fake = FakeSNS()
+        monkeypatch.setattr(sns_client, "_create_client", lambda: fake)
+
+        lines = [
+            json.dumps({"event": "hello.iniesta", "message": "a" * 100000})
+            for _ in range(4)
+        ]
+        await publish_bulk(sns_client, lines)
+
+        assert [len(batch) for batch in fake.batches] == [2, 2]
+
+    async def test_rejects(self, sns_client, monkeypatch):
+        fake = FakeSNS(fail_ids={3})
+        monkeypatch.setattr(sns_client, "_create_client", lambda: fake)
+        rejected = []
+
+        lines = self._lines(5) + ["not json\n", "\n", '{"message": 1}\n']
+        stats = await publish_bulk(
+            sns_client,
+            lines,
+            reject=lambda line, reason: rejected.append((line, reason)),
+        )
+
+        assert stats.published == 4
+        assert stats.rejected == 3
+        assert rejected[0][0] == "not json"
+        assert json.loads(rejected[-1][0])["message"] == {"index": 3}
+        assert rejected[-1][1] == "[InternalError] Oops"
+
+    async def test_rate_limit(self, sns_client, monkeypatch):
+        fake = FakeSNS()
+        monkeypatch.setattr(sns_client, "_create_client", lambda: fake)
+        acquired = []
+
+        async def acquire(self):
+            acquired.append(1)
+
+        monkeypatch.setattr(
+            "iniesta.sns.bulk.TokenBucket.acquire", acquire,
+        )
+
+        await publish_bulk(sns_client, self._lines(15), rate_limit=100)
+
+        assert len(acquired) == 15
+
+    async def test_metrics(self, sns_client, monkeypatch):
+        fake = FakeSNS(fail_ids={1, 2}, code="Throttling")
+        monkeypatch.setattr(sns_client, "_create_client", lambda: fake)
+        published = registry.counter(
+            "iniesta_sns_messages_published_total"
+        ).labels("topic", "hello.iniesta")
+        throttled = registry.counter(
+            "iniesta_sns_messages_failed_total"
+        ).labels("topic", "hello.iniesta", "throttled")
+        before = published.value, throttled.value
+
+        await publish_bulk(sns_client, self._lines(12), concurrency=1)
+
+        assert published.value - before[0] == 10
+        assert throttled.value - before[1] == 2
+        assert (
+            registry.gauge("iniesta_sns_publish_queue_depth")
+            .labels("topic")
+            .value
+            == 0
+        )
@@ -1,3 +1,6 @@
+import datetime
+import time
+
 import pytest
 import ujson as json
 
@@ -314,3 +317,36 @@ class TestSNSMessage:
             message.add_binary_attribute("error", error_value)
 
         assert "error" not in message.message_attributes
+
+    def test_add_expiry_ttl(self, iniesta_config):
+        from insanic.conf import settings
+
+        message = SNSMessage()
+        before = time.time()
+        message.add_expiry(ttl=datetime.timedelta(minutes=1))
+
+        attribute = message.message_attributes[settings.INIESTA_EXPIRES_AT_KEY]
+        assert attribute["DataType"] == "Number"
+        assert float(attribute["StringValue"]) == pytest.approx(
+            before + 60, abs=1
+        )
+
+    def test_add_expiry_expires_at(self, iniesta_config):
+        from insanic.conf import settings
+
+        expires_at = datetime.datetime(2030, 1, 1, tzinfo=datetime.timezone.utc)
+        message = SNSMessage()
+        message.add_expiry(expires_at=expires_at)
+
+        assert message.message_attributes[settings.INIESTA_EXPIRES_AT_KEY][
+            "StringValue"
+        ] == str(expires_at.timestamp())
+
+    @pytest.mark.parametrize(
+        "kwargs", ({}, {"ttl": 1, "expires_at": time.time()})
+    )
+    def test_add_expiry_error(self, kwargs):
+        message = SNSMessage()
+
+        with pytest.raises(ValueError):
+            message.add_expiry(**kwargs)
@@ -1,5 +1,7 @@
 import asyncio
+import hashlib
 import sys
+import time
 
 import botocore
 import pytest
@@ -539,3 +541,164 @@ class TestClientCreateMessage:
         message = sqs_client.create_message("hello")
         assert isinstance(message, SQSMessage)
         assert message.body == "hello"
+        assert "MessageGroupId" not in message
+        assert "MessageDeduplicationId" not in message
+
+    def test_create_message_with_group_id(self, sqs_client):
+        message = sqs_client.create_message("hello", group_id="group")
+
+        assert message.message_group_id == "group"
+        assert message.message_deduplication_id == (
+            hashlib.sha256(b"hello").hexdigest()
+        )
+
+        message = sqs_client.create_message(
+            "hello", group_id="group", deduplication_id="dedup"
+        )
+        assert message.message_deduplication_id == "dedup"
+
+    def test_create_message_deduplication_id_without_group_id(self, sqs_client):
+        with pytest.raises(ValueError):
+            sqs_client.create_message("hello", deduplication_id="dedup")
+
+    def test_create_message_fifo_requires_group_id(self, sqs_client):
+        sqs_client.fifo = True
+
+        with pytest.raises(ValueError):
+            sqs_client.create_message("hello")
+
+
+class TestFIFOProcessing:
+    @pytest.fixture(scope="function")
+    def sqs_client(self, insanic_application):
+        from iniesta import Iniesta
+
+        Iniesta.load_config(insanic_application.config)
+        SQSClient.queue_urls = {"iniesta-tests.fifo": "hello"}
+        client = SQSClient(queue_name="iniesta-tests.fifo")
+        yield client
+
+        SQSClient.queue_urls = {}
+
+    def _messages(self, client, number):
+        messages = []
+        for i in range(number):
+            message = SQSMessage(client, json.dumps({"message_number": i}))
+            message.message_id = str(i)
+            messages.append(message)
+        return messages
+
+    def test_fifo(self, sqs_client):
+        assert sqs_client.fifo is True
+
+    async def test_process_group_in_order(self, sqs_client, monkeypatch):
+        messages = self._messages(sqs_client, 5)
+        processed = []
+
+        async def process_message(client, message):
+            await asyncio.sleep(0.01 * (5 - len(processed)))
+            processed.append(message.message_id)
+            return True
+
+        monkeypatch.setattr(sqs_client, "_process_message", process_message)
+
+        await sqs_client._process_group(None, messages)
+
+        assert processed == ["0", "1", "2", "3", "4"]
+
+    async def test_process_group_stops_on_failure(
+        self, sqs_client, monkeypatch
+    ):
+        messages = self._messages(sqs_client, 5)
+        processed = []
+        released = []
+
+        async def process_message(client, message):
+            processed.append(message.message_id)
+            return message.message_id != "1"
+
+        async def change_visibility(client, messages, visibility_timeout):
+            assert visibility_timeout == 0
+            released.extend(m.message_id for m in messages)
+
+        monkeypatch.setattr(sqs_client, "_process_message", process_message)
+        monkeypatch.setattr(sqs_client, "change_visibility", change_visibility)
+
+        await sqs_client._process_group(None, messages)
+
+        assert processed == ["0", "1"]
+        assert released == ["2", "3", "4"]
+
+
+class TestExpiredMessages:
+    @pytest.fixture(scope="function")
+    def sqs_client(self, insanic_application):
+        from iniesta import Iniesta
+
+        Iniesta.load_config(insanic_application.config)
+        SQSClient.queue_urls = {"iniesta-tests": "hello"}
+        client = SQSClient(queue_name="iniesta-tests")
+        yield client
+
+        SQSClient.queue_urls = {}
+
+    def _received(self, message, message_id):
+        return {
+            "MessageId": message_id,
+            "ReceiptHandle": message_id,
+            "MD5OfBody": "",
+            "Attributes": {},
+            "Body": message.raw_body,
+            "MessageAttributes": message["MessageAttributes"],
+        }
+
+    def test_create_message_ttl(self, sqs_client):
+        message = sqs_client.create_message("hello", ttl=60)
+        received = SQSMessage.from_sqs(sqs_client, self._received(message, "a"))
+
+        assert received.expires_at == pytest.approx(time.time() + 60, abs=1)
+        assert received.expired() is False
+        assert received.expired(time.time() + 61) is True
+
+    def test_no_expiry(self, sqs_client):
+        message = sqs_client.create_message("hello")
+        received = SQSMessage.from_sqs(sqs_client, self._received(message, "a"))
+
+        assert received.expires_at is None
+        assert received.expired() is False
+
+    async def test_expired_messages_are_deleted(self, sqs_client, monkeypatch):
+        processed = []
+        deleted = []
+        hooked = []
+
+        async def process_message(client, message):
+            processed.append(message.message_id)
+            return True
+
+        async def delete_messages(client, messages):
+            deleted.extend(m.message_id for m in messages)
+            return []
+
+        async def hook_expired_messages(messages):
+            hooked.extend(m.message_id for m in messages)
+
+        monkeypatch.setattr(sqs_client, "_process_message", process_message)
+        monkeypatch.setattr(sqs_client, "delete_messages", delete_messages)
+        monkeypatch.setattr(
+            sqs_client, "hook_expired_messages", hook_expired_messages
+        )
+
+        messages = [
+            self._received(sqs_client.create_message("a", ttl=60), "fresh"),
+            self._received(
+                sqs_client.create_message("b", expires_at=time.time() - 1),
+                "expired",
+            ),
+        ]
+        await sqs_client._process(None, messages)
+
+        assert processed == ["fresh"]
+        assert deleted == ["expired"]
+        assert hooked == ["expired"]
+        assert sqs_client.metrics["expired_messages"] == 1
@@ -0,0 +1,96 @@
+import pytest
+
+from iniesta.sqs.adaptive import (
+    AdaptiveReceiveController,
+    MAX_WAIT_TIME_SECONDS,
+)
+
+
+class TestAdaptiveReceiveController:
+    @pytest.fixture
+    def controller(self):
+        return AdaptiveReceiveController(
+            max_number_of_messages=10,
+            wait_time_seconds=5,
+            max_concurrency=3,
+            latency_threshold=1.0,
+            idle_receives=2,
+        )
+
+    def test_disabled_controller_is_static(self):
+        controller = AdaptiveReceiveController(
+            max_number_of_messages=10, wait_time_seconds=5, enabled=False
+        )
+
+        for _ in range(5):
+            controller.record_receive(10, 0)
+
+        assert controller.concurrency == 1
+        assert controller.max_number_of_messages == 10
+        assert controller.wait_time_seconds == 5
+        assert controller.metrics["empty_receives"] == 5
+
+    def test_full_receives_grow_concurrency(self, controller):
+        for _ in range(5):
+            controller.record_receive(
+                controller.max_number_of_messages,
+                controller.max_number_of_messages,
+            )
+
+        assert controller.max_number_of_messages == 10
+        assert controller.concurrency == 3
+
+    def test_empty_receives_shrink(self, controller):
+        controller.idle_receives = 5
+        controller.concurrency = 2
+
+        controller.record_receive(10, 0)
+        assert controller.concurrency == 1
+
+        controller.record_receive(10, 0)
+        assert controller.max_number_of_messages == 5
+        assert controller.idle is False
+
+    def test_empty_receives_idle(self, controller):
+        controller.concurrency = 3
+
+        controller.record_receive(10, 0)
+        assert controller.concurrency == 2
+        assert controller.idle is False
+        assert controller.wait_time_seconds == 5
+
+        controller.record_receive(10, 0)
+        assert controller.concurrency == 1
+        assert controller.max_number_of_messages == 10
+        assert controller.idle is True
+        assert controller.wait_time_seconds == MAX_WAIT_TIME_SECONDS
+
+        controller.record_receive(10, 3)
+        assert controller.idle is False
+        assert controller.wait_time_seconds == 5
+
+    def test_unhealthy_latency_shrinks(self, controller):
+        controller.concurrency = 3
+
+        controller.record_handler_latency(5.0)
+        assert controller.healthy is False
+
+        controller.record_receive(10, 10)
+        assert controller.concurrency == 2
+
+    def test_partial_receive_is_stable(self, controller):
+        controller.concurrency = 2
+
+        controller.record_receive(10, 4)
+
+        assert controller.concurrency == 2
+        assert controller.max_number_of_messages == 10
+
+    def test_metrics(self, controller):
+        controller.record_receive(10, 10)
+        controller.record_receive(10, 0)
+
+        metrics = controller.metrics
+        assert metrics["receives"] == 2
+        assert metrics["full_receives"] == 1
+        assert metrics["empty_receive_ratio"] == 0.5
@@ -0,0 +1,158 @@
+import asyncio
+
+import pytest
+
+from iniesta.sqs.backpressure import Backpressure, HandlerHealthProbe
+
+
+class TestHandlerHealthProbe:
+    @pytest.mark.parametrize(
+        "kwargs",
+        ({"error_rate": 0}, {"error_rate": 2}, {"latency": 0}, {"window": 0}),
+    )
+    def test_invalid(self, kwargs):
+        with pytest.raises(ValueError):
+            HandlerHealthProbe(**kwargs)
+
+    def test_error_rate(self):
+        probe = HandlerHealthProbe(error_rate=0.5, min_samples=4)
+
+        for _ in range(3):
+            probe.record(0.1, True)
+        assert probe()
+
+        probe.record(0.1, False)
+        assert not probe()
+        assert probe.metrics["recent_handler_error_rate"] == 0.75
+
+        for _ in range(4):
+            probe.record(0.1, False)
+        assert probe()
+
+    def test_latency(self):
+        probe = HandlerHealthProbe(latency=1, min_samples=2)
+
+        probe.record(0.5, False)
+        probe.record(1.0, False)
+        assert probe()
+
+        probe.record(3.0, False)
+        assert not probe()
+
+    def test_window(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr(
+            "iniesta.sqs.backpressure.time.monotonic", lambda: now[0]
+        )
+        probe = HandlerHealthProbe(error_rate=0.5, window=10, min_samples=2)
+
+        probe.record(0.1, True)
+        probe.record(0.1, True)
+        assert not probe()
+
+        now[0] += 11
+        assert probe()
+        assert probe.metrics["recent_handler_error_rate"] == 0
+
+
+class TestBackpressure:
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            Backpressure(initial_wait=0)
+        with pytest.raises(ValueError):
+            Backpressure(initial_wait=2, max_wait=1)
+
+    async def test_probes(self):
+        backpressure = Backpressure(interval=0)
+        results = [True]
+
+        async def async_probe():
+            return True
+
+        backpressure.add_probe(async_probe)
+        backpressure.add_probe(lambda: results[-1])
+        assert await backpressure.check()
+
+        results.append(False)
+        assert not await backpressure.check()
+        assert backpressure.metrics["backpressure_paused"] == 1
+
+    async def test_failing_probe(self):
+        backpressure = Backpressure()
+
+        @backpressure.add_probe
+        def probe():
+            raise ConnectionError()
+
+        assert not await backpressure.check()
+
+    async def test_interval(self):
+        backpressure = Backpressure(interval=60)
+        calls = []
+
+        @backpressure.add_probe
+        def probe():
+            calls.append(1)
+            return True
+
+        await backpressure.check()
+        await backpressure.check()
+        assert len(calls) == 1
+
+    async def test_exponential_wait(self, monkeypatch):
+        backpressure = Backpressure(initial_wait=1, max_wait=3)
+        results = [False, False, False, False, True]
+        waits = []
+
+        async def sleep(seconds):
+            waits.append(seconds)
+
+        monkeypatch.setattr("iniesta.sqs.backpressure.asyncio.sleep", sleep)
+        backpressure.add_probe(lambda: results.pop(0))
+
+        await backpressure.wait()
+
+        assert waits == [1, 2, 3, 3]
+        assert backpressure.healthy
+        assert backpressure.metrics["backpressure_paused_seconds"] == 9
+
+
+class TestClientBackpressure:
+    async def test_receive_waits_for_probe(self, sqs_client):
+        healthy = asyncio.Event()
+        requested = []
+
+        class FakeSQS:
+            async def receive_message(self, **kwargs):
+                requested.append(kwargs)
+                return {}
+
+        sqs_client.backpressure.initial_wait = 0.01
+        sqs_client.add_backpressure_probe(healthy.is_set)
+
+        receive = asyncio.ensure_future(sqs_client._receive(FakeSQS()))
+        await asyncio.sleep(0.03)
+        assert requested == []
+        assert sqs_client.metrics["backpressure_healthy"] is False
+
+        healthy.set()
+        await asyncio.wait_for(receive, 1)
+        assert len(requested) == 1
+
+    async def test_handler_health(self, sqs_client, monkeypatch):
+        sqs_client.handler_health = HandlerHealthProbe(
+            error_rate=0.5, min_samples=2
+        )
+        sqs_client.add_backpressure_probe(sqs_client.handler_health)
+
+        async def handle_message(message):
+            raise ValueError()
+
+        monkeypatch.setattr(sqs_client, "handle_message", handle_message)
+
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                await sqs_client._handle_message_timed(None)
+
+        assert not await sqs_client.backpressure.check()
+        assert sqs_client.metrics["recent_handler_error_rate"] == 1
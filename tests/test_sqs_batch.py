@@ -0,0 +1,196 @@
+import asyncio
+
+import pytest
+
+from insanic.exceptions import ImproperlyConfigured
+
+from iniesta.exceptions import BatchItemFailed
+from iniesta.sqs import SQSClient, SQSMessage
+from iniesta.sqs.batch import BatchCollector
+from iniesta.sqs.client import default
+from iniesta.sqs.replay import LocalLockManager
+
+
+class TestBatchCollector:
+    async def test_flush_on_max_size(self):
+        batches = []
+
+        async def flush(batch):
+            batches.append(batch)
+
+        collector = BatchCollector(flush, max_size=3, max_wait_ms=10000)
+        for i in range(7):
+            await collector.add(i)
+
+        await asyncio.sleep(0)
+        assert batches == [[0, 1, 2], [3, 4, 5]]
+        assert collector.pending == [6]
+
+        await collector.flush()
+        assert batches[-1] == [6]
+
+    async def test_flush_on_max_wait(self):
+        batches = []
+
+        async def flush(batch):
+            batches.append(batch)
+
+        collector = BatchCollector(flush, max_size=10, max_wait_ms=10)
+        await collector.add(1)
+        await collector.add(2)
+        assert batches == []
+
+        await asyncio.sleep(0.05)
+        assert batches == [[1, 2]]
+
+    async def test_backpressure(self):
+        release = asyncio.Event()
+
+        async def flush(batch):
+            await release.wait()
+
+        collector = BatchCollector(flush, max_size=1, max_wait_ms=0)
+        await collector.add(1)
+
+        # the second add starts a second flush and waits for one to finish
+        blocked = asyncio.ensure_future(collector.add(2))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+
+        release.set()
+        await blocked
+
+    async def test_close(self):
+        async def flush(batch):
+            raise AssertionError("should not flush")
+
+        collector = BatchCollector(flush, max_size=10, max_wait_ms=10)
+        await collector.add(1)
+        assert collector.close() == [1]
+
+        await asyncio.sleep(0.05)
+        assert collector.pending == []
+
+    async def test_close_returns_queued_batches(self):
+        started = []
+
+        async def flush(batch):
+            started.append(batch)
+            await asyncio.sleep(10)
+
+        collector = BatchCollector(flush, max_size=2, max_wait_ms=1000)
+        collector.max_flushes = 3
+        await collector.add(1)
+        await collector.add(2)
+        await asyncio.sleep(0)
+        await collector.add(3)
+        await collector.add(4)
+
+        # the first flush started, the second is cancelled before it starts
+        assert collector.close() == [3, 4]
+        await asyncio.sleep(0)
+        assert started == [[1, 2]]
+
+
+class TestBatchHandler:
+    @pytest.fixture(autouse=True)
+    async def sqs_client(self, sqs_client):
+        sqs_client.lock_manager = LocalLockManager()
+        # held by another consumer
+        await sqs_client.lock_manager.lock(
+            sqs_client.lock_key.format(message_id="locked")
+        )
+        yield sqs_client
+
+    def _messages(self, client, *message_ids):
+        messages = []
+        for message_id in message_ids:
+            message = SQSMessage(client, "{}")
+            message.message_id = message_id
+            messages.append(message)
+        return messages
+
+    def test_register_batch_handler(self):
+        @SQSClient.batch_handler("UserUpdated", max_size=50, max_wait_ms=200)
+        def handler(messages):
+            pass
+
+        assert SQSClient.handlers["UserUpdated"] == handler
+        options = SQSClient.handler_options["UserUpdated"]
+        assert options.batch is True
+        assert options.batch_max_size == 50
+        assert options.batch_max_wait_ms == 200
+
+    def test_register_default_batch_handler(self):
+        @SQSClient.batch_handler()
+        def handler(messages):
+            pass
+
+        assert SQSClient.handler_options[default].batch is True
+
+    def test_register_invalid_batch_handler(self):
+        with pytest.raises(ValueError):
+            SQSClient.add_batch_handler(lambda m: None, "event", max_size=0)
+
+    def test_fifo_batch_handler(self, sqs_client):
+        SQSClient.queue_urls["orders.fifo"] = "orders"
+        client = SQSClient(queue_name="orders.fifo")
+
+        with pytest.raises(ImproperlyConfigured):
+            client.add_batch_handler(lambda messages: None, "OrderPaid")
+        assert "OrderPaid" not in client.handlers
+
+        SQSClient.add_batch_handler(lambda messages: None, "OrderPaid")
+        with pytest.raises(ImproperlyConfigured, match="OrderPaid"):
+            client.start_receiving_messages()
+        assert not hasattr(client, "_polling_task")
+
+    async def test_handle_batch_all_succeeded(self, sqs_client):
+        messages = self._messages(sqs_client, "a", "b")
+
+        async def handler(batch):
+            assert batch == messages
+
+        results = await sqs_client.handle_batch(handler, messages)
+
+        assert results == [(messages[0], None), (messages[1], None)]
+        assert sqs_client.lock_manager._locked == {
+            sqs_client.lock_key.format(message_id="locked")
+        }
+
+    async def test_handle_batch_partial_failure(self, sqs_client):
+        messages = self._messages(sqs_client, "a", "b", "c", "locked")
+        error = RuntimeError("c failed")
+
+        def handler(batch):
+            assert len(batch) == 3
+            return [True, False, error]
+
+        results = await sqs_client.handle_batch(handler, messages)
+        failures = {message.message_id: exc for message, exc in results}
+
+        assert failures["a"] is None
+        assert isinstance(failures["b"], BatchItemFailed)
+        assert failures["b"].handler is handler
+        assert failures["c"] is error
+        assert failures["locked"].message is messages[3]
+
+    async def test_handle_batch_raises(self, sqs_client):
+        messages = self._messages(sqs_client, "a", "b")
+
+        def handler(batch):
+            raise RuntimeError("database is down")
+
+        results = await sqs_client.handle_batch(handler, messages)
+
+        for message, exc in results:
+            assert isinstance(exc, BatchItemFailed)
+            assert isinstance(exc.__cause__, RuntimeError)
+            assert exc.message is message
+
+    async def test_handle_batch_wrong_length(self, sqs_client):
+        messages = self._messages(sqs_client, "a", "b")
+
+        results = await sqs_client.handle_batch(lambda batch: [True], messages)
+
+        assert all(exc is not None for _, exc in results)
@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+import ujson as json
+
+from iniesta.sqs.budget import InFlightBudget
+
+
+class TestInFlightBudget:
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            InFlightBudget(0)
+
+    def test_add_release(self):
+        budget = InFlightBudget(100)
+
+        budget.add("a", 60)
+        budget.add("a", 60)
+        assert budget.bytes == 60
+        assert budget.messages == 1
+        assert not budget.exceeded
+
+        budget.add("b", 40)
+        assert budget.exceeded
+
+        budget.release("a")
+        budget.release("a")
+        assert budget.bytes == 40
+        assert budget.metrics["in_flight_messages"] == 1
+
+    async def test_wait(self):
+        budget = InFlightBudget(10)
+        await asyncio.wait_for(budget.wait(), 1)
+
+        budget.add("a", 10)
+        waiter = asyncio.ensure_future(budget.wait())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+
+        budget.release("a")
+        await asyncio.wait_for(waiter, 1)
+        assert budget.paused == 1
+
+    def test_max_number_of_messages(self):
+        budget = InFlightBudget(1000)
+        assert budget.max_number_of_messages(10) == 10
+
+        budget.average_size = 100
+        assert budget.max_number_of_messages(10) == 10
+
+        budget.add("a", 100)
+        budget.add("b", 100)
+        budget.add("c", 100)
+        budget.average_size = 200
+        assert budget.max_number_of_messages(10) == 3
+
+        budget.add("d", 700)
+        assert budget.max_number_of_messages(10) == 1
+
+
+class TestClientBudget:
+    @pytest.fixture()
+    def sqs_client(self, sqs_client):
+        sqs_client.budget = InFlightBudget(1000)
+        yield sqs_client
+
+    def _received(self, message_id, size):
+        return {
+            "MessageId": message_id,
+            "ReceiptHandle": message_id,
+            "MD5OfBody": "",
+            "Attributes": {},
+            "Body": json.dumps("a" * (size - 2)),
+            "MessageAttributes": {},
+        }
+
+    async def test_budget_is_released(self, sqs_client, monkeypatch):
+        sizes = []
+
+        async def handle_and_delete(client, message):
+            sizes.append(sqs_client.budget.bytes)
+            return True
+
+        monkeypatch.setattr(sqs_client, "_handle_and_delete", handle_and_delete)
+
+        await sqs_client._process(
+            None, [self._received("a", 300), self._received("b", 200)]
+        )
+
+        assert sizes == [500, 200]
+        assert sqs_client.metrics["in_flight_bytes"] == 0
+
+    async def test_receive_requests_fewer_messages(
+        self, sqs_client, memory_queue, sqs_requests
+    ):
+        for _ in range(10):
+            memory_queue.send(json.dumps("a" * 298))
+
+        async with sqs_client._create_client() as client:
+            sqs_client.budget.add("x", 300)
+            sqs_client.budget.add("y", 300)
+            assert len(await sqs_client._receive(client)) == 1
+
+            sqs_client.budget.release("x")
+            sqs_client.budget.release("y")
+            assert len(await sqs_client._receive(client)) == 3
+
+        assert [
+            r["MaxNumberOfMessages"] for r in sqs_requests["receive_message"]
+        ] == [1, 3]
+
+    async def test_receive_pauses(self, sqs_client, memory_queue, sqs_requests):
+        memory_queue.send(json.dumps("a" * 298))
+        sqs_client.budget.add("x", 1000)
+
+        async with sqs_client._create_client() as client:
+            receive = asyncio.ensure_future(sqs_client._receive(client))
+            await asyncio.sleep(0.01)
+            assert sqs_requests["receive_message"] == []
+
+            sqs_client.budget.release("x")
+            assert len(await asyncio.wait_for(receive, 1)) == 1
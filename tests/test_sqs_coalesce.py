@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+import ujson as json
+
+from iniesta.sqs.handlers import HandlerOptions
+
+
+class TestCoalesce:
+    @pytest.fixture()
+    def sqs_client(self, sqs_client, monkeypatch):
+        client = sqs_client
+        client.handled = []
+        client.deleted = []
+
+        async def process_message(c, message):
+            client.handled.append(message.message_id)
+            return True
+
+        async def delete_messages(c, messages):
+            client.deleted.extend(m.message_id for m in messages)
+            return []
+
+        monkeypatch.setattr(client, "_process_message", process_message)
+        monkeypatch.setattr(client, "delete_messages", delete_messages)
+        yield client
+
+    def _received(self, message_id, body, sent_timestamp, event="profile"):
+        from insanic.conf import settings
+
+        return {
+            "MessageId": message_id,
+            "ReceiptHandle": message_id,
+            "MD5OfBody": "",
+            "Attributes": {"SentTimestamp": str(sent_timestamp)},
+            "Body": json.dumps(body),
+            "MessageAttributes": {
+                settings.INIESTA_SNS_EVENT_KEY: {
+                    "DataType": "String",
+                    "StringValue": event,
+                }
+            },
+        }
+
+    @pytest.mark.parametrize(
+        "kwargs",
+        (
+            {"coalesce_key": ""},
+            {"coalesce_key": "user_id", "coalesce_window_ms": -1},
+            {"coalesce_window_ms": 100},
+        ),
+    )
+    def test_invalid_options(self, kwargs):
+        with pytest.raises(ValueError):
+            HandlerOptions(**kwargs)
+
+    async def test_newest_per_key(self, sqs_client):
+        sqs_client.add_handler(
+            lambda m: None, "profile", coalesce_key="user_id"
+        )
+
+        messages = [
+            self._received("a1", {"user_id": "a"}, 100),
+            self._received("b1", {"user_id": "b"}, 100),
+            # received out of order, but sent after a1
+            self._received("a3", {"user_id": "a"}, 300),
+            self._received("a2", {"user_id": "a"}, 200),
+            self._received("none", {}, 100),
+            self._received("other", {"user_id": "a"}, 100, event="other"),
+        ]
+        await sqs_client._process(None, messages)
+
+        assert sorted(sqs_client.handled) == ["a3", "b1", "none", "other"]
+        assert sorted(sqs_client.deleted) == ["a1", "a2"]
+        assert sqs_client.metrics["coalesced_messages"] == 2
+
+    async def test_window(self, sqs_client):
+        sqs_client.add_handler(
+            lambda m: None,
+            "profile",
+            coalesce_key="user_id",
+            coalesce_window_ms=20,
+        )
+
+        await sqs_client._process(
+            None, [self._received("a1", {"user_id": "a"}, 100)]
+        )
+        await sqs_client._process(
+            None, [self._received("a2", {"user_id": "a"}, 200)]
+        )
+        assert sqs_client.handled == []
+
+        await asyncio.sleep(0.05)
+
+        assert sqs_client.handled == ["a2"]
+        assert sqs_client.deleted == ["a1"]
@@ -0,0 +1,147 @@
+import asyncio
+
+import pytest
+
+from iniesta.sqs import MultiQueueConsumer, SQSClient
+from iniesta.sqs.client import default
+from iniesta.sqs.consumer import WeightedFairScheduler
+
+
+class TestWeightedFairScheduler:
+    def test_invalid_concurrency(self):
+        with pytest.raises(ValueError):
+            WeightedFairScheduler(0)
+
+    async def test_weighted_share(self):
+        scheduler = WeightedFairScheduler(1)
+        order = []
+
+        async def work(flow, weight):
+            async with scheduler.slot(flow, weight):
+                order.append(flow)
+                await asyncio.sleep(0)
+
+        # hold the only slot so everything else has to queue
+        await scheduler.acquire("holder")
+        tasks = [asyncio.ensure_future(work("bulk", 1)) for _ in range(10)] + [
+            asyncio.ensure_future(work("priority", 3)) for _ in range(10)
+        ]
+        await asyncio.sleep(0)
+        assert scheduler.waiting == 20
+
+        scheduler.release()
+        await asyncio.gather(*tasks)
+
+        # while both are backlogged priority gets 3 slots for every bulk slot
+        assert order[:8].count("priority") == 6
+        assert order[:8].count("bulk") == 2
+        assert scheduler.in_flight == 0
+        assert scheduler.granted("priority") == 10
+
+    async def test_cancelled_waiter(self):
+        scheduler = WeightedFairScheduler(1)
+        await scheduler.acquire("a")
+
+        waiter = asyncio.ensure_future(scheduler.acquire("b"))
+        await asyncio.sleep(0)
+        assert scheduler.waiting == 1
+
+        waiter.cancel()
+        await asyncio.sleep(0)
+        assert scheduler.waiting == 0
+
+        scheduler.release()
+        assert scheduler.in_flight == 0
+
+        await scheduler.acquire("c")
+        assert scheduler.metrics["handler_slots_in_flight"] == 1
+
+
+class TestInstanceHandlers:
+    @pytest.fixture(autouse=True)
+    def queue_urls(self, reset_sqs_client):
+        SQSClient.queue_urls.update(priority="priority", bulk="bulk")
+
+    def test_instance_handlers_are_separate(self):
+        priority = SQSClient(queue_name="priority")
+        bulk = SQSClient(queue_name="bulk")
+
+        @priority.handler("PaymentCompleted")
+        def payment_completed(message):
+            pass
+
+        @bulk.handler
+        def bulk_default(message):
+            pass
+
+        assert priority.handlers["PaymentCompleted"] == payment_completed
+        assert "PaymentCompleted" not in bulk.handlers
+        assert bulk.handlers[default] == bulk_default
+        assert default not in priority.handlers
+        assert SQSClient.handlers == {}
+
+    def test_instance_handlers_fall_back_to_class(self):
+        @SQSClient.handler
+        def class_default(message):
+            pass
+
+        client = SQSClient(queue_name="priority")
+        assert client.handlers[default] == class_default
+
+        @client.handler
+        def instance_default(message):
+            pass
+
+        assert client.handlers[default] == instance_default
+        assert SQSClient.handlers[default] == class_default
+
+        with pytest.raises(ValueError):
+            client.add_handler(instance_default)
+
+    def test_class_handlers_added_after_instance(self):
+        client = SQSClient(queue_name="priority")
+
+        # the class mapping is reassigned, e.g. by a test reset
+        SQSClient.handlers = {}
+        SQSClient.handler_options = {}
+
+        @SQSClient.handler("PaymentCompleted", timeout=5)
+        def payment_completed(message):
+            pass
+
+        assert client.handlers["PaymentCompleted"] == payment_completed
+        assert client.handler_options["PaymentCompleted"].timeout == 5
+        assert client._handler_key("PaymentCompleted") == "PaymentCompleted"
+
+    def test_subclass_handlers(self):
+        class PriorityClient(SQSClient):
+            handlers = {}
+            handler_options = {}
+
+        client = PriorityClient(queue_name="priority")
+
+        @PriorityClient.handler("PaymentCompleted")
+        def payment_completed(message):
+            pass
+
+        assert client.handlers["PaymentCompleted"] == payment_completed
+        assert "PaymentCompleted" not in SQSClient.handlers
+
+    def test_multi_queue_consumer(self):
+        priority = SQSClient(queue_name="priority")
+        bulk = SQSClient(queue_name="bulk")
+
+        consumer = MultiQueueConsumer({priority: 4, bulk: 1}, max_concurrency=5)
+
+        assert priority.scheduler is consumer.scheduler
+        assert bulk.scheduler is consumer.scheduler
+        assert priority.weight == 4
+        assert consumer.clients == {"priority": priority, "bulk": bulk}
+
+        metrics = consumer.metrics
+        assert metrics["handler_slots"] == 5
+        assert set(metrics["queues"].keys()) == {"priority", "bulk"}
+
+    def test_multi_queue_consumer_invalid_weight(self):
+        with pytest.raises(ValueError):
+            MultiQueueConsumer({SQSClient(queue_name="bulk"): 0})
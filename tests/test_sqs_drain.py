@@ -0,0 +1,158 @@
+import asyncio
+import gzip
+
+import pytest
+import ujson as json
+
+from iniesta.sqs.budget import InFlightBudget
+from iniesta.sqs.drain import drain_queue
+
+from .infra import send_messages
+
+
+class TestDrain:
+    @pytest.fixture()
+    def queue(self, memory_queue):
+        send_messages(memory_queue, range(25), "hello.iniesta")
+        return memory_queue
+
+    def _read(self, path):
+        opener = gzip.open if str(path).endswith(".gz") else open
+        with opener(str(path), "rt") as file:
+            return [json.loads(line) for line in file]
+
+    @pytest.mark.parametrize(
+        "filename", ("backlog.ndjson", "backlog.ndjson.gz")
+    )
+    async def test_drain(self, sqs_client, queue, tmp_path, filename):
+        path = tmp_path / filename
+
+        stats = await drain_queue(sqs_client, str(path), idle_timeout=0.05)
+
+        records = self._read(path)
+        assert sorted(r["MessageId"] for r in records) == sorted(queue.messages)
+        assert sorted(json.loads(r["Body"])["index"] for r in records) == list(
+            range(25)
+        )
+        assert records[0]["MessageAttributes"]["iniesta_pass"] == {
+            "DataType": "String",
+            "StringValue": "hello.iniesta",
+        }
+        assert "SentTimestamp" in records[0]["Attributes"]
+        assert stats.written == 25
+        assert stats.deleted == 0
+        assert len(queue.messages) == 25
+
+    @pytest.mark.parametrize("delete", (False, True))
+    async def test_small_budget(self, sqs_client, queue, tmp_path, delete):
+        # fits about 4 messages
+        sqs_client.budget = InFlightBudget(50)
+
+        stats = await drain_queue(
+            sqs_client,
+            str(tmp_path / "backlog.ndjson"),
+            delete=delete,
+            idle_timeout=0.5,
+            sync_every=2,
+        )
+
+        assert stats.written == 25
+        assert sqs_client.budget.bytes == 0
+
+    @pytest.mark.parametrize("delete", (False, True))
+    async def test_messages_received_again(
+        self, sqs_client, queue, tmp_path, monkeypatch, delete
+    ):
+        # messages that aren't deleted are received again while draining
+        monkeypatch.setattr(type(queue), "visibility_timeout", 0.2)
+        path = tmp_path / "backlog.ndjson"
+
+        stats = await asyncio.wait_for(
+            drain_queue(
+                sqs_client,
+                str(path),
+                delete=delete,
+                idle_timeout=0.5,
+                sync_every=5,
+            ),
+            5,
+        )
+
+        records = self._read(path)
+        assert sorted(json.loads(r["Body"])["index"] for r in records) == list(
+            range(25)
+        )
+        assert stats.written == 25
+        if delete:
+            assert not queue.messages
+        else:
+            assert stats.repeated > 0
+            assert len(queue.messages) == 25
+
+    async def test_delete_after_sync(
+        self, sqs_client, queue, tmp_path, monkeypatch
+    ):
+        from iniesta.sqs import drain
+
+        path = tmp_path / "backlog.ndjson"
+        synced = []
+        original_sync = drain._sync
+
+        def sync(file):
+            synced.append(25 - len(queue.messages))
+            original_sync(file)
+
+        monkeypatch.setattr(drain, "_sync", sync)
+
+        stats = await drain_queue(
+            sqs_client, str(path), delete=True, max_messages=20, sync_every=10
+        )
+
+        assert stats.written == 20
+        assert stats.deleted == 20
+        assert len(synced) == 3
+        # nothing is deleted before it was synced
+        assert synced[0] == 0
+        written = {r["MessageId"] for r in self._read(path)}
+        assert written.isdisjoint(queue.messages)
+        assert len(queue.messages) == 5
+
+    @pytest.mark.parametrize("delete", (False, True))
+    async def test_deleted_ids_are_forgotten(
+        self, sqs_client, queue, tmp_path, monkeypatch, delete
+    ):
+        assert await sqs_client.queue_visibility_timeout() == 30
+
+        async def queue_visibility_timeout():
+            return 0
+
+        monkeypatch.setattr(
+            sqs_client, "queue_visibility_timeout", queue_visibility_timeout
+        )
+
+        stats = await drain_queue(
+            sqs_client,
+            str(tmp_path / "backlog.ndjson"),
+            delete=delete,
+            max_messages=25,
+            sync_every=5,
+        )
+
+        assert stats.written == 25
+        # only deleted messages can't be received again
+        assert stats.tracked == (0 if delete else 25)
+
+    async def test_progress(self, sqs_client, queue, tmp_path):
+        reports = []
+
+        await drain_queue(
+            sqs_client,
+            str(tmp_path / "backlog.ndjson"),
+            max_messages=5,
+            progress=lambda stats: reports.append(
+                (stats.written, stats.remaining)
+            ),
+        )
+
+        assert reports[0][1] is not None
+        assert reports[-1][0] == 5
@@ -0,0 +1,285 @@
+import asyncio
+import time
+
+import pytest
+
+from iniesta.exceptions import HandlerTimeout
+from iniesta.sqs import SQSMessage
+from iniesta.sqs.limits import HandlerLimiter, TokenBucket
+from iniesta.sqs.priority import PriorityDispatcher
+from iniesta.sqs.replay import LocalLockManager
+
+
+class TestTokenBucket:
+    def test_invalid_rate(self):
+        with pytest.raises(ValueError):
+            TokenBucket(0)
+
+    async def test_rate(self):
+        bucket = TokenBucket(50, capacity=1)
+
+        start = time.monotonic()
+        for _ in range(6):
+            await bucket.acquire()
+
+        # the first token is available right away, the rest at 50 per second
+        assert time.monotonic() - start == pytest.approx(0.1, abs=0.05)
+
+    async def test_concurrent_waiters(self):
+        bucket = TokenBucket(100, capacity=1)
+        await bucket.acquire()
+
+        start = time.monotonic()
+        await asyncio.gather(*[bucket.acquire() for _ in range(5)])
+
+        assert time.monotonic() - start == pytest.approx(0.05, abs=0.03)
+        assert bucket.wait_time() > 0
+
+
+class TestHandlerLimiter:
+    async def test_max_concurrency(self):
+        limiter = HandlerLimiter(max_concurrency=2)
+
+        assert await limiter.acquire(1)
+        assert await limiter.acquire(1)
+        assert limiter.saturation == 1
+
+        waiter = asyncio.ensure_future(limiter.acquire(1))
+        await asyncio.sleep(0)
+        assert limiter.waiting == 1
+
+        limiter.release()
+        assert await waiter is True
+        assert limiter.metrics["held"] == 1
+        assert limiter.in_flight == 2
+
+    async def test_timeout(self):
+        limiter = HandlerLimiter(max_concurrency=1)
+        assert await limiter.acquire(1)
+
+        assert await limiter.acquire(0.01) is False
+        assert limiter.released == 1
+        assert limiter.waiting == 0
+
+        limiter.release()
+        assert await limiter.acquire(0.01) is True
+
+    async def test_rate_limit_releases_without_waiting(self):
+        limiter = HandlerLimiter(rate_limit=1)
+        assert await limiter.acquire(0.5)
+
+        start = time.monotonic()
+        assert await limiter.acquire(0.5) is False
+        assert time.monotonic() - start < 0.1
+        assert limiter.released == 1
+
+
+class TestLimitedHandler:
+    @pytest.fixture()
+    def sqs_client(self, sqs_client):
+        sqs_client.handler_limit_max_hold = 0.05
+        yield sqs_client
+
+    def test_register_invalid(self, sqs_client):
+        with pytest.raises(ValueError):
+            sqs_client.add_handler(lambda m: None, "a", max_concurrency=0)
+        with pytest.raises(ValueError):
+            sqs_client.add_handler(lambda m: None, "b", rate_limit=-1)
+
+    async def test_limited_messages_are_held_and_released(
+        self, sqs_client, monkeypatch
+    ):
+        release = asyncio.Event()
+
+        @sqs_client.handler(max_concurrency=1)
+        def slow(message):
+            pass
+
+        handled = []
+        released = []
+
+        async def handle_and_delete(client, message):
+            handled.append(message.message_id)
+            await release.wait()
+            return True
+
+        async def change_visibility(client, messages, visibility_timeout):
+            assert visibility_timeout == sqs_client.handler_limit_max_hold
+            released.extend(m.message_id for m in messages)
+
+        monkeypatch.setattr(sqs_client, "_handle_and_delete", handle_and_delete)
+        monkeypatch.setattr(sqs_client, "change_visibility", change_visibility)
+
+        messages = []
+        for i in range(2):
+            message = SQSMessage(sqs_client, "{}")
+            message.message_id = str(i)
+            messages.append(message)
+
+        tasks = [
+            asyncio.ensure_future(sqs_client._process_message(None, m))
+            for m in messages
+        ]
+        await asyncio.sleep(0.1)
+
+        # the second message waited for the first and was released
+        assert handled == ["0"]
+        assert released == ["1"]
+
+        release.set()
+        assert await asyncio.gather(*tasks) == [True, False]
+
+        metrics = sqs_client.metrics["handler_limits"][slow.__qualname__]
+        assert metrics["released"] == 1
+        assert metrics["in_flight"] == 0
+
+    async def test_receive_pauses_while_limits_are_saturated(
+        self, sqs_client, monkeypatch
+    ):
+        sqs_client.handler_limit_max_hold = 5
+        sqs_client.handler_limit_max_waiting = 2
+        release = asyncio.Event()
+
+        @sqs_client.handler(max_concurrency=1)
+        def slow(message):
+            pass
+
+        async def handle_and_delete(client, message):
+            await release.wait()
+            return True
+
+        monkeypatch.setattr(sqs_client, "_handle_and_delete", handle_and_delete)
+
+        received = []
+
+        class FakeClient:
+            async def receive_message(self, **kwargs):
+                received.append(kwargs["MaxNumberOfMessages"])
+                return {}
+
+        routed = []
+        for i in range(3):
+            message = SQSMessage(sqs_client, "{}")
+            message.message_id = str(i)
+            key, options = sqs_client._handler_options(message.event)
+            routed.append((key, options, message))
+
+        await sqs_client._route(None, routed)
+        await asyncio.sleep(0.01)
+        assert sqs_client.metrics["handler_limit_waiting"] == 2
+
+        receive = asyncio.ensure_future(sqs_client._receive(FakeClient()))
+        await asyncio.sleep(0.05)
+        assert not receive.done()
+        assert received == []
+
+        # the first message is handled, the second takes its place
+        release.set()
+        await asyncio.wait_for(receive, 1)
+        assert received == [1]
+
+        await sqs_client._finish()
+        assert sqs_client.metrics["handler_limit_waiting"] == 0
+
+    async def test_dispatcher_counts_limited_messages(
+        self, sqs_client, monkeypatch
+    ):
+        sqs_client.handler_limit_max_hold = 5
+        sqs_client.dispatcher = PriorityDispatcher(4)
+        release = asyncio.Event()
+
+        @sqs_client.handler(max_concurrency=1)
+        def slow(message):
+            pass
+
+        async def handle_and_delete(client, message):
+            await release.wait()
+            return True
+
+        monkeypatch.setattr(sqs_client, "_handle_and_delete", handle_and_delete)
+
+        routed = []
+        for i in range(3):
+            message = SQSMessage(sqs_client, "{}")
+            message.message_id = str(i)
+            key, options = sqs_client._handler_options(message.event)
+            routed.append((key, options, message))
+
+        await sqs_client._route(None, routed)
+        await asyncio.sleep(0.01)
+
+        # the messages waiting for the handler's limit take up the capacity
+        assert sqs_client.dispatcher.parked == 2
+        assert sqs_client.dispatcher.capacity == 2
+
+        release.set()
+        await sqs_client._finish()
+        assert sqs_client.dispatcher.parked == 0
+        assert sqs_client.dispatcher.capacity == 4
+
+
+class TestHandlerTimeout:
+    @pytest.fixture()
+    def sqs_client(self, sqs_client):
+        sqs_client.lock_manager = LocalLockManager()
+        yield sqs_client
+
+    def _message(self, client):
+        message = SQSMessage(client, "{}")
+        message.message_id = "a"
+        return message
+
+    def test_register_invalid(self, sqs_client):
+        with pytest.raises(ValueError):
+            sqs_client.add_handler(lambda m: None, timeout=0)
+
+    async def test_timeout(self, sqs_client, monkeypatch):
+        cancelled = asyncio.Event()
+        released = []
+
+        @sqs_client.handler(timeout=0.01)
+        async def hangs(message):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        async def change_visibility(client, messages, visibility_timeout):
+            released.append((messages, visibility_timeout))
+
+        monkeypatch.setattr(sqs_client, "change_visibility", change_visibility)
+        message = self._message(sqs_client)
+
+        assert await sqs_client._process_message(None, message) is False
+
+        assert cancelled.is_set()
+        assert not sqs_client.lock_manager._locked
+        assert released == [([message], 0)]
+        assert sqs_client.metrics["handler_timeouts"] == 1
+        assert sqs_client.metrics["handler_errors"] == 0
+
+    async def test_default_timeout(self, sqs_client):
+        sqs_client.handler_timeout = 0.01
+
+        @sqs_client.handler
+        async def hangs(message):
+            await asyncio.sleep(10)
+
+        with pytest.raises(HandlerTimeout) as exc_info:
+            await sqs_client.handle_message(self._message(sqs_client))
+
+        assert exc_info.value.handler is hangs
+
+    async def test_errors_are_counted_separately(self, sqs_client):
+        @sqs_client.handler
+        async def fails(message):
+            raise RuntimeError("failed")
+
+        assert (
+            await sqs_client._process_message(None, self._message(sqs_client))
+            is False
+        )
+
+        assert sqs_client.metrics["handler_errors"] == 1
+        assert sqs_client.metrics["handler_timeouts"] == 0
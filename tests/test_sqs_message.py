@@ -51,6 +51,66 @@ class TestSQSMessage(SQSInfra):
 
         assert message1 == message2
 
+    def test_message_group_id(self, sqs_client):
+        message = SQSMessage(sqs_client, "message")
+
+        assert message.message_group_id is None
+        assert message.message_deduplication_id is None
+
+        message.message_group_id = "group"
+        message.message_deduplication_id = "dedup"
+
+        assert message["MessageGroupId"] == "group"
+        assert message["MessageDeduplicationId"] == "dedup"
+
+        with pytest.raises(ValueError):
+            message.message_group_id = ""
+
+        with pytest.raises(ValueError):
+            message.message_deduplication_id = "a" * 129
+
+    def test_message_group_id_from_sqs(self, sqs_client):
+        message = SQSMessage.from_sqs(
+            sqs_client,
+            {
+                "MessageId": "message_id",
+                "ReceiptHandle": "receipt_handle",
+                "MD5OfBody": "md5",
+                "Body": "{}",
+                "Attributes": {
+                    "MessageGroupId": "group",
+                    "MessageDeduplicationId": "dedup",
+                },
+            },
+        )
+
+        assert message.message_group_id == "group"
+        assert message.message_deduplication_id == "dedup"
+
+    def test_message_attributes_from_sqs(self, sqs_client):
+        message = SQSMessage.from_sqs(
+            sqs_client,
+            {
+                "MessageId": "message_id",
+                "ReceiptHandle": "receipt_handle",
+                "MD5OfBody": "md5",
+                "Body": "{}",
+                "Attributes": {},
+                "MessageAttributes": {
+                    "version": {"DataType": "Number", "StringValue": "1"}
+                },
+            },
+        )
+
+        assert message.message_attributes == {"version": "1"}
+        assert message.message_attributes is message.message_attributes
+
+        message.add_attribute("user_id", "a")
+        assert message.message_attributes == {"version": "1", "user_id": "a"}
+
+        message["MessageAttributes"] = {}
+        assert message.message_attributes == {}
+
     def test_delay_seconds(self, sqs_client):
         message = SQSMessage(sqs_client, "message")
 
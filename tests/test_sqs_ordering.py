@@ -0,0 +1,149 @@
+import asyncio
+
+import pytest
+import ujson as json
+
+from iniesta.sqs import SQSMessage
+from iniesta.sqs.ordering import KeyedExecutor, ordering_key_value
+
+
+@pytest.mark.usefixtures("iniesta_config")
+class TestOrderingKeyValue:
+    def _message(self, body, **attributes):
+        message = SQSMessage(None, json.dumps(body))
+        for name, value in attributes.items():
+            message.add_attribute(name, value)
+        return message
+
+    def test_attribute(self):
+        message = self._message({"order_id": "body"}, order_id="attribute")
+        assert ordering_key_value(message, "order_id") == "attribute"
+
+    def test_body_field(self):
+        message = self._message({"order_id": 12})
+        assert ordering_key_value(message, "order_id") == "12"
+
+    def test_nested_body_field(self):
+        message = self._message({"order": {"id": "a"}})
+        assert ordering_key_value(message, "order.id") == "a"
+
+    @pytest.mark.parametrize(
+        "body", [{"order": None}, {"user_id": 1}, ["order_id"], "order_id"]
+    )
+    def test_missing(self, body):
+        message = self._message(body)
+        assert ordering_key_value(message, "order") is None
+
+
+class TestKeyedExecutor:
+    async def test_serial_per_key(self):
+        executor = KeyedExecutor()
+        running = {"a": 0, "b": 0}
+        overlap = []
+        order = []
+
+        async def work(key, number):
+            running[key] += 1
+            overlap.append(sum(running.values()))
+            assert running[key] == 1
+            await asyncio.sleep(0.01 * (3 - number))
+            order.append((key, number))
+            running[key] -= 1
+
+        tasks = [
+            executor.submit(key, work, key, number)
+            for number in range(3)
+            for key in ("a", "b")
+        ]
+        assert executor.lanes == 2
+
+        await asyncio.gather(*tasks)
+
+        assert [n for k, n in order if k == "a"] == [0, 1, 2]
+        assert [n for k, n in order if k == "b"] == [0, 1, 2]
+        # different keys run at the same time
+        assert max(overlap) == 2
+        # idle lanes are removed
+        assert executor.lanes == 0
+        assert executor.metrics["ordering_submitted"] == 6
+
+    async def test_failure_does_not_block_lane(self):
+        executor = KeyedExecutor()
+
+        async def fail():
+            raise RuntimeError("failed")
+
+        async def succeed():
+            return "done"
+
+        first = executor.submit("a", fail)
+        second = executor.submit("a", succeed)
+
+        assert await second == "done"
+        with pytest.raises(RuntimeError):
+            await first
+
+
+class TestOrderedHandler:
+    def test_register(self, sqs_client):
+        @sqs_client.handler("OrderPaid", ordering_key="order_id")
+        def handler(message):
+            pass
+
+        assert (
+            sqs_client.handler_options["OrderPaid"].ordering_key == "order_id"
+        )
+
+    def test_register_invalid(self, sqs_client):
+        with pytest.raises(ValueError):
+            sqs_client.add_handler(lambda m: None, "OrderPaid", ordering_key="")
+
+    async def test_process_in_order(self, sqs_client, monkeypatch):
+        from insanic.conf import settings
+
+        sqs_client.add_handler(
+            lambda m: None,
+            ["OrderPaid", "OrderShipped"],
+            ordering_key="order_id",
+        )
+        handled = []
+
+        async def process_message(client, message):
+            body = message.body
+            # later messages finish first if they are not ordered
+            await asyncio.sleep(0.01 * (4 - body["step"]))
+            handled.append((body["order_id"], body["step"]))
+            return True
+
+        monkeypatch.setattr(sqs_client, "_process_message", process_message)
+
+        messages = []
+        for step, (event, order_id) in enumerate(
+            [
+                ("OrderPaid", 1),
+                ("OrderPaid", 2),
+                ("OrderShipped", 1),
+                ("OrderShipped", 2),
+            ]
+        ):
+            messages.append(
+                {
+                    "MessageId": str(step),
+                    "ReceiptHandle": str(step),
+                    "MD5OfBody": "",
+                    "Attributes": {},
+                    "Body": json.dumps({"order_id": order_id, "step": step}),
+                    "MessageAttributes": {
+                        settings.INIESTA_SNS_EVENT_KEY: {
+                            "DataType": "String",
+                            "StringValue": event,
+                        }
+                    },
+                }
+            )
+
+        await sqs_client._process(None, messages)
+
+        assert [s for o, s in handled if o == 1] == [0, 2]
+        assert [s for o, s in handled if o == 2] == [1, 3]
+        assert sqs_client.metrics["ordering_lanes"] == 0
@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from iniesta.sqs.priority import PriorityDispatcher
+
+
+class TestPriorityDispatcher:
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            PriorityDispatcher(0)
+        with pytest.raises(ValueError):
+            PriorityDispatcher(1, aging=-1)
+
+    async def test_priority_order(self):
+        dispatcher = PriorityDispatcher(1, aging=0)
+        order = []
+
+        async def work(name, priority):
+            async with dispatcher.slot(priority):
+                order.append(name)
+                await asyncio.sleep(0)
+
+        await dispatcher.acquire()
+        tasks = [asyncio.ensure_future(work("bulk", 0)) for _ in range(3)] + [
+            asyncio.ensure_future(work("urgent", 10)) for _ in range(3)
+        ]
+        await asyncio.sleep(0)
+        assert dispatcher.waiting == 6
+        assert dispatcher.capacity == 0
+
+        dispatcher.release()
+        await asyncio.gather(*tasks)
+
+        assert order == ["urgent"] * 3 + ["bulk"] * 3
+        assert dispatcher.in_flight == 0
+        assert dispatcher.metrics["dispatched"] == 7
+
+    async def test_aging(self):
+        dispatcher = PriorityDispatcher(1, aging=100)
+        order = []
+
+        async def work(name, priority):
+            async with dispatcher.slot(priority):
+                order.append(name)
+
+        await dispatcher.acquire()
+        old = asyncio.ensure_future(work("old", 0))
+        await asyncio.sleep(0.05)
+        # the old message gained about 5 priority while waiting
+        new = asyncio.ensure_future(work("new", 2))
+        await asyncio.sleep(0)
+
+        dispatcher.release()
+        await asyncio.gather(old, new)
+
+        assert order == ["old", "new"]
+
+    async def test_wait_for_capacity(self):
+        dispatcher = PriorityDispatcher(1)
+        await dispatcher.acquire()
+
+        waiter = asyncio.ensure_future(dispatcher.acquire())
+        await asyncio.sleep(0)
+
+        capacity = asyncio.ensure_future(dispatcher.wait_for_capacity())
+        await asyncio.sleep(0)
+        assert not capacity.done()
+
+        dispatcher.release()
+        await waiter
+        await asyncio.wait_for(capacity, 1)
+
+    async def test_cancelled_waiter(self):
+        dispatcher = PriorityDispatcher(1)
+        await dispatcher.acquire()
+
+        waiter = asyncio.ensure_future(dispatcher.acquire(5))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0)
+
+        assert dispatcher.waiting == 0
+        assert dispatcher.capacity == 1
+
+        dispatcher.release()
+        assert dispatcher.in_flight == 0
+
+    async def test_park(self):
+        dispatcher = PriorityDispatcher(2)
+
+        dispatcher.park()
+        assert dispatcher.capacity == 1
+
+        dispatcher.park()
+        capacity = asyncio.ensure_future(dispatcher.wait_for_capacity())
+        await asyncio.sleep(0)
+        assert not capacity.done()
+        assert dispatcher.metrics["dispatch_parked"] == 2
+
+        dispatcher.unpark()
+        await asyncio.wait_for(capacity, 1)
+        assert dispatcher.capacity == 1
@@ -0,0 +1,221 @@
+import asyncio
+
+import pytest
+import ujson as json
+
+from iniesta.memory import InMemorySQSClient, client_error
+from iniesta.sqs import SQSClient
+from iniesta.sqs.budget import InFlightBudget
+from iniesta.sqs.redrive import event_matches, redrive
+
+from .infra import received, send_messages
+
+
+def indexes(messages):
+    return sorted(json.loads(m.body)["index"] for m in messages)
+
+
+class TestRedrive:
+    @pytest.fixture()
+    def queues(self, memory_session):
+        backend = memory_session.backend
+        queues = {
+            "dlq": backend.create_queue("dlq"),
+            "dlq.fifo": backend.create_queue("dlq.fifo", {"FifoQueue": "true"}),
+            "main": backend.create_queue("main"),
+            "main.fifo": backend.create_queue(
+                "main.fifo", {"FifoQueue": "true"}
+            ),
+        }
+        SQSClient.queue_urls.update(
+            {name: queue.url for name, queue in queues.items()}
+        )
+        yield queues
+
+    def _fail_sends(self, queue, monkeypatch, fail_indexes):
+        send = queue.send
+
+        def fail(body, *args, **kwargs):
+            if json.loads(body)["index"] in fail_indexes:
+                raise client_error("InternalError", "Oops", "SendMessageBatch")
+            return send(body, *args, **kwargs)
+
+        monkeypatch.setattr(queue, "send", fail)
+
+    def test_event_matches(self, iniesta_config):
+        from iniesta.sqs import SQSMessage
+
+        message = SQSMessage.from_sqs(None, received(0))
+
+        assert event_matches(message, [])
+        assert event_matches(message, ["UserCreated.user"])
+        assert event_matches(message, ["User*.user", "Other"])
+        assert not event_matches(message, ["UserDeleted.user"])
+
+    async def test_redrive(self, queues):
+        sent = send_messages(queues["dlq"], range(25))
+
+        stats = await redrive(
+            SQSClient(queue_name="dlq"),
+            SQSClient(queue_name="main"),
+            idle_timeout=0.05,
+        )
+
+        moved = list(queues["main"].messages.values())
+        assert indexes(moved) == list(range(25))
+        assert moved[0].message_attributes == sent[0].message_attributes
+        assert not queues["dlq"].messages
+        assert stats.moved == 25
+
+    async def test_failed_sends_are_not_deleted(self, queues, monkeypatch):
+        send_messages(queues["dlq"], range(5))
+        self._fail_sends(queues["main"], monkeypatch, {1, 3})
+
+        stats = await redrive(
+            SQSClient(queue_name="dlq"),
+            SQSClient(queue_name="main"),
+            max_messages=5,
+        )
+
+        assert indexes(queues["dlq"].messages.values()) == [1, 3]
+        assert indexes(queues["main"].messages.values()) == [0, 2, 4]
+        assert stats.moved == 3
+        assert stats.failed == 2
+
+    async def test_send_errors(self, queues, monkeypatch):
+        send_messages(queues["dlq"], range(50))
+
+        async def send_message_batch(self, **kwargs):
+            raise RuntimeError("Oops")
+
+        monkeypatch.setattr(
+            InMemorySQSClient, "send_message_batch", send_message_batch
+        )
+
+        stats = await asyncio.wait_for(
+            redrive(
+                SQSClient(queue_name="dlq"),
+                SQSClient(queue_name="main"),
+                concurrency=1,
+                idle_timeout=0.05,
+            ),
+            5,
+        )
+
+        assert len(queues["dlq"].messages) == 50
+        assert stats.failed == 50
+        assert stats.moved == 0
+
+    async def test_partial_batches_are_sent(self, queues):
+        send_messages(queues["dlq"], range(3))
+
+        task = asyncio.ensure_future(
+            redrive(
+                SQSClient(queue_name="dlq"),
+                SQSClient(queue_name="main"),
+                idle_timeout=1,
+            )
+        )
+        await asyncio.sleep(0.3)
+
+        # sent and deleted before the redrive runs out of messages
+        assert indexes(queues["main"].messages.values()) == [0, 1, 2]
+        assert not queues["dlq"].messages
+        assert not task.done()
+
+        stats = await task
+        assert stats.moved == 3
+
+    async def test_event_filter(self, queues, sqs_requests):
+        send_messages(queues["dlq"], [0, 2])
+        send_messages(queues["dlq"], [1], "UserDeleted.user")
+
+        stats = await redrive(
+            SQSClient(queue_name="dlq"),
+            SQSClient(queue_name="main"),
+            events=["UserCreated.*"],
+            max_messages=3,
+        )
+
+        assert indexes(queues["main"].messages.values()) == [0, 2]
+        # the skipped message is visible again right away
+        assert indexes(queues["dlq"].take(10, 30)) == [1]
+        assert [
+            [e["VisibilityTimeout"] for e in r["Entries"]]
+            for r in sqs_requests["change_message_visibility_batch"]
+        ] == [[0]]
+        assert stats.skipped == 1
+        assert stats.moved == 2
+
+    async def test_small_budget(self, queues, monkeypatch, sqs_requests):
+        for i in range(30):
+            send_messages(
+                queues["dlq"],
+                [i],
+                "UserDeleted.user" if i % 3 else "UserCreated.user",
+            )
+        self._fail_sends(queues["main"], monkeypatch, {0})
+        source = SQSClient(queue_name="dlq")
+        # fits about 12 messages, so skipped and failed messages must
+        # give back their budget for the redrive to finish
+        source.budget = InFlightBudget(150)
+
+        stats = await redrive(
+            source,
+            SQSClient(queue_name="main"),
+            events=["UserCreated.*"],
+            idle_timeout=0.1,
+        )
+
+        assert stats.received == 30
+        assert stats.skipped == 20
+        assert stats.failed == 1
+        assert stats.moved == 9
+        assert [
+            len(r["Entries"])
+            for r in sqs_requests["change_message_visibility_batch"]
+        ] == [10, 10]
+        assert len(queues["dlq"].take(30, 30)) == 20
+        assert source.budget.bytes == 0
+
+    async def test_skipped_messages_received_again(self, queues, monkeypatch):
+        # the visibility timeout is shorter than the redrive
+        monkeypatch.setattr(type(queues["dlq"]), "visibility_timeout", 0.2)
+        send_messages(queues["dlq"], [0, 2])
+        send_messages(queues["dlq"], [1], "UserDeleted.user")
+
+        stats = await asyncio.wait_for(
+            redrive(
+                SQSClient(queue_name="dlq"),
+                SQSClient(queue_name="main"),
+                events=["UserCreated.*"],
+                idle_timeout=0.5,
+            ),
+            5,
+        )
+
+        assert stats.received == 3
+        assert stats.skipped == 1
+        assert stats.moved == 2
+        # made visible again with the receipt of its latest receive
+        (skipped,) = queues["dlq"].messages.values()
+        assert skipped.receive_count > 1
+        assert not skipped.in_flight
+
+    async def test_fifo_target(self, queues):
+        queues["dlq.fifo"].send(
+            json.dumps({"index": 0}),
+            received(0)["MessageAttributes"],
+            group_id="user-1",
+            deduplication_id="abc",
+        )
+
+        await redrive(
+            SQSClient(queue_name="dlq.fifo"),
+            SQSClient(queue_name="main.fifo"),
+            max_messages=1,
+        )
+
+        (message,) = queues["main.fifo"].messages.values()
+        assert message.group_id == "user-1"
+        assert message.deduplication_id == "abc"
@@ -0,0 +1,150 @@
+import asyncio
+import gzip
+import threading
+
+import pytest
+import ujson as json
+
+from iniesta.sqs import SQSClient
+from iniesta.sqs.replay import LocalLockManager, replay
+from iniesta.sqs.trace import TraceRecorder, read_trace
+
+from .infra import received
+
+
+@pytest.mark.usefixtures("iniesta_config")
+class TestTraceRecorder:
+    def test_invalid(self, tmp_path):
+        with pytest.raises(ValueError):
+            TraceRecorder(str(tmp_path / "trace.gz"), sample_rate=0)
+
+    def test_record(self, tmp_path):
+        path = str(tmp_path / "trace.ndjson.gz")
+        recorder = TraceRecorder(path)
+
+        recorder.record([received(0), received(1)])
+        recorder.close()
+        recorder.record([received(2)])
+        recorder.close()
+
+        records = list(read_trace(path))
+        assert [r["message"]["MessageId"] for r in records] == ["0", "1", "2"]
+        assert records[0]["received_at"] == records[1]["received_at"]
+        assert recorder.recorded == 3
+
+    def test_writes_in_the_background(self, tmp_path, monkeypatch):
+        path = str(tmp_path / "trace.ndjson.gz")
+        threads = []
+        gzip_open = gzip.open
+
+        def open_trace(*args, **kwargs):
+            threads.append(threading.current_thread())
+            return gzip_open(*args, **kwargs)
+
+        monkeypatch.setattr("iniesta.sqs.trace.gzip.open", open_trace)
+
+        recorder = TraceRecorder(path)
+        recorder.flush_every = 2
+        recorder.record([received(0)])
+        assert recorder._executor is None
+
+        recorder.record([received(1), received(2)])
+        recorder.close()
+
+        assert len(threads) == 1
+        assert threads[0] is not threading.current_thread()
+        assert [r["message"]["MessageId"] for r in read_trace(path)] == [
+            "0",
+            "1",
+            "2",
+        ]
+
+    def test_sample_rate(self, tmp_path, monkeypatch):
+        path = str(tmp_path / "trace.ndjson.gz")
+        samples = iter([0.1, 0.9, 0.2, 0.6])
+        monkeypatch.setattr(
+            "iniesta.sqs.trace.random.random", lambda: next(samples)
+        )
+
+        recorder = TraceRecorder(path, sample_rate=0.5)
+        recorder.record([received(i) for i in range(4)])
+        recorder.close()
+
+        assert [r["message"]["MessageId"] for r in read_trace(path)] == [
+            "0",
+            "2",
+        ]
+
+
+@pytest.mark.usefixtures("reset_sqs_client")
+class TestReplay:
+    def _trace(self, tmp_path, receives):
+        path = str(tmp_path / "trace.ndjson.gz")
+        with gzip.open(path, "wb") as file:
+            for received_at, messages in receives:
+                for message in messages:
+                    file.write(
+                        json.dumps(
+                            {"received_at": received_at, "message": message}
+                        ).encode()
+                        + b"\n"
+                    )
+        return path
+
+    async def test_local_lock_manager(self):
+        from aioredlock import LockError
+
+        manager = LocalLockManager()
+        lock = await manager.lock("a")
+        with pytest.raises(LockError):
+            await manager.lock("a")
+
+        await manager.unlock(lock)
+        assert (await manager.lock("a")).valid
+
+    async def test_replay(self, tmp_path):
+        handled = []
+
+        @SQSClient.handler("UserCreated.user")
+        async def created(message):
+            handled.append(message.body["index"])
+
+        @SQSClient.handler("UserDeleted.user")
+        def deleted(message):
+            raise ValueError()
+
+        path = self._trace(
+            tmp_path,
+            [
+                (1.0, [received(i) for i in range(10)]),
+                (2.0, [received(10), received(11, "UserDeleted.user")]),
+            ],
+        )
+
+        stats = await replay(path)
+
+        assert sorted(handled) == list(range(11))
+        assert stats.messages == 12
+        assert stats.transport.deleted == 11
+        assert stats.client.handler_errors == 1
+        assert stats.events["UserCreated.user"]["count"] == 11
+        assert stats.events["UserDeleted.user"]["count"] == 1
+        created_latency = stats.events["UserCreated.user"]
+        assert 0 < created_latency["p50"] <= created_latency["p99"]
+        assert created_latency["p99"] <= created_latency["max"]
+        assert stats.metrics["throughput"] > 0
+
+    async def test_recorded_speed(self, tmp_path):
+        times = []
+
+        @SQSClient.handler("UserCreated.user")
+        async def created(message):
+            times.append(asyncio.get_event_loop().time())
+
+        path = self._trace(
+            tmp_path, [(100.0, [received(0)]), (100.1, [received(1)])]
+        )
+
+        await replay(path, speed=1)
+
+        assert times[1] - times[0] >= 0.09
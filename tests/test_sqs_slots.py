@@ -0,0 +1,41 @@
+import asyncio
+
+from iniesta.sqs.slots import SlotPool
+
+
+class TestSlotPool:
+    async def test_key_order(self):
+        pool = SlotPool(1)
+        order = []
+
+        async def work(key):
+            await pool._acquire(key, key)
+            order.append(key)
+            pool.release()
+
+        await pool._acquire(0)
+        tasks = [asyncio.ensure_future(work(key)) for key in (3, 1, 2, 1)]
+        await asyncio.sleep(0)
+        assert pool.waiting == 4
+
+        pool.release()
+        await asyncio.gather(*tasks)
+
+        assert order == [1, 1, 2, 3]
+        assert pool.in_flight == 0
+
+    async def test_cancelled_after_grant(self):
+        pool = SlotPool(1)
+        await pool._acquire(0)
+
+        waiter = asyncio.ensure_future(pool._acquire(1))
+        await asyncio.sleep(0)
+
+        # the slot is granted and the waiter cancelled before it resumes
+        pool.release()
+        waiter.cancel()
+        await asyncio.sleep(0)
+
+        assert waiter.cancelled()
+        assert pool.in_flight == 0
+        assert pool.waiting == 0
@@ -0,0 +1,138 @@
+import pytest
+
+from iniesta.sqs.budget import InFlightBudget
+from iniesta.sqs.stream import MessageStream
+
+from .infra import send_messages
+
+
+class TestMessageStream:
+    @pytest.mark.parametrize(
+        "kwargs",
+        ({"max_messages": 0}, {"idle_timeout": 0}, {"concurrency": 0}),
+    )
+    def test_invalid(self, sqs_client, kwargs):
+        with pytest.raises(ValueError):
+            MessageStream(sqs_client, **kwargs)
+
+    async def test_ack(self, sqs_client, memory_queue, sqs_requests):
+        send_messages(memory_queue, range(25))
+
+        received = []
+        async with sqs_client.messages(idle_timeout=0.05) as messages:
+            async for message in messages:
+                received.append(message.body["index"])
+                await message.ack()
+
+        assert sorted(received) == list(range(25))
+        assert not memory_queue.messages
+        assert messages.metrics["stream_acked"] == 25
+        assert sqs_requests["close"]
+
+    async def test_max_messages(self, sqs_client, memory_queue, sqs_requests):
+        send_messages(memory_queue, range(30))
+
+        received = []
+        async for message in sqs_client.messages(
+            max_messages=12, concurrency=3
+        ):
+            received.append(message)
+            await message.ack()
+
+        assert len(received) == 12
+        assert (
+            sum(
+                r["MaxNumberOfMessages"]
+                for r in sqs_requests["receive_message"]
+            )
+            == 12
+        )
+        assert len(memory_queue.messages) == 18
+
+    async def test_nack(self, sqs_client, memory_queue, sqs_requests):
+        send_messages(memory_queue, range(3))
+
+        async for message in sqs_client.messages(max_messages=3):
+            await message.nack(delay=30)
+            with pytest.raises(RuntimeError):
+                await message.ack()
+
+        entries = sum(
+            (
+                r["Entries"]
+                for r in sqs_requests["change_message_visibility_batch"]
+            ),
+            [],
+        )
+        assert [e["VisibilityTimeout"] for e in entries] == [30, 30, 30]
+        assert len(memory_queue.messages) == 3
+
+    async def test_invalid_nack(self, sqs_client, memory_queue):
+        send_messages(memory_queue, range(1))
+
+        async with sqs_client.messages(max_messages=1) as messages:
+            async for message in messages:
+                with pytest.raises(ValueError):
+                    await message.nack(delay=-1)
+                await message.ack()
+
+    async def test_close_releases_buffered(self, sqs_client, memory_queue):
+        send_messages(memory_queue, range(10))
+
+        async with sqs_client.messages(concurrency=1) as messages:
+            async for message in messages:
+                await message.ack()
+                break
+
+        # the buffered messages are visible again right away
+        assert len(memory_queue.messages) == 9
+        assert len(memory_queue.take(10, 30)) == 9
+
+        with pytest.raises(RuntimeError):
+            await message.stream.ack(message)
+
+    async def test_close_releases_budget(self, sqs_client, memory_queue):
+        send_messages(memory_queue, range(10))
+        sqs_client.budget = InFlightBudget(50)
+
+        received = []
+        async with sqs_client.messages(idle_timeout=0.05) as messages:
+            async for message in messages:
+                # neither acked nor nacked, but given back before the
+                # budget runs out
+                received.append(message)
+                if len(received) % 2 == 0:
+                    messages.release(received[-2:])
+
+        assert len(received) == 10
+        assert sqs_client.budget.bytes == 0
+
+    async def test_close_releases_unsettled_budget(
+        self, sqs_client, memory_queue, sqs_requests
+    ):
+        send_messages(memory_queue, range(3))
+        sqs_client.budget = InFlightBudget(1000)
+
+        async with sqs_client.messages(max_messages=3) as messages:
+            async for message in messages:
+                pass
+            assert sqs_client.budget.messages == 3
+
+        assert sqs_client.budget.bytes == 0
+        assert len(memory_queue.messages) == 3
+        assert not sqs_requests["delete_message_batch"]
+        assert not sqs_requests["change_message_visibility_batch"]
+
+    async def test_receive_error(
+        self, sqs_client, memory_queue, sqs_requests, monkeypatch
+    ):
+        async def receive(*args, **kwargs):
+            raise ConnectionError()
+
+        monkeypatch.setattr(memory_queue, "receive", receive)
+
+        with pytest.raises(ConnectionError):
+            async for _ in sqs_client.messages():
+                pass  # pragma: no cover
+
+        assert sqs_requests["close"]
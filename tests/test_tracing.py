@@ -0,0 +1,195 @@
+import time
+
+import pytest
+
+from insanic.conf import settings
+
+from iniesta.bench import in_memory
+from iniesta.metrics import registry
+from iniesta.sessions import BotoSession
+from iniesta.sns import SNSClient
+from iniesta.sqs import SQSClient
+from iniesta.sqs.message import SQSMessage
+from iniesta.sqs.replay import LocalLockManager
+from iniesta.tracing import current_trace_id, new_trace_id, trace
+
+
+def attribute(message, key):
+    return message.message_attributes.get(key, {}).get("StringValue")
+
+
+class TestTrace:
+    def test_trace(self):
+        assert current_trace_id() is None
+
+        with trace("parent"):
+            assert current_trace_id() == "parent"
+            with trace(None):
+                assert current_trace_id() is None
+            assert current_trace_id() == "parent"
+
+        assert current_trace_id() is None
+
+    def test_new_trace_id(self):
+        assert new_trace_id() != new_trace_id()
+
+
+@pytest.mark.usefixtures("iniesta_config")
+class TestCreateMessage:
+    @pytest.fixture()
+    def sns_client(self, insanic_application):
+        yield SNSClient("arn:aws:sns:us-east-1:000000000000:topic")
+
+    def test_published_at(self, sns_client):
+        before = time.time()
+        message = sns_client.create_message(event="Created", message={})
+
+        published_at = float(
+            attribute(message, settings.INIESTA_PUBLISHED_AT_KEY)
+        )
+        assert before <= published_at <= time.time()
+        assert settings.INIESTA_TRACE_ID_KEY not in message.message_attributes
+
+    def test_published_at_disabled(self, sns_client, monkeypatch):
+        monkeypatch.setattr(settings, "INIESTA_PUBLISHED_AT_KEY", None)
+
+        message = sns_client.create_message(event="Created", message={})
+
+        assert list(message.message_attributes) == [
+            settings.INIESTA_SNS_EVENT_KEY,
+            "version",
+        ]
+
+    def test_published_at_argument(self, sns_client):
+        message = sns_client.create_message(
+            event="Created", message={}, published_at=False
+        )
+
+        assert (
+            settings.INIESTA_PUBLISHED_AT_KEY not in message.message_attributes
+        )
+
+    def test_too_many_attributes(self, sns_client):
+        attributes = {f"attribute_{i}": i for i in range(8)}
+
+        with pytest.raises(ValueError, match="too many attributes"):
+            sns_client.create_message(event="Created", message={}, **attributes)
+
+        message = sns_client.create_message(
+            event="Created", message={}, published_at=False, **attributes
+        )
+        assert len(message.message_attributes) == 10
+
+    def test_trace_id(self, sns_client):
+        message = sns_client.create_message(
+            event="Created", message={}, trace_id="abc"
+        )
+
+        assert attribute(message, settings.INIESTA_TRACE_ID_KEY) == "abc"
+
+    def test_inherits_trace_id(self, sns_client):
+        with trace("parent"):
+            inherited = sns_client.create_message(event="Created", message={})
+            explicit = sns_client.create_message(
+                event="Created", message={}, trace_id="other"
+            )
+
+        assert attribute(inherited, settings.INIESTA_TRACE_ID_KEY) == "parent"
+        assert attribute(explicit, settings.INIESTA_TRACE_ID_KEY) == "other"
+
+
+@pytest.mark.usefixtures("iniesta_config")
+class TestSQSMessage:
+    def _message(self, attributes=None, message_attributes=None):
+        return SQSMessage.from_sqs(
+            None,
+            {
+                "Body": "{}",
+                "MessageId": "1",
+                "ReceiptHandle": "1",
+                "MD5OfBody": "",
+                "Attributes": attributes or {},
+                "MessageAttributes": message_attributes or {},
+            },
+        )
+
+    def test_published_at(self, insanic_application):
+        message = self._message(
+            {"SentTimestamp": "1600000000000"},
+            {
+                settings.INIESTA_PUBLISHED_AT_KEY: {
+                    "DataType": "Number",
+                    "StringValue": "1599999999.123456",
+                },
+                settings.INIESTA_TRACE_ID_KEY: {
+                    "DataType": "String",
+                    "StringValue": "abc",
+                },
+            },
+        )
+
+        assert message.published_at == 1599999999.123456
+        assert message.trace_id == "abc"
+
+    def test_sent_timestamp(self, insanic_application):
+        message = self._message({"SentTimestamp": "1600000000123"})
+
+        assert message.published_at == 1600000000.123
+        assert message.trace_id is None
+
+    def test_unknown(self, insanic_application):
+        assert self._message().published_at is None
+
+
+@pytest.mark.usefixtures("reset_sqs_client")
+class TestHandlerTrace:
+    @pytest.fixture()
+    async def resources(self, insanic_application):
+        yield in_memory()
+
+    @pytest.fixture()
+    async def sqs_client(self, resources):
+        sqs_client = await SQSClient.initialize(
+            queue_name=resources["queue_name"]
+        )
+        sqs_client.lock_manager = LocalLockManager()
+        yield sqs_client
+
+    async def _receive(self, sqs_client):
+        async with BotoSession.get_session().create_client(
+            "sqs", region_name="us-east-1"
+        ) as client:
+            response = await client.receive_message(
+                QueueUrl=sqs_client.queue_url,
+                AttributeNames=["All"],
+                MessageAttributeNames=["All"],
+            )
+        return SQSMessage.from_sqs(sqs_client, response["Messages"][0])
+
+    @pytest.mark.parametrize("timeout", [None, 1])
+    async def test_child_inherits_trace_id(
+        self, resources, sqs_client, timeout
+    ):
+        sns_client = SNSClient(resources["topic_arn"])
+        parent = sns_client.create_message(
+            event="Parent", message={}, trace_id="t1"
+        )
+        await parent.publish()
+
+        async def handler(message):
+            await sns_client.create_message(event="Child", message={}).publish()
+
+        sqs_client.add_handler(handler, parent.event, timeout=timeout)
+        lag = registry.histogram("iniesta_sqs_lag_seconds").labels(
+            resources["queue_name"], parent.event
+        )
+        before = lag.count
+
+        await sqs_client.handle_message(await self._receive(sqs_client))
+
+        child = await self._receive(sqs_client)
+        assert child.event.startswith("Child")
+        assert child.trace_id == "t1"
+        assert lag.count - before == 1
+        assert lag.max < 5
+        assert current_trace_id() is None
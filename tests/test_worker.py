@@ -0,0 +1,75 @@
+import os
+import signal
+import threading
+import time
+
+import click
+import pytest
+
+from iniesta.cli import parse_queues
+from iniesta.worker import WorkerSupervisor
+
+
+def exit_immediately(queues, drain_timeout):
+    os._exit(3)
+
+
+def wait_for_sigterm(queues, drain_timeout):
+    stopping = []
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *args: stopping.append(True))
+    while not stopping:
+        time.sleep(0.01)
+
+
+class TestWorkerSupervisor:
+    def _stop_after(self, seconds):
+        timer = threading.Timer(
+            seconds, lambda: os.kill(os.getpid(), signal.SIGTERM)
+        )
+        timer.start()
+        return timer
+
+    def test_invalid_processes(self):
+        with pytest.raises(ValueError):
+            WorkerSupervisor({"queue": 1}, processes=0)
+
+    def test_restarts_crashed_workers(self):
+        supervisor = WorkerSupervisor(
+            {"queue": 1}, processes=1, drain_timeout=1, target=exit_immediately,
+        )
+        supervisor.check_interval = 0.05
+        supervisor.min_uptime = 0
+
+        self._stop_after(0.5)
+        supervisor.run()
+
+        assert supervisor.stopping is True
+        assert supervisor.restarts > 1
+
+    def test_forwards_sigterm(self):
+        supervisor = WorkerSupervisor(
+            {"queue": 1}, processes=2, drain_timeout=5, target=wait_for_sigterm,
+        )
+        supervisor.check_interval = 0.05
+
+        self._stop_after(0.5)
+        start = time.monotonic()
+        supervisor.run()
+
+        assert time.monotonic() - start < 5
+        assert supervisor.restarts == 0
+        for process in supervisor._workers:
+            assert process.exitcode == 0
+
+
+class TestParseQueues:
+    def test_parse_queues(self):
+        assert parse_queues(("priority:3", "bulk")) == {
+            "priority": 3.0,
+            "bulk": 1.0,
+        }
+
+    def test_parse_queues_invalid_weight(self):
+        with pytest.raises(click.BadParameter):
+            parse_queues(("priority:high",))